@@ -0,0 +1,110 @@
+import re
+from decimal import Decimal
+
+# 语法版本，修改语法或权重时递增（参与OCR缓存的配置指纹）
+GRAMMAR_VERSION = 1
+
+# 支付截图OCR文本中的负数金额，一次扫描识别所有写法：
+#   (12.30)          括号
+#   支付/实付/付款/总计 -12.30    带前缀（前缀和负号之间可有空白）
+#   ¥-12.30          带"¥"
+#   -12.30 / —12.30 / - 12.30   负号（'-' 或 '—'）
+PAYMENT_GRAMMAR = re.compile(r'''
+    \((?P<paren>\d+\.\d{2})\)
+  | (?:(?P<prefix>支付|实付|付款|总计)\s*|(?P<yen>¥)\s*)?
+    (?P<sign>[-—])(?P<gap>\s*)(?P<number>\d+\.\d{2})
+''', re.VERBOSE)
+
+# 原来依次匹配的9个模式的序号（结果顺序和投票次数与原来一致）：
+# 0 -xx.xx  1 [-—]\s*xx.xx  2 [-—]xx.xx  3 (xx.xx)  4 支付  5 ¥  6 实付  7 付款  8 总计
+_PREFIX_PATTERNS = {'支付': 4, '实付': 6, '付款': 7, '总计': 8}
+
+# DocumentAnalyzer 按单词识别的负数金额：负号（'-' 或 '−'）、可选的"¥"、整数或两位小数
+WORD_GRAMMAR = re.compile(r'(?P<sign>[-−])\s*(?P<yen>¥?)\s*(?P<number>\d+(?:[.,]\d{2})?)')
+
+# 快速筛选可能包含金额的单词
+_WORD_CANDIDATE = re.compile(r'[-−]\s*¥?\s*\d')
+
+# 原来依次匹配的3个单词模式
+WORD_PATTERNS = [
+    r'-\s*(\d+(?:[.,]\d{2})?)',  # 匹配以'-'开头的数字
+    r'−\s*(\d+(?:[.,]\d{2})?)',  # 匹配以'−'开头的数字（不同的减号字符）
+    r'[\-−]\s*¥?\s*(\d+(?:[.,]\d{2})?)',  # 匹配减号后带￥的数字
+]
+
+# 单词金额的合理范围
+WORD_AMOUNT_MIN = Decimal('1')
+WORD_AMOUNT_MAX = Decimal('1000000')
+
+
+def _payment_patterns(match):
+    """一个匹配对应原来哪些模式（每个模式计一次）"""
+    if match.group('paren') is not None:
+        return [3]
+
+    sign, gap = match.group('sign'), match.group('gap')
+    # 负号和数字之间只有空格时才是负数（原来只去掉空格后再取数字）
+    if gap.strip(' '):
+        return []
+
+    patterns = []
+    if not gap:
+        patterns.extend([0, 1, 2] if sign == '-' else [1, 2])
+        if match.group('yen'):
+            patterns.append(5)
+    else:
+        patterns.append(1)
+    if match.group('prefix'):
+        patterns.append(_PREFIX_PATTERNS[match.group('prefix')])
+    return patterns
+
+
+def find_payment_amounts(text):
+    """找出文本中所有负数金额的绝对值（Decimal）
+
+    同一金额被几种写法同时匹配时重复出现相应次数，作为投票权重，顺序与原来逐个模式匹配的结果一致。
+    """
+    found = []
+    for match in PAYMENT_GRAMMAR.finditer(text):
+        amount = Decimal(match.group('paren') or match.group('number'))
+        found.extend((pattern, amount) for pattern in _payment_patterns(match))
+    found.sort(key=lambda item: item[0])
+    return [amount for _, amount in found]
+
+
+def extract_word_amounts(words):
+    """对OCR单词列（pandas Series）一次提取负数金额，返回 [(行索引, 金额绝对值Decimal, 原模式序号)]
+
+    先用向量化的 str.contains 筛出含负号和数字的单词，再对这些单词一次 str.extractall；
+    结果按单词顺序排列，单词内按原来逐个模式匹配的顺序排列，已去掉超出合理范围的金额。
+    """
+    # 转为 object 列：pandas 的 pyarrow 字符串列用 RE2 匹配，其中 \d 只匹配ASCII数字，与 re 的结果不一致
+    words = words.astype(str).astype(object)
+    words = words[words.str.contains(_WORD_CANDIDATE)]
+    if words.empty:
+        return []
+    matches = words.str.extractall(WORD_GRAMMAR)
+
+    found = []
+    word_row, word = None, []
+    # extractall 的结果按单词顺序排列，同一单词的匹配相邻
+    for row, sign, yen, number in zip(matches.index.get_level_values(0), matches['sign'].tolist(),
+                                      matches['yen'].tolist(), matches['number'].tolist()):
+        if row != word_row:
+            found.extend(_word_order(word_row, word))
+            word_row, word = row, []
+        amount = Decimal(number.replace(',', ''))
+        if not WORD_AMOUNT_MIN <= amount <= WORD_AMOUNT_MAX:
+            continue
+        # '-' 匹配模式0、'−' 匹配模式1（都要求没有"¥"），所有匹配都符合模式2
+        if not isinstance(yen, str) or not yen:
+            word.append((0 if sign == '-' else 1, amount))
+        word.append((2, amount))
+    found.extend(_word_order(word_row, word))
+    return found
+
+
+def _word_order(row, word):
+    """单词内按原来逐个模式匹配的顺序排列"""
+    word.sort(key=lambda item: item[0])
+    return [(row, amount, pattern) for pattern, amount in word]
@@ -0,0 +1,96 @@
+# 检测算法版本，修改检测逻辑时递增（参与OCR缓存的配置指纹）
+DETECTOR_VERSION = 2
+
+# 局部阈值的窗口大小和偏移量
+MASK_BLOCK_SIZE = 31
+MASK_OFFSET = 15
+
+
+def _text_masks(gray):
+    """局部阈值得到的文字掩码（文字为255），分别对应深色文字和浅色文字（深色模式截图）
+
+    局部阈值不受背景颜色不均匀影响，例如照片中的桌面和纸张。
+    """
+    import cv2
+    for image in (gray, cv2.bitwise_not(gray)):
+        yield cv2.adaptiveThreshold(image, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV,
+                                    MASK_BLOCK_SIZE, MASK_OFFSET)
+
+
+def _glyph_boxes(mask, min_height):
+    """连通域分析，返回可能是字符的区域 [(x, y, w, h)]"""
+    import cv2
+    import numpy as np
+    count, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    if count <= 1:
+        return []
+    stats = stats[1:]
+    x, y, w, h, area = (stats[:, i] for i in range(5))
+    fill = area / np.maximum(w * h, 1)
+
+    # 字符高度不小于最小字高且不超过图片高度的1/5，宽高比和填充率排除图标、色块和分隔线
+    keep = ((h >= min_height) & (h <= mask.shape[0] // 5) & (w <= 3 * h)
+            & (fill >= 0.1) & (fill <= 0.95))
+    return [tuple(int(v) for v in box) for box in stats[keep, :4]]
+
+
+def _group_lines(boxes):
+    """把字高相近、垂直方向重叠、水平方向相邻的字符合并为文本行"""
+    lines = []
+    for x, y, w, h in sorted(boxes):
+        center = y + h / 2
+        for line in lines:
+            line_height = line['y1'] - line['y0']
+            if (abs(center - (line['y0'] + line['y1']) / 2) < 0.5 * max(h, line_height)
+                    and 0.6 <= h / line_height <= 1.67
+                    and x - line['x1'] < 2 * line_height):
+                line['x1'] = max(line['x1'], x + w)
+                line['y0'] = min(line['y0'], y)
+                line['y1'] = max(line['y1'], y + h)
+                line['heights'].append(h)
+                break
+        else:
+            lines.append({'x0': x, 'y0': y, 'x1': x + w, 'y1': y + h, 'heights': [h]})
+    return lines
+
+
+def _text_lines(gray, min_height, min_glyphs=2):
+    """检测文本行，取排成行的字符更多的一种文字颜色
+
+    金额至少包含两位数字，只有一个连通域的通常是图标或噪点。
+    """
+    best = []
+    for mask in _text_masks(gray):
+        lines = [line for line in _group_lines(_glyph_boxes(mask, min_height))
+                 if len(line['heights']) >= min_glyphs]
+        if sum(len(line['heights']) for line in lines) > sum(len(line['heights']) for line in best):
+            best = lines
+    return best
+
+
+def estimate_glyph_height(gray, min_height=6):
+    """估计正文字符的高度（排成行的字符高度的中位数），没有文字时返回None"""
+    import numpy as np
+    heights = [h for line in _text_lines(gray, min_height, min_glyphs=3) for h in line['heights']]
+    return float(np.median(heights)) if heights else None
+
+
+def find_text_lines(gray, min_height=20, max_lines=3):
+    """检测字号最大的几行文字，返回 [(x, y, w, h, 字高)]，按字高从大到小排序
+
+    支付截图中实付金额通常是字号最大的一行；返回的区域已向左扩展，包含负号和货币符号。
+    """
+    import numpy as np
+    lines = _text_lines(gray, min_height)
+    lines.sort(key=lambda line: (float(np.median(line['heights'])), line['x1'] - line['x0']), reverse=True)
+
+    img_h, img_w = gray.shape[:2]
+    regions = []
+    for line in lines[:max_lines]:
+        glyph_height = int(np.median(line['heights']))
+        x0 = max(0, int(line['x0'] - 1.5 * glyph_height))
+        x1 = min(img_w, int(line['x1'] + 0.5 * glyph_height))
+        y0 = max(0, int(line['y0'] - 0.35 * glyph_height))
+        y1 = min(img_h, int(line['y1'] + 0.35 * glyph_height))
+        regions.append((x0, y0, x1 - x0, y1 - y0, glyph_height))
+    return regions
@@ -1,12 +1,15 @@
 import os
-import webview
-from flask import Flask, render_template, request, jsonify
-from datetime import datetime
+import json
+import time
+from flask import Flask, Response, render_template, request, jsonify, stream_with_context
 from pdf_image_analyzer import DocumentAnalyzer
 from test_image_payment import PaymentImageTester
+from image_preprocess import is_payment_image
+from ocr_backend import get_backend, import_tesserocr, limit_openmp_threads, ocr_limiter
+from pipeline import combine_results
+from jobs import MAX_RUNNING_JOBS, Job, JobManager, JobLogHandler
 import logging
 import threading
-from queue import Queue
 import traceback
 
 # 创建Flask应用
@@ -19,16 +22,14 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# 创建消息队列用于存储日志
-log_queue = Queue()
+# 处理任务中产生的所有日志记录到各自任务的日志中（通过 /jobs/<id>/events 推送）
+logging.getLogger().addHandler(JobLogHandler())
 
-class LogHandler(logging.Handler):
-    def emit(self, record):
-        log_entry = self.format(record)
-        log_queue.put(log_entry)
-
-# 添加自定义日志处理器
-logger.addHandler(LogHandler())
+# 任务日志推送（Server-Sent Events）：每批最多推送的日志数、两批之间的最短间隔（秒，合并高频日志），
+# 以及进度事件的间隔（秒）
+SSE_BATCH_SIZE = 200
+SSE_FLUSH_INTERVAL = 0.25
+SSE_STATUS_INTERVAL = 1.0
 
 @app.route('/')
 def home():
@@ -36,6 +37,7 @@ def home():
 
 @app.route('/select-folder')
 def select_folder():
+    import webview
     try:
         folder_path = webview.windows[0].create_file_dialog(
             webview.FOLDER_DIALOG
@@ -48,65 +50,214 @@ def select_folder():
         logger.error(f"选择文件夹时出错: {str(e)}")
         return jsonify({'status': 'error', 'message': str(e)})
 
+def run_job(job):
+    """执行处理任务：解析发票和支付截图（同时生成合并PDF），再生成汇总结果
+
+    所有输出文件写入任务自己的输出目录（job.output_dir），同时运行的任务互不影响。
+    """
+    folder_path = job.folder
+    output_dir = job.output_dir
+    logger.info(f"开始处理文件夹: {folder_path}，输出目录: {output_dir}")
+    
+    # 预先统计文件数，用于估算剩余时间
+    filenames = os.listdir(folder_path)
+    job.set_totals(pdf=sum(f.lower().endswith('.pdf') for f in filenames),
+                   image=sum(is_payment_image(f) for f in filenames),
+                   combine=1)
+    
+    # 创建处理器实例（共用同一个OCR后端），每处理完一个文件报告进度
+    ocr_backend = get_ocr_backend()
+    analyzer = DocumentAnalyzer(folder_path, ocr_backend=ocr_backend)
+    tester = PaymentImageTester(ocr_backend=ocr_backend)
+    analyzer.progress = tester.progress = job.update
+    
+    # 处理PDF文件（解析过程中合并PDF）
+    logger.info("开始处理PDF文件...")
+    invoices = analyzer.process_pdfs(folder_path, output_dir)
+    
+    # 处理图片文件（同时合并支付截图）
+    logger.info("开始处理图片文件...")
+    payments = tester.process_payment_images(folder_path, output_dir)
+    
+    # 生成数据对应关系文件
+    job.update('combine', 0, 1)
+    combine_results(invoices, payments, output_dir)
+    job.update('combine', 1, 1)
+    logger.info("处理完成!")
+
+# 多个任务同时识别，Tesseract自身只使用一个线程（在加载Tesseract之前设置）
+limit_openmp_threads()
+
+# 所有任务共用的OCR后端（引擎池是线程安全的），第一个任务开始时才创建，导入本模块时不加载OCR库。
+# 引擎在识别线程中按需创建；只有 tesserocr 模块本身必须在主线程中导入（见 main 中的 import_tesserocr）
+_ocr_backend = None
+_ocr_backend_lock = threading.Lock()
+
+def get_ocr_backend():
+    global _ocr_backend
+    with _ocr_backend_lock:
+        if _ocr_backend is None:
+            _ocr_backend = get_backend()
+            logger.info(f"OCR后端: {_ocr_backend.name}")
+        return _ocr_backend
+
+# 每个任务的目录（输出文件和 job.log）都在这里，以任务ID命名
+JOBS_DIR = os.path.join('output', 'jobs')
+
+# 整个进程同时进行的OCR识别调用数：多个任务同时运行时共用，不随任务数增加
+OCR_CONCURRENCY = os.cpu_count() or 1
+ocr_limiter.set_limit(OCR_CONCURRENCY)
+
+# 任务管理器：后台线程池执行处理任务，最多 MAX_RUNNING_JOBS 个任务同时运行，其余任务排队
+jobs = JobManager(run_job, max_workers=MAX_RUNNING_JOBS, jobs_dir=JOBS_DIR)
+
+def _job_not_found(job_id):
+    return jsonify({'status': 'error', 'message': f'任务不存在: {job_id}'}), 404
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    """提交处理任务，立即返回任务ID"""
+    folder_path = (request.get_json(silent=True) or {}).get('folder_path')
+    if not folder_path:
+        return jsonify({'status': 'error', 'message': '请选择文件夹'}), 400
+    if not os.path.isdir(folder_path):
+        return jsonify({'status': 'error', 'message': f'文件夹不存在: {folder_path}'}), 400
+    job = jobs.submit(folder_path)
+    return jsonify({'status': 'accepted', 'job': job.snapshot()}), 202, {'Location': f'/jobs/{job.id}'}
+
+@app.route('/jobs', methods=['GET'])
+def list_jobs():
+    return jsonify({'status': 'success', 'jobs': [job.snapshot() for job in jobs.list()]})
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """任务状态：各阶段已完成数/总数、当前阶段和预计剩余时间"""
+    job = jobs.get(job_id)
+    if job is None:
+        return _job_not_found(job_id)
+    return jsonify({'status': 'success', 'job': job.snapshot()})
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """取消任务：正在处理的文件处理完后停止"""
+    job = jobs.cancel(job_id)
+    if job is None:
+        return _job_not_found(job_id)
+    return jsonify({'status': 'success', 'job': job.snapshot()}), 202
+
 @app.route('/process', methods=['POST'])
 def process_files():
+    """兼容旧界面：提交任务并等待处理完成，返回任务ID和该任务的日志"""
     try:
         folder_path = request.json.get('folder_path')
         if not folder_path:
             return jsonify({'status': 'error', 'message': '请选择文件夹'})
-            
-        # 清空日志队列
-        while not log_queue.empty():
-            log_queue.get()
-            
-        # 开始处理
-        logger.info(f"开始处理文件夹: {folder_path}")
-        
-        # 创建处理器实例
-        analyzer = DocumentAnalyzer(folder_path)
-        tester = PaymentImageTester()
         
-        # 处理PDF文件
-        logger.info("开始处理PDF文件...")
-        analyzer.analyze_documents()
-        
-        # 处理图片文件
-        logger.info("开始处理图片文件...")
-        tester.process_payment_images(folder_path)
-        
-        # 生成合并文件
-        date_str = datetime.now().strftime("%Y%m%d")
-        
-        # 合并PDF
-        merged_pdf = os.path.join(folder_path, f'merged_{date_str}.pdf')
-        analyzer.merge_pdfs(merged_pdf)
-        
-        # 合并支付截图
-        merged_log = os.path.join(folder_path, f'merged_{date_str}_log.pdf')
-        analyzer.merge_images(merged_log)
-        
-        # 生成数据对应关系文件
-        analyzer.save_combined_results()
-        
-        logger.info("处理完成!")
-        return jsonify({'status': 'success'})
+        job = jobs.submit(folder_path)
+        job.wait()
+        events, _, _ = job.log.since(0)
+        result = {'job_id': job.id, 'output_dir': job.output_dir, 'logs': [event.message for event in events]}
+        if job.status == Job.DONE:
+            return jsonify({'status': 'success', **result})
+        return jsonify({'status': 'error', 'message': job.error or '任务已取消', **result})
         
     except Exception as e:
         logger.error(f"处理文件时出错: {str(e)}")
         traceback.print_exc()
         return jsonify({'status': 'error', 'message': str(e)})
 
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    """以Server-Sent Events推送任务日志（log）、进度（status）和结束（end）事件
+
+    ?level=WARNING 只推送该级别及以上的日志；断线重连时浏览器自动发送 Last-Event-ID（也可以用
+    ?last_event_id= 指定），从该日志之后继续推送，已被环形缓冲区丢弃的日志以 gap 事件报告条数。
+    """
+    job = jobs.get(job_id)
+    if job is None:
+        return _job_not_found(job_id)
+    level = logging.getLevelName(request.args.get('level', 'INFO').upper())
+    if not isinstance(level, int):
+        return jsonify({'status': 'error', 'message': f"未知的日志级别: {request.args.get('level')}"}), 400
+    try:
+        last_id = int(request.headers.get('Last-Event-ID') or request.args.get('last_event_id') or 0)
+    except ValueError:
+        return jsonify({'status': 'error', 'message': '无效的事件ID'}), 400
+    return Response(stream_with_context(_event_stream(job, last_id, level)), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def _sse(event, data, event_id=None):
+    """一条SSE事件；只有日志事件带ID，重连时从最后收到的日志继续"""
+    message = f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+    return message if event_id is None else f"id: {event_id}\n{message}"
+
+def _event_stream(job, last_id, level):
+    """任务事件流：日志分批推送，每批之间至少间隔 SSE_FLUSH_INTERVAL，推送开销与日志产生的速度无关
+
+    任务运行期间每隔 SSE_STATUS_INTERVAL 推送一次进度，同时起到保持连接的作用。
+    """
+    yield "retry: 2000\n\n"
+    status_sent = 0.0
+    while True:
+        finished = job.wait(0)
+        events, missed, last_id = job.log.since(last_id, level, SSE_BATCH_SIZE)
+        if missed:
+            yield _sse('gap', {'missed': missed})
+        for event in events:
+            yield _sse('log', {'time': event.time, 'level': logging.getLevelName(event.level),
+                               'message': event.message}, event.id)
+        
+        if finished and last_id >= job.log.last_id:
+            yield _sse('status', job.snapshot())
+            yield _sse('end', {'status': job.status})
+            return
+        if time.monotonic() - status_sent >= SSE_STATUS_INTERVAL:
+            yield _sse('status', job.snapshot())
+            status_sent = time.monotonic()
+        
+        # 等待新日志（最多等到下一次进度事件），再合并这段时间内的日志一起推送
+        if len(events) < SSE_BATCH_SIZE:
+            job.log.wait(last_id, SSE_STATUS_INTERVAL)
+            time.sleep(SSE_FLUSH_INTERVAL)
+
+# 旧界面不带任务ID轮询时，最近提交的任务已返回到的日志位置（与原来的全局日志队列一样，每条日志只返回一次）
+_legacy_log_cursor = {}
+_legacy_log_lock = threading.Lock()
+
 @app.route('/get-logs')
 def get_logs():
-    logs = []
-    while not log_queue.empty():
-        logs.append(log_queue.get())
-    return jsonify({'logs': logs})
+    """旧界面轮询任务日志：?job_id= 指定任务，?last_id= 为上次返回的 last_id（新界面使用 /jobs/<id>/events）
+
+    旧界面在 /process 返回之前拿不到任务ID：不指定任务ID时读取最近提交的任务，每次只返回上次之后的新日志。
+    日志来自各任务自己的日志，同时运行的任务不会读到或清空其他任务的日志。
+    """
+    job_id = request.args.get('job_id')
+    job = jobs.get(job_id) if job_id else jobs.latest()
+    if job is None:
+        return _job_not_found(job_id) if job_id else jsonify({'logs': [], 'last_id': 0})
+    try:
+        last_id = int(request.args.get('last_id') or 0)
+    except ValueError:
+        return jsonify({'status': 'error', 'message': '无效的事件ID'}), 400
+    if job_id or 'last_id' in request.args:
+        events, _, last_id = job.log.since(last_id)
+    else:
+        with _legacy_log_lock:
+            events, _, last_id = job.log.since(_legacy_log_cursor.get(job.id, 0))
+            _legacy_log_cursor.clear()
+            _legacy_log_cursor[job.id] = last_id
+    return jsonify({'logs': [event.message for event in events], 'last_id': last_id})
 
 def run_server():
     app.run(port=5000)
 
 def main():
+    # 界面库只在打开窗口时导入，导入本模块（例如测试中使用 Flask 测试客户端）不需要 pywebview
+    import webview
+    
+    # tesserocr 只能在主线程中导入；后端在第一个任务中创建
+    import_tesserocr()
+    
     # 启动Flask服务器
     threading.Thread(target=run_server, daemon=True).start()
     
@@ -119,6 +270,11 @@ def main():
         resizable=True
     )
     webview.start()
+    
+    # 窗口关闭后取消未完成的任务
+    jobs.shutdown()
+    if _ocr_backend is not None:
+        _ocr_backend.close()
 
 if __name__ == '__main__':
     main() 
\ No newline at end of file
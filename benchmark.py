@@ -0,0 +1,1110 @@
+import os
+import re
+import sys
+import time
+import random
+import shutil
+import logging
+import argparse
+import tempfile
+from image_preprocess import is_payment_image
+from tests.reference import (SUPPLIERS, PRODUCTS, legacy_payment_amounts, legacy_word_amounts, grammar_word_amounts,
+                             grammar_corpus, word_frames, legacy_invoice_fields, invoice_text, legacy_find_invoice_file,
+                             matching_corpus, combine_corpus, legacy_combine_csv)
+
+
+def _quiet_logging():
+    """基准测试只输出汇总结果"""
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s - %(message)s')
+    logging.getLogger().setLevel(logging.WARNING)
+
+
+def _payment_images(input_dir, limit=None):
+    paths = [os.path.join(input_dir, name) for name in sorted(os.listdir(input_dir)) if is_payment_image(name)]
+    return paths[:limit] if limit else paths
+
+
+def bench_ocr_backends(args):
+    """比较各OCR后端识别支付截图的吞吐量，并检查识别结果是否一致"""
+    from ocr_backend import available_backends, get_backend
+    from test_image_payment import PaymentImageTester
+
+    image_paths = _payment_images(args.input_dir, args.limit)
+    if not image_paths:
+        print(f"目录中没有支付截图: {args.input_dir}")
+        return 1
+
+    backends = args.backends or available_backends()
+    print(f"支付截图: {len(image_paths)}张, 线程数: {args.workers}, 级联模式: {'是' if args.cascade else '否'}")
+    print(f"{'后端':<12}{'调用次数':>10}{'图像数':>10}{'耗时(秒)':>12}{'张/秒':>10}{'结果一致':>10}")
+
+    baseline = None
+    for name in backends:
+        try:
+            backend = get_backend(name)
+        except Exception as e:
+            print(f"{name:<12}不可用: {str(e)}")
+            continue
+        tester = PaymentImageTester(cascade=args.cascade, workers=args.workers, use_cache=False,
+                                    ocr_backend=backend)
+
+        start = time.perf_counter()
+        try:
+            extracted = tester.extract_payments(image_paths)
+        except Exception as e:
+            print(f"{name:<12}识别失败: {str(e)}")
+            continue
+        elapsed = time.perf_counter() - start
+
+        amounts = {path: amount for path, (amount, passes) in extracted.items()}
+        if baseline is None:
+            baseline = amounts
+        same = '是' if amounts == baseline else '否'
+        print(f"{name:<12}{backend.calls:>10}{backend.images:>10}{elapsed:>12.2f}"
+              f"{backend.images / elapsed if elapsed > 0 else 0:>10.2f}{same:>10}")
+        backend.close()
+    return 0
+
+
+# 分辨率分组：(名称, 宽, 高, 是否为纸质小票照片)
+RESOLUTION_BUCKETS = [
+    ('720p', 720, 1600, False),
+    ('1080p', 1080, 2400, False),
+    ('1440p', 1440, 3200, False),
+    ('4K', 2160, 4800, False),
+    ('12MP照片', 4032, 3024, True)
+]
+
+
+def _render_payment_image(path, width, height, amount, photo=False, dark=False):
+    """生成一张已知金额的合成支付截图（或纸质小票照片）"""
+    from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+    def font(size):
+        return ImageFont.load_default(size=size)
+
+    if photo:
+        # 灰色桌面上的白色小票，文字约占画面中间三分之一
+        image = Image.new('RGB', (width, height), (120, 118, 110))
+        draw = ImageDraw.Draw(image)
+        left, top = width // 3, height // 12
+        paper_width = width // 3
+        draw.rectangle((left, top, left + paper_width, height - top), fill=(236, 234, 228))
+        unit = paper_width / 1080
+        origin_x, origin_y = left, top
+        fg, sub = (30, 30, 30), (90, 90, 90)
+    else:
+        bg, fg, sub = ((25, 25, 25), (235, 235, 235), (150, 150, 150)) if dark else \
+            ((247, 247, 247), (20, 20, 20), (120, 120, 120))
+        image = Image.new('RGB', (width, height), bg)
+        draw = ImageDraw.Draw(image)
+        unit = width / 1080
+        origin_x, origin_y = 0, 0
+
+    def text(x, y, value, size, fill):
+        draw.text((origin_x + x * unit, origin_y + y * unit), value, fill=fill, font=font(max(8, int(size * unit))))
+
+    text(60, 50, "Bill details", 40, fg)
+    text(380, 450, "Shop No.7 Ltd", 44, fg)
+    text(300, 560, f"-{amount:.2f}", 120, fg)
+    y = 820
+    for key, value in [("Status", "Paid"), ("Time", "2024-03-01 12:30"), ("Product", "Lab supplies"),
+                       ("Method", "Balance"), ("Order No.", "420000123456789")]:
+        text(60, y, key, 40, sub)
+        text(460, y, value, 40, fg)
+        y += 110
+
+    if photo:
+        image = image.filter(ImageFilter.GaussianBlur(1.2))
+        image.save(path, quality=90)
+    else:
+        image.save(path)
+
+
+def bench_resolution(args):
+    """各分辨率分组的支付截图识别耗时和准确率：原始尺寸 vs 分辨率归一化"""
+    from image_preprocess import DEFAULT_GLYPH_HEIGHT
+    from ocr_backend import get_backend
+    from test_image_payment import PaymentImageTester
+
+    rng = random.Random(args.seed)
+    temp_dir = tempfile.mkdtemp(prefix='bench_resolution_')
+    backend = get_backend(args.ocr_backend)
+    modes = [('原始尺寸', 0), ('归一化', args.glyph_height or DEFAULT_GLYPH_HEIGHT)]
+    try:
+        print(f"OCR后端: {backend.name}, 每组{args.samples}张, 目标字高: {modes[1][1]}像素")
+        print(f"{'分辨率':<10}{'模式':<8}{'预处理(毫秒)':>14}{'单张耗时(秒)':>14}{'准确率':>10}")
+        for bucket, width, height, photo in RESOLUTION_BUCKETS:
+            samples = []
+            for index in range(args.samples):
+                amount = rng.randint(100, 999999) / 100
+                path = os.path.join(temp_dir, f"{bucket}_{index}_log.{'jpg' if photo else 'png'}")
+                _render_payment_image(path, width, height, amount, photo=photo, dark=index % 3 == 2)
+                samples.append((path, amount))
+
+            for mode, glyph_height in modes:
+                tester = PaymentImageTester(use_cache=False, ocr_backend=backend, target_glyph_height=glyph_height)
+                preprocess_seconds = 0.0
+                total_seconds = 0.0
+                correct = 0
+                for path, amount in samples:
+                    start = time.perf_counter()
+                    tester._load_image_versions(path)
+                    preprocess_seconds += time.perf_counter() - start
+
+                    start = time.perf_counter()
+                    result = tester.extract_payment_from_image(path)
+                    total_seconds += time.perf_counter() - start
+                    correct += result is not None and abs(result - amount) < 0.005
+                count = len(samples)
+                print(f"{bucket:<10}{mode:<8}{preprocess_seconds / count * 1000:>14.1f}"
+                      f"{total_seconds / count:>14.2f}{correct / count:>10.0%}")
+    finally:
+        backend.close()
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    return 0
+
+
+def _timed(func, items, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for item in items:
+            func(item)
+    return (time.perf_counter() - start) / repeat
+
+
+def bench_amount_grammar(args):
+    """金额语法与原来逐个模式匹配的耗时比较（随机语料，结果的一致性见 tests/test_amount_grammar.py）"""
+    from amount_grammar import find_payment_amounts
+
+    rng = random.Random(args.seed)
+    texts = grammar_corpus(rng, args.samples)
+    frames = word_frames(rng, max(1, args.samples // 50))
+
+    print(f"语料: {len(texts)}段文本, {len(frames)}个单词表（共{sum(len(f) for f in frames)}个单词）")
+    print(f"{'类型':<10}{'原来(毫秒)':>14}{'金额语法(毫秒)':>16}{'加速':>10}")
+    for name, legacy, grammar, items in [
+            ('文本', legacy_payment_amounts, find_payment_amounts, texts),
+            ('单词表', legacy_word_amounts, grammar_word_amounts, frames)]:
+        legacy_seconds = _timed(legacy, items, args.repeat)
+        grammar_seconds = _timed(grammar, items, args.repeat)
+        print(f"{name:<10}{legacy_seconds * 1000:>14.1f}{grammar_seconds * 1000:>16.1f}"
+              f"{legacy_seconds / grammar_seconds if grammar_seconds > 0 else 0:>10.2f}")
+    return 0
+
+
+# 超过该字符数的发票单独统计（多页、带明细附页）
+LONG_INVOICE_CHARS = 5000
+
+
+def bench_invoice_fields(args):
+    """字段扫描器与原来逐个模式列表匹配的耗时比较（合成发票文本，结果的一致性见 tests/test_invoice_fields.py）"""
+    from pdf_image_analyzer import DocumentAnalyzer
+
+    rng = random.Random(args.seed)
+    texts = [invoice_text(rng) for _ in range(args.samples)]
+    scanner = DocumentAnalyzer.field_scanner()
+
+    print(f"合成发票: {len(texts)}张")
+    print(f"{'分组':<12}{'张数':>6}{'平均字符数':>12}{'逐个模式(微秒/张)':>20}{'字段扫描器(微秒/张)':>22}{'加速':>8}")
+    long_texts = [text for text in texts if len(text) > LONG_INVOICE_CHARS]
+    short_texts = [text for text in texts if len(text) <= LONG_INVOICE_CHARS]
+    for name, group in [('全部', texts), ('普通发票', short_texts), ('长明细发票', long_texts)]:
+        if not group:
+            continue
+        legacy_seconds = _timed(legacy_invoice_fields, group, args.repeat) / len(group)
+        scanner_seconds = _timed(scanner.scan, group, args.repeat) / len(group)
+        print(f"{name:<12}{len(group):>6}{sum(len(t) for t in group) / len(group):>12.0f}"
+              f"{legacy_seconds * 1e6:>20.0f}{scanner_seconds * 1e6:>22.0f}"
+              f"{legacy_seconds / scanner_seconds if scanner_seconds > 0 else 0:>8.2f}")
+    return 0
+
+
+def _draw_invoice_qr(pdf, payload, style, x, y, size):
+    """在 (x, y) 画发票二维码：style 为 'image' 时嵌入位图（每个模块一个像素），'vector' 时用矩形画出"""
+    import cv2
+    import numpy as np
+    from PIL import Image
+    from reportlab.lib.utils import ImageReader
+
+    modules = cv2.QRCodeEncoder.create().encode(payload)
+    if style == 'image':
+        pdf.drawImage(ImageReader(Image.fromarray(modules)), x, y, size, size)
+        return
+    cell = size / modules.shape[0]
+    for row, col in zip(*np.nonzero(modules == 0)):
+        pdf.rect(x + col * cell, y + size - (row + 1) * cell, cell, cell, stroke=0, fill=1)
+
+
+def _supplier_seal(supplier, size=240):
+    """销售方的发票专用章图像（同一销售方的图像完全相同，与真实发票一样在每张发票中重复嵌入）"""
+    import cv2
+    import numpy as np
+
+    seed = sum(supplier.encode('utf-8'))
+    image = np.full((size, size, 3), 255, np.uint8)
+    color = (40, 40, 200 + seed % 40)
+    cv2.ellipse(image, (size // 2, size // 2), (size // 2 - 8, size // 3), 0, 0, 360, color, 6)
+    for index in range(8):
+        x = size // 4 + (seed * (index + 3)) % (size // 2)
+        cv2.line(image, (x, size // 2 - 20), (size - x, size // 2 + 20), color, 3)
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+
+def _render_invoice_pdf(path, rng, pages, qr=None, decoy=False, seal=False):
+    """生成一张合成发票PDF：第一页为发票，后面是商品明细附页；部分发票把价税合计放在最后一页
+
+    qr 为 'image' 或 'vector' 时在左上角画发票二维码；decoy 为真时在备注中加一个比价税合计大的金额；
+    seal 为真时在右下角嵌入销售方的发票专用章图像。返回发票的真实字段（发票号码、开票日期、价税合计）。
+    """
+    from reportlab.pdfgen import canvas
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+
+    if 'STSong-Light' not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(UnicodeCIDFont('STSong-Light'))
+    amount = rng.randint(100, 9999999) / 100
+    total_last = pages > 1 and rng.random() < 0.2
+    total_line = f"价税合计（大写）壹佰元整 （小写）¥{amount:.2f}"
+
+    pdf = canvas.Canvas(path)
+    number = str(rng.randint(10 ** 7, 10 ** 20))
+    year, month, day = rng.randint(2019, 2025), rng.randint(1, 12), rng.randint(1, 28)
+    supplier = rng.choice(SUPPLIERS)
+    lines = [f"发票号码：{number}",
+             f"开票日期：{year}年{month:02d}月{day:02d}日",
+             "购买方名称：某某大学", f"销售方名称：{supplier}",
+             "项目名称 规格型号 单位 数量 单价 金额"]
+    top = 800
+    if qr:
+        rate = rng.choice([0, 0.01, 0.03, 0.06, 0.09, 0.13])
+        pretax = round(amount / (1 + rate), 2)
+        lines.append(f"合计 ¥{pretax:.2f} ¥{amount - pretax:.2f}")
+        if decoy:
+            lines.append(f"备注：本年累计开票金额¥{amount * rng.uniform(1.5, 20):.2f}")
+        payload = f"01,10,{rng.randint(10 ** 11, 10 ** 12 - 1)},{number},{pretax:.2f},{year}{month:02d}{day:02d},{rng.randint(10 ** 19, 10 ** 20 - 1)},A1B2,"
+        _draw_invoice_qr(pdf, payload, qr, 40, 740, 60)
+        top = 720
+    if seal:
+        from PIL import Image
+        from reportlab.lib.utils import ImageReader
+        pdf.drawImage(ImageReader(Image.fromarray(_supplier_seal(supplier))), 400, 60, 120, 120)
+    for page in range(pages):
+        if page:
+            lines = [f"销货清单 第{page + 1}页"]
+            lines += [f"{rng.choice(PRODUCTS)} 个 {rng.randint(1, 20)} ¥{rng.randint(1, 99999) / 100:.2f}"
+                      for _ in range(60)]
+        if page == (pages - 1 if total_last else 0):
+            lines.append(total_line)
+        pdf.setFont('STSong-Light', 10)
+        y = top if not page else 800
+        for line in lines:
+            pdf.drawString(40, y, line)
+            y -= 12
+        pdf.showPage()
+    pdf.save()
+    return {'invoice_number': number, 'invoice_date': f"{year}-{month:02d}-{day:02d}", 'price': f"{amount:.2f}"}
+
+
+def bench_pdf_text(args):
+    """各PDF文本后端提取发票字段的耗时、解析页数和结果（合成多页发票）"""
+    from pdf_image_analyzer import DocumentAnalyzer
+    from pdf_text import available_pdf_backends
+
+    rng = random.Random(args.seed)
+    temp_dir = tempfile.mkdtemp(prefix='bench_pdf_text_')
+    try:
+        pdf_files = []
+        for index in range(args.samples):
+            path = os.path.join(temp_dir, f"invoice_{index:04d}.pdf")
+            _render_invoice_pdf(path, rng, rng.choice(args.pages))
+            pdf_files.append(path)
+
+        backends = args.backends or available_pdf_backends()
+        print(f"合成发票: {len(pdf_files)}张, 页数: {args.pages}")
+        print(f"{'后端':<12}{'提前停止':<8}{'耗时(秒)':>10}{'单张(毫秒)':>12}{'解析页数':>14}{'与原方式一致':>14}")
+
+        # 原方式：pdfplumber 解析所有页
+        reference = DocumentAnalyzer(temp_dir, use_cache=False, pdf_backend='pdfplumber', stop_early=False)
+        expected = {path: reference._extract_pdf_fields(path) for path in pdf_files}
+        for name in backends:
+            for stop_early in (False, True):
+                analyzer = DocumentAnalyzer(temp_dir, use_cache=False, pdf_backend=name, stop_early=stop_early)
+                start = time.perf_counter()
+                fields = {path: analyzer._extract_pdf_fields(path) for path in pdf_files}
+                elapsed = time.perf_counter() - start
+                same = sum(fields[path] == expected[path] for path in pdf_files)
+                backend = analyzer.pdf_backend
+                print(f"{name:<12}{'是' if stop_early else '否':<8}{elapsed:>10.2f}{elapsed / len(pdf_files) * 1000:>12.1f}"
+                      f"{f'{backend.pages_parsed}/{backend.pages_total}':>14}{f'{same}/{len(pdf_files)}':>14}")
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    return 0
+
+
+# 合成版式发票的页面大小（点）和各行文字的位置（相对页面宽高的比例，原点在左上角）
+_LAYOUT_PAGES = {'数电发票': (595.3, 396.9), '增值税电子发票': (683.1, 396.9)}
+
+
+def _layout_lines(layout, fields, rng):
+    """版式发票上的文字：[(x, top, 文本)]，购买方名称总在销售方名称之前"""
+    number, date, supplier, total, pretax, items = (fields[name] for name in
+                                                    ('number', 'date', 'supplier', 'total', 'pretax', 'items'))
+    tax_id = f"91{rng.randint(10 ** 15, 10 ** 16 - 1)}X"
+    if layout == '数电发票':
+        lines = [(0.36, 0.05, '电子发票（普通发票）'), (0.7, 0.06, f"发票号码：{number}"), (0.7, 0.11, f"开票日期：{date}"),
+                 (0.05, 0.21, '购买方信息'), (0.08, 0.25, '名称：某某大学'),
+                 (0.08, 0.3, '统一社会信用代码/纳税人识别号：12100000400000000A'),
+                 (0.52, 0.21, '销售方信息'), (0.55, 0.25, f"名称：{supplier}"),
+                 (0.55, 0.3, f"统一社会信用代码/纳税人识别号：{tax_id}"),
+                 (0.05, 0.37, '项目名称'), (0.32, 0.37, '规格型号 单位 数量 单价 金额 税率/征收率 税额')]
+        row, total_top, remark = 0.42, 0.74, (0.05, 0.84)
+    else:
+        lines = [(0.33, 0.04, '广东增值税电子普通发票'), (0.66, 0.05, f"发票代码：{rng.randint(10 ** 11, 10 ** 12 - 1)}"),
+                 (0.66, 0.09, f"发票号码：{number}"), (0.66, 0.13, f"开票日期：{date}"),
+                 (0.66, 0.17, f"校验码：{rng.randint(10 ** 19, 10 ** 20 - 1)}"),
+                 (0.04, 0.21, '购买方'), (0.1, 0.21, '名 称：某某大学'), (0.1, 0.26, '纳税人识别号：12100000400000000A'),
+                 (0.04, 0.37, '货物或应税劳务、服务名称'), (0.34, 0.37, '规格型号 单位 数量 单价 金额 税率 税额'),
+                 (0.04, 0.77, '销售方'), (0.1, 0.77, f"名 称：{supplier}"), (0.1, 0.81, f"纳税人识别号：{tax_id}")]
+        row, total_top, remark = 0.42, 0.67, (0.66, 0.77)
+    for index, item in enumerate(items):
+        lines.append((0.05, row + index * 0.05, item))
+        lines.append((0.34, row + index * 0.05, f"个 {rng.randint(1, 9)} {rng.randint(1, 999)}.00 {rng.randint(1, 999)}.00 13%"))
+    lines.append((0.05, total_top - 0.09, '合 计'))
+    lines.append((0.7, total_top - 0.09, f"¥{pretax:.2f} ¥{total - pretax:.2f}"))
+    lines.append((0.05, total_top, '价税合计（大写）壹佰元整'))
+    lines.append((0.66, total_top, f"（小写）¥{total:.2f}"))
+    lines.append((remark[0], remark[1], '备注'))
+    if fields['decoy']:
+        lines.append((remark[0], remark[1] + 0.04, f"本年累计开票金额¥{total * rng.uniform(1.5, 20):.2f}"))
+    return lines
+
+
+def _render_layout_invoice(path, rng, layout, decoy=False):
+    """按发票版式生成单页合成发票PDF（位置随机偏移），返回发票的真实字段"""
+    from reportlab.pdfgen import canvas
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+
+    if 'STSong-Light' not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(UnicodeCIDFont('STSong-Light'))
+    total = rng.randint(100, 9999999) / 100
+    year, month, day = rng.randint(2019, 2025), rng.randint(1, 12), rng.randint(1, 28)
+    fields = {
+        'number': str(rng.randint(10 ** 7, 10 ** 20)),
+        'date': f"{year}年{month:02d}月{day:02d}日",
+        'supplier': rng.choice(SUPPLIERS),
+        'total': total,
+        'pretax': round(total / (1 + rng.choice([0, 0.01, 0.03, 0.06, 0.09, 0.13])), 2),
+        'items': [rng.choice(PRODUCTS) for _ in range(rng.randint(1, 3))],
+        'decoy': decoy
+    }
+
+    width, height = _LAYOUT_PAGES[layout]
+    dx, dy = rng.uniform(-0.01, 0.01), rng.uniform(-0.01, 0.01)
+    pdf = canvas.Canvas(path, pagesize=(width, height))
+    pdf.setFont('STSong-Light', 9)
+    for x, top, text in _layout_lines(layout, fields, rng):
+        pdf.drawString((x + dx) * width, (1 - top - dy) * height - 9, text)
+    pdf.showPage()
+    pdf.save()
+
+    clean = lambda text: re.sub(r'[^\w\s\u4e00-\u9fff]', '', text).strip()
+    return {'invoice_number': fields['number'], 'invoice_date': f"{year}-{month:02d}-{day:02d}",
+            'supplier': clean(fields['supplier']), 'price': f"{total:.2f}", 'product_name': clean(fields['items'][0])}
+
+
+def bench_invoice_templates(args):
+    """版式模板与全文提取的准确率、耗时和扫描的文本量（合成版式发票，以及没有模板的发票）"""
+    from pdf_image_analyzer import DocumentAnalyzer
+    from pdf_text import get_pdf_backend
+    from invoice_templates import match_template
+
+    rng = random.Random(args.seed)
+    temp_dir = tempfile.mkdtemp(prefix='bench_invoice_templates_')
+    try:
+        truth, layouts = {}, {}
+        for index in range(args.samples):
+            path = os.path.join(temp_dir, f"invoice_{index:04d}.pdf")
+            layout = rng.choice(list(_LAYOUT_PAGES) + [None])
+            if layout:
+                truth[path] = _render_layout_invoice(path, rng, layout, decoy=rng.random() < args.decoys)
+            else:
+                _render_invoice_pdf(path, rng, rng.choice([1, 2]))
+            layouts[path] = layout
+        pdf_files = sorted(layouts)
+        templated = [path for path in pdf_files if layouts[path]]
+        others = [path for path in pdf_files if not layouts[path]]
+
+        # 每张发票需要扫描的文本量：模板只读取字段区域，全文提取读取所有页
+        backend = get_pdf_backend(args.pdf_backend)
+        box_chars = text_chars = 0
+        for path in templated:
+            with backend.open(path) as document:
+                template, words = match_template(document)
+                box_chars += sum(len(text) for text in template.read_boxes(words).values()) if template else 0
+                text_chars += len(''.join(document.pages()))
+
+        print(f"合成发票: {len(pdf_files)}张（版式发票 {len(templated)}, 没有模板的发票 {len(others)}）")
+        print(f"版式发票平均扫描字符数: 全文 {text_chars / max(len(templated), 1):.0f}, "
+              f"模板区域 {box_chars / max(len(templated), 1):.0f}")
+        names = ('invoice_number', 'invoice_date', 'supplier', 'price', 'product_name')
+        print(f"{'方式':<10}{'单张(毫秒)':>12}" + ''.join(f"{name:>16}" for name in names))
+        results = {}
+        for use_templates in (False, True):
+            analyzer = DocumentAnalyzer(temp_dir, use_cache=False, pdf_backend=args.pdf_backend, use_qr=False,
+                                        use_templates=use_templates)
+            start = time.perf_counter()
+            results[use_templates] = {path: analyzer._extract_pdf_fields(path) for path in pdf_files}
+            elapsed = time.perf_counter() - start
+            fields = results[use_templates]
+            correct = [sum(fields[path][name] == truth[path][name] for path in templated) for name in names]
+            print(f"{'模板' if use_templates else '全文':<10}{elapsed / len(pdf_files) * 1000:>12.1f}"
+                  + ''.join(f"{f'{count}/{len(templated)}':>16}" for count in correct))
+
+        failed = 0
+        for path in templated:
+            wrong = [name for name in names if results[True][path][name] != truth[path][name]]
+            if wrong:
+                failed += 1
+                print(f"模板提取不正确: {os.path.basename(path)} ({layouts[path]}) {wrong}")
+        # 没有模板的发票结果与原来相同
+        for path in others:
+            if results[True][path] != results[False][path]:
+                failed += 1
+                print(f"没有模板的发票结果不同: {os.path.basename(path)}")
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    return 1 if failed else 0
+
+
+def bench_invoice_qr(args):
+    """发票二维码快速路径与只用文本提取的耗时和准确率（合成发票，部分备注中有更大的金额）"""
+    from pdf_image_analyzer import DocumentAnalyzer
+
+    rng = random.Random(args.seed)
+    temp_dir = tempfile.mkdtemp(prefix='bench_invoice_qr_')
+    try:
+        truth, styles = {}, {}
+        for index in range(args.samples):
+            path = os.path.join(temp_dir, f"invoice_{index:04d}.pdf")
+            style = rng.choices(['image', 'vector', None], weights=[6, 3, 1])[0]
+            truth[path] = _render_invoice_pdf(path, rng, rng.choice(args.pages), qr=style,
+                                              decoy=style is not None and rng.random() < args.decoys)
+            styles[path] = style
+        pdf_files = sorted(truth)
+
+        print(f"合成发票: {len(pdf_files)}张（嵌入图像二维码 {sum(v == 'image' for v in styles.values())}, "
+              f"矢量二维码 {sum(v == 'vector' for v in styles.values())}, 无二维码 {sum(v is None for v in styles.values())}）")
+        print(f"{'方式':<10}{'耗时(秒)':>10}{'单张(毫秒)':>12}{'发票号码':>10}{'开票日期':>10}{'金额':>10}")
+        failed = 0
+        for use_qr in (False, True):
+            analyzer = DocumentAnalyzer(temp_dir, use_cache=False, pdf_backend=args.pdf_backend, use_qr=use_qr)
+            start = time.perf_counter()
+            fields = {path: analyzer._extract_pdf_fields(path) for path in pdf_files}
+            elapsed = time.perf_counter() - start
+            correct = [sum(fields[path][name] == truth[path][name] for path in pdf_files)
+                       for name in ('invoice_number', 'invoice_date', 'price')]
+            print(f"{'二维码' if use_qr else '只用文本':<10}{elapsed:>10.2f}{elapsed / len(pdf_files) * 1000:>12.1f}"
+                  + ''.join(f"{f'{count}/{len(pdf_files)}':>10}" for count in correct))
+            if use_qr:
+                # 有二维码的发票必须全部正确
+                for path in pdf_files:
+                    if styles[path] and any(fields[path][name] != truth[path][name] for name in truth[path]):
+                        failed += 1
+                        print(f"不一致: {os.path.basename(path)} ({styles[path]}) {fields[path]} != {truth[path]}")
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    return 1 if failed else 0
+
+
+def _scan_pdf(source, target, dpi, page_size=None):
+    """把PDF的每一页渲染成图像后生成只有图像、没有文本层的PDF（模拟扫描的纸质发票）"""
+    import cv2
+    from PIL import Image
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.utils import ImageReader
+    from pdf_text import get_pdf_backend
+
+    pdf = None
+    with get_pdf_backend().open(source) as document:
+        for index in range(document.page_count):
+            width, height = page_size or document.page_size(index)
+            image = document.render(index, dpi=dpi)
+            if pdf is None:
+                pdf = canvas.Canvas(target, pagesize=(width, height))
+            pdf.setPageSize((width, height))
+            pdf.drawImage(ImageReader(Image.fromarray(cv2.cvtColor(image, cv2.COLOR_GRAY2RGB))), 0, 0, width, height)
+            pdf.showPage()
+    pdf.save()
+
+
+def bench_pdf_ocr(args):
+    """扫描件（没有文本层的PDF）OCR识别：与文本层提取结果的一致性、渲染缓存的效果和渲染像素上限"""
+    import cv2
+    from pdf_image_analyzer import DocumentAnalyzer
+
+    rng = random.Random(args.seed)
+    temp_dir = tempfile.mkdtemp(prefix='bench_pdf_ocr_')
+    try:
+        scan_dir = os.path.join(temp_dir, 'scans')
+        os.makedirs(scan_dir)
+        sources, scans = [], []
+        for index in range(args.samples):
+            source = os.path.join(temp_dir, f"invoice_{index:04d}.pdf")
+            _render_invoice_pdf(source, rng, rng.choice([1, 1, 2]))
+            scan = os.path.join(scan_dir, f"invoice_{index:04d}.pdf")
+            # 最后一张按大幅面扫描，检查渲染像素上限
+            _scan_pdf(source, scan, args.scan_dpi, (2384, 3370) if index == args.samples - 1 else None)
+            sources.append(source)
+            scans.append(scan)
+
+        reference = DocumentAnalyzer(temp_dir, use_cache=False, pdf_ocr=False)
+        expected = {scan: reference._extract_pdf_fields(source) for source, scan in zip(sources, scans)}
+
+        cache_dir = os.path.join(temp_dir, 'page_cache')
+        print(f"扫描件: {len(scans)}张, 扫描分辨率 {args.scan_dpi} DPI, OCR语言 {args.lang}, "
+              f"渲染 {args.ocr_dpi} DPI, 最多 {args.max_pixels} 像素/页")
+        print(f"{'运行':<10}{'耗时(秒)':>10}{'OCR页数':>10}{'缓存命中':>10}" +
+              ''.join(f"{name:>16}" for name in ('invoice_number', 'invoice_date', 'supplier', 'price')))
+        runs = []
+        for run in ('首次', '再次'):
+            analyzer = DocumentAnalyzer(scan_dir, use_cache=False, ocr_dpi=args.ocr_dpi,
+                                        max_render_pixels=args.max_pixels, page_cache_dir=cache_dir)
+            analyzer.PDF_OCR_LANG = analyzer.page_reader.lang = args.lang
+            start = time.perf_counter()
+            fields = {scan: analyzer._extract_pdf_fields(scan) for scan in scans}
+            elapsed = time.perf_counter() - start
+            runs.append(fields)
+            reader = analyzer.page_reader
+            agree = [sum(fields[scan][name] == expected[scan][name] for scan in scans)
+                     for name in ('invoice_number', 'invoice_date', 'supplier', 'price')]
+            print(f"{run:<10}{elapsed:>10.2f}{reader.pages:>10}{reader.cache_hits:>10}"
+                  + ''.join(f"{f'{count}/{len(scans)}':>16}" for count in agree))
+
+        largest = 0
+        for root, _, files in os.walk(cache_dir):
+            for name in files:
+                image = cv2.imread(os.path.join(root, name), cv2.IMREAD_GRAYSCALE)
+                largest = max(largest, image.shape[0] * image.shape[1])
+        print(f"渲染的最大页面: {largest} 像素（上限 {args.max_pixels}）")
+        failed = largest > args.max_pixels or runs[0] != runs[1]
+        if runs[0] != runs[1]:
+            print("使用缓存的页面图像后识别结果不同")
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    return 1 if failed else 0
+
+
+def _merge_in_child(method, pdf_files, output, pdf_backend):
+    """在独立进程中合并PDF（峰值内存只包含这一种方式），返回 (耗时, 合并前的内存, 峰值内存)，内存单位为MB"""
+    import resource
+
+    def peak_rss():
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # Linux 上单位为KB
+
+    if method == 'pypdf2':
+        import PyPDF2
+    else:
+        from pdf_text import get_pdf_backend
+        from pdf_stream_writer import StreamingPDFWriter
+        backend = get_pdf_backend(pdf_backend)
+    baseline = peak_rss()
+    start = time.perf_counter()
+    if method == 'pypdf2':
+        # 原方式：所有文件的对象都保留在内存中，最后一次写出
+        merger = PyPDF2.PdfMerger()
+        for path in pdf_files:
+            merger.append(path)
+        merger.write(output)
+        merger.close()
+    else:
+        with StreamingPDFWriter(output) as writer:
+            for path in pdf_files:
+                with backend.open(path) as document:
+                    writer.append(document.merge_source())
+    return time.perf_counter() - start, baseline, peak_rss()
+
+
+def bench_pdf_merge(args):
+    """合并PDF的峰值内存、耗时和输出文件大小：原方式（PyPDF2）与流式写入（合成发票，同一销售方的印章图像相同）
+
+    合并结果的检查见 tests/test_pdf_stream_writer.py。
+    """
+    import multiprocessing
+    import importlib.util
+
+    rng = random.Random(args.seed)
+    temp_dir = tempfile.mkdtemp(prefix='bench_pdf_merge_')
+    try:
+        pdf_files = []
+        for index in range(args.samples):
+            path = os.path.join(temp_dir, f"invoice_{index:05d}.pdf")
+            _render_invoice_pdf(path, rng, rng.choice(args.pages), qr='image', seal=True)
+            pdf_files.append(path)
+        input_size = sum(os.path.getsize(path) for path in pdf_files)
+        print(f"合成发票: {len(pdf_files)}张, 共 {input_size / 1024 / 1024:.1f}MB")
+
+        methods = ['streaming']
+        if importlib.util.find_spec('PyPDF2') is not None and not args.skip_pypdf2:
+            methods.insert(0, 'pypdf2')
+        print(f"{'方式':<12}{'耗时(秒)':>10}{'合并前内存(MB)':>16}{'峰值内存(MB)':>14}{'合并占用(MB)':>14}{'输出大小(MB)':>14}")
+        context = multiprocessing.get_context('spawn')
+        for method in methods:
+            output = os.path.join(temp_dir, f"merged_{method}.pdf")
+            with context.Pool(1) as pool:
+                elapsed, baseline, peak = pool.apply(_merge_in_child, (method, pdf_files, output, args.pdf_backend))
+            print(f"{method:<12}{elapsed:>10.2f}{baseline:>16.1f}{peak:>14.1f}{peak - baseline:>14.1f}"
+                  f"{os.path.getsize(output) / 1024 / 1024:>14.1f}")
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    return 0
+
+
+def _merge_images_in_child(method, image_files, output):
+    """在独立进程中把截图合并为PDF，返回 (耗时, 合并前的内存, 峰值内存)，内存单位为MB"""
+    import resource
+    from PIL import Image
+    from pdf_stream_writer import StreamingPDFWriter
+
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    start = time.perf_counter()
+    if method == 'pil':
+        # 原方式：打开所有截图后一次保存（PIL 重新编码为JPEG，所有解码的图像同时保留在内存中）
+        images = []
+        for path in image_files:
+            image = Image.open(path)
+            if image.mode == 'RGBA':
+                image = image.convert('RGB')
+            images.append(image)
+        images[0].save(output, save_all=True, append_images=images[1:])
+    else:
+        with StreamingPDFWriter(output) as writer:
+            for path in image_files:
+                writer.add_image_page(path)
+    return time.perf_counter() - start, baseline, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def bench_image_merge(args):
+    """支付截图合并为PDF的峰值内存、耗时和输出大小：原方式（PIL）与流式写入（合成截图，JPEG和PNG各一半）
+
+    合并结果的检查见 tests/test_merge_images.py。
+    """
+    import multiprocessing
+
+    rng = random.Random(args.seed)
+    temp_dir = tempfile.mkdtemp(prefix='bench_image_merge_')
+    try:
+        image_files = []
+        for index in range(args.samples):
+            path = os.path.join(temp_dir, f"payment_{index:05d}_log.{'jpg' if index % 2 else 'png'}")
+            _render_payment_image(path, args.width, args.height, rng.randint(100, 99999) / 100,
+                                  photo=index % 2 == 1, dark=index % 4 == 2)
+            image_files.append(path)
+        input_size = sum(os.path.getsize(path) for path in image_files)
+        print(f"合成截图: {len(image_files)}张 {args.width}x{args.height}, 共 {input_size / 1024 / 1024:.1f}MB")
+
+        methods = ['streaming'] if args.skip_pil else ['pil', 'streaming']
+        print(f"{'方式':<12}{'耗时(秒)':>10}{'合并前内存(MB)':>16}{'峰值内存(MB)':>14}{'合并占用(MB)':>14}{'输出大小(MB)':>14}")
+        context = multiprocessing.get_context('spawn')
+        for method in methods:
+            output = os.path.join(temp_dir, f"merged_{method}.pdf")
+            with context.Pool(1) as pool:
+                elapsed, baseline, peak = pool.apply(_merge_images_in_child, (method, image_files, output))
+            print(f"{method:<12}{elapsed:>10.2f}{baseline:>16.1f}{peak:>14.1f}{peak - baseline:>14.1f}"
+                  f"{os.path.getsize(output) / 1024 / 1024:>14.1f}")
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    return 0
+
+
+def bench_matching(args):
+    """发票和支付截图匹配：原来的文件名包含关系（逐对比较）与索引匹配的耗时和准确率（合成文件名和金额）
+
+    索引匹配耗时超过上限时返回非零；正确数不少于原方式的检查见 tests/test_matching.py。
+    """
+    from matching import match_payments
+
+    rng = random.Random(args.seed)
+    print(f"{'方式':<10}{'发票数':>8}{'截图数':>8}{'耗时(秒)':>10}{'正确':>14}{'错误匹配':>10}{'未匹配':>8}")
+    failed = 0
+    for size in args.sizes:
+        invoices, payments, truth = matching_corpus(rng, size)
+        results = {}
+        if size <= args.legacy_limit:
+            pdf_files = [name for name, _ in invoices]
+            start = time.perf_counter()
+            results['原方式'] = {payment: legacy_find_invoice_file(payment, pdf_files) for payment, _ in payments}
+            results['原方式'] = (time.perf_counter() - start, results['原方式'])
+        start = time.perf_counter()
+        matches = match_payments(invoices, payments)
+        results['索引匹配'] = (time.perf_counter() - start,
+                           {payment: matches[payment].invoice if payment in matches else None for payment, _ in payments})
+
+        for name, (elapsed, found) in results.items():
+            correct = sum(found[payment] == truth[payment] for payment in truth)
+            wrong = sum(found[payment] is not None and found[payment] != truth[payment] for payment in truth)
+            missed = sum(found[payment] is None and truth[payment] is not None for payment in truth)
+            print(f"{name:<10}{len(invoices):>8}{len(payments):>8}{elapsed:>10.3f}"
+                  f"{f'{correct}/{len(truth)}':>14}{wrong:>10}{missed:>8}")
+            if name == '索引匹配' and elapsed > args.budget:
+                failed += 1
+                print(f"索引匹配耗时超过 {args.budget} 秒")
+    return 1 if failed else 0
+
+
+def bench_combine(args):
+    """合并发票和支付记录：原来的CSV读写 + 逐行合并，与内存中的记录整列合并的耗时
+
+    两种方式的结果比较见 tests/test_combine.py。
+    """
+    import pipeline
+
+    rng = random.Random(args.seed)
+    records, payment_records = combine_corpus(rng, args.rows)
+    temp_dir = tempfile.mkdtemp(prefix='bench_combine_')
+    logging.disable(logging.WARNING)
+    try:
+        print(f"发票记录: {len(records)}, 支付记录: {len(payment_records)}")
+        print(f"{'方式':<12}{'耗时(秒)':>10}")
+
+        start = time.perf_counter()
+        legacy_combine_csv(records, payment_records, temp_dir)
+        print(f"{'CSV往返逐行':<12}{time.perf_counter() - start:>10.2f}")
+
+        # 内存中的记录直接合并（包括匹配和统计）
+        start = time.perf_counter()
+        pipeline.combine_results(records, payment_records, temp_dir)
+        print(f"{'内存记录':<12}{time.perf_counter() - start:>10.2f}")
+    finally:
+        logging.disable(logging.NOTSET)
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    return 0
+
+
+def bench_load_test(args):
+    """同时提交多个文件夹的处理任务（通过 /jobs 接口），检查各任务的输出互不干扰且结果正确
+
+    每个文件夹的发票和支付截图文件名带有各自的前缀。检查每个任务的 combined_results.csv 只包含本文件夹的文件，
+    发票号码和价税合计与生成时相同，合并PDF的页数正确，job.log 中没有其他文件夹的文件名。
+    """
+    import pandas as pd
+    from decimal import Decimal
+    from datetime import datetime
+    from pdf_text import get_pdf_backend
+    from ocr_backend import import_tesserocr, ocr_limiter
+
+    # tesserocr 只能在主线程中导入，任务线程中第一次创建后端时才能使用它
+    import_tesserocr()
+
+    # 任务日志文件需要INFO级别的日志（含文件名），控制台仍只输出警告
+    root = logging.getLogger()
+    for handler in root.handlers:
+        handler.setLevel(logging.WARNING)
+    root.setLevel(logging.INFO)
+    import app
+
+    rng = random.Random(args.seed)
+    temp_dir = tempfile.mkdtemp(prefix='bench_load_')
+    cwd = os.getcwd()
+    failed = 0
+    try:
+        # 生成各文件夹：发票PDF（1-2页）和部分发票对应的支付截图
+        folders = []
+        for index in range(args.jobs):
+            prefix = f"batch{chr(ord('a') + index % 26)}{index}"
+            folder = os.path.join(temp_dir, 'input', prefix)
+            os.makedirs(folder)
+            truth, pages = {}, 0
+            for number in range(args.invoices):
+                name = f"{prefix}_item{number}.pdf"
+                page_count = rng.choice([1, 1, 2])
+                truth[name] = _render_invoice_pdf(os.path.join(folder, name), rng, page_count)
+                pages += page_count
+            screenshots = []
+            for name in list(truth)[:args.screenshots]:
+                screenshot = f"{os.path.splitext(name)[0]}log.png"
+                _render_payment_image(os.path.join(folder, screenshot), 540, 1170, float(truth[name]['price']))
+                screenshots.append(screenshot)
+            folders.append((prefix, folder, truth, pages, screenshots))
+        print(f"文件夹: {args.jobs}个, 每个 {args.invoices} 张发票、{args.screenshots} 张支付截图")
+
+        # 在临时目录中运行，任务目录和识别缓存都从空开始
+        os.chdir(temp_dir)
+        if args.ocr_concurrency:
+            ocr_limiter.set_limit(args.ocr_concurrency)
+        ocr_limiter.reset_stats()
+        client = app.app.test_client()
+        start = time.perf_counter()
+        job_ids = []
+        for _, folder, _, _, _ in folders:
+            response = client.post('/jobs', json={'folder_path': folder})
+            job_ids.append(response.get_json()['job']['id'])
+        snapshots = {}
+        while len(snapshots) < len(job_ids):
+            time.sleep(0.2)
+            for job_id in job_ids:
+                job = client.get(f'/jobs/{job_id}').get_json()['job']
+                if job['status'] not in ('queued', 'running'):
+                    snapshots[job_id] = job
+        elapsed = time.perf_counter() - start
+        print(f"总耗时: {elapsed:.2f}秒, 同时运行的任务数上限: {app.jobs.max_workers}, "
+              f"OCR并发上限: {ocr_limiter.limit}, 峰值: {ocr_limiter.peak}, 等待: {ocr_limiter.wait_seconds:.2f}秒")
+        if ocr_limiter.limit is not None and ocr_limiter.peak > ocr_limiter.limit:
+            failed += 1
+            print(f"同时进行的OCR调用数超过上限: {ocr_limiter.peak} > {ocr_limiter.limit}")
+
+        output_dirs = [snapshots[job_id]['output_dir'] for job_id in job_ids]
+        if len(set(output_dirs)) != len(output_dirs):
+            failed += 1
+            print("任务的输出目录相同")
+
+        date = datetime.now().strftime("%Y%m%d")
+        backend = get_pdf_backend()
+        prefixes = [prefix for prefix, _, _, _, _ in folders]
+        print(f"{'文件夹':<12}{'状态':<12}{'耗时(秒)':>10}{'发票':>8}{'截图':>8}  问题")
+        for job_id, (prefix, folder, truth, pages, screenshots) in zip(job_ids, folders):
+            job = snapshots[job_id]
+            output_dir = job['output_dir']
+            problems = []
+            if job['status'] != 'done':
+                problems.append(f"任务{job['status']}: {job['error']}")
+            combined_file = os.path.join(output_dir, 'combined_results.csv')
+            combined = (pd.read_csv(combined_file, dtype=str, keep_default_na=False, encoding='utf-8')
+                        if os.path.exists(combined_file) else pd.DataFrame(columns=['发票文件', '文件名']))
+            invoices = combined[combined['发票文件'] != '']
+            if sorted(invoices['发票文件']) != sorted(truth):
+                problems.append("发票文件与文件夹不同")
+            for _, row in invoices.iterrows():
+                expected = truth.get(row['发票文件'])
+                if expected and (row['发票号码'] != expected['invoice_number'] or
+                                 not row['发票金额'] or Decimal(row['发票金额']) != Decimal(expected['price'])):
+                    problems.append(f"{row['发票文件']} 发票号码或金额不同")
+            if sorted(name for name in combined['文件名'] if name) != sorted(screenshots):
+                problems.append("支付截图与文件夹不同")
+            for merged, expected in ((f'merged_{date}.pdf', pages), (f'merged_{date}_log.pdf', len(screenshots))):
+                path = os.path.join(output_dir, merged)
+                if not expected:
+                    continue
+                if not os.path.exists(path):
+                    problems.append(f"缺少 {merged}")
+                    continue
+                with backend.open(path) as document:
+                    if document.page_count != expected:
+                        problems.append(f"{merged} 页数 {document.page_count} != {expected}")
+            log_file = os.path.join(os.path.dirname(output_dir), 'job.log')
+            with open(log_file, encoding='utf-8') as f:
+                log = f.read()
+            others = [other for other in prefixes if other != prefix and f"{other}_" in log]
+            if others or f"{prefix}_" not in log:
+                problems.append(f"job.log 包含其他文件夹的日志: {', '.join(others)}" if others else "job.log 没有本任务的日志")
+            failed += bool(problems)
+            print(f"{prefix:<12}{job['status']:<12}{job['elapsed_seconds'] or 0:>10.2f}{len(invoices):>8}"
+                  f"{sum(combined['文件名'] != ''):>8}  {'; '.join(problems[:3]) or '-'}")
+        print("各任务的输出相互独立且结果正确" if not failed else "检查未通过")
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    return 1 if failed else 0
+
+
+# 启动时不应导入的模块（只在处理阶段第一次需要时导入）
+HEAVY_MODULES = ('cv2', 'numpy', 'pandas', 'pytesseract', 'pdfplumber', 'fitz', 'pymupdf', 'PIL', 'tesserocr')
+
+# 各入口模块的导入耗时上限（毫秒，取多次运行的中位数）
+STARTUP_BUDGETS = {'main': 120, 'app': 400}
+
+
+def _import_time(module):
+    """在新的Python进程中用 -X importtime 导入模块，返回 (总耗时毫秒, {模块: 累计耗时毫秒})"""
+    import subprocess
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+                          capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    if proc.returncode:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+    modules = {}
+    for line in proc.stderr.splitlines():
+        match = re.match(r'import time:\s+\d+ \|\s+(\d+) \|\s*(\S+)', line)
+        if match:
+            modules[match.group(2)] = int(match.group(1)) / 1000
+    return modules[module], modules
+
+
+def _probe_in_child(cache_path):
+    """在新的进程中探测Tesseract，返回 (耗时毫秒, 执行的子进程数)"""
+    import subprocess
+    code = ("import time, ocr_backend\n"
+            "calls = []\n"
+            "run = ocr_backend._run_tesseract\n"
+            "ocr_backend._run_tesseract = lambda *args: calls.append(args) or run(*args)\n"
+            "start = time.perf_counter()\n"
+            f"ocr_backend.probe_tesseract(cache_path={cache_path!r})\n"
+            "print((time.perf_counter() - start) * 1000, len(calls))")
+    proc = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                          cwd=os.path.dirname(os.path.abspath(__file__)))
+    if proc.returncode:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+    elapsed, calls = proc.stdout.split()
+    return float(elapsed), int(calls)
+
+
+def bench_startup(args):
+    """入口模块的导入耗时（python -X importtime，新进程中多次运行取中位数）和Tesseract探测缓存
+
+    超过耗时上限、启动时导入了 HEAVY_MODULES 中的模块、或缓存后仍执行探测子进程时返回非零。
+    """
+    import statistics
+
+    failed = 0
+    print(f"{'模块':<8}{'导入耗时(毫秒)':>16}{'上限(毫秒)':>12}  最慢的依赖")
+    for module in args.modules:
+        runs = [_import_time(module) for _ in range(args.repeat)]
+        elapsed = statistics.median(total for total, _ in runs)
+        modules = runs[-1][1]
+        budget = args.budget_ms or STARTUP_BUDGETS.get(module)
+        slowest = sorted((name for name in modules if name != module and '.' not in name),
+                         key=modules.get, reverse=True)[:3]
+        print(f"{module:<8}{elapsed:>16.1f}{budget or '-':>12}  "
+              f"{', '.join(f'{name} {modules[name]:.0f}' for name in slowest)}")
+        heavy = [name for name in HEAVY_MODULES if name in modules]
+        if heavy:
+            failed += 1
+            print(f"  启动时导入了: {', '.join(heavy)}")
+        if budget and elapsed > budget:
+            failed += 1
+            print(f"  导入耗时超过上限: {elapsed:.1f} > {budget}")
+
+    # Tesseract探测：第一次执行 --version / --list-langs 并写入缓存，之后的进程直接读取缓存
+    temp_dir = tempfile.mkdtemp(prefix='bench_startup_')
+    try:
+        cache_path = os.path.join(temp_dir, 'tesseract_probe.json')
+        cold, cold_calls = _probe_in_child(cache_path)
+        warm, warm_calls = _probe_in_child(cache_path)
+        print(f"Tesseract探测: 首次 {cold:.1f}毫秒（{cold_calls}个子进程），缓存后 {warm:.1f}毫秒（{warm_calls}个子进程）")
+        if warm_calls:
+            failed += 1
+            print("  缓存后仍执行了探测子进程")
+    except (RuntimeError, ValueError) as e:
+        print(f"Tesseract探测失败: {str(e)}")
+        failed += 1
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    print("启动检查通过" if not failed else "启动检查未通过")
+    return 1 if failed else 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='发票处理工具性能测试')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    ocr = subparsers.add_parser('ocr-backends', help='比较OCR后端的识别吞吐量')
+    ocr.add_argument('input_dir', nargs='?', default='.', help='支付截图所在目录（默认当前目录）')
+    ocr.add_argument('--backends', nargs='+', help='要比较的后端（默认所有可用后端）')
+    ocr.add_argument('--limit', type=int, help='最多使用的图片数')
+    ocr.add_argument('--workers', type=int, default=1, help='识别线程数（默认1）')
+    ocr.add_argument('--cascade', action='store_true', help='使用级联识别')
+    ocr.set_defaults(func=bench_ocr_backends)
+
+    resolution = subparsers.add_parser('resolution', help='各分辨率分组的识别耗时和准确率（合成截图）')
+    resolution.add_argument('--samples', type=int, default=3, help='每个分辨率分组的图片数（默认3）')
+    resolution.add_argument('--glyph-height', type=int, help='归一化的目标字高')
+    resolution.add_argument('--ocr-backend', default='auto', help='OCR后端（默认auto）')
+    resolution.add_argument('--seed', type=int, default=1, help='随机种子')
+    resolution.set_defaults(func=bench_resolution)
+
+    grammar = subparsers.add_parser('amount-grammar', help='金额语法与原来逐个模式匹配的耗时比较（随机语料）')
+    grammar.add_argument('--samples', type=int, default=5000, help='随机文本段数（默认5000）')
+    grammar.add_argument('--repeat', type=int, default=3, help='计时重复次数（默认3）')
+    grammar.add_argument('--seed', type=int, default=1, help='随机种子')
+    grammar.set_defaults(func=bench_amount_grammar)
+
+    fields = subparsers.add_parser('invoice-fields', help='发票字段扫描器与原来逐个模式列表匹配的耗时比较（合成发票文本）')
+    fields.add_argument('--samples', type=int, default=1000, help='合成发票数（默认1000）')
+    fields.add_argument('--repeat', type=int, default=3, help='计时重复次数（默认3）')
+    fields.add_argument('--seed', type=int, default=1, help='随机种子')
+    fields.set_defaults(func=bench_invoice_fields)
+
+    pdf_text = subparsers.add_parser('pdf-text', help='比较PDF文本后端和提前停止解析的耗时（合成多页发票）')
+    pdf_text.add_argument('--samples', type=int, default=30, help='合成发票数（默认30）')
+    pdf_text.add_argument('--pages', type=int, nargs='+', default=[1, 1, 2, 5, 30], help='发票页数的候选值')
+    pdf_text.add_argument('--backends', nargs='+', help='要比较的后端（默认所有可用后端）')
+    pdf_text.add_argument('--seed', type=int, default=1, help='随机种子')
+    pdf_text.set_defaults(func=bench_pdf_text)
+
+    invoice_qr = subparsers.add_parser('invoice-qr', help='发票二维码快速路径的耗时和准确率（合成发票）')
+    invoice_qr.add_argument('--samples', type=int, default=100, help='合成发票数（默认100）')
+    invoice_qr.add_argument('--pages', type=int, nargs='+', default=[1, 1, 1, 2, 5], help='发票页数的候选值')
+    invoice_qr.add_argument('--decoys', type=float, default=0.3, help='备注中有更大金额的发票比例（默认0.3）')
+    invoice_qr.add_argument('--pdf-backend', default='auto', help='PDF文本后端（默认auto）')
+    invoice_qr.add_argument('--seed', type=int, default=1, help='随机种子')
+    invoice_qr.set_defaults(func=bench_invoice_qr)
+
+    templates = subparsers.add_parser('invoice-templates', help='发票版式模板的准确率和耗时（合成版式发票）')
+    templates.add_argument('--samples', type=int, default=90, help='合成发票数（默认90）')
+    templates.add_argument('--decoys', type=float, default=0.3, help='备注中有更大金额的发票比例（默认0.3）')
+    templates.add_argument('--pdf-backend', default='auto', help='PDF文本后端（默认auto）')
+    templates.add_argument('--seed', type=int, default=1, help='随机种子')
+    templates.set_defaults(func=bench_invoice_templates)
+
+    pdf_ocr = subparsers.add_parser('pdf-ocr', help='扫描件OCR识别的一致性、渲染缓存和内存上限（合成扫描件）')
+    pdf_ocr.add_argument('--samples', type=int, default=5, help='合成扫描件数（默认5，最后一张为大幅面）')
+    pdf_ocr.add_argument('--scan-dpi', type=int, default=150, help='模拟扫描的分辨率（默认150）')
+    pdf_ocr.add_argument('--ocr-dpi', type=int, default=300, help='识别时的渲染分辨率（默认300）')
+    pdf_ocr.add_argument('--max-pixels', type=int, default=16_000_000, help='单页渲染的最大像素数')
+    pdf_ocr.add_argument('--lang', default='chi_sim', help='OCR语言（默认chi_sim）')
+    pdf_ocr.add_argument('--seed', type=int, default=1, help='随机种子')
+    pdf_ocr.set_defaults(func=bench_pdf_ocr)
+
+    pdf_merge = subparsers.add_parser('pdf-merge', help='合并PDF的峰值内存和输出大小：PyPDF2 与流式写入（合成发票）')
+    pdf_merge.add_argument('--samples', type=int, default=5000, help='合成发票数（默认5000）')
+    pdf_merge.add_argument('--pages', type=int, nargs='+', default=[1, 1, 1, 2], help='每张发票的页数（随机选择）')
+    pdf_merge.add_argument('--pdf-backend', default='auto', help='读取PDF的后端（默认auto）')
+    pdf_merge.add_argument('--skip-pypdf2', action='store_true', help='不运行原方式（PyPDF2）')
+    pdf_merge.add_argument('--seed', type=int, default=1, help='随机种子')
+    pdf_merge.set_defaults(func=bench_pdf_merge)
+
+    image_merge = subparsers.add_parser('image-merge', help='支付截图合并为PDF的峰值内存和输出大小：PIL 与流式写入（合成截图）')
+    image_merge.add_argument('--samples', type=int, default=200, help='合成截图数（默认200）')
+    image_merge.add_argument('--width', type=int, default=1080, help='截图宽度（默认1080）')
+    image_merge.add_argument('--height', type=int, default=2340, help='截图高度（默认2340）')
+    image_merge.add_argument('--skip-pil', action='store_true', help='不运行原方式（PIL，内存占用随截图数增长）')
+    image_merge.add_argument('--seed', type=int, default=1, help='随机种子')
+    image_merge.set_defaults(func=bench_image_merge)
+
+    matching = subparsers.add_parser('matching', help='发票和支付截图匹配的耗时和准确率：原方式与索引匹配（合成文件名和金额）')
+    matching.add_argument('--sizes', type=int, nargs='+', default=[1000, 5000, 20000], help='发票数（默认1000 5000 20000）')
+    matching.add_argument('--legacy-limit', type=int, default=5000, help='原方式（逐对比较）只在发票数不超过此值时运行')
+    matching.add_argument('--budget', type=float, default=1.0, help='索引匹配的耗时上限（秒，默认1）')
+    matching.add_argument('--seed', type=int, default=1, help='随机种子')
+    matching.set_defaults(func=bench_matching)
+
+    combine = subparsers.add_parser('combine', help='合并发票和支付记录：CSV往返逐行合并与内存记录合并的耗时')
+    combine.add_argument('--rows', type=int, default=60000, help='发票数（默认60000）')
+    combine.add_argument('--seed', type=int, default=1, help='随机种子')
+    combine.set_defaults(func=bench_combine)
+
+    load = subparsers.add_parser('load-test', help='同时提交多个文件夹的处理任务，检查输出互不干扰且结果正确（合成发票和截图）')
+    load.add_argument('--jobs', type=int, default=4, help='同时提交的文件夹数（默认4）')
+    load.add_argument('--invoices', type=int, default=20, help='每个文件夹的发票数（默认20）')
+    load.add_argument('--screenshots', type=int, default=2, help='每个文件夹的支付截图数（默认2）')
+    load.add_argument('--ocr-concurrency', type=int, help='整个进程同时进行的OCR调用数（默认与界面相同，为CPU核数）')
+    load.add_argument('--seed', type=int, default=1, help='随机种子')
+    load.set_defaults(func=bench_load_test)
+
+    startup = subparsers.add_parser('startup', help='入口模块的导入耗时（-X importtime）和Tesseract探测缓存，超过上限时返回非零')
+    startup.add_argument('modules', nargs='*', default=['main', 'app'], help='要检查的入口模块（默认 main app）')
+    startup.add_argument('--repeat', type=int, default=5, help='每个模块导入的次数，取中位数（默认5）')
+    startup.add_argument('--budget-ms', type=float, help='导入耗时上限（毫秒，默认 main 120、app 400）')
+    startup.set_defaults(func=bench_startup)
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    _quiet_logging()
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
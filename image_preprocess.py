@@ -0,0 +1,304 @@
+import os
+import functools
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+from amount_region import estimate_glyph_height, find_text_lines
+
+# 预处理版本，修改读取或缩放逻辑时递增（参与OCR缓存的配置指纹）
+PREPROCESS_VERSION = 1
+
+# 缩小解码后图片的长边不小于该值，保证小字号文字仍可识别
+MIN_DECODE_SIDE = 1800
+
+# 正文字符高度的目标值（像素），Tesseract在字高约30像素时识别效果最好
+DEFAULT_GLYPH_HEIGHT = 32
+
+# 缩放比例范围，以及不缩放的容差
+MIN_SCALE = 0.25
+MAX_SCALE = 2.0
+SCALE_TOLERANCE = 0.15
+
+# 估计字高时，短边超过该值的图片先缩小一半再分析
+ESTIMATE_HALF_SIDE = 1000
+
+# 缩小解码的倍数 -> OpenCV读取标志的名称（cv2 在第一次读取图片时才导入）
+_REDUCED_GRAYSCALE = {
+    2: 'IMREAD_REDUCED_GRAYSCALE_2',
+    4: 'IMREAD_REDUCED_GRAYSCALE_4',
+    8: 'IMREAD_REDUCED_GRAYSCALE_8'
+}
+
+
+def is_payment_image(filename):
+    """支付截图：文件名包含log的jpg/jpeg/png图片"""
+    name = os.path.basename(filename).lower()
+    return 'log' in name and name.endswith(('.jpg', '.jpeg', '.png'))
+
+
+def decode_factor(image_path):
+    """根据图片尺寸选择缩小解码的倍数（1/2/4/8），只读取文件头"""
+    from PIL import Image
+    try:
+        with Image.open(image_path) as img:
+            long_side = max(img.size)
+    except Exception:
+        return 1
+    factor = 1
+    while factor < 8 and long_side / (factor * 2) >= MIN_DECODE_SIDE:
+        factor *= 2
+    return factor
+
+
+def _estimate_glyph_height(gray):
+    """估计正文字高，大图在一半尺寸上分析以减少连通域分析的耗时"""
+    import cv2
+    if min(gray.shape[:2]) < ESTIMATE_HALF_SIDE:
+        return estimate_glyph_height(gray)
+    half = cv2.resize(gray, None, fx=0.5, fy=0.5, interpolation=cv2.INTER_AREA)
+    glyph_height = estimate_glyph_height(half, min_height=3)
+    return glyph_height * 2 if glyph_height is not None else None
+
+
+def read_gray(image_path, factor=1):
+    """读取灰度图，factor 为缩小解码的倍数（JPEG在解码时直接缩小），读取失败返回None
+
+    使用 np.fromfile + imdecode 读取，支持Windows下的中文路径。
+    """
+    import cv2
+    import numpy as np
+    try:
+        data = np.fromfile(str(image_path), dtype=np.uint8)
+    except OSError:
+        return None
+    gray = cv2.imdecode(data, getattr(cv2, _REDUCED_GRAYSCALE.get(factor, 'IMREAD_GRAYSCALE')))
+    if gray is None and factor > 1:
+        gray = cv2.imdecode(data, cv2.IMREAD_GRAYSCALE)
+    return gray
+
+
+def normalize_resolution(gray, target_glyph_height=DEFAULT_GLYPH_HEIGHT, glyph_height=None):
+    """按正文字高缩放图片，返回 (缩放后的图片, 缩放比例)
+
+    不同分辨率的截图和照片缩放后字号大致相同，后续的二值化和OCR都在统一的尺度上进行。
+    """
+    if not target_glyph_height:
+        return gray, 1.0
+    if glyph_height is None:
+        glyph_height = _estimate_glyph_height(gray)
+    if glyph_height is None:
+        return gray, 1.0
+
+    scale = min(MAX_SCALE, max(MIN_SCALE, target_glyph_height / glyph_height))
+    if abs(scale - 1.0) <= SCALE_TOLERANCE:
+        return gray, 1.0
+    import cv2
+    interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC
+    return cv2.resize(gray, None, fx=scale, fy=scale, interpolation=interpolation), scale
+
+
+def load_gray(image_path, target_glyph_height=DEFAULT_GLYPH_HEIGHT):
+    """读取灰度图并归一化分辨率，返回 (图片, 相对原图的缩放比例)，读取失败时图片为None
+
+    超大图片先缩小解码；如果缩小后字高已经低于目标值，按估计的字高改用较小的倍数重新解码，
+    避免先缩小再放大损失细节。
+    """
+    if not target_glyph_height:
+        return read_gray(image_path), 1.0
+
+    factor = decode_factor(image_path)
+    gray = read_gray(image_path, factor)
+    if gray is None:
+        return None, 1.0
+
+    glyph_height = _estimate_glyph_height(gray)
+    if factor > 1 and glyph_height is not None and target_glyph_height / glyph_height > 1 + SCALE_TOLERANCE:
+        full_glyph_height = glyph_height * factor
+        new_factor = factor
+        while new_factor > 1 and full_glyph_height / new_factor < target_glyph_height:
+            new_factor //= 2
+        reduced = read_gray(image_path, new_factor)
+        if reduced is not None:
+            gray = reduced
+            glyph_height = full_glyph_height / new_factor
+            factor = new_factor
+
+    gray, scale = normalize_resolution(gray, target_glyph_height, glyph_height)
+    return gray, scale / factor
+
+
+def _clahe(gray):
+    import cv2
+    return cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8)).apply(gray)
+
+
+def _otsu(gray):
+    import cv2
+    return cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
+
+
+def _adaptive(gray):
+    import cv2
+    return cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)
+
+
+# 图像处理版本：名称 -> (来源版本, 处理函数)
+VARIANTS = {
+    'clahe': ('gray', _clahe),                # CLAHE增强
+    'clahe_otsu': ('clahe', _otsu),           # CLAHE增强后Otsu二值化
+    'clahe_adaptive': ('clahe', _adaptive),   # CLAHE增强后自适应二值化
+    'otsu': ('gray', _otsu),                  # 灰度图直接Otsu二值化
+    'adaptive': ('gray', _adaptive)           # 灰度图直接自适应二值化
+}
+
+
+class PreprocessedImage:
+    """一张图片的预处理结果：只解码一次，各图像处理版本在第一次使用时生成并缓存
+
+    box 不为None时表示图片中 (x, y, w, h) 区域的裁剪图及其图像处理版本。
+    """
+
+    def __init__(self, image_path, target_glyph_height=DEFAULT_GLYPH_HEIGHT, on_grow=None):
+        self.image_path = image_path
+        self.target_glyph_height = target_glyph_height
+        self.scale = 1.0
+        # on_grow(图片, 增加的字节数)：解码或生成图像处理版本后调用（ImageStore 据此统计内存）
+        self.on_grow = on_grow
+        self._nbytes = 0
+        self._gray = None
+        self._loaded = False
+        self._variants = {}
+        self._regions = {}
+        self._lock = threading.RLock()
+
+    def load(self):
+        """解码并归一化分辨率，读取失败返回False"""
+        with self._lock:
+            if not self._loaded:
+                self._loaded = True
+                self._gray, self.scale = load_gray(self.image_path, self.target_glyph_height)
+                if self._gray is not None:
+                    self._grow(self._gray.nbytes)
+            return self._gray is not None
+
+    @property
+    def gray(self):
+        self.load()
+        return self._gray
+
+    def variant(self, name, box=None):
+        """返回图像处理版本（'gray' 或 VARIANTS 中的名称）"""
+        with self._lock:
+            if name == 'gray' and box is None:
+                return self.gray
+            key = (name, box)
+            if key not in self._variants:
+                if name == 'gray':
+                    x, y, w, h = box
+                    self._variants[key] = self.gray[y:y + h, x:x + w]
+                else:
+                    source, build = VARIANTS[name]
+                    self._variants[key] = build(self.variant(source, box))
+                    self._grow(self._variants[key].nbytes)
+            return self._variants[key]
+
+    def regions(self, min_height, max_regions):
+        """字号最大的几行文字的区域 [(x, y, w, h, 字高)]"""
+        with self._lock:
+            key = (min_height, max_regions)
+            if key not in self._regions:
+                self._regions[key] = find_text_lines(self.gray, min_height, max_regions) if self.load() else []
+            return self._regions[key]
+
+    def _grow(self, nbytes):
+        self._nbytes += nbytes
+        if self.on_grow is not None:
+            self.on_grow(self, nbytes)
+
+    def nbytes(self):
+        """已解码和已生成的图像占用的内存（裁剪图与原图共用内存，不重复计算）"""
+        return self._nbytes
+
+
+class VariantView(Mapping):
+    """按显示名称访问 PreprocessedImage 的图像处理版本：{名称: (版本, 区域)}
+
+    只有取值时才生成对应的图像。
+    """
+
+    def __init__(self, image, names):
+        self.image = image
+        self.names = names
+
+    def __getitem__(self, key):
+        name, box = self.names[key]
+        return self.image.variant(name, box)
+
+    def __contains__(self, key):
+        return key in self.names
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+
+class ImageStore:
+    """按图片文件缓存 PreprocessedImage 的有界LRU，两个分析器共用，同一张截图只解码一次
+
+    以 (路径, 大小, 修改时间, 目标字高) 为键，总内存超过 max_bytes 时淘汰最久未使用的图片。
+    图片解码和按需生成图像处理版本时都会更新占用的内存并检查上限，而不只是在取出图片时。
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._images = OrderedDict()
+        self._sizes = {}
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def get(self, image_path, target_glyph_height=DEFAULT_GLYPH_HEIGHT):
+        try:
+            stat = os.stat(image_path)
+            key = (os.path.abspath(image_path), stat.st_size, stat.st_mtime_ns, target_glyph_height)
+        except OSError:
+            return PreprocessedImage(image_path, target_glyph_height)
+
+        with self._lock:
+            image = self._images.pop(key, None)
+            if image is None:
+                image = PreprocessedImage(image_path, target_glyph_height, functools.partial(self._grown, key))
+                self._sizes[key] = 0
+            self._images[key] = image
+            self._evict()
+        return image
+
+    def _grown(self, key, image, nbytes):
+        """图片解码或生成了图像处理版本；已被淘汰的图片不再计入"""
+        with self._lock:
+            if self._images.get(key) is not image:
+                return
+            self._sizes[key] += nbytes
+            self._total += nbytes
+            self._evict()
+
+    def _evict(self):
+        while self._total > self.max_bytes and len(self._images) > 1:
+            key, _ = self._images.popitem(last=False)
+            self._total -= self._sizes.pop(key)
+
+    def nbytes(self):
+        """缓存中的图片占用的内存"""
+        with self._lock:
+            return self._total
+
+    def clear(self):
+        with self._lock:
+            self._images.clear()
+            self._sizes.clear()
+            self._total = 0
+
+
+# 两个分析器默认共用的图片缓存
+shared_store = ImageStore()
@@ -0,0 +1,394 @@
+import os
+import sys
+import json
+import time
+import select
+import struct
+import logging
+import traceback
+import ctypes
+import ctypes.util
+from datetime import datetime
+from result_cache import file_sha256
+from pdf_stream_writer import StreamingPDFWriter
+from image_preprocess import is_payment_image
+from pipeline import combine_results
+from records import InvoiceRecord
+
+logger = logging.getLogger(__name__)
+
+
+def is_invoice_pdf(filename):
+    """发票PDF"""
+    return filename.lower().endswith('.pdf')
+
+
+class RunManifest:
+    """增量处理清单：记录每个输入文件的 (大小, 修改时间, 内容哈希) 及其处理结果
+
+    大小和修改时间都未变化时直接认为文件未变化；只有修改时间变化时再比较内容哈希。
+    处理配置变化时清单整体失效。merged 记录合并PDF中每个文件的页面，用于增量更新合并文件；
+    其中 pending 为上次没有合并成功的文件，下次运行时重新追加。
+    """
+
+    VERSION = 1
+
+    def __init__(self, path, input_dir, config):
+        self.path = path
+        self.input_dir = os.path.abspath(input_dir)
+        self.config = config
+        self.entries = {}
+        self.merged = {}
+        self.load()
+
+    def load(self):
+        """读取清单，输入目录或处理配置不一致时从空清单开始"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"无法读取处理清单，将重新处理所有文件: {str(e)}")
+            return
+
+        if (data.get('version') != self.VERSION or data.get('input_dir') != self.input_dir
+                or data.get('config') != self.config):
+            logger.info("处理配置已变化，将重新处理所有文件")
+            return
+        self.entries = data.get('entries', {})
+        self.merged = data.get('merged', {})
+
+    def save(self):
+        """保存清单（先写临时文件再替换，避免中断时损坏）"""
+        output_dir = os.path.dirname(self.path)
+        if output_dir and not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': self.VERSION,
+                'input_dir': self.input_dir,
+                'config': self.config,
+                'updated': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'entries': self.entries,
+                'merged': self.merged
+            }, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def is_current(self, name, file_path):
+        """文件自上次处理后是否未变化"""
+        entry = self.entries.get(name)
+        if entry is None:
+            return False
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return False
+        if stat.st_size != entry['size']:
+            return False
+        if stat.st_mtime == entry['mtime']:
+            return True
+
+        # 修改时间变化但内容可能相同（例如重新复制），比较内容哈希
+        if file_sha256(file_path) != entry['sha256']:
+            return False
+        entry['mtime'] = stat.st_mtime
+        return True
+
+    def result(self, name):
+        """文件上次处理成功的结果，没有记录时返回None"""
+        entry = self.entries.get(name)
+        return entry['result'] if entry else None
+
+    def update(self, name, file_path, result):
+        """记录文件的处理结果"""
+        stat = os.stat(file_path)
+        self.entries[name] = {
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'sha256': file_sha256(file_path),
+            'result': result
+        }
+
+    def discard(self, name):
+        """删除文件的记录（处理失败），下次运行时重新处理"""
+        self.entries.pop(name, None)
+
+    def prune(self, names):
+        """删除已不存在的文件，返回被删除的文件名"""
+        removed = [name for name in self.entries if name not in names]
+        for name in removed:
+            del self.entries[name]
+        return removed
+
+
+class IncrementalRunner:
+    """增量处理：只处理新增或修改的发票和支付截图，并更新合并结果"""
+
+    def __init__(self, pdf_analyzer, payment_tester, input_dir='.', output_dir='output', formats=('csv',)):
+        self.pdf_analyzer = pdf_analyzer
+        self.payment_tester = payment_tester
+        self.input_dir = input_dir
+        self.output_dir = output_dir
+        self.formats = formats  # 结果文件的导出格式（见 records.EXPORT_FORMATS）
+        self.manifest_path = os.path.join(output_dir, 'manifest.json')
+
+    def run(self):
+        """执行一次增量处理，没有任何变化时返回False"""
+        manifest = RunManifest(self.manifest_path, self.input_dir, {
+            'pdf': self.pdf_analyzer.extractor_fingerprint(),
+            'image': self.payment_tester.config_fingerprint()
+        })
+
+        filenames = sorted(os.listdir(self.input_dir))
+        pdf_names = [f for f in filenames if is_invoice_pdf(f)]
+        image_names = [f for f in filenames if is_payment_image(f)]
+
+        changed_pdfs = [f for f in pdf_names if not manifest.is_current(f, self._path(f))]
+        changed_images = [f for f in image_names if not manifest.is_current(f, self._path(f))]
+        removed = manifest.prune(set(pdf_names) | set(image_names))
+
+        # 上次合并失败的文件即使没有变化也要重新追加
+        date_str = datetime.now().strftime("%Y%m%d")
+        merged_pdf = os.path.join(self.output_dir, f'merged_{date_str}.pdf')
+        merged_log_pdf = os.path.join(self.output_dir, f'merged_{date_str}_log.pdf')
+        pending = [path for path in (merged_pdf, merged_log_pdf)
+                   if manifest.merged.get(os.path.basename(path), {}).get('pending')]
+
+        combined_file = os.path.join(self.output_dir, 'combined_results.csv')
+        if not (changed_pdfs or changed_images or removed or pending) and os.path.exists(combined_file):
+            logger.info("没有新增、修改或删除的文件，跳过处理")
+            manifest.save()
+            return False
+
+        logger.info(f"\n增量处理: 发票 {len(changed_pdfs)}/{len(pdf_names)} 个需要处理, "
+                    f"支付截图 {len(changed_images)}/{len(image_names)} 张需要处理, "
+                    f"已删除 {len(removed)} 个文件, 合并失败待重试 {len(pending)} 个合并文件")
+
+        # 只处理新增或修改的文件
+        if changed_pdfs:
+            infos = self.pdf_analyzer.extract_pdfs([self._path(f) for f in changed_pdfs])
+            for name, info in zip(changed_pdfs, infos):
+                # 提取失败的文件不记录，下次运行时重试
+                if not info:
+                    manifest.discard(name)
+                    continue
+                info = {key: value for key, value in info.items() if key != 'filename'}
+                manifest.update(name, self._path(name), info)
+
+        if changed_images:
+            extracted = self.payment_tester.extract_payments([self._path(f) for f in changed_images])
+            for name in changed_images:
+                amount, passes = extracted[self._path(name)]
+                # 没有识别出金额（包括读取失败）的截图不记录，下次运行时重试（OCR结果缓存使重试的开销很小）
+                if amount is None:
+                    manifest.discard(name)
+                    continue
+                manifest.update(name, self._path(name), {'amount': amount, 'passes': passes})
+
+        manifest.save()
+
+        # 用清单中的全部结果重新生成汇总文件
+        invoices = [InvoiceRecord.from_info(dict(manifest.result(name), filename=name))
+                    for name in pdf_names if manifest.result(name)]
+        payments = []
+        for name in image_names:
+            result = manifest.result(name)
+            if result:
+                payments.append((name, result['amount'], result['passes']))
+        payment_results = self.payment_tester.payment_records(payments, pdf_names)
+
+        self.pdf_analyzer.save_invoice_results(invoices, self.output_dir, self.formats)
+        combine_results(invoices, payment_results, self.output_dir, self.formats)
+
+        # 只在文件有变化或上次有文件合并失败时更新合并PDF
+        removed_pdfs = [f for f in removed if is_invoice_pdf(f)]
+        removed_images = [f for f in removed if is_payment_image(f)]
+        if changed_pdfs or removed_pdfs or merged_pdf in pending or not os.path.exists(merged_pdf):
+            self._update_merged(manifest, merged_pdf, pdf_names, self.pdf_analyzer.append_to_merge)
+        if changed_images or removed_images or merged_log_pdf in pending or not os.path.exists(merged_log_pdf):
+            self._update_merged(manifest, merged_log_pdf, image_names, self.payment_tester.append_to_merge)
+
+        manifest.save()
+        return True
+
+    def _update_merged(self, manifest, output_file, names, append):
+        """更新合并PDF：只追加新增或修改的文件的页面，已删除的文件的页面从页面树中去掉
+
+        合并文件以PDF增量更新的方式追加写入（见 StreamingPDFWriter 的 resume），未变化的文件不再读取和复制。
+        没有上次的记录、合并文件被修改过，或去掉的页面多于保留的页面（文件中无用的数据过多）时重新合并所有文件。
+        append(writer, path) 追加一个文件的页面，失败时返回False：该文件记录在 pending 中，下次运行时
+        即使没有文件变化也重新追加；更新出错时保留上次的记录，同样在下次运行时重试。
+        """
+        key = os.path.basename(output_file)
+        if not names:
+            logger.warning(f"没有文件可供合并: {key}")
+            manifest.merged.pop(key, None)
+            return
+
+        stats = {}
+        for name in names:
+            stat = os.stat(self._path(name))
+            stats[name] = [stat.st_size, stat.st_mtime]
+
+        merged = manifest.merged.pop(key, None) or {}
+        previous = merged.get('files', {})
+        kept = {name: entry for name, entry in previous.items() if stats.get(name) == entry['stat']}
+        dropped = merged.get('dropped', 0) + sum(len(entry['pages']) for name, entry in previous.items()
+                                                 if name not in kept)
+        writer = None
+        try:
+            if merged.get('writer') and dropped <= sum(len(entry['pages']) for entry in kept.values()):
+                try:
+                    writer = StreamingPDFWriter(output_file, resume=merged['writer'])
+                except (OSError, ValueError) as e:
+                    logger.info(f"重新合并所有文件: {str(e)}")
+            if writer is None:
+                writer = StreamingPDFWriter(output_file)
+                kept, dropped = {}, 0
+
+            files, failed = {}, []
+            for name in names:
+                if name in kept:
+                    files[name] = kept[name]
+                    continue
+                start = len(writer.pages)
+                succeeded = append(writer, self._path(name))
+                pages = writer.pages[start:]
+                if succeeded:
+                    files[name] = {'stat': stats[name], 'pages': pages}
+                else:
+                    failed.append(name)
+                    dropped += len(pages)
+
+            # 按文件名排序页面，与重新合并的结果一致
+            writer.set_pages([page for name in names if name in files for page in files[name]['pages']])
+            writer.close()
+            manifest.merged[key] = {'writer': writer.state, 'files': files, 'dropped': dropped, 'pending': failed}
+            logger.info(f"合并PDF已更新: {output_file}，追加 {writer.documents} 个文件，共 {writer.page_count} 页")
+            if failed:
+                logger.warning(f"{len(failed)} 个文件合并失败，下次运行时重试: {', '.join(failed)}")
+        except Exception as e:
+            logger.error(f"更新合并PDF时出错 {output_file}: {str(e)}")
+            traceback.print_exc()
+            manifest.merged[key] = dict(merged, pending=[name for name in names if name not in kept])
+        finally:
+            # 出错时放弃本次写入（继续写入时截断回原来的长度）；已完成时不做任何处理
+            if writer is not None:
+                writer.abort()
+
+    def _path(self, name):
+        return os.path.join(self.input_dir, name)
+
+
+class _InotifyWatcher:
+    """基于Linux inotify的目录监视"""
+
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_DELETE = 0x00000200
+    EVENT_HEADER = struct.Struct('iIII')
+
+    def __init__(self, path):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 失败')
+        mask = self.IN_CLOSE_WRITE | self.IN_MOVED_FROM | self.IN_MOVED_TO | self.IN_DELETE
+        if libc.inotify_add_watch(self.fd, os.fsencode(path), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f'inotify_add_watch 失败: {path}')
+
+    def wait(self, timeout=None):
+        """等待文件事件，返回发生变化的文件名列表（超时返回空列表）"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        data = os.read(self.fd, 64 * 1024)
+        names = []
+        offset = 0
+        while offset + self.EVENT_HEADER.size <= len(data):
+            _, _, _, length = self.EVENT_HEADER.unpack_from(data, offset)
+            offset += self.EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if name:
+                names.append(os.fsdecode(name))
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+
+class _PollingWatcher:
+    """定期比较目录快照的监视方式（非Linux系统或inotify不可用时使用）"""
+
+    def __init__(self, path, interval=5.0):
+        self.path = path
+        self.interval = interval
+        self.snapshot = self._scan()
+
+    def _scan(self):
+        snapshot = {}
+        for name in os.listdir(self.path):
+            try:
+                stat = os.stat(os.path.join(self.path, name))
+            except OSError:
+                continue
+            snapshot[name] = (stat.st_size, stat.st_mtime)
+        return snapshot
+
+    def wait(self, timeout=None):
+        time.sleep(self.interval if timeout is None else min(timeout, self.interval))
+        current = self._scan()
+        changed = [name for name in set(current) | set(self.snapshot)
+                   if current.get(name) != self.snapshot.get(name)]
+        self.snapshot = current
+        return changed
+
+    def close(self):
+        pass
+
+
+def watch_folder(input_dir, callback, debounce=2.0):
+    """监视文件夹，有发票或支付截图写入、移动或删除时调用 callback
+
+    连续的文件事件会合并：最后一个事件后 debounce 秒内没有新事件才开始处理。
+    callback 出错时记录错误后继续监视，下一次文件变化时重新处理。
+    """
+    watcher = None
+    if sys.platform.startswith('linux'):
+        try:
+            watcher = _InotifyWatcher(input_dir)
+            logger.info(f"使用inotify监视文件夹: {os.path.abspath(input_dir)}")
+        except (OSError, AttributeError) as e:
+            logger.warning(f"inotify不可用，改为定期扫描: {str(e)}")
+    if watcher is None:
+        watcher = _PollingWatcher(input_dir)
+        logger.info(f"定期扫描文件夹: {os.path.abspath(input_dir)}")
+
+    try:
+        _run_callback(callback)
+        while True:
+            names = watcher.wait()
+            if not any(is_invoice_pdf(name) or is_payment_image(name) for name in names):
+                continue
+
+            # 等待文件写入完成
+            while watcher.wait(debounce):
+                pass
+            _run_callback(callback)
+    finally:
+        watcher.close()
+
+
+def _run_callback(callback):
+    """执行一次处理，出错时只记录错误，不结束监视"""
+    try:
+        callback()
+    except Exception as e:
+        logger.error(f"处理文件夹时出错，等待下一次文件变化: {str(e)}")
+        traceback.print_exc()
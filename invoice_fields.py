@@ -0,0 +1,289 @@
+import re
+from functools import lru_cache
+
+# 锚点关键字：(名称, 关键字)。以关键字为前缀（或后缀）的模式只在关键字出现的位置附近尝试匹配。
+# "No"、"¥"在英文单词和明细行中大量出现，作为锚点反而更慢，以它们开头的模式直接在全文上匹配
+ANCHOR_KEYS = [
+    ('invoice_number', '发票号码'),
+    ('invoice_code', '发票代码'),
+    ('date', '日期'),
+    ('name', '名'),
+    ('seller', '销'),
+    ('supplier', '供'),
+    ('amount', '金额'),
+    ('total', '合'),
+    ('lowercase', '小写'),
+    ('rmb', '人民币'),
+    ('sum', '总额'),
+]
+
+
+class AnchorIndex:
+    """一段文本中各锚点关键字的出现位置
+
+    位置用 str.find（C实现的子串搜索）按需逐个查找并记录，由所有使用该关键字的模式共用；
+    只用到第一个位置的模式不会触发后面位置的查找。
+    """
+
+    KEYS = dict(ANCHOR_KEYS)
+
+    def __init__(self, text):
+        self.text = text
+        self._positions = {}    # 名称 -> 已找到的位置
+        self._finished = set()  # 已找完所有位置的关键字
+
+    def iter(self, name):
+        """按顺序返回关键字的出现位置"""
+        positions = self._positions.setdefault(name, [])
+        index = 0
+        while True:
+            if index < len(positions):
+                yield positions[index]
+                index += 1
+                continue
+            if name in self._finished:
+                return
+            position = self.text.find(self.KEYS[name], positions[-1] + 1 if positions else 0)
+            if position < 0:
+                self._finished.add(name)
+                return
+            positions.append(position)
+
+
+# 提前停止读取后面页面所需的字段（另外还需要找到价税合计金额）
+REQUIRED_FIELDS = ('invoice_number', 'invoice_date', 'supplier')
+
+# 价税合计金额："价税合计：¥xx"、"价税合计（大写）…（小写）¥xx" 等，关键字后同一行内出现的第一个数字
+TOTAL_AMOUNT_PATTERN = re.compile(r'(?:价税合计|小写)[^\n\d]*\d')
+
+# 发票二维码中的金额不含税，价税合计在 [金额, 金额 × (1 + 最高税率)] 范围内
+MAX_TAX_RATE = 0.17
+
+# 模式开头的字面文本（遇到第一个正则元字符为止）
+_LITERAL_PREFIX = re.compile(r'[^\\\[\](){}.*+?^$|]*')
+
+# 逐页检查字段是否已出现时，新页之前的文本再多检查的字符数（覆盖跨页的匹配）
+PAGE_OVERLAP = 200
+
+# 以"\s*关键字"结尾的模式（例如"2024-01-01 日期"），关键字前面部分的最大长度
+LOOKBACK_WIDTH = 16
+
+
+class _AnchoredPattern:
+    """一个字段模式及其锚点：只在锚点附近尝试匹配，结果与在全文上 search / findall 相同
+
+    匹配开头必定位于"锚点位置 - offset"（前缀锚点），或锚点前空白之前的 LOOKBACK_WIDTH 个字符内（后缀锚点）；
+    没有可用锚点的模式退回到全文匹配。
+    """
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.regex = re.compile(pattern)
+        self.anchor, self.offset, self.lookback = None, 0, False
+
+        if '|' in pattern:
+            return
+        prefix = _LITERAL_PREFIX.match(pattern).group()
+        if pattern[len(prefix):len(prefix) + 1] in ('?', '*', '+', '{'):
+            prefix = prefix[:-1]  # 最后一个字符可以省略
+        for name, key in ANCHOR_KEYS:
+            if pattern.startswith(key) and pattern[len(key):len(key) + 1] not in ('?', '*', '+', '{'):
+                self.anchor = name
+                return
+            match = re.search(key, prefix)
+            if match:
+                self.anchor, self.offset = name, match.start()
+                return
+        for name, key in ANCHOR_KEYS:
+            if re.fullmatch(r'\w+', key) and pattern.endswith(r'\s*' + key):
+                self.anchor, self.lookback = name, True
+                return
+
+    def _starts(self, text, anchors):
+        """可能的匹配开头（升序，按需生成）"""
+        if not self.lookback:
+            for position in anchors.iter(self.anchor):
+                if position >= self.offset:
+                    yield position - self.offset
+            return
+
+        last = -1
+        for position in anchors.iter(self.anchor):
+            end = position
+            while end > 0 and text[end - 1].isspace():
+                end -= 1
+            for start in range(max(last + 1, end - LOOKBACK_WIDTH), end):
+                yield start
+            last = max(last, end - 1)
+
+    def search(self, text, anchors):
+        if self.anchor is None:
+            return self.regex.search(text)
+        if not self.lookback:
+            # 第一个可能的匹配开头之前不会有匹配，从那里开始交给 search
+            start = next(self._starts(text, anchors), None)
+            return self.regex.search(text, start) if start is not None else None
+        for start in self._starts(text, anchors):
+            match = self.regex.match(text, start)
+            if match:
+                return match
+        return None
+
+    def findall(self, text, anchors):
+        """与全文 findall 相同：第一个可能的匹配开头之前不会有匹配，从那里开始交给 findall"""
+        if self.anchor is None:
+            return self.regex.findall(text)
+        start = next(self._starts(text, anchors), None)
+        return self.regex.findall(text, start) if start is not None else []
+
+
+class InvoiceFieldScanner:
+    """按锚点关键字提取发票字段
+
+    各模式共用一份锚点索引（发票号码、日期、名称、合计等关键字的位置）：以关键字开头的模式从第一个锚点处开始匹配，
+    日期写在"日期"之前的模式只检查锚点前的窗口，金额的所有匹配一次转换后取最大值。
+    模式优先级、金额取最大值等规则与逐个模式在全文上匹配时完全相同。
+    """
+
+    def __init__(self, invoice_patterns, date_patterns, supplier_patterns, amount_patterns, product_patterns):
+        self.invoice_patterns = [_AnchoredPattern(p) for p in invoice_patterns]
+        self.date_patterns = [_AnchoredPattern(p) for p in date_patterns]
+        self.supplier_patterns = [_AnchoredPattern(p) for p in supplier_patterns]
+        self.amount_patterns = [_AnchoredPattern(p) for p in amount_patterns]
+        self.product_patterns = [_AnchoredPattern(p) for p in product_patterns]
+
+    @staticmethod
+    def _first(patterns, text, anchors):
+        """按优先级返回第一个匹配的模式的匹配结果"""
+        for pattern in patterns:
+            match = pattern.search(text, anchors)
+            if match:
+                return match
+        return None
+
+    @staticmethod
+    def _amounts(values):
+        """金额字符串（去掉千分位逗号后）转换为数值，无法转换的跳过"""
+        try:
+            # 金额中没有空白，拼接后一次拆分转换，避免逐个处理
+            return list(map(float, ' '.join(values).replace(',', '').split()))
+        except ValueError:
+            amounts = []
+            for value in values:
+                try:
+                    amounts.append(float(value.replace(',', '')))
+                except ValueError:
+                    continue
+            return amounts
+
+    @staticmethod
+    def _total_near(amounts, pretax):
+        """二维码中的不含税金额对应的价税合计：税率范围内最大的金额，没有时使用不含税金额"""
+        low = float(pretax) - 0.005
+        high = float(pretax) * (1 + MAX_TAX_RATE) + 0.005
+        candidates = [amount for amount in amounts if low <= amount <= high]
+        return max(candidates) if candidates else float(pretax)
+
+    def scan(self, text, qr=None):
+        """提取发票号码、开票日期、供应商、金额和商品名称，返回与字段缓存相同格式的字典
+
+        qr 为发票二维码的内容时，发票号码和开票日期以二维码为准，不再在文本中查找；
+        金额取二维码金额（不含税）对应的价税合计，而不是文本中最大的金额。
+        """
+        anchors = AnchorIndex(text)
+
+        invoice_number = None
+        if qr:
+            invoice_number = qr['invoice_number']
+        else:
+            match = self._first(self.invoice_patterns, text, anchors)
+            if match:
+                invoice_number = match.group(1).strip()
+
+        invoice_date = None
+        if qr:
+            invoice_date = qr['invoice_date']
+        else:
+            match = self._first(self.date_patterns, text, anchors)
+            if match:
+                # 统一日期格式
+                invoice_date = match.group(1).replace('年', '-').replace('月', '-').replace('日', '').replace('/', '-')
+
+        supplier = None
+        match = self._first(self.supplier_patterns, text, anchors)
+        if match:
+            # 清理供应商名称中的特殊字符
+            supplier = re.sub(r'[^\w\s\u4e00-\u9fff]', '', match.group(1).strip())
+
+        # 金额：所有模式的所有匹配中的最大值（有二维码时为二维码金额对应的价税合计）
+        values = [value for pattern in self.amount_patterns for value in pattern.findall(text, anchors)]
+        amounts = self._amounts(values) if values else []
+        if qr:
+            amount = self._total_near(amounts, qr['amount'])
+        else:
+            amount = max(amounts) if amounts else None
+
+        product_name = None
+        match = self._first(self.product_patterns, text, anchors)
+        if match:
+            # 清理商品名称中的特殊字符
+            product_name = re.sub(r'[^\w\s\u4e00-\u9fff]', '', match.group(1).strip())
+
+        return {
+            'invoice_number': invoice_number,
+            'invoice_date': invoice_date,
+            'supplier': supplier,
+            'price': f"{amount:.2f}" if amount is not None else None,
+            'product_name': product_name
+        }
+
+
+    def is_complete(self, fields, text):
+        """发票号码、开票日期、供应商和价税合计金额是否都已找到"""
+        return (all(fields[name] is not None for name in REQUIRED_FIELDS)
+                and TOTAL_AMOUNT_PATTERN.search(text) is not None)
+
+    def _found_on_page(self, window, qr):
+        """新页（连同前一页末尾 PAGE_OVERLAP 个字符）中出现的所需字段和价税合计"""
+        anchors = AnchorIndex(window)
+        found = set()
+        if qr or self._first(self.invoice_patterns, window, anchors):
+            found.add('invoice_number')
+        if qr or self._first(self.date_patterns, window, anchors):
+            found.add('invoice_date')
+        if self._first(self.supplier_patterns, window, anchors):
+            found.add('supplier')
+        if TOTAL_AMOUNT_PATTERN.search(window):
+            found.add('total')
+        return found
+
+    def scan_pages(self, pages, stop_early=True, qr=None):
+        """逐页累积文本并提取字段，返回 (字段, 文本)
+
+        stop_early 为真时，所需字段都已找到后不再读取后面的页（pages 为惰性迭代器时后面的页不会被解析）。
+        每页只在新页中查找还没出现的字段，所有字段都出现过之后才扫描全文确认，
+        一直不完整的长发票（例如没有价税合计）的扫描量与页数成正比，而不是每页重新扫描全文。
+        """
+        text = ''
+        fields = None
+        missing = set(REQUIRED_FIELDS) | {'total'}
+        for page_text in pages:
+            start = len(text)
+            text += page_text
+            if not stop_early:
+                continue
+            if missing:
+                missing -= self._found_on_page(text[max(start - PAGE_OVERLAP, 0):], qr)
+                if missing:
+                    continue
+            fields = self.scan(text, qr)
+            if self.is_complete(fields, text):
+                return fields, text
+        return self.scan(text, qr), text
+
+
+@lru_cache(maxsize=None)
+def get_scanner(invoice_patterns, date_patterns, supplier_patterns, amount_patterns, product_patterns):
+    """按模式列表（元组）创建并缓存扫描器，解析子进程中每个PDF不需要重新编译"""
+    return InvoiceFieldScanner(invoice_patterns, date_patterns, supplier_patterns, amount_patterns,
+                               product_patterns)
@@ -0,0 +1,112 @@
+import re
+from decimal import Decimal
+
+# 二维码解析规则的版本号，修改时递增（参与发票缓存的指纹）
+QR_VERSION = 1
+
+# 增值税电子发票二维码的内容：版本,发票种类,发票代码,发票号码,金额（不含税）,开票日期,校验码,随机码
+#   01,10,044031900111,12345678,100.00,20240101,12345678901234567890,ABCD,
+# 全电发票没有发票代码，发票号码为20位：01,32,,24442000000012345678,100.00,20240101,,ABCD
+QR_PATTERN = re.compile(r'01,(?P<type>\d{2}),(?P<code>\d*),(?P<number>\d{8,20}),'
+                        r'(?P<amount>\d+(?:\.\d{1,2})?),(?P<date>\d{8})(?:,|$)')
+
+# 二维码在发票第一页左上角，嵌入图像中没有时只渲染这个区域（按页面宽高的比例）
+QR_REGION = (0, 0, 0.4, 0.45)
+QR_RENDER_DPI = 200
+
+# 发票二维码的最小边长（毫米），渲染区域中更小的方块不当作二维码
+MIN_QR_MM = 10
+
+# 小于这个尺寸的二维码图像先放大再识别（像素）
+MIN_DECODE_SIZE = 150
+
+
+def parse_invoice_qr(payload):
+    """解析发票二维码内容，不是发票二维码时返回None"""
+    match = QR_PATTERN.match(payload.strip())
+    if not match:
+        return None
+    date = match.group('date')
+    return {
+        'invoice_type': match.group('type'),
+        'invoice_code': match.group('code') or None,
+        'invoice_number': match.group('number'),
+        'invoice_date': f"{date[:4]}-{date[4:6]}-{date[6:]}",
+        'amount': Decimal(match.group('amount'))  # 不含税金额
+    }
+
+
+def _binarize(gray):
+    """深色像素为255的二值图像"""
+    import cv2
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    return binary
+
+
+def decode_qr(image, detector=None):
+    """识别只包含一个二维码（四周可以有少量空白）的灰度图像，返回其内容，没有识别出时返回空字符串
+
+    二维码的四个角就是深色像素的外接矩形，直接按角点解码，不需要在图像中检测二维码的位置。
+    """
+    import cv2
+    import numpy as np
+    if image is None or image.size == 0:
+        return ''
+    detector = detector or cv2.QRCodeDetector()
+    # 嵌入的二维码图像通常每个模块只有一两个像素，且没有四周的空白区
+    if max(image.shape[:2]) < MIN_DECODE_SIZE:
+        scale = int(np.ceil(MIN_DECODE_SIZE / max(image.shape[:2])))
+        image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_NEAREST)
+    margin = max(image.shape[:2]) // 8
+    image = cv2.copyMakeBorder(image, margin, margin, margin, margin, cv2.BORDER_CONSTANT, value=255)
+
+    x, y, width, height = cv2.boundingRect(_binarize(image))
+    if not width or not height:
+        return ''
+    corners = np.array([[[x, y], [x + width, y], [x + width, y + height], [x, y + height]]], dtype=np.float32)
+    payload, _ = detector.decode(image, corners)
+    if not payload:
+        payload, _, _ = detector.detectAndDecode(image)
+    return payload or ''
+
+
+def find_qr_regions(gray, dpi):
+    """在渲染的页面区域中找出可能是二维码的方块，返回裁剪出的图像（按面积从大到小）
+
+    二维码的模块相互靠近，膨胀后连成一个接近正方形的整体；文字行膨胀后是细长的矩形。
+    """
+    import cv2
+    import numpy as np
+    binary = _binarize(gray)
+    size = max(3, int(round(dpi / 40)))  # 约0.6毫米，大于模块间的空隙、小于文字行间距
+    merged = cv2.dilate(binary, np.ones((size, size), np.uint8))
+    contours, _ = cv2.findContours(merged, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    min_side = dpi * MIN_QR_MM / 25.4
+    boxes = []
+    for contour in contours:
+        x, y, width, height = cv2.boundingRect(contour)
+        if min(width, height) >= min_side and max(width, height) <= 1.2 * min(width, height):
+            boxes.append((x, y, width, height))
+    boxes.sort(key=lambda box: box[2] * box[3], reverse=True)
+    return [gray[y:y + height, x:x + width] for x, y, width, height in boxes]
+
+
+def read_invoice_qr(document):
+    """从PDF第一页读取发票二维码（PDFDocument），返回解析后的字段，没有发票二维码时返回None
+
+    先识别页面中嵌入的正方形图像，不需要渲染页面；二维码为矢量图形时只渲染左上角区域。
+    """
+    import cv2
+    if not document.page_count:
+        return None
+    detector = cv2.QRCodeDetector()
+    for image in document.page_images(0):
+        qr = parse_invoice_qr(decode_qr(image, detector))
+        if qr:
+            return qr
+    for image in find_qr_regions(document.render(0, QR_REGION, QR_RENDER_DPI), QR_RENDER_DPI):
+        qr = parse_invoice_qr(decode_qr(image, detector))
+        if qr:
+            return qr
+    return None
@@ -0,0 +1,132 @@
+import re
+from invoice_fields import TOTAL_AMOUNT_PATTERN
+
+# 模板定义的版本号，修改模板或区域时递增（参与发票缓存的指纹）
+TEMPLATE_VERSION = 1
+
+# 只从模板区域提取、不再解析全文所需的字段
+TEMPLATE_REQUIRED = ('invoice_number', 'invoice_date', 'supplier', 'price')
+
+
+class InvoiceTemplate:
+    """固定版式发票的模板：标题区域中的标志文字用于识别版式，各字段只读取所在区域中的单词
+
+    区域为相对页面宽高的比例 (x0, top, x1, bottom)，原点在左上角，与页面大小无关。
+    """
+
+    def __init__(self, name, aspect, title_box, markers, boxes):
+        self.name = name
+        self.aspect = aspect          # 页面宽高比的范围
+        self.title_box = title_box
+        self.markers = markers        # 标题中出现任意一个即为该版式
+        self.boxes = boxes            # 区域名 -> 区域
+
+    def fits_page(self, width, height):
+        """页面宽高比是否符合（不需要解析页面内容）"""
+        return height > 0 and self.aspect[0] <= width / height <= self.aspect[1]
+
+    def matches(self, words):
+        # 标题可能被拆成几个单词（例如"电子发票 （普通发票）"），去掉空白后比较
+        title = ''.join(_box_lines(words, self.title_box)).replace(' ', '')
+        return any(marker in title for marker in self.markers)
+
+    def read_boxes(self, words):
+        """各区域中的文本（按行排列）"""
+        return {name: '\n'.join(_box_lines(words, box)) for name, box in self.boxes.items()}
+
+    def extract(self, words, scanner, qr=None):
+        """从各区域的文本中提取发票字段，返回 (字段, 各区域的文本)
+
+        每个区域只用对应字段的模式匹配，例如供应商只在销售方区域中查找，不会取到购买方名称。
+        """
+        texts = self.read_boxes(words)
+        header = scanner.scan(texts.get('header', ''), qr)
+        total = texts.get('total', '')
+        fields = {
+            'invoice_number': header['invoice_number'],
+            'invoice_date': header['invoice_date'],
+            'supplier': scanner.scan(texts.get('seller', ''))['supplier'],
+            # 价税合计区域中没有金额时不使用二维码金额代替，交给全文提取
+            'price': scanner.scan(total, qr)['price'] if TOTAL_AMOUNT_PATTERN.search(total) else None,
+            'product_name': first_item(texts.get('items', ''))
+        }
+        return fields, texts
+
+
+def _box_lines(words, box):
+    """中心点在区域内的单词，按行从上到下、行内从左到右拼接"""
+    x0, top, x1, bottom = box
+    inside = [word for word in words
+              if x0 <= (word[0] + word[2]) / 2 <= x1 and top <= (word[1] + word[3]) / 2 <= bottom]
+    inside.sort(key=lambda word: (word[1] + word[3]) / 2)
+
+    lines, line, center = [], [], None
+    for word in inside:
+        middle = (word[1] + word[3]) / 2
+        # 中心高度相差不到半个字高的单词在同一行
+        if line and abs(middle - center) > (word[3] - word[1]) / 2:
+            lines.append(line)
+            line = []
+        if not line:
+            center = middle
+        line.append(word)
+    if line:
+        lines.append(line)
+    return [' '.join(word[4] for word in sorted(line, key=lambda word: word[0])) for line in lines]
+
+
+# 已知的发票版式，按顺序尝试（数电发票的标题"电子发票（增值税专用发票）"包含"增值税专用发票"，需要排在前面）
+TEMPLATES = [
+    # 全面数字化的电子发票：购买方和销售方左右并排
+    InvoiceTemplate(
+        name='数电发票',
+        aspect=(1.35, 1.65),
+        title_box=(0.25, 0.0, 0.75, 0.15),
+        markers=('电子发票（普通发票）', '电子发票（增值税专用发票）', '电子发票(普通发票)', '电子发票(增值税专用发票)'),
+        boxes={
+            'header': (0.65, 0.0, 1.0, 0.17),   # 发票号码、开票日期
+            'seller': (0.5, 0.17, 1.0, 0.34),   # 销售方信息
+            'items': (0.0, 0.34, 0.3, 0.7),     # 项目名称列
+            'total': (0.0, 0.7, 1.0, 0.8),      # 价税合计
+        }),
+    # 增值税电子普通发票 / 专用发票：购买方在上，销售方在下
+    InvoiceTemplate(
+        name='增值税电子发票',
+        aspect=(1.55, 1.95),
+        title_box=(0.25, 0.0, 0.75, 0.16),
+        markers=('增值税电子普通发票', '增值税电子专用发票', '增值税普通发票', '增值税专用发票'),
+        boxes={
+            'header': (0.62, 0.0, 1.0, 0.24),   # 发票代码、发票号码、开票日期、校验码
+            'items': (0.0, 0.36, 0.32, 0.64),   # 货物或应税劳务、服务名称列
+            'total': (0.0, 0.64, 1.0, 0.74),    # 价税合计
+            'seller': (0.0, 0.74, 0.62, 0.94),  # 销售方
+        }),
+]
+
+
+def match_template(document):
+    """按第一页的宽高比和标题识别发票版式，返回 (模板, 第一页的单词)，没有匹配的模板时返回 (None, None)
+
+    宽高比不符合任何模板时不解析页面内容。
+    """
+    if not document.page_count:
+        return None, None
+    width, height = document.page_size(0)
+    candidates = [template for template in TEMPLATES if template.fits_page(width, height)]
+    if not candidates:
+        return None, None
+    words = document.page_words(0)
+    for template in candidates:
+        if template.matches(words):
+            return template, words
+    return None, None
+
+
+def first_item(text):
+    """项目名称列中的第一个项目（跳过表头和合计行）"""
+    for line in text.split('\n'):
+        line = line.strip()
+        if not line or '名称' in line or re.match(r'合\s*计', line):
+            continue
+        return re.sub(r'[^\w\s\u4e00-\u9fff]', '', line).strip() or None
+    return None
@@ -0,0 +1,387 @@
+import os
+import time
+import uuid
+import logging
+import threading
+import traceback
+import contextvars
+from datetime import datetime
+from itertools import islice
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# 同时运行的任务数，其余任务排队等待（OCR识别另有全局并发限制，见 ocr_backend.ocr_limiter）
+MAX_RUNNING_JOBS = 4
+
+# 内存中保留的已结束任务数，超过时不再能查询最早结束的任务（任务目录中的输出文件和日志保留在磁盘上）
+MAX_FINISHED_JOBS = 100
+
+# 任务的处理阶段：发票PDF、支付截图、生成汇总结果
+STAGES = ('pdf', 'image', 'combine')
+
+# 每个任务保留的日志条数（环形缓冲区），更早的日志被丢弃
+LOG_BUFFER_SIZE = 2000
+
+# 每个任务每秒最多记录的 INFO 及以下级别日志数（令牌桶，允许短时间内 LOG_BURST 条），WARNING 及以上不限速
+LOG_RATE = 100
+LOG_BURST = 200
+
+# 任务日志文件（任务目录下的 job.log）的格式
+JOB_LOG_FORMAT = '%(asctime)s - %(levelname)s - %(name)s - %(message)s'
+
+# 当前线程正在执行的任务（任务线程中设置；派生的识别线程通过复制上下文继承）
+current_job = contextvars.ContextVar('current_job', default=None)
+
+LogEvent = namedtuple('LogEvent', ['id', 'time', 'level', 'message'])
+
+
+class JobCancelled(BaseException):
+    """任务被取消，由进度回调在两个文件之间抛出
+
+    继承 BaseException：各处理阶段用 except Exception 记录并跳过出错的文件，取消不能被当作普通错误吞掉。
+    """
+
+
+class JobLog:
+    """任务日志：固定大小的环形缓冲区，每条日志有递增的事件ID
+
+    INFO 及以下级别的日志按令牌桶限速，超出的日志只计数，每秒最多插入一条省略提示（任务结束时补上最后一条）。
+    无论处理过程产生多少日志，内存占用和推送的数据量都有上限。
+    """
+
+    def __init__(self, size=LOG_BUFFER_SIZE, rate=LOG_RATE, burst=LOG_BURST):
+        self.rate = rate
+        self.burst = burst
+        self._events = deque(maxlen=size)
+        self._last_id = 0
+        self._tokens = burst
+        self._refilled = time.monotonic()
+        self._suppressed = 0
+        self._suppressed_reported = 0.0
+        self._closed = False
+        self._condition = threading.Condition()
+
+    @property
+    def last_id(self):
+        return self._last_id
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def append(self, level, message, created=None):
+        """记录一条日志；INFO 及以下级别超过限速时丢弃"""
+        with self._condition:
+            if level < logging.WARNING and not self._take_token():
+                self._suppressed += 1
+                return
+            if time.monotonic() - self._suppressed_reported >= 1.0:
+                self._flush_suppressed(created)
+            self._add(level, message, created)
+
+    def close(self):
+        """任务结束：记录尚未报告的省略条数，唤醒所有等待的读取者"""
+        with self._condition:
+            self._flush_suppressed()
+            self._closed = True
+            self._condition.notify_all()
+
+    def since(self, last_id, level=logging.NOTSET, limit=None):
+        """返回 (事件ID在 last_id 之后、级别不低于 level 的日志, 已被环形缓冲区丢弃的条数, 新的读取位置)"""
+        with self._condition:
+            if last_id > self._last_id:
+                last_id = 0  # 不是这个任务的事件ID（例如服务重启前的ID），从头读取
+            first_id = self._events[0].id if self._events else self._last_id + 1
+            missed = max(first_id - last_id - 1, 0)
+            events, cursor = [], max(last_id, first_id - 1)
+            for event in islice(self._events, cursor - first_id + 1, None):
+                cursor = event.id
+                if event.level >= level:
+                    events.append(event)
+                    if limit and len(events) >= limit:
+                        break
+            return events, missed, cursor
+
+    def wait(self, last_id, timeout=None):
+        """等待 last_id 之后的新日志或任务结束，返回是否有新日志"""
+        with self._condition:
+            self._condition.wait_for(lambda: self._last_id > last_id or self._closed, timeout)
+            return self._last_id > last_id
+
+    def _take_token(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def _flush_suppressed(self, created=None):
+        if self._suppressed:
+            self._add(logging.WARNING, f"日志过多，已省略 {self._suppressed} 条（每秒最多记录 {self.rate} 条）", created)
+            self._suppressed = 0
+            self._suppressed_reported = time.monotonic()
+
+    def _add(self, level, message, created):
+        self._last_id += 1
+        self._events.append(LogEvent(self._last_id, created or time.time(), level, message))
+        self._condition.notify_all()
+
+
+class JobLogHandler(logging.Handler):
+    """把日志记录到当前任务（见 current_job）的日志和日志文件中，不在任务中产生的日志忽略"""
+
+    def emit(self, record):
+        job = current_job.get()
+        if job is None:
+            return
+        try:
+            job.log.append(record.levelno, self.format(record), record.created)
+            if job.log_handler is not None:
+                job.log_handler.handle(record)
+        except Exception:
+            self.handleError(record)
+
+
+class _StageProgress:
+    """一个处理阶段的进度：已完成数、总数，以及第一次和最近一次报告的时间（用于估算每个文件的耗时）"""
+
+    __slots__ = ('done', 'total', 'started', 'updated')
+
+    def __init__(self):
+        self.done = 0
+        self.total = 0
+        self.started = None
+        self.updated = None
+
+    def seconds_per_file(self):
+        """观察到的每个文件的平均耗时，还没有完成的文件时返回None"""
+        if not self.done or self.started is None:
+            return None
+        return (self.updated - self.started) / self.done
+
+
+class Job:
+    """一个文件夹的处理任务：状态、各阶段进度和取消标志
+
+    work_dir 为任务自己的目录（输出文件写入其中的 output 目录，完整日志写入 job.log），
+    同时运行的任务互不覆盖对方的文件。
+    """
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+
+    def __init__(self, folder, jobs_dir=None):
+        self.id = uuid.uuid4().hex
+        self.folder = folder
+        self.work_dir = os.path.join(jobs_dir, self.id) if jobs_dir else None
+        self.output_dir = os.path.join(self.work_dir, 'output') if self.work_dir else None
+        self.log_handler = None
+        self.status = Job.QUEUED
+        self.stage = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.stages = {stage: _StageProgress() for stage in STAGES}
+        self.log = JobLog()
+        self._lock = threading.Lock()
+        self._cancel = threading.Event()
+        self._finished = threading.Event()
+
+    def update(self, stage, done, total):
+        """进度回调：stage 阶段已完成 done/total 个文件；任务已被取消时抛出 JobCancelled"""
+        now = time.monotonic()
+        with self._lock:
+            progress = self.stages[stage]
+            if progress.started is None:
+                progress.started = now
+            progress.done, progress.total, progress.updated = done, total, now
+            self.stage = stage
+        if self._cancel.is_set():
+            raise JobCancelled(self.id)
+
+    def set_totals(self, **totals):
+        """任务开始时预先设置各阶段的文件数，使后面阶段的剩余时间也能估算"""
+        with self._lock:
+            for stage, total in totals.items():
+                self.stages[stage].total = total
+
+    def cancel(self):
+        """请求取消：正在处理的文件处理完后停止"""
+        self._cancel.set()
+
+    @property
+    def cancel_requested(self):
+        return self._cancel.is_set()
+
+    def wait(self, timeout=None):
+        """等待任务结束，返回是否已结束"""
+        return self._finished.wait(timeout)
+
+    def eta(self):
+        """按已观察到的每个文件耗时估算剩余秒数；各阶段都还没有完成的文件时返回None"""
+        if self.status != Job.RUNNING:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            stages = list(self.stages.items())
+            current = self.stage
+        observed = [progress for _, progress in stages if progress.seconds_per_file() is not None]
+        if not observed:
+            return None
+        # 还没有完成文件的阶段使用所有已完成文件的平均耗时
+        overall = (sum(progress.updated - progress.started for progress in observed)
+                   / sum(progress.done for progress in observed))
+        remaining = 0.0
+        for stage, progress in stages:
+            left = max(progress.total - progress.done, 0)
+            if not left:
+                continue
+            per_file = progress.seconds_per_file()
+            remaining += left * (overall if per_file is None else per_file)
+            if stage == current and progress.updated is not None:
+                # 当前文件已经处理了一段时间
+                remaining -= min(now - progress.updated, per_file or overall)
+        return max(remaining, 0.0)
+
+    def _open_work_dir(self):
+        """创建任务目录和输出目录，打开任务日志文件"""
+        if self.work_dir is None:
+            return
+        os.makedirs(self.output_dir, exist_ok=True)
+        handler = logging.FileHandler(os.path.join(self.work_dir, 'job.log'), encoding='utf-8')
+        handler.setFormatter(logging.Formatter(JOB_LOG_FORMAT))
+        self.log_handler = handler
+
+    def _mark(self, status, error=None):
+        with self._lock:
+            self.status = status
+            if status == Job.RUNNING:
+                self.started = time.time()
+            else:
+                self.finished = time.time()
+                self.error = error
+        if status not in (Job.QUEUED, Job.RUNNING):
+            self.log.close()
+            handler, self.log_handler = self.log_handler, None
+            if handler is not None:
+                handler.close()
+            self._finished.set()
+
+    def snapshot(self):
+        """任务状态（JSON可序列化）"""
+        eta = self.eta()
+        with self._lock:
+            end = self.finished or time.time()
+            return {
+                'id': self.id,
+                'folder': self.folder,
+                'output_dir': self.output_dir,
+                'status': self.status,
+                'stage': self.stage,
+                'progress': {stage: {'done': progress.done, 'total': progress.total}
+                             for stage, progress in self.stages.items()},
+                'eta_seconds': None if eta is None else round(eta, 1),
+                'elapsed_seconds': round(end - self.started, 1) if self.started else 0.0,
+                'created': datetime.fromtimestamp(self.created).isoformat(timespec='seconds'),
+                'cancel_requested': self._cancel.is_set(),
+                'error': self.error
+            }
+
+
+class JobManager:
+    """任务管理：固定大小的线程池执行任务，其余任务排队；按任务ID查询和取消
+
+    runner(job) 执行任务，处理过程中调用 job.update 报告进度（任务被取消时由它抛出 JobCancelled）。
+    指定 jobs_dir 时每个任务在其中有自己的目录（见 Job.work_dir）。
+    """
+
+    def __init__(self, runner, max_workers=MAX_RUNNING_JOBS, max_finished=MAX_FINISHED_JOBS, jobs_dir=None):
+        self.runner = runner
+        self.max_finished = max_finished
+        self.jobs_dir = jobs_dir
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, folder):
+        """提交任务，立即返回 Job"""
+        job = Job(folder, self.jobs_dir)
+        with self._lock:
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job)
+        logger.info(f"已提交任务 {job.id}: {folder}")
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def latest(self):
+        """最近提交的任务，没有任务时返回None"""
+        with self._lock:
+            return next(reversed(self._jobs.values()), None)
+
+    def cancel(self, job_id):
+        """取消任务：排队中的任务不再执行，运行中的任务在两个文件之间停止；返回 Job，不存在时返回None"""
+        job = self.get(job_id)
+        if job is not None and job.status in (Job.QUEUED, Job.RUNNING):
+            job.cancel()
+            logger.info(f"请求取消任务 {job_id}")
+        return job
+
+    def shutdown(self, cancel=True):
+        """停止任务管理器，cancel 为真时取消所有未结束的任务"""
+        if cancel:
+            for job in self.list():
+                job.cancel()
+        self._executor.shutdown(wait=True)
+
+    def _run(self, job):
+        token = current_job.set(job)
+        try:
+            if job.cancel_requested:
+                logger.info(f"任务 {job.id} 在开始前已取消")
+                job._mark(Job.CANCELLED)
+                return
+            try:
+                job._open_work_dir()
+                job._mark(Job.RUNNING)
+                self.runner(job)
+                logger.info(f"任务 {job.id} 处理完成")
+                job._mark(Job.DONE)
+            except JobCancelled:
+                logger.info(f"任务 {job.id} 已取消")
+                job._mark(Job.CANCELLED)
+            except Exception as e:
+                logger.error(f"任务 {job.id} 处理出错: {str(e)}")
+                traceback.print_exc()
+                job._mark(Job.FAILED, str(e))
+            except BaseException as e:
+                # 其他 BaseException（例如处理代码中的 KeyboardInterrupt、SystemExit）同样结束任务，
+                # 否则任务一直停留在运行中，等待它的请求和事件流永远不会返回
+                logger.error(f"任务 {job.id} 被中断: {e!r}")
+                job._mark(Job.FAILED, repr(e))
+                raise
+        finally:
+            current_job.reset(token)
+            self._prune()
+
+    def _prune(self):
+        """已结束的任务超过上限时从内存中删除最早结束的任务；任务目录（输出文件和 job.log）不删除"""
+        with self._lock:
+            finished = [job for job in self._jobs.values() if job.wait(0)]
+            for job in sorted(finished, key=lambda job: job.finished)[:max(len(finished) - self.max_finished, 0)]:
+                del self._jobs[job.id]
@@ -2,24 +2,16 @@ import os
 import logging
 from pdf_image_analyzer import DocumentAnalyzer
 from test_image_payment import PaymentImageTester
-import pandas as pd
+from pipeline import run_pipeline
+from incremental import IncrementalRunner, watch_folder
+from ocr_backend import BACKENDS, get_backend, limit_openmp_threads, probe_tesseract
+from pdf_text import PDF_BACKENDS
+from pdf_ocr import DEFAULT_OCR_DPI, MAX_RENDER_PIXELS
+from image_preprocess import DEFAULT_GLYPH_HEIGHT
 from datetime import datetime
 import sys
-import re
-
-def clean_filename_for_name(filename):
-    """从文件名提取商品名称（去掉数字和log字符）"""
-    # 移除扩展名
-    name = os.path.splitext(filename)[0]
-    # 移除数字
-    name = re.sub(r'\d+', '', name)
-    # 移除log字符（不区分大小写）
-    name = re.sub(r'log', '', name, flags=re.IGNORECASE)
-    # 移除特殊字符
-    name = re.sub(r'[^\w\s\u4e00-\u9fff]', '', name)
-    # 移除多余的空格
-    name = ' '.join(name.split())
-    return name.strip()
+import argparse
+import multiprocessing
 
 def setup_logging():
     """设置日志配置"""
@@ -59,20 +51,71 @@ def print_system_info():
     logger.info(f"Python版本: {sys.version}")
     logger.info(f"系统平台: {sys.platform}")
     try:
-        import pytesseract
-        version = pytesseract.get_tesseract_version()
-        logger.info(f"Tesseract版本: {version}")
+        # 版本和语言包按Tesseract可执行文件缓存，未变化时不启动子进程
+        info = probe_tesseract()
+        logger.info(f"Tesseract版本: {info.version} ({info.path})")
+        logger.info(f"Tesseract语言包: {', '.join(info.languages) or '无'}")
     except Exception as e:
         logger.error(f"Tesseract检查失败: {str(e)}")
     logger.info("=" * 50)
 
-def main():
+def parse_args(argv=None):
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='发票处理工具')
+    parser.add_argument('--cascade', action='store_true',
+                        help='支付截图使用级联识别：同一金额被多次识别确认后提前结束')
+    parser.add_argument('--agreement', type=int, default=3,
+                        help='级联识别需要的一致次数（默认3）')
+    parser.add_argument('--no-roi', action='store_true',
+                        help='支付截图不使用金额区域检测，每次识别整张图片')
+    parser.add_argument('--glyph-height', type=int, default=DEFAULT_GLYPH_HEIGHT,
+                        help=f'支付截图分辨率归一化的目标正文字高（像素，默认{DEFAULT_GLYPH_HEIGHT}，0表示不缩放）')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='并行处理数：支付截图识别的线程数和PDF解析的进程数（默认1，即串行处理）')
+    parser.add_argument('--ocr-backend', default='auto', choices=['auto'] + list(BACKENDS),
+                        help='OCR后端：tesserocr（进程内引擎）、cli-batch（一次命令行调用识别多张图像）、'
+                             'cli（每次识别一个子进程）；auto 优先使用 tesserocr（默认auto）')
+    parser.add_argument('--pdf-backend', default='auto', choices=['auto'] + list(PDF_BACKENDS),
+                        help='PDF文本提取后端：pymupdf（C实现，速度快）、pdfplumber；auto 优先使用 pymupdf（默认auto）')
+    parser.add_argument('--all-pages', action='store_true',
+                        help='解析发票的所有页（默认在发票号码、日期、供应商和价税合计都找到后停止解析后面的页）')
+    parser.add_argument('--no-qr', action='store_true',
+                        help='不读取发票二维码，只从PDF文本中提取发票号码、日期和金额')
+    parser.add_argument('--no-templates', action='store_true',
+                        help='不使用发票版式模板，始终从PDF全文中提取发票信息')
+    parser.add_argument('--no-pdf-ocr', action='store_true',
+                        help='不识别扫描件：没有文本层的PDF页不渲染、不OCR识别')
+    parser.add_argument('--ocr-dpi', type=int, default=DEFAULT_OCR_DPI,
+                        help=f'扫描件页面的渲染分辨率（默认{DEFAULT_OCR_DPI}）')
+    parser.add_argument('--max-render-pixels', type=int, default=MAX_RENDER_PIXELS,
+                        help=f'扫描件单页渲染的最大像素数，超过时自动降低分辨率（默认{MAX_RENDER_PIXELS}）')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='不使用缓存，重新识别所有文件')
+    parser.add_argument('--incremental', action='store_true',
+                        help='增量处理：只处理新增或修改的文件，并更新汇总结果')
+    parser.add_argument('--watch', action='store_true',
+                        help='监视当前目录，有新文件时自动增量处理（按Ctrl+C停止）')
+    parser.add_argument('--parquet', action='store_true',
+                        help='结果同时导出为Parquet文件（需要安装 pyarrow 或 fastparquet）')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    
     # 设置日志
     logger = setup_logging()
     
     # 打印系统信息
     print_system_info()
     
+    # 并行识别时限制Tesseract自身的线程数（必须在加载Tesseract之前设置）
+    if args.workers > 1:
+        limit_openmp_threads()
+    
+    # 两个分析器共用同一个OCR后端，语言模型只加载一次
+    ocr_backend = get_backend(args.ocr_backend)
+    logger.info(f"OCR后端: {ocr_backend.name}")
+    
     try:
         # 指定输入目录
         input_dir = '.'  # 当前目录
@@ -82,191 +125,49 @@ def main():
         if not os.path.exists(output_dir):
             os.makedirs(output_dir)
         
-        # 处理PDF发票
-        logger.info("\n开始处理PDF发票...")
-        pdf_analyzer = DocumentAnalyzer(input_dir)
-        pdf_analyzer.process_pdfs(input_dir)
-        
-        # 处理支付截图
-        logger.info("\n开始处理支付截图...")
-        payment_tester = PaymentImageTester()
-        payment_results = payment_tester.process_payment_images(input_dir)
-        
-        # 合并结果
-        logger.info("\n开始合并处理结果...")
-        
-        # 读取发票处理结果
-        invoice_results_file = os.path.join(output_dir, 'invoice_results.csv')
-        try:
-            invoice_results = pd.read_csv(invoice_results_file, encoding='utf-8')
-            logger.info(f"读取到 {len(invoice_results)} 条发票记录")
-            
-            # 显示发票数据的列名
-            logger.info(f"发票数据列名: {invoice_results.columns.tolist()}")
-            
-            # 显示前几条记录的内容
-            logger.info("\n发票数据示例:")
-            logger.info(invoice_results.head().to_string())
-            
-        except FileNotFoundError:
-            invoice_results = pd.DataFrame()
-            logger.warning("未找到发票处理结果文件")
-        except Exception as e:
-            logger.error(f"读取发票文件时出错: {str(e)}")
-            invoice_results = pd.DataFrame()
-        
-        # 转换支付记录为DataFrame
-        if payment_results:
-            payment_df = pd.DataFrame(payment_results)
-            logger.info(f"处理了 {len(payment_df)} 条支付记录")
-            
-            # 显示支付数据的列名
-            logger.info(f"支付数据列名: {payment_df.columns.tolist()}")
-            
-            # 显示前几条记录的内容
-            logger.info("\n支付数据示例:")
-            logger.info(payment_df.head().to_string())
-            
+        # 处理发票和支付截图
+        pdf_analyzer = DocumentAnalyzer(input_dir, workers=args.workers,
+                                        use_cache=not args.no_cache,
+                                        ocr_backend=ocr_backend,
+                                        target_glyph_height=args.glyph_height,
+                                        pdf_backend=args.pdf_backend,
+                                        stop_early=not args.all_pages,
+                                        use_qr=not args.no_qr,
+                                        use_templates=not args.no_templates,
+                                        pdf_ocr=not args.no_pdf_ocr,
+                                        ocr_dpi=args.ocr_dpi,
+                                        max_render_pixels=args.max_render_pixels)
+        payment_tester = PaymentImageTester(cascade=args.cascade,
+                                            agreement_threshold=args.agreement,
+                                            roi=not args.no_roi,
+                                            target_glyph_height=args.glyph_height,
+                                            workers=args.workers,
+                                            use_cache=not args.no_cache,
+                                            ocr_backend=ocr_backend)
+        # 结果文件的导出格式
+        formats = ('csv', 'parquet') if args.parquet else ('csv',)
+        if args.watch:
+            runner = IncrementalRunner(pdf_analyzer, payment_tester, input_dir, output_dir, formats)
+            logger.info("开始监视文件夹，按Ctrl+C停止")
+            watch_folder(input_dir, runner.run)
+        elif args.incremental:
+            IncrementalRunner(pdf_analyzer, payment_tester, input_dir, output_dir, formats).run()
         else:
-            payment_df = pd.DataFrame()
-            logger.warning("未找到支付记录")
-        
-        # 准备合并结果
-        combined_results = []
-        
-        # 遍历所有记录
-        processed_files = set()
+            run_pipeline(pdf_analyzer, payment_tester, input_dir, output_dir, formats)
         
-        # 处理有发票的记录
-        if not invoice_results.empty:
-            for _, invoice in invoice_results.iterrows():
-                # 从文件名提取商品名称
-                filename = invoice.get('filename', '')
-                product_name = clean_filename_for_name(filename)
-                
-                record = {
-                    '名称': product_name or invoice.get('product_name', ''),  # 优先使用清理后的文件名
-                    '品牌': 'NA',
-                    '规格数量': 1,
-                    '规格单位': '套',
-                    '计量单位': '套',
-                    '数量': 1,
-                    '存放地点': '科技楼1907',
-                    '供应商': invoice.get('supplier', ''),
-                    '发票号码': invoice.get('invoice_number', ''),
-                    '开票日期': invoice.get('invoice_date', ''),
-                    '发票金额': invoice.get('price', ''),
-                    '发票文件': invoice.get('filename', ''),
-                    '实际支付金额': None,
-                    '文件名': None,
-                    '差额': None
-                }
-                
-                # 查找对应的支付记录
-                if not payment_df.empty:
-                    payment_match = payment_df[payment_df['发票文件'] == invoice['filename']]
-                    if not payment_match.empty:
-                        record['实际支付金额'] = payment_match.iloc[0]['实际支付金额']
-                        record['文件名'] = payment_match.iloc[0]['文件名']
-                        
-                        # 计算差额
-                        try:
-                            invoice_amount = float(record['发票金额'])
-                            payment_amount = float(record['实际支付金额'])
-                            record['差额'] = payment_amount - invoice_amount
-                        except (ValueError, TypeError):
-                            record['差额'] = None
-                
-                combined_results.append(record)
-                processed_files.add(invoice.get('filename', ''))
-        
-        # 处理没有发票的支付记录
-        if not payment_df.empty:
-            for _, payment in payment_df.iterrows():
-                if payment['发票文件'] not in processed_files:
-                    # 从文件名提取商品名称
-                    filename = payment.get('文件名', '')
-                    product_name = clean_filename_for_name(filename)
-                    
-                    record = {
-                        '名称': product_name,  # 使用清理后的文件名
-                        '品牌': 'NA',
-                        '规格数量': 1,
-                        '规格单位': '套',
-                        '计量单位': '套',
-                        '数量': 1,
-                        '存放地点': '科技楼1907',
-                        '供应商': '',
-                        '发票号码': '',
-                        '开票日期': '',
-                        '发票金额': '',
-                        '发票文件': payment['发票文件'],
-                        '实际支付金额': payment['实际支付金额'],
-                        '文件名': payment['文件名'],
-                        '差额': None
-                    }
-                    combined_results.append(record)
-        
-        # 保存合并结果
-        if combined_results:
-            df = pd.DataFrame(combined_results)
-            
-            # 重新排列列顺序
-            columns_order = [
-                '名称', '品牌', '规格数量', '规格单位', '计量单位', '数量', 
-                '存放地点', '供应商', '发票号码', '开票日期', '发票金额',
-                '实际支付金额', '差额', '发票文件', '文件名'
-            ]
-            
-            # 确保所有列都存在
-            for col in columns_order:
-                if col not in df.columns:
-                    df[col] = None
-            
-            # 按指定顺序排列列
-            df = df[columns_order]
-            
-            output_file = os.path.join(output_dir, 'combined_results.csv')
-            df.to_csv(output_file, index=False, encoding='utf-8')
-            logger.info(f"\n合并结果已保存到: {output_file}")
-            logger.info(f"总记录数: {len(df)}")
-            
-            # 显示合并后的数据示例
-            logger.info("\n合并后的数据示例:")
-            logger.info(df.head().to_string())
-            
-            # 显示统计信息
-            logger.info("\n处理结果统计:")
-            logger.info(f"发票记录数: {len(invoice_results) if not invoice_results.empty else 0}")
-            logger.info(f"支付记录数: {len(payment_df) if not payment_df.empty else 0}")
-            logger.info(f"成功匹配数: {df['实际支付金额'].notna().sum()}")
-            
-            # 检查金额差异
-            if '发票金额' in df.columns and '实际支付金额' in df.columns:
-                matched_records = df[df['发票金额'].notna() & df['实际支付金额'].notna()]
-                if not matched_records.empty:
-                    matched_records['误差百分比'] = abs(pd.to_numeric(matched_records['差额'], errors='coerce') / 
-                                                  pd.to_numeric(matched_records['发票金额'], errors='coerce') * 100)
-                    mismatches = matched_records[matched_records['误差百分比'] > 10]
-                    
-                    if not mismatches.empty:
-                        logger.warning("\n发现金额不匹配的记录（误差>10%）:")
-                        for _, row in mismatches.iterrows():
-                            logger.warning(f"发票: {row['发票文件']}, "
-                                         f"发票金额: {row['发票金额']}, "
-                                         f"支付金额: {row['实际支付金额']}, "
-                                         f"差额: {row['差额']:.2f}, "
-                                         f"误差: {row['误差百分比']:.1f}%")
-        else:
-            logger.warning("没有找到任何处理结果")
-            
         logger.info("\n处理完成!")
         logger.info("=" * 50)
         
+    except KeyboardInterrupt:
+        logger.info("\n已停止监视")
     except Exception as e:
         logger.error(f"程序执行出错: {str(e)}")
         logger.error("详细错误信息:", exc_info=True)
         raise
+    finally:
+        ocr_backend.close()
 
 if __name__ == '__main__':
+    # 打包后的程序使用进程池时需要
+    multiprocessing.freeze_support()
     main() 
\ No newline at end of file
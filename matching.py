@@ -0,0 +1,149 @@
+import os
+import re
+import math
+import bisect
+from collections import namedtuple
+
+# 支付金额与发票金额的允许误差（相对发票金额），超过时只按文件名匹配
+AMOUNT_TOLERANCE = 0.10
+
+# 得分 = 文件名相似度 * NAME_WEIGHT + 金额接近程度 * AMOUNT_WEIGHT，不低于 MIN_SCORE 的候选才会被匹配
+NAME_WEIGHT = 0.6
+AMOUNT_WEIGHT = 0.4
+MIN_SCORE = 0.4
+
+# 文件名相同、一个包含另一个（按词）、部分相同时的相似度；部分相同时再乘以按词频加权的重合比例
+NAME_EQUAL = 1.0
+NAME_CONTAINED = 0.9
+NAME_PARTIAL = 0.8
+
+# 每张支付截图按文件名最多考虑的候选发票数（从最少见的词开始取；很多发票都有的词区分不出发票，不产生候选）
+MAX_NAME_CANDIDATES = 50
+
+# 文件名中的词：英文单词、数字、中文字符串（中文按相邻两个字切分，与分隔符无关）
+_TOKEN = re.compile(r'[a-z]+|\d+|[\u4e00-\u9fff]+')
+_CJK = re.compile(r'[\u4e00-\u9fff]')
+
+Match = namedtuple('Match', ['invoice', 'payment', 'score', 'reason'])
+
+
+def filename_tokens(filename):
+    """文件名（不含扩展名和支付截图的"log"标记）中的词"""
+    tokens = []
+    for token in _TOKEN.findall(os.path.splitext(filename)[0].lower()):
+        if token == 'log':
+            continue
+        if _CJK.match(token) and len(token) > 2:
+            tokens.extend(token[i:i + 2] for i in range(len(token) - 1))
+        else:
+            tokens.append(token)
+    return tokens
+
+
+def _amount(value):
+    """金额转换为浮点数，没有金额（None、空字符串、NaN、无法解析）时返回None"""
+    try:
+        amount = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(amount) else amount
+
+
+class PaymentMatcher:
+    """发票和支付截图的一对一匹配
+
+    发票文件名的词建立倒排索引，发票金额建立有序索引。每张支付截图只与文件名有共同的词、
+    或金额完全相同且唯一的发票比较，按文件名相似度和金额接近程度打分，所有候选按得分从高到低
+    依次确定匹配（每张发票、每张截图最多匹配一次）。
+    """
+
+    def __init__(self, tolerance=AMOUNT_TOLERANCE, min_score=MIN_SCORE):
+        self.tolerance = tolerance
+        self.min_score = min_score
+
+    def match(self, invoices, payments):
+        """invoices、payments 为 [(文件名, 金额)]，金额可以为None；返回 {支付截图文件名: Match}"""
+        invoices = [(name, _amount(amount), filename_tokens(name)) for name, amount in invoices]
+        payments = [(name, _amount(amount), filename_tokens(name)) for name, amount in payments]
+
+        postings = {}
+        for index, (_, _, tokens) in enumerate(invoices):
+            for token in set(tokens):
+                postings.setdefault(token, []).append(index)
+        weights = {token: math.log(1 + len(invoices) / len(indices)) for token, indices in postings.items()}
+        amounts = sorted((amount, index) for index, (_, amount, _) in enumerate(invoices) if amount is not None)
+        amount_keys = [amount for amount, _ in amounts]
+
+        candidates = []
+        default_weight = math.log(1 + len(invoices))
+        for payment_index, (_, payment_amount, tokens) in enumerate(payments):
+            seen = set()
+            for index in self._name_candidates(tokens, postings):
+                seen.add(index)
+                candidates.append(self._score(invoices[index], payments[payment_index], weights, default_weight)
+                                  + (index, payment_index))
+            # 文件名没有共同的词时，金额完全相同且只有一张发票是这个金额也可以匹配
+            if payment_amount is None:
+                continue
+            start = bisect.bisect_left(amount_keys, round(payment_amount, 2) - 0.005)
+            end = bisect.bisect_right(amount_keys, round(payment_amount, 2) + 0.005)
+            if end - start == 1 and amounts[start][1] not in seen:
+                index = amounts[start][1]
+                candidates.append((AMOUNT_WEIGHT, 0.0, '文件名不同，金额相同', index, payment_index))
+
+        # 得分高的先匹配；得分相同时金额误差小的优先，再按文件名顺序，结果与输入顺序无关
+        candidates.sort(key=lambda item: (-item[0], item[1], invoices[item[3]][0], payments[item[4]][0]))
+        matched_invoices, result = set(), {}
+        for score, _, reason, index, payment_index in candidates:
+            payment = payments[payment_index][0]
+            if score < self.min_score or index in matched_invoices or payment in result:
+                continue
+            matched_invoices.add(index)
+            result[payment] = Match(invoices[index][0], payment, round(score, 3), reason)
+        return result
+
+    @staticmethod
+    def _name_candidates(tokens, postings):
+        """与支付截图文件名有共同的词的发票：从最少见的词开始，候选数超过上限后不再取更常见的词"""
+        found = []
+        for token in sorted(set(tokens), key=lambda token: len(postings.get(token, ()))):
+            indices = postings.get(token)
+            if not indices:
+                continue
+            if found and len(found) + len(indices) > MAX_NAME_CANDIDATES:
+                break
+            found.extend(indices)
+        return set(found)
+
+    def _score(self, invoice, payment, weights, default_weight):
+        """返回 (得分, 金额误差, 匹配依据)"""
+        invoice_tokens, payment_tokens = invoice[2], payment[2]
+        invoice_set, payment_set = set(invoice_tokens), set(payment_tokens)
+        if invoice_tokens == payment_tokens:
+            name, reasons = NAME_EQUAL, ['文件名相同']
+        elif invoice_set <= payment_set or payment_set <= invoice_set:
+            name, reasons = NAME_CONTAINED, ['文件名包含']
+        else:
+            weight = lambda tokens: sum(weights.get(token, default_weight) for token in tokens)
+            overlap = weight(invoice_set & payment_set) / weight(invoice_set | payment_set)
+            name, reasons = NAME_PARTIAL * overlap, [f'文件名部分相同（{overlap:.0%}）']
+
+        closeness, error = 0.0, math.inf
+        if invoice[1] is None or payment[1] is None:
+            reasons.append('缺少金额')
+        elif abs(payment[1] - invoice[1]) < 0.005:
+            closeness, error = 1.0, 0.0
+            reasons.append('金额相同')
+        else:
+            error = abs(payment[1] - invoice[1]) / abs(invoice[1]) if invoice[1] else math.inf
+            if error <= self.tolerance:
+                closeness = 1 - error / self.tolerance
+                reasons.append(f'金额误差{error:.1%}')
+            else:
+                reasons.append(f'金额误差超过{self.tolerance:.0%}')
+        return NAME_WEIGHT * name + AMOUNT_WEIGHT * closeness, error, '，'.join(reasons)
+
+
+def match_payments(invoices, payments, tolerance=AMOUNT_TOLERANCE):
+    """按文件名和金额一对一匹配发票和支付截图，返回 {支付截图文件名: Match}"""
+    return PaymentMatcher(tolerance).match(invoices, payments)
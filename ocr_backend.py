@@ -0,0 +1,464 @@
+import os
+import io
+import re
+import sys
+import csv
+import json
+import time
+import shlex
+import shutil
+import tempfile
+import threading
+import subprocess
+import importlib.util
+import logging
+from collections import namedtuple
+
+# image_to_data 返回的TSV列（与 pytesseract 的 Output.DATAFRAME 一致）
+TSV_COLUMNS = ['level', 'page_num', 'block_num', 'par_num', 'line_num', 'word_num',
+               'left', 'top', 'width', 'height', 'conf', 'text']
+
+
+def _read_tsv(tsv_text):
+    """按 pytesseract 的方式解析TSV输出"""
+    import pandas as pd
+    return pd.read_csv(io.BytesIO(tsv_text.encode('utf-8')), quoting=csv.QUOTE_NONE, sep='\t')
+
+
+# Tesseract版本和语言包的探测结果，按可执行文件（路径、修改时间、大小）和 TESSDATA_PREFIX 缓存
+PROBE_CACHE_PATH = os.path.join('output', 'tesseract_probe.json')
+
+TesseractInfo = namedtuple('TesseractInfo', ['path', 'version', 'languages'])
+
+_probes = {}
+_probe_lock = threading.Lock()
+
+
+def tesseract_command():
+    """当前使用的Tesseract命令：pytesseract 的 tesseract_cmd（Windows下设置为安装路径），未导入 pytesseract 时为默认命令"""
+    pytesseract = sys.modules.get('pytesseract')
+    return pytesseract.pytesseract.tesseract_cmd if pytesseract else 'tesseract'
+
+
+def _run_tesseract(path, option):
+    """执行 tesseract --version / --list-langs，返回输出（旧版本输出到stderr）"""
+    proc = subprocess.run([path, option], capture_output=True, timeout=30,
+                          creationflags=getattr(subprocess, 'CREATE_NO_WINDOW', 0))
+    return (proc.stdout + proc.stderr).decode('utf-8', 'ignore')
+
+
+def _read_probe_cache(cache_path):
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_probe_cache(cache_path, probes):
+    """先写临时文件再替换，多个进程同时写入时不会损坏"""
+    cache_dir = os.path.dirname(cache_path)
+    if cache_dir and not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(probes, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, cache_path)
+
+
+def probe_tesseract(command=None, cache_path=PROBE_CACHE_PATH):
+    """Tesseract的版本和已安装的语言包（TesseractInfo），找不到Tesseract时抛出 FileNotFoundError
+
+    结果缓存在进程内和 cache_path 中，键为可执行文件的路径、修改时间、大小和 TESSDATA_PREFIX；
+    Tesseract未升级或重新安装时，启动时不再执行 tesseract --version / --list-langs 子进程。
+    """
+    command = command or tesseract_command()
+    path = os.path.abspath(shutil.which(command) or command)
+    stat = os.stat(path)
+    key = f"{path}|{stat.st_mtime_ns}|{stat.st_size}|{os.environ.get('TESSDATA_PREFIX', '')}"
+    with _probe_lock:
+        info = _probes.get(key)
+        if info is not None:
+            return info
+        probes = _read_probe_cache(cache_path) if cache_path else {}
+        entry = probes.get(key)
+        if entry is None:
+            version_output = _run_tesseract(path, '--version')
+            match = re.search(r'tesseract\s+v?(\S+)', version_output)
+            if not match:
+                raise RuntimeError(f"无法识别Tesseract版本: {version_output.strip()[:200]}")
+            # 第一行是语言包目录的说明，其余每行一个语言
+            languages = _run_tesseract(path, '--list-langs').splitlines()[1:]
+            entry = {'version': match.group(1), 'languages': sorted(lang.strip() for lang in languages if lang.strip())}
+            if cache_path:
+                probes[key] = entry
+                try:
+                    _write_probe_cache(cache_path, probes)
+                except OSError as e:
+                    logging.getLogger(__name__).warning(f"无法保存Tesseract探测结果: {str(e)}")
+        info = _probes[key] = TesseractInfo(path, entry['version'], tuple(entry['languages']))
+        return info
+
+
+def limit_openmp_threads():
+    """Tesseract自身只使用一个OpenMP线程，并行识别时由线程池占满CPU
+
+    OpenMP在加载Tesseract时读取 OMP_THREAD_LIMIT，因此必须在进程启动、第一次识别之前调用；
+    已设置的值不覆盖。处理过程中不修改环境变量（多个任务同时运行时会相互干扰）。
+    """
+    os.environ.setdefault('OMP_THREAD_LIMIT', '1')
+
+
+class OCRLimiter:
+    """进程内所有OCR后端共用的并发限制：同时进行的识别调用不超过 limit（None 表示不限制）
+
+    多个处理任务同时运行时，限制的是整个进程占用的CPU，而不是每个任务各自的线程数。
+    """
+
+    def __init__(self, limit=None):
+        self.limit = limit
+        self.active = 0
+        self.peak = 0               # 同时进行的识别调用数的最大值
+        self.wait_seconds = 0.0     # 所有调用等待空位的时间之和
+        self._condition = threading.Condition()
+
+    def set_limit(self, limit):
+        with self._condition:
+            self.limit = limit
+            self._condition.notify_all()
+
+    def reset_stats(self):
+        with self._condition:
+            self.peak = self.active
+            self.wait_seconds = 0.0
+
+    def __enter__(self):
+        start = time.perf_counter()
+        with self._condition:
+            self._condition.wait_for(lambda: self.limit is None or self.active < self.limit)
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            self.wait_seconds += time.perf_counter() - start
+        return self
+
+    def __exit__(self, *exc_info):
+        with self._condition:
+            self.active -= 1
+            self._condition.notify()
+
+
+# 所有OCR后端共用的并发限制（默认不限制，见 OCRLimiter.set_limit）
+ocr_limiter = OCRLimiter()
+
+
+class OCRBackend:
+    """OCR后端基类
+
+    所有后端接受numpy数组或PIL图像，image_to_string / image_to_data 的返回值与 pytesseract 相同。
+    支持批量识别的后端可以一次提交多张图像，减少启动Tesseract和加载语言模型的次数。
+    """
+
+    name = 'base'
+    supports_batch = False
+
+    def __init__(self):
+        self.calls = 0
+        self.images = 0
+        self.seconds = 0.0          # 所有调用耗时之和
+        self.wall_seconds = 0.0     # 至少有一个调用在执行的总时间（多线程时小于 seconds）
+        self._active = 0
+        self._active_since = 0.0
+        self.logger = logging.getLogger(__name__)
+        self._stats_lock = threading.Lock()
+
+    def image_to_string(self, image, lang='eng', config=''):
+        return self.image_to_string_batch([image], lang, config)[0]
+
+    def image_to_data(self, image, lang='eng', config=''):
+        return self.image_to_data_batch([image], lang, config)[0]
+
+    def image_to_string_batch(self, images, lang='eng', config=''):
+        """识别多张图像，返回文本列表（顺序与输入一致）"""
+        with ocr_limiter:
+            start = self._begin()
+            try:
+                return self._image_to_string_batch(images, lang, config)
+            finally:
+                self._record(len(images), start)
+
+    def image_to_data_batch(self, images, lang='eng', config=''):
+        """识别多张图像，返回DataFrame列表（顺序与输入一致）"""
+        with ocr_limiter:
+            start = self._begin()
+            try:
+                return self._image_to_data_batch(images, lang, config)
+            finally:
+                self._record(len(images), start)
+
+    def _image_to_string_batch(self, images, lang, config):
+        raise NotImplementedError
+
+    def _image_to_data_batch(self, images, lang, config):
+        raise NotImplementedError
+
+    def version(self):
+        """Tesseract版本，用于缓存的配置指纹（见 probe_tesseract，不会每次启动子进程）"""
+        return probe_tesseract().version
+
+    def _begin(self):
+        now = time.perf_counter()
+        with self._stats_lock:
+            if self._active == 0:
+                self._active_since = now
+            self._active += 1
+        return now
+
+    def _record(self, image_count, start):
+        now = time.perf_counter()
+        with self._stats_lock:
+            self.calls += 1
+            self.images += image_count
+            self.seconds += now - start
+            self._active -= 1
+            if self._active == 0:
+                self.wall_seconds += now - self._active_since
+
+    def throughput(self):
+        """每秒识别的图像数（按实际经过的时间计算，包含多线程并行的效果）"""
+        return self.images / self.wall_seconds if self.wall_seconds > 0 else 0.0
+
+    def report(self):
+        """输出本后端的识别吞吐量"""
+        if not self.images:
+            return
+        self.logger.info(f"OCR后端 {self.name}: {self.calls}次调用, {self.images}张图像, "
+                         f"OCR耗时{self.wall_seconds:.2f}秒, 平均{self.throughput():.2f}张/秒, "
+                         f"单张平均{self.seconds / self.images * 1000:.0f}毫秒")
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self.calls = 0
+            self.images = 0
+            self.seconds = 0.0
+            self.wall_seconds = 0.0
+
+    def close(self):
+        pass
+
+
+class PytesseractBackend(OCRBackend):
+    """每次识别启动一个Tesseract子进程（原有方式）"""
+
+    name = 'cli'
+
+    def _image_to_string_batch(self, images, lang, config):
+        import pytesseract
+        return [pytesseract.image_to_string(image, lang=lang, config=config) for image in images]
+
+    def _image_to_data_batch(self, images, lang, config):
+        import pytesseract
+        return [pytesseract.image_to_data(image, lang=lang, config=config, output_type=pytesseract.Output.DATAFRAME)
+                for image in images]
+
+
+class BatchCLIBackend(OCRBackend):
+    """一次Tesseract调用识别多张图像
+
+    把图像写入临时目录，用图片列表文件一次提交给Tesseract，语言模型只加载一次。
+    文本结果按页分隔符拆分，TSV结果按 page_num 拆分。
+    """
+
+    name = 'cli-batch'
+    supports_batch = True
+    PAGE_SEPARATOR = '\f'
+
+    def _image_to_string_batch(self, images, lang, config):
+        output = self._run(images, lang, config, 'txt')
+        pages = output.split(self.PAGE_SEPARATOR)
+        if len(pages) != len(images) + 1:
+            raise RuntimeError(f"批量识别结果页数不一致: {len(pages) - 1} / {len(images)}")
+        return [page + self.PAGE_SEPARATOR for page in pages[:-1]]
+
+    def _image_to_data_batch(self, images, lang, config):
+        data = _read_tsv(self._run(images, lang, f'-c tessedit_create_tsv=1 {config.strip()}', ''))
+        results = []
+        for page_num in range(1, len(images) + 1):
+            page = data[data.page_num == page_num].reset_index(drop=True)
+            page['page_num'] = 1
+            results.append(page)
+        return results
+
+    def _run(self, images, lang, config, extension):
+        """把图像写入临时目录并执行一次Tesseract，返回标准输出"""
+        import pytesseract
+        temp_dir = tempfile.mkdtemp(prefix='tess_batch_')
+        try:
+            list_file = os.path.join(temp_dir, 'images.txt')
+            with open(list_file, 'w', encoding='utf-8') as f:
+                for index, image in enumerate(images):
+                    image, extension_name = pytesseract.pytesseract.prepare(image)
+                    image_path = os.path.join(temp_dir, f'{index:05d}.{extension_name}')
+                    image.save(image_path, format=image.format)
+                    f.write(image_path + '\n')
+
+            cmd_args = [pytesseract.pytesseract.tesseract_cmd, list_file, 'stdout', '-l', lang]
+            cmd_args += shlex.split(config, posix=os.name != 'nt')
+            if extension:
+                cmd_args.append(extension)
+
+            proc = subprocess.run(cmd_args, **pytesseract.pytesseract.subprocess_args())
+            if proc.returncode:
+                raise pytesseract.TesseractError(proc.returncode, proc.stderr.decode('utf-8', 'ignore').strip())
+            return proc.stdout.decode('utf-8')
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+class TesserocrBackend(OCRBackend):
+    """通过 tesserocr 在进程内调用Tesseract API
+
+    每组 (语言, OEM) 的引擎初始化后放回空闲列表重复使用，语言模型只加载一次，
+    PSM模式在每次识别前设置，图像直接在内存中传递，不需要临时文件和子进程。
+    """
+
+    name = 'tesserocr'
+    CONFIG_OPTION = re.compile(r'--(psm|oem)\s+(\d+)|-c\s+(\S+?)=(\S+)')
+
+    def __init__(self, tessdata_path=None):
+        super().__init__()
+        import tesserocr
+        self._tesserocr = tesserocr
+        self.tessdata_path = tessdata_path or os.environ.get('TESSDATA_PREFIX')
+        self._idle = {}             # 配置 -> 空闲引擎列表
+        self._apis = []
+        self._apis_lock = threading.Lock()
+
+    def version(self):
+        return self._tesserocr.tesseract_version().split()[1]
+
+    def check(self, lang='eng'):
+        """实际初始化一次引擎，返回错误信息（可以使用时返回None）；例如找不到语言包时初始化失败"""
+        kwargs = {'lang': lang}
+        if self.tessdata_path:
+            kwargs['path'] = self.tessdata_path
+        try:
+            api = self._tesserocr.PyTessBaseAPI(**kwargs)
+        except Exception as e:
+            return str(e)
+        api.End()
+        return None
+
+    def _parse_config(self, lang, config):
+        """把命令行形式的配置转换为 (PSM, 引擎的键 (语言, OEM, 变量))"""
+        psm, oem, variables = 3, 3, []
+        for match in self.CONFIG_OPTION.finditer(config):
+            if match.group(1) == 'psm':
+                psm = int(match.group(2))
+            elif match.group(1) == 'oem':
+                oem = int(match.group(2))
+            else:
+                variables.append((match.group(3), match.group(4)))
+        return psm, (lang, oem, tuple(variables))
+
+    def _acquire(self, key):
+        """取出一个空闲引擎，没有时新建（引擎数量不超过同时识别的线程数）"""
+        with self._apis_lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop()
+
+        lang, oem, variables = key
+        kwargs = {'lang': lang, 'oem': oem}
+        if self.tessdata_path:
+            kwargs['path'] = self.tessdata_path
+        api = self._tesserocr.PyTessBaseAPI(**kwargs)
+        for name, value in variables:
+            api.SetVariable(name, value)
+        with self._apis_lock:
+            self._apis.append(api)
+        return api
+
+    def _release(self, key, api):
+        with self._apis_lock:
+            self._idle.setdefault(key, []).append(api)
+
+    def _recognize(self, images, lang, config, read):
+        import pytesseract
+        psm, key = self._parse_config(lang, config)
+        api = self._acquire(key)
+        try:
+            api.SetPageSegMode(psm)
+            results = []
+            for image in images:
+                image, _ = pytesseract.pytesseract.prepare(image)
+                api.SetImage(image)
+                results.append(read(api))
+            return results
+        finally:
+            api.Clear()
+            self._release(key, api)
+
+    def _image_to_string_batch(self, images, lang, config):
+        return self._recognize(images, lang, config, lambda api: api.GetUTF8Text() + '\f')
+
+    def _image_to_data_batch(self, images, lang, config):
+        header = '\t'.join(TSV_COLUMNS) + '\n'
+        return self._recognize(images, lang, config, lambda api: _read_tsv(header + api.GetTSVText(0)))
+
+    def close(self):
+        with self._apis_lock:
+            for api in self._apis:
+                api.End()
+            self._apis = []
+            self._idle = {}
+
+
+BACKENDS = {
+    PytesseractBackend.name: PytesseractBackend,
+    BatchCLIBackend.name: BatchCLIBackend,
+    TesserocrBackend.name: TesserocrBackend
+}
+
+
+def import_tesserocr():
+    """在主线程中预先导入 tesserocr，未安装时忽略
+
+    tesserocr 导入时会安装信号处理器，只能在主线程中导入；导入之后可以在任何线程中创建
+    TesserocrBackend 和引擎。在后台线程中第一次创建后端的程序（例如界面）需要在启动时调用。
+    """
+    if importlib.util.find_spec('tesserocr') is None:
+        return
+    try:
+        import tesserocr  # noqa: F401
+    except Exception as e:
+        logging.getLogger(__name__).warning(f"无法导入 tesserocr: {str(e)}")
+
+
+def available_backends():
+    """返回当前环境可用的后端名称"""
+    names = [PytesseractBackend.name, BatchCLIBackend.name]
+    if importlib.util.find_spec('tesserocr') is not None:
+        names.append(TesserocrBackend.name)
+    return names
+
+
+def get_backend(backend=None):
+    """按名称创建OCR后端，'auto' 优先使用 tesserocr，未安装或无法初始化时使用批量命令行模式"""
+    if isinstance(backend, OCRBackend):
+        return backend
+    name = backend or 'auto'
+    if name == 'auto':
+        if TesserocrBackend.name in available_backends():
+            try:
+                tesserocr_backend = TesserocrBackend()
+                error = tesserocr_backend.check()
+            except Exception as e:  # 例如在非主线程中第一次导入 tesserocr（见 import_tesserocr）
+                error = str(e)
+            else:
+                if error is None:
+                    return tesserocr_backend
+            logging.getLogger(__name__).warning(f"tesserocr 无法初始化，改用 {BatchCLIBackend.name}: {error}")
+        name = BatchCLIBackend.name
+    if name not in BACKENDS:
+        raise ValueError(f"未知的OCR后端: {name}（可选: auto, {', '.join(BACKENDS)}）")
+    return BACKENDS[name]()
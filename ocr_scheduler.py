@@ -0,0 +1,166 @@
+import os
+import threading
+import contextvars
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait
+from ocr_backend import limit_openmp_threads
+
+# 有进度回调时，等待识别任务期间报告进度的间隔（秒）
+PROGRESS_INTERVAL = 0.2
+
+
+class _ImageJob:
+    """单张图片的识别任务状态"""
+
+    def __init__(self, image_path, plan):
+        self.image_path = image_path
+        self.plan = plan
+        self.lock = threading.Lock()
+        self.images = None          # 图像处理版本，第一个任务开始时才生成
+        self.loaded = False
+        self.pass_results = {}      # 计划序号 -> [(金额, 图像版本, PSM)]
+        self.next_index = 0         # 已按顺序合并的计划项数
+        self.all_results = []
+        self.futures = []
+        self.done = False
+        self.failed = False         # 图片读取失败
+        self.amount = None
+        self.passes = 0
+
+
+class OCRScheduler:
+    """把所有图片拆成 (图片, 图像版本, PSM) 任务，在线程池中并行识别
+
+    每次识别都是独立的Tesseract子进程，因此使用线程池即可占满所有核心。
+    识别结果按 PaymentImageTester 串行识别的顺序合并投票，结果与串行识别完全一致；
+    级联模式下某张图片达成一致，或在金额区域中已找到金额后，会取消该图片尚未开始的任务。
+    """
+
+    def __init__(self, tester, workers=None):
+        self.tester = tester
+        self.workers = workers or os.cpu_count() or 1
+        self.logger = logging.getLogger(__name__)
+
+    def run(self, image_paths, progress=None):
+        """识别所有图片，返回 {图片路径: (支付金额, 识别次数, 所有识别结果)}
+
+        图片读取失败或识别未完成时所有识别结果为None。progress(已完成的图片数) 在主线程中调用，
+        抛出异常（任务被取消）时取消所有尚未开始的识别任务后重新抛出。
+        """
+        # 先处理大图片，避免最后只剩一张大图在单核上运行
+        jobs = [_ImageJob(path, self.tester._pass_plan())
+                for path in sorted(image_paths, key=self._file_size, reverse=True)]
+        if not jobs:
+            return {}
+
+        self.logger.info(f"OCR任务调度: {len(jobs)}张图片, "
+                         f"{sum(len(job.plan) for job in jobs)}个识别任务, {self.workers}个线程")
+
+        # 多个线程同时识别时Tesseract自身只使用一个OpenMP线程，避免超额占用CPU（已设置的值不覆盖）。
+        # 命令行后端的每个子进程都会读取该设置；进程内的引擎只在第一次加载Tesseract之前设置才生效
+        limit_openmp_threads()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for job in jobs:
+                for index, (img_name, psm) in enumerate(job.plan):
+                    # 识别线程继承调用者的上下文（例如日志所属的处理任务）
+                    job.futures.append(executor.submit(contextvars.copy_context().run,
+                                                       self._run_task, job, index, img_name, psm))
+            futures = [future for job in jobs for future in job.futures]
+            if progress is None:
+                wait(futures)
+            else:
+                self._wait_with_progress(jobs, futures, progress)
+
+        return {job.image_path: (job.amount, job.passes, job.all_results if job.done and not job.failed else None)
+                for job in jobs}
+
+    def _wait_with_progress(self, jobs, futures, progress):
+        """等待所有识别任务，完成的图片数变化时报告进度"""
+        reported = None
+        try:
+            while futures:
+                futures = list(wait(futures, timeout=PROGRESS_INTERVAL).not_done)
+                finished = sum(job.done for job in jobs)
+                if finished != reported:
+                    progress(finished)
+                    reported = finished
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+    def _file_size(self, path):
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+
+    def _run_task(self, job, index, img_name, psm):
+        """执行单个识别任务，并把结果按顺序合并到所属图片
+
+        识别出错时这一次识别没有结果，但仍参与顺序合并，不影响同一图片后面的识别结果。
+        """
+        images = self._get_images(job)
+        if images is None:
+            return
+
+        try:
+            results = self.tester._run_pass(images, img_name, psm)
+        except Exception as e:
+            self.logger.exception(f"OCR任务失败 ({job.image_path}, 图像处理: {img_name}, PSM: {psm}): {str(e)}")
+            results = []
+
+        with job.lock:
+            if job.done:
+                return
+            job.pass_results[index] = results
+            self._merge_in_order(job)
+
+    def _get_images(self, job):
+        """第一次使用时生成图片的图像处理版本"""
+        with job.lock:
+            if not job.loaded:
+                job.loaded = True
+                try:
+                    job.images = self.tester._load_image_versions(job.image_path)
+                except Exception as e:
+                    self.logger.exception(f"读取图片失败 ({job.image_path}): {str(e)}")
+                if job.images is None:
+                    job.failed = True
+                    self._finish(job, None)
+            return job.images
+
+    def _merge_in_order(self, job):
+        """按计划顺序合并已完成的识别结果，与串行识别的判断过程一致"""
+        while job.next_index in job.pass_results:
+            job.all_results.extend(job.pass_results.pop(job.next_index))
+            job.next_index += 1
+
+            if self.tester.cascade:
+                agreed_amount = self.tester._agreed_amount(job.all_results)
+                if agreed_amount is not None:
+                    self._finish(job, self.tester._select_amount(job.all_results, self._passes(job), agreed_amount))
+                    return
+            
+            # 金额区域中已找到金额时取消整张图片的识别任务
+            if self.tester._roi_found(job.all_results, job.next_index):
+                self._finish(job, self.tester._select_amount(job.all_results, self._passes(job)))
+                return
+
+        if job.next_index == len(job.plan):
+            self._finish(job, self.tester._select_amount(job.all_results, self._passes(job)))
+
+    def _passes(self, job):
+        """已合并的计划项中实际执行OCR的次数"""
+        if job.images is None:
+            return 0
+        return self.tester._count_passes(job.images, job.plan[:job.next_index])
+
+    def _finish(self, job, amount):
+        """记录图片的最终结果，取消尚未开始的任务并释放图像"""
+        job.done = True
+        job.amount = amount
+        job.passes = self._passes(job)
+        job.images = None
+        for future in job.futures:
+            future.cancel()
@@ -1,14 +1,26 @@
 import os
-import pdfplumber
-import pytesseract
-import cv2
-import pandas as pd
 from datetime import datetime
 import re
-import numpy as np
-from pytesseract import Output
 import traceback
 import logging
+import logging.handlers
+import contextvars
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from result_cache import ResultCache, file_sha256, config_fingerprint
+from ocr_backend import get_backend
+from image_preprocess import DEFAULT_GLYPH_HEIGHT, is_payment_image, shared_store
+from amount_grammar import WORD_PATTERNS, extract_word_amounts
+from invoice_fields import get_scanner
+from pdf_text import get_pdf_backend
+from invoice_qr import QR_VERSION, read_invoice_qr
+from invoice_templates import TEMPLATE_REQUIRED, TEMPLATE_VERSION, match_template
+from pdf_ocr import PDF_OCR_VERSION, DEFAULT_OCR_DPI, MAX_RENDER_PIXELS, ScannedPageReader
+from pdf_stream_writer import StreamingPDFWriter
+from matching import match_payments
+from pipeline import combine_results
+from records import InvoiceRecord, PaymentRecord, records_frame, export_table
 
 # 配置日志
 logging.basicConfig(
@@ -16,208 +28,371 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
+def _init_pdf_worker(log_queue):
+    """PDF解析子进程初始化：日志统一发回主进程"""
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(logging.INFO)
+
+# 子进程中的OCR后端，同一进程处理的所有扫描件共用（语言模型只加载一次）
+_worker_ocr_backends = {}
+
+def _extract_pdf_worker(folder_path, pdf_path, index, started, options):
+    """在子进程中解析单个PDF，返回 (提取的字段, 统计)，出错时字段为None
+
+    options 为主进程中分析器的提取设置（见 DocumentAnalyzer._worker_options）。
+    """
+    started[index] = True
+    options = dict(options)
+    name = options.pop('ocr_backend')
+    if name not in _worker_ocr_backends:
+        _worker_ocr_backends[name] = get_backend(name)
+    analyzer = DocumentAnalyzer(folder_path, use_cache=False, ocr_backend=_worker_ocr_backends[name], **options)
+    try:
+        fields = analyzer._extract_pdf_fields(pdf_path)
+    except Exception as e:
+        analyzer.logger.error(f"处理PDF文件时出错 {pdf_path}: {str(e)}")
+        traceback.print_exc()
+        fields = None
+    backend, reader = analyzer.pdf_backend, analyzer.page_reader
+    return fields, {
+        'pages': (backend.pages_parsed, backend.pages_total, backend.seconds),
+        'ocr': (reader.pages, reader.cache_hits, reader.seconds)
+    }
+
+class _LogForwarder(logging.Handler):
+    """把子进程发回的日志交给主进程中同名的日志记录器（在创建者的上下文中处理，例如日志所属的处理任务）"""
+    def __init__(self):
+        super().__init__()
+        self.context = contextvars.copy_context()
+
+    def emit(self, record):
+        self.context.run(logging.getLogger(record.name).handle, record)
+
 class DocumentAnalyzer:
-    def __init__(self, folder_path):
+    # 发票号码
+    INVOICE_PATTERNS = [
+        r'发票号码[:：]\s*(\w+)',
+        r'发票号码\s*[:：]?\s*(\w+)',
+        r'NO[.：]\s*(\w+)',
+        r'发票代码[:：]\s*(\w+)',
+        r'[Nn][Oo]\.?\s*(\w+)'
+    ]
+    
+    # 开票日期
+    DATE_PATTERNS = [
+        r'开票日期[:：]\s*(\d{4}[-年/]\d{1,2}[-月/]\d{1,2})',
+        r'开票日期\s*[:：]?\s*(\d{4}[-年/]\d{1,2}[-月/]\d{1,2})',
+        r'日期[:：]\s*(\d{4}[-年/]\d{1,2}[-月/]\d{1,2})',
+        r'(\d{4}[-年/]\d{1,2}[-月/]\d{1,2})\s*日期'
+    ]
+    
+    # 供应商名称
+    SUPPLIER_PATTERNS = [
+        r'名\s*称[:：]\s*([^\n]*)',
+        r'销\s*售\s*方[:：]\s*([^\n]*)',
+        r'供\s*应\s*商[:：]\s*([^\n]*)',
+        r'销售方名称[:：]\s*([^\n]*)',
+        r'公司名称[:：]\s*([^\n]*)'
+    ]
+    
+    # 金额
+    AMOUNT_PATTERNS = [
+        r'金额[:：]\s*[¥￥]?\s*(\d+[\.,]?\d*)',
+        r'合\s*计[:：]\s*[¥￥]?\s*(\d+[\.,]?\d*)',
+        r'价税合计[:：]\s*[¥￥]?\s*(\d+[\.,]?\d*)',
+        r'小写[:：]\s*[¥￥]?\s*(\d+[\.,]?\d*)',
+        r'[¥￥]\s*(\d+[\.,]?\d*)',
+        r'人民币\s*[¥￥]?\s*(\d+[\.,]?\d*)',
+        r'总额[:：]\s*[¥￥]?\s*(\d+[\.,]?\d*)',
+        r'应付金额[:：]\s*[¥￥]?\s*(\d+[\.,]?\d*)'
+    ]
+    
+    # 商品名称
+    PRODUCT_PATTERNS = [
+        r'货物或应税劳务、服务名称\s*([^\n]*)',
+        r'商品名称\s*([^\n]*)',
+        r'项目名称\s*([^\n]*)',
+        r'商品或服务名称\s*([^\n]*)'
+    ]
+    
+    # 扫描件（没有文本层的页）OCR识别的语言
+    PDF_OCR_LANG = 'chi_sim'
+    
+    # 提取逻辑的版本号，修改提取代码（而不只是模式列表）时需要递增，使缓存失效
+    EXTRACTOR_VERSION = 4
+    
+    def __init__(self, folder_path, workers=1, use_cache=True, cache_path=None, ocr_backend=None,
+                 image_store=None, target_glyph_height=DEFAULT_GLYPH_HEIGHT, pdf_backend=None, stop_early=True,
+                 use_qr=True, use_templates=True, pdf_ocr=True, ocr_dpi=DEFAULT_OCR_DPI,
+                 max_render_pixels=MAX_RENDER_PIXELS, page_cache_dir=None):
         self.folder_path = folder_path
+        self.workers = workers  # 大于1时使用进程池并行解析PDF
         self.results = []
         self.payment_images = {}  # 存储支付图片信息
-        self.payment_patterns = [
-            r'-\s*(\d+(?:[.,]\d{2})?)',  # 匹配以'-'开头的数字
-            r'−\s*(\d+(?:[.,]\d{2})?)',  # 匹配以'−'开头的数字（不同的减号字符）
-            r'[\-−]\s*¥?\s*(\d+(?:[.,]\d{2})?)',  # 匹配减号后带￥的数字
-        ]
         self.logger = logging.getLogger(__name__)
         
         # 设置输出文件路径
         self.output_dir = folder_path
-        self.invoice_results_file = os.path.join(self.output_dir, 'analysis_results.csv')
-        self.payment_records_file = os.path.join(self.output_dir, 'payment_records.csv')
+        
+        # 发票信息缓存：PDF内容哈希 + 提取器版本 -> 提取的字段
+        self.use_cache = use_cache
+        self.cache_path = cache_path or os.path.join('output', 'pdf_cache.sqlite')
+        self._cache = None
+        
+        # 支付截图使用的OCR后端，以及与 PaymentImageTester 共用的图片缓存
+        self.ocr_backend = get_backend(ocr_backend)
+        self.image_store = image_store or shared_store
+        self.target_glyph_height = target_glyph_height
+        
+        # PDF文本提取后端；stop_early 为真时，所需字段都已找到后不再解析后面的页
+        self.pdf_backend = get_pdf_backend(pdf_backend)
+        self.stop_early = stop_early
+        
+        # 读取发票二维码：发票号码、开票日期和金额以二维码为准
+        self.use_qr = use_qr
+        
+        # 按发票版式模板只读取各字段所在区域的文本，没有匹配的模板时解析全文
+        self.use_templates = use_templates
+        
+        # 没有文本层的页（扫描件）渲染后用同一个OCR后端识别；渲染的页面图像缓存在磁盘上
+        self.pdf_ocr = pdf_ocr
+        self.page_cache_dir = page_cache_dir or (os.path.join('output', 'page_cache') if use_cache else None)
+        self.page_reader = ScannedPageReader(self.ocr_backend, self.PDF_OCR_LANG, ocr_dpi, max_render_pixels,
+                                             self.page_cache_dir)
+        
+        # 合并PDF的写入器：处理过程中每个发票解析完后立即追加页面（见 _start_merge）
+        self.merge_writer = None
+        
+        # 进度回调 progress(阶段, 已完成数, 总数)，每个PDF处理完后调用（见 jobs.Job.update）
+        self.progress = None
+
+    def extractor_fingerprint(self):
+        """提取器版本指纹，模式列表、提取逻辑或文本提取方式变化时自动变化"""
+        return config_fingerprint(self.EXTRACTOR_VERSION, self.INVOICE_PATTERNS, self.DATE_PATTERNS,
+                                  self.SUPPLIER_PATTERNS, self.AMOUNT_PATTERNS, self.PRODUCT_PATTERNS,
+                                  self.pdf_backend.name, self.stop_early, self.use_qr and QR_VERSION,
+                                  self.use_templates and TEMPLATE_VERSION,
+                                  self.pdf_ocr and (PDF_OCR_VERSION, self.PDF_OCR_LANG, self.page_reader.dpi,
+                                                    self.page_reader.max_pixels))
+
+    def _worker_options(self):
+        """传给PDF解析子进程的提取设置"""
+        return {
+            'ocr_backend': self.ocr_backend.name,
+            'pdf_backend': self.pdf_backend.name,
+            'stop_early': self.stop_early,
+            'use_qr': self.use_qr,
+            'use_templates': self.use_templates,
+            'pdf_ocr': self.pdf_ocr,
+            'ocr_dpi': self.page_reader.dpi,
+            'max_render_pixels': self.page_reader.max_pixels,
+            'page_cache_dir': self.page_cache_dir
+        }
+
+    @classmethod
+    def field_scanner(cls):
+        """按当前模式列表编译的字段扫描器（同一组模式只编译一次）"""
+        return get_scanner(tuple(cls.INVOICE_PATTERNS), tuple(cls.DATE_PATTERNS), tuple(cls.SUPPLIER_PATTERNS),
+                           tuple(cls.AMOUNT_PATTERNS), tuple(cls.PRODUCT_PATTERNS))
 
     def extract_pdf_info(self, pdf_path):
         """从PDF提取发票信息"""
         try:
-            with pdfplumber.open(pdf_path) as pdf:
-                text = ''
-                for page in pdf.pages:
-                    text += page.extract_text() or ''
-                
-                self.logger.info(f"\n提取的文本内容:")
-                self.logger.info("-" * 50)
-                self.logger.info(text)
-                self.logger.info("-" * 50)
-                
-                # 提取发票号码
-                invoice_patterns = [
-                    r'发票号码[:：]\s*(\w+)',
-                    r'发票号码\s*[:：]?\s*(\w+)',
-                    r'NO[.：]\s*(\w+)',
-                    r'发票代码[:：]\s*(\w+)',
-                    r'[Nn][Oo]\.?\s*(\w+)'
-                ]
-                invoice_number = None
-                for pattern in invoice_patterns:
-                    match = re.search(pattern, text)
-                    if match:
-                        invoice_number = match.group(1).strip()
-                        self.logger.info(f"找到发票号码: {invoice_number}")
-                        break
-                
-                # 提取开票日期
-                date_patterns = [
-                    r'开票日期[:：]\s*(\d{4}[-年/]\d{1,2}[-月/]\d{1,2})',
-                    r'开票日期\s*[:：]?\s*(\d{4}[-年/]\d{1,2}[-月/]\d{1,2})',
-                    r'日期[:：]\s*(\d{4}[-年/]\d{1,2}[-月/]\d{1,2})',
-                    r'(\d{4}[-年/]\d{1,2}[-月/]\d{1,2})\s*日期'
-                ]
-                invoice_date = None
-                for pattern in date_patterns:
-                    match = re.search(pattern, text)
-                    if match:
-                        date_str = match.group(1)
-                        # 统一日期格式
-                        date_str = date_str.replace('年', '-').replace('月', '-').replace('日', '').replace('/', '-')
-                        invoice_date = date_str
-                        self.logger.info(f"找到开票日期: {invoice_date}")
-                        break
-                
-                # 提取供应商名称
-                supplier_patterns = [
-                    r'名\s*称[:：]\s*([^\n]*)',
-                    r'销\s*售\s*方[:：]\s*([^\n]*)',
-                    r'供\s*应\s*商[:：]\s*([^\n]*)',
-                    r'销售方名称[:：]\s*([^\n]*)',
-                    r'公司名称[:：]\s*([^\n]*)'
-                ]
-                supplier = None
-                for pattern in supplier_patterns:
-                    match = re.search(pattern, text)
-                    if match:
-                        supplier = match.group(1).strip()
-                        # 清理供应商名称中的特殊字符
-                        supplier = re.sub(r'[^\w\s\u4e00-\u9fff]', '', supplier)
-                        self.logger.info(f"找到供应商: {supplier}")
-                        break
-                
-                # 提取金额
-                amount_patterns = [
-                    r'金额[:：]\s*[¥￥]?\s*(\d+[\.,]?\d*)',
-                    r'合\s*计[:：]\s*[¥￥]?\s*(\d+[\.,]?\d*)',
-                    r'价税合计[:：]\s*[¥￥]?\s*(\d+[\.,]?\d*)',
-                    r'小写[:：]\s*[¥￥]?\s*(\d+[\.,]?\d*)',
-                    r'[¥￥]\s*(\d+[\.,]?\d*)',
-                    r'人民币\s*[¥￥]?\s*(\d+[\.,]?\d*)',
-                    r'总额[:：]\s*[¥￥]?\s*(\d+[\.,]?\d*)',
-                    r'应付金额[:：]\s*[¥￥]?\s*(\d+[\.,]?\d*)'
-                ]
-                
-                amount = None
-                for pattern in amount_patterns:
-                    matches = re.finditer(pattern, text)
-                    for match in matches:
-                        potential_amount = match.group(1).replace(',', '')
-                        try:
-                            current_amount = float(potential_amount)
-                            if amount is None or current_amount > amount:
-                                amount = current_amount
-                                self.logger.info(f"找到金额: {amount}")
-                        except ValueError:
-                            continue
-                
-                # 提取商品名称
-                product_patterns = [
-                    r'货物或应税劳务、服务名称\s*([^\n]*)',
-                    r'商品名称\s*([^\n]*)',
-                    r'项目名称\s*([^\n]*)',
-                    r'商品或服务名称\s*([^\n]*)'
-                ]
-                product_name = None
-                for pattern in product_patterns:
-                    match = re.search(pattern, text)
-                    if match:
-                        product_name = match.group(1).strip()
-                        # 清理商品名称中的特殊字符
-                        product_name = re.sub(r'[^\w\s\u4e00-\u9fff]', '', product_name)
-                        self.logger.info(f"找到商品名称: {product_name}")
-                        break
-                
-                # 如果没有找到商品名称，尝试从文件名提取
-                if not product_name:
-                    product_name = self.extract_product_name_from_filename(pdf_path)
-                    if product_name:
-                        self.logger.info(f"从文件名提取的商品名称: {product_name}")
-                
-                # 记录提取结果
-                self.logger.info("\n发票信息提取结果:")
-                self.logger.info(f"发票号码: {invoice_number}")
-                self.logger.info(f"开票日期: {invoice_date}")
-                self.logger.info(f"供应商: {supplier}")
-                self.logger.info(f"金额: {amount}")
-                self.logger.info(f"商品名称: {product_name}")
-                
-                return {
-                    'invoice_number': invoice_number,
-                    'invoice_date': invoice_date,
-                    'supplier': supplier,
-                    'price': f"{amount:.2f}" if amount is not None else None,
-                    'product_name': product_name,
-                    'filename': os.path.basename(pdf_path)
-                }
+            cache_key, fields = self._load_cached(pdf_path)
+            if fields is None:
+                fields = self._extract_pdf_fields(pdf_path)
+                self._save_cached(cache_key, fields)
+            else:
+                self.logger.info(f"使用缓存的发票信息: {os.path.basename(pdf_path)}")
+                self._merge_file(pdf_path)
+            return self._pdf_info_from_fields(pdf_path, fields)
                 
         except Exception as e:
             self.logger.error(f"处理PDF文件时出错 {pdf_path}: {str(e)}")
             traceback.print_exc()
             return None
 
+    def _extract_pdf_fields(self, pdf_path):
+        """解析PDF文本并提取发票字段（不含从文件名推断的信息）"""
+        with self.pdf_backend.open(pdf_path) as document:
+            try:
+                return self._extract_document_fields(document, pdf_path)
+            finally:
+                # 合并PDF时直接复制已打开文档中的页面，不再重新读取文件
+                self._merge_document(document)
+    
+    def _extract_document_fields(self, document, pdf_path):
+        """从打开的PDF文档中提取发票字段"""
+        qr = self._read_qr(document, pdf_path) if self.use_qr else None
+        template_fields = self._read_template(document, pdf_path, qr) if self.use_templates else None
+        
+        if template_fields and all(template_fields[name] is not None for name in TEMPLATE_REQUIRED):
+            # 模板区域中已找到所需字段，不再解析全文
+            fields = template_fields
+        else:
+            # 逐页提取文本并识别字段，发票号码、日期、供应商和价税合计都找到后不再解析后面的页
+            fields, text = self.field_scanner().scan_pages(self._page_texts(document), self.stop_early, qr)
+            
+            self.logger.info(f"\n提取的文本内容（已解析 {document.pages_parsed}/{document.page_count} 页）:")
+            self.logger.info("-" * 50)
+            self.logger.info(text)
+            self.logger.info("-" * 50)
+            
+            if template_fields:
+                # 模板区域中找到的字段（例如销售方名称）比全文匹配准确，优先使用
+                fields.update({name: value for name, value in template_fields.items() if value is not None})
+        
+        for name, label in [('invoice_number', '发票号码'), ('invoice_date', '开票日期'), ('supplier', '供应商'),
+                            ('price', '金额'), ('product_name', '商品名称')]:
+            if fields[name] is not None:
+                self.logger.info(f"找到{label}: {fields[name]}")
+        return fields
+
+    def _page_texts(self, document):
+        """逐页返回文本，没有文本层的页（扫描件）渲染后OCR识别"""
+        for index, text in enumerate(document.pages()):
+            if self.pdf_ocr and not text.strip():
+                try:
+                    text = self.page_reader.read(document, index)
+                except Exception as e:
+                    self.logger.error(f"OCR识别扫描件第{index + 1}页时出错 {document.pdf_path}: {str(e)}")
+                    traceback.print_exc()
+            yield text
+
+    def _read_template(self, document, pdf_path, qr):
+        """按版式模板从第一页的字段区域中提取发票字段，没有匹配的模板或出错时返回None"""
+        try:
+            template, words = match_template(document)
+            if template is None:
+                return None
+            fields, texts = template.extract(words, self.field_scanner(), qr)
+        except Exception as e:
+            self.logger.error(f"按发票模板提取时出错 {pdf_path}: {str(e)}")
+            traceback.print_exc()
+            return None
+        
+        self.logger.info(f"\n发票版式: {template.name}，各区域的文本内容:")
+        self.logger.info("-" * 50)
+        for name, text in texts.items():
+            self.logger.info(f"[{name}] {text}")
+        self.logger.info("-" * 50)
+        return fields
+
+    def _read_qr(self, document, pdf_path):
+        """读取发票二维码，没有二维码或读取失败时返回None（只使用文本中的字段）"""
+        try:
+            qr = read_invoice_qr(document)
+        except Exception as e:
+            self.logger.error(f"读取发票二维码时出错 {pdf_path}: {str(e)}")
+            traceback.print_exc()
+            return None
+        if qr:
+            self.logger.info(f"发票二维码: 发票代码 {qr['invoice_code'] or '无'}, 发票号码 {qr['invoice_number']}, "
+                             f"开票日期 {qr['invoice_date']}, 金额（不含税） {qr['amount']}")
+        else:
+            self.logger.info("未找到发票二维码，从文本中提取发票信息")
+        return qr
+
+    def _pdf_info_from_fields(self, pdf_path, fields):
+        """根据提取的字段生成发票记录"""
+        product_name = fields['product_name']
+        
+        # 如果没有找到商品名称，尝试从文件名提取
+        if not product_name:
+            product_name = self.extract_product_name_from_filename(pdf_path)
+            if product_name:
+                self.logger.info(f"从文件名提取的商品名称: {product_name}")
+        
+        # 记录提取结果
+        self.logger.info("\n发票信息提取结果:")
+        self.logger.info(f"发票号码: {fields['invoice_number']}")
+        self.logger.info(f"开票日期: {fields['invoice_date']}")
+        self.logger.info(f"供应商: {fields['supplier']}")
+        self.logger.info(f"金额: {fields['price']}")
+        self.logger.info(f"商品名称: {product_name}")
+        
+        return {
+            'invoice_number': fields['invoice_number'],
+            'invoice_date': fields['invoice_date'],
+            'supplier': fields['supplier'],
+            'price': fields['price'],
+            'product_name': product_name,
+            'filename': os.path.basename(pdf_path)
+        }
+
+    def _get_cache(self):
+        """打开发票信息缓存，未启用或无法打开时返回None"""
+        if not self.use_cache:
+            return None
+        if self._cache is None:
+            try:
+                self._cache = ResultCache(self.cache_path, 'pdf_info')
+            except Exception as e:
+                self.logger.warning(f"无法打开发票缓存，本次不使用缓存: {str(e)}")
+                self.use_cache = False
+                return None
+        return self._cache
+
+    def _load_cached(self, pdf_path):
+        """返回 (缓存键, 缓存的字段)，未启用缓存时均为None"""
+        cache = self._get_cache()
+        if cache is None:
+            return None, None
+        try:
+            key = f"{file_sha256(pdf_path)}:{self.extractor_fingerprint()}"
+        except OSError:
+            return None, None
+        return key, cache.get(key)
+
+    def _save_cached(self, cache_key, fields):
+        if cache_key is None or self._cache is None:
+            return
+        self._cache.put(cache_key, fields)
+
+    def _close_cache(self):
+        """报告缓存命中情况，淘汰旧记录并关闭缓存（页面图像缓存同样淘汰旧图像）"""
+        self.page_reader.evict_cache()
+        if self._cache is None:
+            return
+        self.logger.info(f"发票缓存: 命中{self._cache.hits}次, 未命中{self._cache.misses}次")
+        self._cache.close()
+        self._cache = None
+
     def match_payment_to_invoice(self):
-        """将支付图片与发票匹配并更新结果"""
+        """将支付图片与发票匹配并更新结果（按文件名和金额一对一匹配，见 matching.py）"""
+        invoices = [(result['filename'], result['price']) for result in self.results if 'price' in result]
+        matches = match_payments(invoices, self.payment_images.items())
+        by_invoice = {match.invoice: match for match in matches.values()}
         for result in self.results:
             if 'price' in result:  # 这是票记录
-                invoice_amount = float(result['price'])
-                filename_without_ext = os.path.splitext(result['filename'])[0]
-                
-                # 查找对应的支付图片
-                matching_payment = None
-                for payment_filename, payment_amount in self.payment_images.items():
-                    payment_name_without_ext = os.path.splitext(payment_filename)[0]
-                    
-                    # 如果文件名（不含扩展名）相同或包含关系，认为是匹配的
-                    if (payment_name_without_ext in filename_without_ext or 
-                        filename_without_ext in payment_name_without_ext):
-                        matching_payment = payment_amount
-                        break
+                match = by_invoice.get(result['filename'])
                 
-                # 更新结果，添加实际支付金额
-                result['actual_payment'] = matching_payment
+                # 更新结果，添加实际支付金额和匹配依据
+                result['actual_payment'] = self.payment_images[match.payment] if match else None
+                result['match_score'] = match.score if match else None
+                result['match_reason'] = match.reason if match else None
 
     def extract_payment_from_image(self, image_path):
         """Extract payment amount from image using OCR"""
         try:
-            # 读取图片
-            image = cv2.imdecode(np.fromfile(str(image_path), dtype=np.uint8), cv2.IMREAD_COLOR)
-            if image is None:
+            # 读取灰度图并按正文字高缩放到统一尺度（与 PaymentImageTester 共用解码和图像处理结果）
+            image = self.image_store.get(image_path, self.target_glyph_height)
+            if not image.load():
                 print(f"错误：无法读取图片 {image_path}")
                 return None
-                
-            # 转换为灰度图
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
             
             # 应用不同的图像预处理方法并获取文本数据
             results = []
             
-            # 1. 原始灰度图
-            data = pytesseract.image_to_data(gray, lang='chi_sim', output_type=Output.DATAFRAME)
-            self.process_ocr_data(data, "原始灰度图", results)
-            
-            # 2. OTSU 二值化
-            _, threshold = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-            data = pytesseract.image_to_data(threshold, lang='chi_sim', output_type=Output.DATAFRAME)
-            self.process_ocr_data(data, "OTSU二值化", results)
-            
-            # 3. 自适应阈值
-            adaptive = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
-                                          cv2.THRESH_BINARY, 11, 2)
-            data = pytesseract.image_to_data(adaptive, lang='chi_sim', output_type=Output.DATAFRAME)
-            self.process_ocr_data(data, "自适应阈值", results)
+            # 原始灰度图、OTSU 二值化和自适应阈值一次提交给OCR后端
+            versions = [("原始灰度图", image.variant('gray')), ("OTSU二值化", image.variant('otsu')),
+                        ("自适应阈值", image.variant('adaptive'))]
+            data_list = self.ocr_backend.image_to_data_batch([image for _, image in versions], lang='chi_sim')
+            for (method_name, _), data in zip(versions, data_list):
+                self.process_ocr_data(data, method_name, results)
 
             # 分析结果
             if results:
@@ -241,33 +416,18 @@ class DocumentAnalyzer:
         """处理OCR数据，提取数字及其高度信息"""
         # 清理数据
         data = data[data.conf != -1]  # 移除低置信度的结果
+        words = data.text[data.text.notna()]
+        words = words[~words.astype(str).str.isspace()]
         
-        # 遍历每个识别出的文本块
-        for _, row in data.iterrows():
-            if pd.isna(row.text) or str(row.text).isspace():
-                continue
-                
-            text = str(row.text)
-            height = row.height
-            
-            # 查找负数金额
-            for pattern in self.payment_patterns:
-                matches = re.finditer(pattern, text)
-                for match in matches:
-                    amount_str = match.group(1).replace(',', '')
-                    try:
-                        # 将金额转换为负数
-                        amount_float = -float(amount_str)
-                        if -1000000 <= amount_float <= -1:  # 设置合理的负数金额范围
-                            results.append((amount_float, height, method_name, pattern))
-                    except ValueError:
-                        continue
+        # 对所有识别出的文本块一次匹配负数金额（已限制在合理范围内）
+        for index, amount, pattern in extract_word_amounts(words):
+            results.append((-float(amount), data.height[index], method_name, WORD_PATTERNS[pattern]))
 
     def analyze_documents(self):
         """Analyze all documents in the folder"""
         # 首先处理所有图片文件，存储支付信息
         for filename in os.listdir(self.folder_path):
-            if filename.lower().endswith(('.png', '.jpg', '.jpeg')):
+            if is_payment_image(filename):
                 file_path = os.path.join(self.folder_path, filename)
                 payment_amount = self.extract_payment_from_image(file_path)
                 if payment_amount:
@@ -281,16 +441,19 @@ class DocumentAnalyzer:
                 pdf_info = self.extract_pdf_info(file_path)
                 if pdf_info:
                     self.results.append(pdf_info)
+        self._close_cache()
+        self.ocr_backend.report()
         
         # 匹配支付图片和发票
         self.match_payment_to_invoice()
 
     def save_to_csv(self, output_file='analysis_results.csv'):
         """Save results to CSV file"""
+        import pandas as pd
         df = pd.DataFrame(self.results)
         
         # 重新排列列的顺序，确保actual_payment在price旁边
-        columns = ['filename', 'price', 'actual_payment', 'invoice_number', 'invoice_date']
+        columns = ['filename', 'price', 'actual_payment', 'invoice_number', 'invoice_date', 'match_score', 'match_reason']
         df = df.reindex(columns=columns)
         
         # 添加支付差额列
@@ -303,7 +466,9 @@ class DocumentAnalyzer:
             'invoice_number': '发票号码',
             'invoice_date': '开票日期',
             'filename': '文件名',
-            'payment_difference': '支付差额'
+            'payment_difference': '支付差额',
+            'match_score': '匹配得分',
+            'match_reason': '匹配依据'
         })
         
         # 保存结果
@@ -343,8 +508,8 @@ class DocumentAnalyzer:
             self.logger.error(f"从文件名提取商品名称时出错: {str(e)}")
             return None
 
-    def process_pdfs(self, input_dir):
-        """处理目录下的所有PDF文件"""
+    def process_pdfs(self, input_dir, output_dir='output', formats=('csv',)):
+        """处理目录下的所有PDF文件，返回发票记录列表（InvoiceRecord）；结果和合并PDF写入 output_dir"""
         try:
             results = []
             pdf_files = []
@@ -357,54 +522,191 @@ class DocumentAnalyzer:
             
             if not pdf_files:
                 self.logger.warning("未找到PDF文件")
-                return
+                return []
             
-            self.logger.info(f"\n开始处理 {len(pdf_files)} 个PDF文件...")
-            
-            # 处理每个PDF文件
-            for pdf_path in pdf_files:
-                self.logger.info(f"\n处理PDF文件: {os.path.basename(pdf_path)}")
-                info = self.extract_pdf_info(pdf_path)
-                if info:
-                    results.append(info)
-            
-            # 保存结果到CSV
-            if results:
-                df = pd.DataFrame(results)
-                
-                # 确保输出目录存在
-                output_dir = 'output'
-                if not os.path.exists(output_dir):
-                    os.makedirs(output_dir)
-                
-                # 保存到invoice_results.csv
-                output_file = os.path.join(output_dir, 'invoice_results.csv')
-                df.to_csv(output_file, index=False, encoding='utf-8')
-                self.logger.info(f"\n发票处理结果已保存到: {output_file}")
-                self.logger.info(f"处理完成的PDF数量: {len(results)}")
-                
-                # 显示处理结果统计
-                self.logger.info("\n处理结果统计:")
-                self.logger.info(f"成功提取发票号码: {df['invoice_number'].notna().sum()}/{len(df)}")
-                self.logger.info(f"成功提取开票日期: {df['invoice_date'].notna().sum()}/{len(df)}")
-                self.logger.info(f"成功提取供应商: {df['supplier'].notna().sum()}/{len(df)}")
-                self.logger.info(f"成功提取金额: {df['price'].notna().sum()}/{len(df)}")
-                self.logger.info(f"成功提取商品名称: {df['product_name'].notna().sum()}/{len(df)}")
-            else:
-                self.logger.warning("没有成功提取的发票信息")
+            # 按文件名排序，与合并PDF的顺序一致
+            pdf_files.sort()
             
-            # 合并PDF文件
-            self.merge_pdfs(input_dir)
+            self.logger.info(f"\n开始处理 {len(pdf_files)} 个PDF文件...")
+            # 合并PDF文件：每个发票解析完后立即追加到合并文件
+            self._start_merge(output_dir)
+            results = [InvoiceRecord.from_info(info) for info in self.extract_pdfs(pdf_files) if info]
+            
+            # 导出结果到CSV
+            self.save_invoice_results(results, output_dir, formats)
+            self._finish_merge()
+            return results
                 
         except Exception as e:
             self.logger.error(f"处理PDF文件时出错: {str(e)}")
             traceback.print_exc()
+            return []
+        finally:
+            self._abort_merge()
+            self._close_cache()
             
-    def merge_pdfs(self, input_dir):
-        """合并所有PDF文件"""
+    def extract_pdfs(self, pdf_files):
+        """提取多个PDF的发票信息，返回与 pdf_files 顺序一致的结果列表（失败的为None）"""
         try:
-            import PyPDF2
+            if self.workers > 1:
+                # 进程池并行处理
+                return self.extract_pdfs_parallel(pdf_files)
             
+            # 处理每个PDF文件
+            results = []
+            self._report_progress(0, len(pdf_files))
+            for pdf_path in pdf_files:
+                self.logger.info(f"\n处理PDF文件: {os.path.basename(pdf_path)}")
+                results.append(self.extract_pdf_info(pdf_path))
+                self._report_progress(len(results), len(pdf_files))
+            return results
+        finally:
+            self._close_cache()
+            self.pdf_backend.report()
+            self.page_reader.report()
+
+    def save_invoice_results(self, results, output_dir='output', formats=('csv',)):
+        """导出发票记录（InvoiceRecord）到 invoice_results.csv 并显示统计"""
+        if not results:
+            self.logger.warning("没有成功提取的发票信息")
+            return
+        
+        df = records_frame(results, InvoiceRecord)
+        
+        # 确保输出目录存在
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        
+        # 导出到invoice_results.csv
+        output_file = os.path.join(output_dir, 'invoice_results.csv')
+        for exported in export_table(df, output_file, formats):
+            self.logger.info(f"\n发票处理结果已保存到: {exported}")
+        self.logger.info(f"处理完成的PDF数量: {len(results)}")
+        
+        # 显示处理结果统计
+        self.logger.info("\n处理结果统计:")
+        self.logger.info(f"成功提取发票号码: {df['invoice_number'].notna().sum()}/{len(df)}")
+        self.logger.info(f"成功提取开票日期: {df['invoice_date'].notna().sum()}/{len(df)}")
+        self.logger.info(f"成功提取供应商: {df['supplier'].notna().sum()}/{len(df)}")
+        self.logger.info(f"成功提取金额: {df['price'].notna().sum()}/{len(df)}")
+        self.logger.info(f"成功提取商品名称: {df['product_name'].notna().sum()}/{len(df)}")
+
+    def extract_pdfs_parallel(self, pdf_files):
+        """使用进程池并行提取发票信息，返回与 pdf_files 顺序一致的结果列表
+        
+        缓存在主进程中读写，只有未命中缓存的PDF交给子进程解析。子进程的日志通过队列
+        发回主进程。某个PDF导致子进程崩溃时，崩溃时正在处理的文件逐个在独立进程中重试，
+        尚未开始的文件重新并行处理，最终只丢弃出问题的文件；进程池无法启动时改为在主进程中逐个处理。
+        """
+        fields_list = [None] * len(pdf_files)
+        cache_keys = {}
+        for index, pdf_path in enumerate(pdf_files):
+            cache_key, fields = self._load_cached(pdf_path)
+            if fields is not None:
+                self.logger.info(f"使用缓存的发票信息: {os.path.basename(pdf_path)}")
+                fields_list[index] = fields
+            else:
+                cache_keys[index] = cache_key
+        self._pdfs_done = len(pdf_files) - len(cache_keys)
+        self._report_progress(self._pdfs_done, len(pdf_files))
+        
+        if cache_keys:
+            self._parse_pdfs_in_pool(pdf_files, list(cache_keys), fields_list)
+            self._report_progress(len(pdf_files), len(pdf_files))  # 包括子进程崩溃后跳过的文件
+        
+        results = [None] * len(pdf_files)
+        for index, fields in enumerate(fields_list):
+            if fields is None:
+                continue
+            if index in cache_keys:
+                self._save_cached(cache_keys[index], fields)
+            results[index] = self._pdf_info_from_fields(pdf_files[index], fields)
+        
+        # 子进程不能写入同一个合并文件：解析完成后在主进程中按顺序追加
+        for pdf_path in pdf_files:
+            self._merge_file(pdf_path)
+        return results
+
+    def _parse_pdfs_in_pool(self, pdf_files, indices, fields_list):
+        """在进程池中解析指定序号的PDF，提取的字段写入 fields_list"""
+        manager = multiprocessing.Manager()
+        log_queue = manager.Queue()
+        started = manager.dict()
+        listener = logging.handlers.QueueListener(log_queue, _LogForwarder())
+        listener.start()
+        try:
+            self.logger.info(f"使用 {self.workers} 个进程并行处理 {len(indices)} 个PDF")
+            pending = indices
+            while pending:
+                unfinished = self._run_pdf_pool(pdf_files, pending, self.workers, log_queue, started, fields_list)
+                not_started = [index for index in unfinished if index not in started]
+                if len(not_started) == len(pending):
+                    # 没有任何文件开始处理（例如子进程无法启动或初始化失败），重试也不会有进展
+                    self.logger.error("PDF解析进程池无法启动，改为在主进程中逐个处理")
+                    self._parse_pdfs_serially(pdf_files, not_started, fields_list)
+                    break
+                pending = not_started
+                
+                # 进程池崩溃时正在处理的文件逐个隔离重试
+                for index in unfinished:
+                    if index not in started:
+                        continue
+                    self.logger.warning(f"重新单独处理PDF文件: {os.path.basename(pdf_files[index])}")
+                    if self._run_pdf_pool(pdf_files, [index], 1, log_queue, started, fields_list):
+                        self.logger.error(f"处理PDF文件时子进程崩溃，已跳过: {pdf_files[index]}")
+        finally:
+            listener.stop()
+            manager.shutdown()
+
+    def _parse_pdfs_serially(self, pdf_files, indices, fields_list):
+        """在主进程中逐个解析指定序号的PDF（不追加到合并文件，解析完成后统一合并）"""
+        for index in indices:
+            pdf_path = pdf_files[index]
+            try:
+                with self.pdf_backend.open(pdf_path) as document:
+                    fields_list[index] = self._extract_document_fields(document, pdf_path)
+            except Exception as e:
+                self.logger.error(f"处理PDF文件时出错 {pdf_path}: {str(e)}")
+                traceback.print_exc()
+            self._pdfs_done += 1
+            self._report_progress(self._pdfs_done, len(pdf_files))
+
+    def _run_pdf_pool(self, pdf_files, indices, workers, log_queue, started, results):
+        """在进程池中解析指定序号的PDF，结果写入 results，返回因进程池崩溃而未完成的序号"""
+        unfinished = []
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_pdf_worker,
+                                 initargs=(log_queue,)) as executor:
+            options = self._worker_options()
+            futures = [(index, executor.submit(_extract_pdf_worker, self.folder_path, pdf_files[index], index,
+                                               started, options))
+                       for index in indices]
+            try:
+                for index, future in futures:
+                    try:
+                        results[index], stats = future.result()
+                        self.pdf_backend.add_pages(*stats['pages'])
+                        self.page_reader.add_stats(*stats['ocr'])
+                    except BrokenProcessPool:
+                        unfinished.append(index)
+                        continue
+                    except Exception as e:
+                        self.logger.error(f"处理PDF文件时出错 {pdf_files[index]}: {str(e)}")
+                    self._pdfs_done += 1
+                    self._report_progress(self._pdfs_done, len(pdf_files))
+            except BaseException:
+                # 任务被取消（或按Ctrl+C）时不再等待尚未开始的文件
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+        return unfinished
+
+    def _report_progress(self, done, total):
+        """报告PDF处理进度；任务被取消时进度回调会抛出异常，在两个文件之间停止处理"""
+        if self.progress is not None:
+            self.progress('pdf', done, total)
+
+    def merge_pdfs(self, input_dir, output_dir='output'):
+        """合并所有PDF文件（process_pdfs 在解析过程中逐个追加，不需要再调用）"""
+        try:
             # 收集所有PDF文件
             pdf_files = []
             for filename in os.listdir(input_dir):
@@ -416,146 +718,86 @@ class DocumentAnalyzer:
                 self.logger.warning("未找到PDF文件可供合并")
                 return
             
-            # 确保输出目录存在
-            output_dir = 'output'
-            if not os.path.exists(output_dir):
-                os.makedirs(output_dir)
-            
-            # 创建PDF合并器
-            merger = PyPDF2.PdfMerger()
-            
             # 按文件名排序，确保合并顺序一致
             pdf_files.sort()
             
-            # 添加所有PDF文件
+            self._start_merge(output_dir)
             for pdf_file in pdf_files:
-                merger.append(pdf_file)
-                self.logger.info(f"添加PDF文件: {os.path.basename(pdf_file)}")
-            
-            # 保存合并后的文件
-            output_file = os.path.join(output_dir, f'merged_{datetime.now().strftime("%Y%m%d")}.pdf')
-            merger.write(output_file)
-            merger.close()
-            
-            self.logger.info(f"PDF文件已合并到: {output_file}")
-            self.logger.info(f"合并的PDF数量: {len(pdf_files)}")
+                self._merge_file(pdf_file)
+            self._finish_merge()
             
         except Exception as e:
             self.logger.error(f"合并PDF文件时出错: {str(e)}")
             traceback.print_exc()
+        finally:
+            self._abort_merge()
+
+    def _start_merge(self, output_dir='output'):
+        """创建合并PDF的写入器，之后解析的PDF逐个追加（页面对象复制后立即写入文件，内存占用不随文件数增长）"""
+        # 确保输出目录存在
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        output_file = os.path.join(output_dir, f'merged_{datetime.now().strftime("%Y%m%d")}.pdf')
+        self.merge_writer = StreamingPDFWriter(output_file)
 
-    def save_combined_results(self):
-        """保存合并后的结果到CSV文件"""
+    def _merge_document(self, document):
+        """把打开的PDF文档的所有页面追加到合并文件"""
+        if self.merge_writer is None:
+            return
         try:
-            # 定义所有需要的列
-            required_columns = [
-                '名称',              # 从文件名提取的中文关键字
-                '品牌',              # 固定为NA
-                '规格数量',          # 固定为1
-                '规格单位',          # 固定为套
-                '计量单位',          # 固定为套
-                '数量',              # 固定为1
-                '存放地点',          # 固定为科技楼1907
-                '供应商',            # 从发票提取
-                '发票号码',
-                '开票日期',
-                '发票金额',
-                '实际支付金额',
-                '差额',
-                '发票文件',          # 发票文件名
-                '文件名'             # 支付记录文件名
-            ]
-            
-            # 读取之前保存的发票结果
-            try:
-                invoice_results = pd.read_csv(self.invoice_results_file, encoding='utf-8')
-            except FileNotFoundError:
-                self.logger.warning(f"未找到发票结果文件，创建新文件")
-                invoice_results = pd.DataFrame(columns=['文件名'])
-                
-            # 读取支付记录
-            try:
-                payment_records = pd.read_csv(self.payment_records_file, encoding='utf-8')
-            except FileNotFoundError:
-                self.logger.warning(f"未找到支付记录文件，创建新文件")
-                payment_records = pd.DataFrame(columns=['文件名', '实际支付金额'])
-            
-            # 确保列名一致
-            self.logger.info("\n数据列名:")
-            self.logger.info(f"发票结果列: {invoice_results.columns.tolist()}")
-            self.logger.info(f"支付记录列: {payment_records.columns.tolist()}")
-            
-            # 合并数据
-            combined_df = pd.merge(invoice_results, payment_records, on='文件名', how='outer')
-            
-            # 设置固定值的列
-            combined_df['品牌'] = 'NA'
-            combined_df['规格数量'] = 1
-            combined_df['规格单位'] = '套'
-            combined_df['计量单位'] = '套'
-            combined_df['数量'] = 1
-            combined_df['存放地点'] = '科技楼1907'
-            
-            # 重命名列
-            column_mapping = {
-                'invoice_number': '发票号码',
-                'invoice_date': '开票日期',
-                'price': '发票金额',
-                'payment_amount': '实际支付金额',
-                'supplier': '供应商',
-                'product_name': '名称',
-                'filename': '发票文件'
-            }
-            combined_df = combined_df.rename(columns=column_mapping)
-            
-            # 确保所有必需的列都存在
-            for col in required_columns:
-                if col not in combined_df.columns:
-                    self.logger.info(f"创建缺失的列: {col}")
-                    combined_df[col] = None
-            
-            # 计算差额（如果存在必要的列）
-            if '发票金额' in combined_df.columns and '实际支付金额' in combined_df.columns:
-                combined_df['差额'] = pd.to_numeric(combined_df['实际支付金额'], errors='coerce') - pd.to_numeric(combined_df['发票金额'], errors='coerce')
-            
-            # 获取所有可用的列
-            available_columns = combined_df.columns.tolist()
-            self.logger.info(f"合并后可用列: {available_columns}")
-            
-            # 重新排列列顺序
-            final_columns = [col for col in required_columns if col in available_columns]
-            combined_df = combined_df[final_columns]
-            
-            # 保存合并后的结果
-            output_file = os.path.join(self.output_dir, 'combined_results.csv')
-            combined_df.to_csv(output_file, index=False, encoding='utf-8')
-            self.logger.info(f"合并结果已保存到: {output_file}")
-            self.logger.info(f"最终列名: {final_columns}")
-            
-            # 打印分析摘要
-            self.logger.info("\n分析摘要:")
-            self.logger.info("-" * 50)
-            self.logger.info(f"总计处理记录数: {len(combined_df)}")
-            self.logger.info(f"成功匹配支付记录数: {combined_df['实际支付金额'].notna().sum()}")
-            
-            # 检查金额差异
-            if '差额' in combined_df.columns:
-                # 计算误差百分比
-                combined_df['误差百分比'] = abs(combined_df['差额'] / combined_df['发票金额'] * 100)
-                differences = combined_df[combined_df['误差百分比'] > 10].dropna(subset=['误差百分比'])
-                
-                if not differences.empty:
-                    self.logger.info("\n发现金额不匹配的记录 (误差>10%):")
-                    for _, row in differences.iterrows():
-                        self.logger.info(f"文件 {row['文件名']}: "
-                                       f"发票金额 {row.get('发票金额', 'N/A')}, "
-                                       f"实际支付 {row.get('实际支付金额', 'N/A')}, "
-                                       f"差额 {row.get('差额', 'N/A'):.2f}, "
-                                       f"误差 {row.get('误差百分比', 'N/A'):.1f}%")
-                
-                # 删除临时列
-                combined_df = combined_df.drop('误差百分比', axis=1)
-            
+            self.merge_writer.append(document.merge_source())
+            self.logger.info(f"添加PDF文件: {os.path.basename(document.pdf_path)}")
+        except Exception as e:
+            self.logger.error(f"合并PDF文件时出错 {document.pdf_path}: {str(e)}")
+            traceback.print_exc()
+
+    def _merge_file(self, pdf_path):
+        """打开PDF并追加到合并文件（使用缓存的发票信息、没有在当前进程中解析的文件）"""
+        if self.merge_writer is None:
+            return
+        try:
+            with self.pdf_backend.open(pdf_path) as document:
+                self._merge_document(document)
+        except Exception as e:
+            self.logger.error(f"合并PDF文件时出错 {pdf_path}: {str(e)}")
+
+    def append_to_merge(self, writer, pdf_path):
+        """把PDF文件的所有页面追加到指定的合并写入器（增量处理更新合并文件时使用），返回是否成功"""
+        try:
+            with self.pdf_backend.open(pdf_path) as document:
+                writer.append(document.merge_source())
+            self.logger.info(f"添加PDF文件: {os.path.basename(pdf_path)}")
+            return True
+        except Exception as e:
+            self.logger.error(f"合并PDF文件时出错 {pdf_path}: {str(e)}")
+            return False
+
+    def _finish_merge(self):
+        """完成合并文件并输出统计"""
+        writer, self.merge_writer = self.merge_writer, None
+        if writer is None:
+            return
+        writer.close()
+        self.logger.info(f"PDF文件已合并到: {writer.path}")
+        self.logger.info(f"合并的PDF数量: {writer.documents}, 页数: {writer.page_count}, "
+                         f"文件大小: {os.path.getsize(writer.path) / 1024:.1f}KB")
+        if writer.objects_deduplicated:
+            self.logger.info(f"相同的字体、图像等对象只写入一次: 去重{writer.objects_deduplicated}个对象, "
+                             f"节省{writer.bytes_deduplicated / 1024:.1f}KB")
+
+    def _abort_merge(self):
+        """处理出错时放弃未完成的合并文件"""
+        writer, self.merge_writer = self.merge_writer, None
+        if writer is not None:
+            writer.abort()
+
+    def save_combined_results(self, payments=None):
+        """保存合并后的结果：直接使用 analyze_documents 的分析结果，payments 为空时使用识别出的支付截图金额"""
+        try:
+            invoices = [InvoiceRecord.from_info(result) for result in self.results]
+            if payments is None:
+                payments = [PaymentRecord(filename, amount) for filename, amount in self.payment_images.items()]
+            combine_results(invoices, payments, self.output_dir)
         except Exception as e:
             self.logger.error(f"保存合并结果时出错: {str(e)}")
             traceback.print_exc()
@@ -0,0 +1,183 @@
+import os
+import re
+import time
+import threading
+import logging
+from result_cache import file_sha256
+
+# 扫描件识别规则的版本号，修改渲染或文本整理方式时递增（参与发票缓存的指纹）
+PDF_OCR_VERSION = 1
+
+# 扫描件页面的渲染分辨率
+DEFAULT_OCR_DPI = 300
+
+# 单页渲染的最大像素数（灰度图每像素1字节，约16MB）；超过时降低分辨率，大幅面页面不会占用过多内存
+MAX_RENDER_PIXELS = 16_000_000
+
+# 中文字符之间被OCR插入的空格（"发 票 号 码：" -> "发票号码："），字段模式才能匹配
+_CJK_GAP = re.compile(r'(?<=[\u4e00-\u9fff：（）])[ \t]+(?=[\u4e00-\u9fff：:（）])')
+
+
+def bounded_dpi(width, height, dpi, max_pixels=MAX_RENDER_PIXELS):
+    """页面（宽高单位为点）按 dpi 渲染的像素数超过 max_pixels 时，返回降低后的分辨率"""
+    pixels = (width * dpi / 72) * (height * dpi / 72)
+    if not max_pixels or pixels <= max_pixels:
+        return dpi
+    return max(int(dpi * (max_pixels / pixels) ** 0.5), 1)
+
+
+def normalize_ocr_text(text):
+    """整理OCR文本：去掉分页符和中文字符之间的空格"""
+    return _CJK_GAP.sub('', text.replace('\f', '')).strip('\n')
+
+
+class PageImageCache:
+    """渲染的页面图像的磁盘缓存：PDF内容哈希 + 页码 + 分辨率 -> PNG（无损），重新运行时不需要再次渲染
+
+    与 ResultCache 相同，按保存时间（文件修改时间）和总大小淘汰旧图像，最近使用时间记录在文件访问时间中。
+    """
+
+    def __init__(self, cache_dir, max_age_days=90, max_bytes=256 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_age_days = max_age_days
+        self.max_bytes = max_bytes
+        self.logger = logging.getLogger(__name__)
+
+    def _path(self, digest, index, dpi):
+        return os.path.join(self.cache_dir, digest[:2], f"{digest}_{index}_{dpi}.png")
+
+    def get(self, digest, index, dpi):
+        path = self._path(digest, index, dpi)
+        try:
+            # 更新访问时间（保留修改时间），按最久未使用淘汰
+            os.utime(path, ns=(time.time_ns(), os.stat(path).st_mtime_ns))
+        except OSError:
+            return None
+        import cv2
+        return cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+
+    def put(self, digest, index, dpi, image):
+        import cv2
+        path = self._path(digest, index, dpi)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先写临时文件再改名，并行处理或中断时不会留下不完整的图像
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp.png"
+        if cv2.imwrite(temp_path, image):
+            os.replace(temp_path, path)
+
+    def evict(self):
+        """删除过期的图像和中断时留下的临时文件，并在超出总大小限制时删除最久未使用的图像"""
+        files = []
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((path, name, stat))
+
+        now = time.time()
+        cutoff = now - self.max_age_days * 86400 if self.max_age_days is not None else None
+        stale, kept = [], []
+        for path, name, stat in files:
+            if name.endswith('.tmp.png'):
+                # 其他任务可能正在写入，只删除一小时前的临时文件
+                if stat.st_mtime < now - 3600:
+                    stale.append(path)
+            elif cutoff is not None and stat.st_mtime < cutoff:
+                stale.append(path)
+            else:
+                kept.append((stat.st_atime, stat.st_size, path))
+
+        if self.max_bytes is not None:
+            total = sum(size for _, size, _ in kept)
+            for _, size, path in sorted(kept):
+                if total <= self.max_bytes:
+                    break
+                stale.append(path)
+                total -= size
+
+        removed = 0
+        for path in stale:
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+        if removed:
+            self.logger.info(f"页面图像缓存淘汰文件数: {removed}")
+        return removed
+
+
+class ScannedPageReader:
+    """没有文本层的页面（扫描的纸质发票）：按受控的分辨率渲染后用OCR后端识别"""
+
+    def __init__(self, ocr_backend, lang='chi_sim', dpi=DEFAULT_OCR_DPI, max_pixels=MAX_RENDER_PIXELS,
+                 cache_dir=None):
+        self.ocr_backend = ocr_backend
+        self.lang = lang
+        self.dpi = dpi
+        self.max_pixels = max_pixels
+        self.cache = PageImageCache(cache_dir) if cache_dir else None
+        self.logger = logging.getLogger(__name__)
+        self._digests = {}  # PDF路径 -> (修改时间, 大小, 内容哈希)
+
+        self.pages = 0
+        self.cache_hits = 0
+        self.seconds = 0.0
+        self._stats_lock = threading.Lock()
+
+    def _digest(self, pdf_path):
+        stat = os.stat(pdf_path)
+        cached = self._digests.get(pdf_path)
+        if cached is None or cached[:2] != (stat.st_mtime_ns, stat.st_size):
+            cached = (stat.st_mtime_ns, stat.st_size, file_sha256(pdf_path))
+            self._digests[pdf_path] = cached
+        return cached[2]
+
+    def render(self, document, index):
+        """渲染一页（优先使用磁盘缓存），返回 (灰度图像, 是否来自缓存)"""
+        width, height = document.page_size(index)
+        dpi = bounded_dpi(width, height, self.dpi, self.max_pixels)
+        if dpi < self.dpi:
+            self.logger.info(f"第{index + 1}页幅面较大，渲染分辨率从{self.dpi}降低到{dpi} DPI")
+
+        digest = self._digest(document.pdf_path) if self.cache else None
+        if self.cache:
+            image = self.cache.get(digest, index, dpi)
+            if image is not None:
+                return image, True
+        image = document.render(index, dpi=dpi)
+        if self.cache:
+            try:
+                self.cache.put(digest, index, dpi, image)
+            except OSError as e:
+                self.logger.warning(f"无法写入页面图像缓存: {str(e)}")
+        return image, False
+
+    def read(self, document, index):
+        """识别一页的文字"""
+        start = time.perf_counter()
+        image, cached = self.render(document, index)
+        text = self.ocr_backend.image_to_string(image, lang=self.lang, config='--oem 3 --psm 3')
+        self.add_stats(1, int(cached), time.perf_counter() - start)
+        self.logger.info(f"第{index + 1}页没有文本层，已OCR识别（{'使用缓存的页面图像' if cached else '渲染页面'}）")
+        return normalize_ocr_text(text)
+
+    def add_stats(self, pages, cache_hits, seconds):
+        """记录识别的页数（并行解析时由主进程汇总子进程的统计）"""
+        with self._stats_lock:
+            self.pages += pages
+            self.cache_hits += cache_hits
+            self.seconds += seconds
+
+    def evict_cache(self):
+        """淘汰页面图像缓存中的旧图像"""
+        if self.cache:
+            self.cache.evict()
+
+    def report(self):
+        if not self.pages:
+            return
+        self.logger.info(f"扫描件OCR: {self.pages}页（页面图像缓存命中{self.cache_hits}页）, 耗时{self.seconds:.2f}秒")
@@ -0,0 +1,525 @@
+import os
+import re
+import zlib
+import struct
+import hashlib
+import logging
+
+# PDF对象的中间表示（与读取PDF所用的库无关）：
+#   dict（键为名称字符串）、list、int、float、bool、None、bytes（字符串）
+#   Name（名称）、Ref（间接引用）、Stream（字典 + 原始编码的数据）
+
+
+class Name(str):
+    """PDF名称对象（/Name）"""
+    __slots__ = ()
+
+
+class Ref:
+    """源文档中的间接引用（n 0 R）"""
+    __slots__ = ('num',)
+
+    def __init__(self, num):
+        self.num = num
+
+
+class Stream:
+    """流对象：字典（不含 /Length）和未解码的原始数据"""
+    __slots__ = ('dict', 'data')
+
+    def __init__(self, dictionary, data):
+        self.dict = dictionary
+        self.data = data
+
+
+class _NewRef:
+    """输出文件中的间接引用"""
+    __slots__ = ('num',)
+
+    def __init__(self, num):
+        self.num = num
+
+
+# 可以从父节点继承的页面属性
+INHERITABLE = ('Resources', 'MediaBox', 'CropBox', 'Rotate')
+
+_DELIMITERS = b'()<>[]{}/%'
+_WHITESPACE = b' \t\r\n\f\x00'
+_NUMBER = re.compile(rb'[+-]?(?:\d+\.?\d*|\.\d+)')
+_REF = re.compile(rb'(\d+)\s+(\d+)\s+R(?![^' + re.escape(_WHITESPACE + _DELIMITERS) + rb'])')
+_ESCAPES = {ord('n'): b'\n', ord('r'): b'\r', ord('t'): b'\t', ord('b'): b'\b', ord('f'): b'\f',
+            ord('('): b'(', ord(')'): b')', ord('\\'): b'\\'}
+
+
+def parse_object(source):
+    """把一个PDF对象的文本（如 PyMuPDF 的 xref_object 的结果）解析为中间表示
+
+    PyMuPDF 用 raw-unicode-escape 把对象的字节解码为文本，这里按同样的编码还原为原来的字节；
+    文本中有解码失败时替换的字符（U+FFFD）时无法还原，报错而不是写入错误的内容。
+    """
+    if isinstance(source, str):
+        if '\ufffd' in source:
+            raise ValueError(f"PDF对象中有无法还原的字符: {source[:40]!r}")
+        source = source.encode('raw_unicode_escape')
+    value, _ = _parse(source, _skip(source, 0))
+    return value
+
+
+def _skip(data, pos):
+    """跳过空白和注释"""
+    while pos < len(data):
+        if data[pos] in _WHITESPACE:
+            pos += 1
+        elif data[pos] == ord('%'):
+            while pos < len(data) and data[pos] not in b'\r\n':
+                pos += 1
+        else:
+            break
+    return pos
+
+
+def _parse(data, pos):
+    char = data[pos:pos + 1]
+    if data.startswith(b'<<', pos):
+        result, pos = {}, _skip(data, pos + 2)
+        while not data.startswith(b'>>', pos):
+            key, pos = _parse(data, pos)
+            value, pos = _parse(data, _skip(data, pos))
+            result[str(key)] = value
+            pos = _skip(data, pos)
+        return result, pos + 2
+    if char == b'[':
+        result, pos = [], _skip(data, pos + 1)
+        while data[pos:pos + 1] != b']':
+            value, pos = _parse(data, pos)
+            result.append(value)
+            pos = _skip(data, pos)
+        return result, pos + 1
+    if char == b'/':
+        end = pos + 1
+        while end < len(data) and data[end] not in _WHITESPACE and data[end] not in _DELIMITERS:
+            end += 1
+        name = re.sub(rb'#([0-9A-Fa-f]{2})', lambda m: bytes([int(m.group(1), 16)]), data[pos + 1:end])
+        return Name(name.decode('latin-1')), end
+    if char == b'(':
+        return _parse_string(data, pos + 1)
+    if char == b'<':
+        end = data.index(b'>', pos)
+        digits = re.sub(rb'\s', b'', data[pos + 1:end])
+        return bytes.fromhex((digits + b'0' * (len(digits) % 2)).decode('ascii')), end + 1
+    match = _REF.match(data, pos)
+    if match:
+        return Ref(int(match.group(1))), match.end()
+    match = _NUMBER.match(data, pos)
+    if match:
+        text = match.group()
+        return (float(text) if b'.' in text else int(text)), match.end()
+    for keyword, value in ((b'true', True), (b'false', False), (b'null', None)):
+        if data.startswith(keyword, pos):
+            return value, pos + len(keyword)
+    raise ValueError(f"无法解析的PDF对象: {data[pos:pos + 20]!r}")
+
+
+def _parse_string(data, pos):
+    """字面字符串 (...)，处理转义和嵌套的括号"""
+    result, depth = bytearray(), 1
+    while True:
+        char = data[pos]
+        if char == ord('\\'):
+            pos += 1
+            escaped = data[pos]
+            if escaped in _ESCAPES:
+                result += _ESCAPES[escaped]
+                pos += 1
+            elif chr(escaped) in '01234567':
+                digits = re.match(rb'[0-7]{1,3}', data[pos:pos + 3]).group()
+                result.append(int(digits, 8) & 0xFF)
+                pos += len(digits)
+            elif escaped in b'\r\n':  # 续行
+                pos += 2 if data.startswith(b'\r\n', pos) else 1
+            else:
+                result.append(escaped)
+                pos += 1
+            continue
+        if char == ord('('):
+            depth += 1
+        elif char == ord(')'):
+            depth -= 1
+            if not depth:
+                return bytes(result), pos + 1
+        result.append(char)
+        pos += 1
+
+
+def _name(name):
+    out = bytearray(b'/')
+    for byte in name.encode('latin-1', errors='replace') if isinstance(name, str) else name:
+        if byte < 0x21 or byte > 0x7E or byte in _DELIMITERS or byte == ord('#'):
+            out += b'#%02X' % byte
+        else:
+            out.append(byte)
+    return bytes(out)
+
+
+def serialize(value):
+    """把中间表示的对象（引用已替换为输出文件中的编号）转换为PDF语法"""
+    if value is None:
+        return b'null'
+    if value is True:
+        return b'true'
+    if value is False:
+        return b'false'
+    if isinstance(value, Name):
+        return _name(value)
+    if isinstance(value, int):
+        return b'%d' % value
+    if isinstance(value, float):
+        return (f"{value:.6f}".rstrip('0').rstrip('.') or '0').encode('ascii')
+    if isinstance(value, _NewRef):
+        return b'%d 0 R' % value.num
+    if isinstance(value, (bytes, bytearray)):
+        return b'<' + bytes(value).hex().encode('ascii') + b'>'
+    if isinstance(value, list):
+        return b'[' + b' '.join(serialize(item) for item in value) + b']'
+    if isinstance(value, dict):
+        return b'<<' + b''.join(_name(key) + b' ' + serialize(item) for key, item in value.items()) + b'>>'
+    raise TypeError(f"无法写入的PDF对象类型: {type(value).__name__}")
+
+
+class StreamingPDFWriter:
+    """逐个文档追加页面的PDF合并写入器
+
+    每个对象复制后立即写入文件，内存中只保留各对象的偏移量和用于去重的内容摘要，
+    峰值内存与合并的发票数量基本无关。内容相同的对象（同一开票平台的字体、印章图像等）只写入一次：
+    对象按引用关系自底向上复制，引用的对象去重后编号相同，引用它们的字体字典等也随之相同。
+    输出先写入临时文件，close() 时再改名，中途出错不会留下不完整的文件。
+
+    resume 为上次 close() 后的 state 时，以PDF增量更新的方式继续写入该文件：已有的对象不再复制，
+    新的对象、页面树和交叉引用表追加在文件末尾（见 set_pages）；中途出错时文件截断回原来的长度。
+    继续写入时只在新写入的对象之间去重。
+    """
+
+    def __init__(self, path, resume=None):
+        self.path = path
+        self.logger = logging.getLogger(__name__)
+        self._unique = {}               # 内容摘要 -> 对象编号
+        self._resume = resume
+        self.state = None
+
+        self.documents = 0
+        self.objects_copied = 0
+        self.objects_deduplicated = 0
+        self.bytes_deduplicated = 0
+
+        if resume is None:
+            self._temp_path = f"{path}.tmp"
+            self._file = open(self._temp_path, 'wb')
+            self._file.write(b'%PDF-1.7\n%\xe2\xe3\xcf\xd3\n')
+            self._offsets = [None]          # 对象编号 -> 文件偏移
+            self._pages_root = self._reserve()
+            self._catalog = None
+            self._kids = []
+        else:
+            self._temp_path = None
+            self._file = open(path, 'r+b')
+            try:
+                self._check_resumable(resume)
+            except BaseException:
+                self._file.close()
+                raise
+            self._file.seek(resume['size'])
+            self._offsets = [None] * resume['objects']  # 已有的对象不写入本次的交叉引用表
+            self._pages_root = resume['pages_root']
+            self._catalog = resume['catalog']
+            self._kids = list(resume['pages'])
+
+    def _check_resumable(self, resume):
+        """文件在上次 close() 之后被修改过（大小或交叉引用表的位置不一致）时抛出 ValueError"""
+        marker = b'startxref\n%d\n%%%%EOF\n' % resume['xref']
+        size = self._file.seek(0, os.SEEK_END)
+        self._file.seek(max(size - len(marker), 0))
+        if size != resume['size'] or self._file.read() != marker:
+            raise ValueError(f"合并文件已被修改，不能增量更新: {self.path}")
+
+    @property
+    def page_count(self):
+        return len(self._kids)
+
+    @property
+    def pages(self):
+        """页面树中的页面对象编号（按页面顺序）"""
+        return list(self._kids)
+
+    def set_pages(self, pages):
+        """设置页面树中的页面及其顺序（已写入的页面对象编号），不在其中的页面不再出现在输出文件中"""
+        self._kids = list(pages)
+
+    def _reserve(self):
+        self._offsets.append(None)
+        return len(self._offsets) - 1
+
+    def _write(self, num, body, data=None):
+        self._offsets[num] = self._file.tell()
+        self._file.write(b'%d 0 obj\n' % num)
+        self._file.write(body)
+        if data is not None:
+            self._file.write(b'\nstream\n')
+            self._file.write(data)
+            self._file.write(b'\nendstream')
+        self._file.write(b'\nendobj\n')
+
+    def _store(self, body, data=None, num=None):
+        """写入对象，内容相同的对象只写一次；num 给出时（对象被循环引用）直接使用该编号"""
+        if num is None:
+            digest = hashlib.blake2b(body, digest_size=16)
+            if data is not None:
+                digest.update(b'\0stream\0')
+                digest.update(data)
+            digest = digest.digest()
+            existing = self._unique.get(digest)
+            if existing is not None:
+                self.objects_deduplicated += 1
+                self.bytes_deduplicated += len(body) + (len(data) if data is not None else 0)
+                return existing
+            num = self._reserve()
+            self._unique[digest] = num
+        self._write(num, body, data)
+        self.objects_copied += 1
+        return num
+
+    def append(self, source):
+        """追加一个文档的所有页面
+
+        source 提供 page_refs()（页面对象的编号列表）和 resolve(编号)（返回中间表示的对象）。
+        """
+        page_refs = list(source.page_refs())
+        # 页面编号预先分配：批注的 /P、链接的目标等指向本文档页面的引用直接对应到新页面
+        mapping = {num: self._reserve() for num in page_refs}
+        copier = _DocumentCopier(self, source, mapping)
+        for num in page_refs:
+            page = dict(source.resolve(num))
+            for key in INHERITABLE:
+                if key not in page:
+                    value = copier.inherited(page, key)
+                    if value is not None:
+                        page[key] = value
+            page.pop('Parent', None)
+            page = copier.copy(page)
+            page['Parent'] = _NewRef(self._pages_root)
+            self._write(mapping[num], serialize(page))
+            self._kids.append(mapping[num])
+        self.documents += 1
+        return len(page_refs)
+
+    def add_image_page(self, image_path):
+        """追加一页只包含一张图像的页面，页面大小与图像相同（每像素1点，与原来用 PIL 保存的PDF一致）
+
+        图像数据按 image_xobject 的方式直接嵌入，每次只读取一个文件；内容相同的图像只写入一次。
+        """
+        dictionary, data = image_xobject(image_path)
+        width, height = dictionary['Width'], dictionary['Height']
+        dictionary['Length'] = len(data)
+        image = self._store(serialize(dictionary), data)
+        content = b'q %d 0 0 %d 0 0 cm /Im0 Do Q' % (width, height)
+        contents = self._store(serialize({'Length': len(content)}), content)
+
+        page = self._reserve()
+        self._write(page, serialize({
+            'Type': Name('Page'), 'Parent': _NewRef(self._pages_root), 'MediaBox': [0, 0, width, height],
+            'Resources': {'XObject': {'Im0': _NewRef(image)}}, 'Contents': _NewRef(contents)}))
+        self._kids.append(page)
+        self.documents += 1
+
+    def close(self):
+        """写入页面树、目录和交叉引用表，完成输出文件；完成后 state 可用于继续写入（见 resume）"""
+        if self._file is None:
+            return
+        try:
+            self._write(self._pages_root, b'<</Type/Pages/Count %d/Kids[%s]>>' % (
+                len(self._kids), b' '.join(b'%d 0 R' % num for num in self._kids)))
+            if self._catalog is None:
+                self._catalog = self._reserve()
+                self._write(self._catalog, b'<</Type/Catalog/Pages %d 0 R>>' % self._pages_root)
+
+            xref = self._file.tell()
+            if self._resume is None:
+                self._file.write(b'xref\n0 %d\n0000000000 65535 f \n' % len(self._offsets))
+                for offset in self._offsets[1:]:
+                    # 预留后没有写入的编号（不应出现）记为空闲对象
+                    self._file.write(b'%010d 00000 n \n' % offset if offset is not None else b'0000000000 65535 f \n')
+                previous = b''
+            else:
+                # 增量更新：只列出本次写入的对象（页面树根节点和新对象），/Prev 指向原来的交叉引用表
+                self._file.write(b'xref\n')
+                start = self._resume['objects']
+                self._file.write(b'%d 1\n%010d 00000 n \n' % (self._pages_root, self._offsets[self._pages_root]))
+                self._file.write(b'%d %d\n' % (start, len(self._offsets) - start))
+                for offset in self._offsets[start:]:
+                    self._file.write(b'%010d 00000 n \n' % offset if offset is not None else b'0000000000 65535 f \n')
+                previous = b'/Prev %d' % self._resume['xref']
+            self._file.write(b'trailer\n<</Size %d/Root %d 0 R%s>>\nstartxref\n%d\n%%%%EOF\n' % (
+                len(self._offsets), self._catalog, previous, xref))
+            size = self._file.tell()
+            self._file.close()
+            if self._temp_path is not None:
+                os.replace(self._temp_path, self.path)
+            self.state = {'size': size, 'xref': xref, 'objects': len(self._offsets), 'catalog': self._catalog,
+                          'pages_root': self._pages_root, 'pages': list(self._kids)}
+        finally:
+            self._file = None
+
+    def abort(self):
+        """放弃输出：删除临时文件；继续写入已有文件时把文件截断回原来的长度"""
+        if self._file is not None:
+            if self._temp_path is None:
+                self._file.truncate(self._resume['size'])
+            self._file.close()
+            self._file = None
+            if self._temp_path is not None:
+                os.remove(self._temp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class _DocumentCopier:
+    """把一个源文档中的对象复制到写入器，源对象编号到新编号的映射只在复制该文档时保留"""
+
+    def __init__(self, writer, source, mapping):
+        self.writer = writer
+        self.source = source
+        self.mapping = mapping
+        self._in_progress = {}  # 正在复制的源对象 -> 被循环引用时预留的新编号
+
+    def inherited(self, page, key):
+        """沿 /Parent 向上查找可继承的页面属性"""
+        node, seen = page, set()
+        while isinstance(node.get('Parent'), Ref) and node['Parent'].num not in seen:
+            seen.add(node['Parent'].num)
+            node = self.source.resolve(node['Parent'].num)
+            if key in node:
+                return node[key]
+        return None
+
+    def copy(self, value):
+        if isinstance(value, Ref):
+            return _NewRef(self._copy_ref(value.num))
+        if isinstance(value, dict):
+            return {key: self.copy(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self.copy(item) for item in value]
+        return value
+
+    def _copy_ref(self, num):
+        if num in self.mapping:
+            return self.mapping[num]
+        if num in self._in_progress:
+            # 循环引用：预留编号，该对象复制完成后用这个编号写入（不参与去重）
+            if self._in_progress[num] is None:
+                self._in_progress[num] = self.writer._reserve()
+            return self._in_progress[num]
+
+        self._in_progress[num] = None
+        try:
+            value = self.source.resolve(num)
+            if isinstance(value, Stream):
+                dictionary = self.copy({key: item for key, item in value.dict.items() if key != 'Length'})
+                dictionary['Length'] = len(value.data)
+                body, data = serialize(dictionary), value.data
+            else:
+                body, data = serialize(self.copy(value)), None
+        finally:
+            reserved = self._in_progress.pop(num)
+        new_num = self.writer._store(body, data, reserved)
+        self.mapping[num] = new_num
+        return new_num
+
+
+_PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# JPEG 的颜色模式 -> PDF颜色空间
+_JPEG_COLOR_SPACES = {'L': 'DeviceGray', 'RGB': 'DeviceRGB', 'CMYK': 'DeviceCMYK'}
+
+
+def image_xobject(image_path):
+    """图像文件转换为PDF图像对象，返回 (字典, 编码的数据)
+
+    JPEG 文件的内容直接作为 DCTDecode 数据嵌入，不解码；不透明、非隔行扫描的 PNG 直接使用其中的
+    zlib 数据（FlateDecode 加 PNG 预测器），也不解码。其余图像（带透明通道的 PNG 等）解码后无损压缩，
+    透明通道与原来一样去掉。
+    """
+    from PIL import Image
+
+    with Image.open(image_path) as image:
+        width, height = image.size
+        if image.format == 'JPEG' and image.mode in _JPEG_COLOR_SPACES:
+            dictionary = _image_dict(width, height, Name(_JPEG_COLOR_SPACES[image.mode]), 8, 'DCTDecode')
+            if image.mode == 'CMYK':
+                dictionary['Decode'] = [1, 0] * 4  # Photoshop 等保存的 CMYK JPEG 是反相的（与 PIL 的处理一致）
+            with open(image_path, 'rb') as f:
+                return dictionary, f.read()
+        if image.format == 'PNG':
+            embedded = _png_xobject(image_path)
+            if embedded:
+                return embedded
+
+        # 需要解码的图像：灰度图保持灰度，其余转为RGB
+        image = image.convert('L' if image.mode in ('1', 'L', 'LA', 'I', 'I;16') else 'RGB')
+        dictionary = _image_dict(width, height, Name('DeviceGray' if image.mode == 'L' else 'DeviceRGB'), 8,
+                                 'FlateDecode')
+        return dictionary, zlib.compress(image.tobytes(), 6)
+
+
+def _image_dict(width, height, color_space, bits, filter_name):
+    return {'Type': Name('XObject'), 'Subtype': Name('Image'), 'Width': width, 'Height': height,
+            'ColorSpace': color_space, 'BitsPerComponent': bits, 'Filter': Name(filter_name)}
+
+
+def _png_xobject(image_path):
+    """不解码 PNG，直接使用其中的压缩数据；有透明通道、隔行扫描或16位的 PNG 返回None
+
+    文件被截断或数据块损坏（PIL 通常仍能解码出图像）时也返回None，改为解码后重新压缩。
+    """
+    with open(image_path, 'rb') as f:
+        if f.read(8) != _PNG_SIGNATURE:
+            return None
+        header, palette, data = None, None, []
+        try:
+            while True:
+                length, kind = struct.unpack('>I4s', f.read(8))
+                chunk = f.read(length)
+                if len(chunk) != length:
+                    return None
+                f.read(4)  # CRC
+                if kind == b'IHDR':
+                    header = struct.unpack('>IIBBBBB', chunk)
+                elif kind == b'PLTE':
+                    palette = chunk
+                elif kind == b'tRNS':
+                    return None
+                elif kind == b'IDAT':
+                    data.append(chunk)
+                elif kind == b'IEND':
+                    break
+        except struct.error:
+            return None
+    if header is None or not data:
+        return None
+
+    width, height, bits, color_type, _, _, interlaced = header
+    if interlaced or bits > 8 or color_type not in (0, 2, 3) or (color_type == 3 and not palette):
+        return None
+    if color_type == 3:
+        color_space = [Name('Indexed'), Name('DeviceRGB'), len(palette) // 3 - 1, palette]
+    else:
+        color_space = Name('DeviceRGB' if color_type == 2 else 'DeviceGray')
+    dictionary = _image_dict(width, height, color_space, bits, 'FlateDecode')
+    dictionary['DecodeParms'] = {'Predictor': 15, 'Colors': 3 if color_type == 2 else 1,
+                                 'BitsPerComponent': bits, 'Columns': width}
+    return dictionary, b''.join(data)
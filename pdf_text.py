@@ -0,0 +1,377 @@
+import time
+import threading
+import importlib.util
+import zlib
+import logging
+from pdf_stream_writer import Name, Ref, Stream, parse_object
+
+
+class PDFDocument:
+    """打开的PDF文档：page_count 为总页数，pages() 按顺序逐页提取文本
+
+    只有真正取到的页才会被解析，提前停止迭代时后面的页不做任何处理。
+    """
+
+    def __init__(self, backend, pdf_path):
+        self.backend = backend
+        self.pdf_path = pdf_path
+        self._handle = backend._open(pdf_path)
+        try:
+            self.page_count = backend._page_count(self._handle)
+        except Exception:
+            backend._close(self._handle)
+            raise
+        self._parsed = set()  # 已解析文本的页
+        self.seconds = 0.0
+
+    @property
+    def pages_parsed(self):
+        return len(self._parsed)
+
+    def _parse(self, index, extract, *args):
+        """解析一页的文本层并计时（同一页的文本和单词位置只计一次）"""
+        start = time.perf_counter()
+        try:
+            return extract(self._handle, index, *args)
+        finally:
+            self._parsed.add(index)
+            self.seconds += time.perf_counter() - start
+
+    def pages(self):
+        for index in range(self.page_count):
+            yield self._parse(index, self.backend._page_text) or ''
+
+    def page_size(self, index):
+        """页面的宽和高（点），不解析页面内容"""
+        return self.backend._page_size(self._handle, index)
+
+    def page_words(self, index):
+        """页面中的单词及位置：[(x0, top, x1, bottom, 文本)]，坐标为相对页面宽高的比例，原点在左上角"""
+        return self._parse(index, self.backend._page_words)
+
+    def page_images(self, index, min_size=21):
+        """页面中嵌入的近似正方形的图像（灰度数组），例如发票二维码"""
+        return self.backend._page_images(self._handle, index, min_size)
+
+    def render(self, index, region=(0, 0, 1, 1), dpi=200):
+        """只渲染页面的一个区域（按页面宽高的比例给出 x0, y0, x1, y1），返回灰度数组"""
+        return self.backend._render(self._handle, index, region, dpi)
+
+    def merge_source(self):
+        """页面对象的来源，传给 StreamingPDFWriter.append() 合并到输出文件（需要在文档关闭前使用）"""
+        return self.backend._merge_source(self._handle)
+
+    def close(self):
+        if self._handle is not None:
+            self.backend._close(self._handle)
+            self._handle = None
+            self.backend.add_pages(self.pages_parsed, self.page_count, self.seconds)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PDFTextBackend:
+    """PDF文本层提取后端基类，统计解析的页数和耗时"""
+
+    name = 'base'
+
+    def __init__(self):
+        self.documents = 0
+        self.pages_parsed = 0
+        self.pages_total = 0
+        self.seconds = 0.0
+        self.logger = logging.getLogger(__name__)
+        self._stats_lock = threading.Lock()
+
+    def open(self, pdf_path):
+        """打开PDF，返回 PDFDocument（可用于 with 语句）"""
+        return PDFDocument(self, pdf_path)
+
+    def _open(self, pdf_path):
+        raise NotImplementedError
+
+    def _page_count(self, handle):
+        raise NotImplementedError
+
+    def _page_text(self, handle, index):
+        raise NotImplementedError
+
+    def _page_size(self, handle, index):
+        raise NotImplementedError
+
+    def _page_words(self, handle, index):
+        raise NotImplementedError
+
+    def _page_images(self, handle, index, min_size):
+        return []
+
+    def _render(self, handle, index, region, dpi):
+        raise NotImplementedError
+
+    def _merge_source(self, handle):
+        raise NotImplementedError
+
+    def _close(self, handle):
+        pass
+
+    def add_pages(self, parsed, total, seconds=0.0):
+        """记录文档解析的页数、总页数和耗时（并行解析时由主进程汇总子进程的统计）"""
+        with self._stats_lock:
+            self.documents += 1
+            self.pages_parsed += parsed
+            self.pages_total += total
+            self.seconds += seconds
+
+    def report(self):
+        """输出解析的页数和节省的页数"""
+        if not self.documents:
+            return
+        skipped = self.pages_total - self.pages_parsed
+        self.logger.info(f"PDF文本后端 {self.name}: {self.documents}个文件, 解析{self.pages_parsed}/{self.pages_total}页"
+                         f"（提前停止跳过{skipped}页）, 文本提取耗时{self.seconds:.2f}秒")
+
+
+class PyMuPDFBackend(PDFTextBackend):
+    """PyMuPDF（MuPDF的C实现），比 pdfplumber 快一个数量级以上"""
+
+    name = 'pymupdf'
+
+    def __init__(self):
+        super().__init__()
+        try:
+            import pymupdf
+        except ImportError:
+            import fitz as pymupdf  # 1.24.3 之前的版本只有 fitz 模块名
+        self._pymupdf = pymupdf
+
+    def _open(self, pdf_path):
+        return self._pymupdf.open(pdf_path)
+
+    def _page_count(self, handle):
+        return handle.page_count
+
+    def _page_text(self, handle, index):
+        # 与 pdfplumber 一致，页末不带换行（各页文本直接拼接）
+        return handle.load_page(index).get_text().rstrip('\n')
+
+    def _page_size(self, handle, index):
+        rect = handle.load_page(index).rect
+        return rect.width, rect.height
+
+    def _page_words(self, handle, index):
+        page = handle.load_page(index)
+        rect = page.rect
+        return [((x0 - rect.x0) / rect.width, (top - rect.y0) / rect.height,
+                 (x1 - rect.x0) / rect.width, (bottom - rect.y0) / rect.height, text)
+                for x0, top, x1, bottom, text, *_ in page.get_text('words')]
+
+    def _page_images(self, handle, index, min_size):
+        images = []
+        for image in handle.get_page_images(index):
+            xref, width, height = image[0], image[2], image[3]
+            if min(width, height) < min_size or max(width, height) > 1.25 * min(width, height):
+                continue
+            pixmap = self._pymupdf.Pixmap(handle, xref)
+            if pixmap.colorspace is None or pixmap.n - pixmap.alpha != 1:
+                pixmap = self._pymupdf.Pixmap(self._pymupdf.csGRAY, pixmap)
+            if pixmap.alpha:
+                pixmap = self._pymupdf.Pixmap(pixmap, 0)  # 去掉透明通道
+            images.append(self._to_array(pixmap))
+        return images
+
+    def _render(self, handle, index, region, dpi):
+        page = handle.load_page(index)
+        rect = page.rect
+        clip = self._pymupdf.Rect(rect.x0 + rect.width * region[0], rect.y0 + rect.height * region[1],
+                                  rect.x0 + rect.width * region[2], rect.y0 + rect.height * region[3])
+        return self._to_array(page.get_pixmap(dpi=dpi, clip=clip, colorspace=self._pymupdf.csGRAY))
+
+    @staticmethod
+    def _to_array(pixmap):
+        import numpy as np
+        # 每行可能有填充字节，按 stride 取出后再截掉
+        data = np.frombuffer(pixmap.samples, dtype=np.uint8).reshape(pixmap.height, pixmap.stride)
+        return data[:, :pixmap.width].copy()
+
+    def _merge_source(self, handle):
+        return _PyMuPDFSource(handle)
+
+    def _close(self, handle):
+        handle.close()
+
+
+class PdfplumberBackend(PDFTextBackend):
+    """pdfplumber（纯Python，原有方式），未安装 PyMuPDF 时使用"""
+
+    name = 'pdfplumber'
+
+    def _open(self, pdf_path):
+        import pdfplumber
+        return pdfplumber.open(pdf_path)
+
+    def _page_count(self, handle):
+        return len(handle.pages)
+
+    def _page_text(self, handle, index):
+        page = handle.pages[index]
+        try:
+            return page.extract_text()
+        finally:
+            page.close()  # 释放该页解析出的对象，长文档不累积内存
+
+    def _page_size(self, handle, index):
+        page = handle.pages[index]
+        return float(page.width), float(page.height)
+
+    def _page_words(self, handle, index):
+        page = handle.pages[index]
+        try:
+            x, y = float(page.bbox[0]), float(page.bbox[1])
+            width, height = float(page.width), float(page.height)
+            return [((word['x0'] - x) / width, (word['top'] - y) / height,
+                     (word['x1'] - x) / width, (word['bottom'] - y) / height, word['text'])
+                    for word in page.extract_words()]
+        finally:
+            page.close()
+
+    def _page_images(self, handle, index, min_size):
+        # pdfplumber 不解码图像数据：渲染整页后按图像位置裁剪
+        page = handle.pages[index]
+        try:
+            boxes = [(image['x0'], image['top'], image['x1'], image['bottom']) for image in page.images]
+            boxes = [box for box in boxes if min(box[2] - box[0], box[3] - box[1]) > 0
+                     and max(box[2] - box[0], box[3] - box[1]) <= 1.25 * min(box[2] - box[0], box[3] - box[1])]
+            if not boxes:
+                return []
+            image = self._render_page(page, 200)
+            scale = image.shape[1] / float(page.width)
+            images = [image[max(int(top * scale), 0):int(bottom * scale) + 1, max(int(x0 * scale), 0):int(x1 * scale) + 1]
+                      for x0, top, x1, bottom in boxes]
+            return [image for image in images if min(image.shape) >= min_size]
+        finally:
+            page.close()
+
+    def _render(self, handle, index, region, dpi):
+        page = handle.pages[index]
+        try:
+            image = self._render_page(page, dpi)
+            height, width = image.shape
+            return image[int(height * region[1]):int(height * region[3]),
+                         int(width * region[0]):int(width * region[2])].copy()
+        finally:
+            page.close()
+
+    @staticmethod
+    def _render_page(page, dpi):
+        import numpy as np
+        return np.array(page.to_image(resolution=dpi).original.convert('L'))
+
+    def _merge_source(self, handle):
+        return _PdfminerSource(handle)
+
+    def _close(self, handle):
+        handle.close()
+
+
+class _PyMuPDFSource:
+    """PyMuPDF 文档中的原始对象：解析对象的PDF语法，流数据不解码"""
+
+    def __init__(self, handle):
+        self.handle = handle
+
+    def page_refs(self):
+        return [self.handle.page_xref(index) for index in range(self.handle.page_count)]
+
+    def resolve(self, num):
+        # ascii: 名称和字符串中的非ASCII字节转义输出，文本与原始字节一一对应
+        value = parse_object(self.handle.xref_object(num, compressed=True, ascii=True))
+        if self.handle.xref_is_stream(num):
+            return Stream(value, self.handle.xref_stream_raw(num))
+        return value
+
+
+# pdfminer 解码时原样保留的图像编码
+_UNDECODED_FILTERS = ('DCTDecode', 'DCT', 'JPXDecode', 'JBIG2Decode')
+
+
+class _PdfminerSource:
+    """pdfplumber（pdfminer）解析出的对象，转换为与后端无关的表示"""
+
+    def __init__(self, handle):
+        self.handle = handle
+
+    def page_refs(self):
+        return [page.page_obj.pageid for page in self.handle.pages]
+
+    def resolve(self, num):
+        return self._convert(self.handle.doc.getobj(num))
+
+    def _convert(self, value):
+        from pdfminer.psparser import PSLiteral, PSKeyword
+        from pdfminer.pdftypes import PDFObjRef, PDFStream
+        if isinstance(value, PDFObjRef):
+            return Ref(value.objid)
+        if isinstance(value, PSLiteral):
+            name = value.name
+            return Name(name.decode('latin-1') if isinstance(name, bytes) else name)
+        if isinstance(value, PSKeyword):
+            return None
+        if isinstance(value, dict):
+            return {str(key): self._convert(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self._convert(item) for item in value]
+        if isinstance(value, PDFStream):
+            return self._stream(value)
+        return value
+
+    def _stream(self, stream):
+        attrs = self._convert(stream.attrs)
+        if stream.rawdata is not None:
+            data = stream.rawdata
+            if stream.decipher:
+                data = stream.decipher(stream.objid, stream.genno, data, stream.attrs)
+            return Stream(attrs, data)
+
+        # 提取文本时已经解码的流（页面内容等）：JPEG 等图像编码被原样保留，其余编码已经解开
+        filters = [(self._convert(name), self._convert(params)) for name, params in stream.get_filters()]
+        kept = [(name, params) for name, params in filters if name in _UNDECODED_FILTERS]
+        for key in ('Filter', 'DecodeParms', 'F', 'FFilter', 'FDecodeParms', 'DL'):
+            attrs.pop(key, None)
+        if kept:
+            attrs['Filter'] = [name for name, _ in kept]
+            if any(params for _, params in kept):
+                attrs['DecodeParms'] = [params or None for _, params in kept]
+            return Stream(attrs, stream.data)
+        attrs['Filter'] = Name('FlateDecode')
+        return Stream(attrs, zlib.compress(stream.data))
+
+
+PDF_BACKENDS = {
+    PyMuPDFBackend.name: PyMuPDFBackend,
+    PdfplumberBackend.name: PdfplumberBackend
+}
+
+
+def available_pdf_backends():
+    """返回当前环境可用的后端名称"""
+    names = []
+    if importlib.util.find_spec('pymupdf') is not None or importlib.util.find_spec('fitz') is not None:
+        names.append(PyMuPDFBackend.name)
+    names.append(PdfplumberBackend.name)
+    return names
+
+
+def get_pdf_backend(backend=None):
+    """按名称创建PDF文本后端，'auto' 优先使用 PyMuPDF，未安装时使用 pdfplumber"""
+    if isinstance(backend, PDFTextBackend):
+        return backend
+    name = backend or 'auto'
+    if name == 'auto':
+        name = available_pdf_backends()[0]
+    if name not in PDF_BACKENDS:
+        raise ValueError(f"未知的PDF文本后端: {name}（可选: auto, {', '.join(PDF_BACKENDS)}）")
+    return PDF_BACKENDS[name]()
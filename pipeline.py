@@ -0,0 +1,183 @@
+import os
+import re
+import logging
+from matching import AMOUNT_TOLERANCE, Match, match_payments
+from records import InvoiceRecord, PaymentRecord, records_frame, subtract_amounts, export_table
+
+logger = logging.getLogger(__name__)
+
+# 每条记录都相同的列（整列广播）
+FIXED_COLUMNS = {
+    '品牌': 'NA',
+    '规格数量': 1,
+    '规格单位': '套',
+    '计量单位': '套',
+    '数量': 1,
+    '存放地点': '科技楼1907'
+}
+
+# combined_results.csv 的列顺序
+COMBINED_COLUMNS = [
+    '名称', '品牌', '规格数量', '规格单位', '计量单位', '数量',
+    '存放地点', '供应商', '发票号码', '开票日期', '发票金额',
+    '实际支付金额', '差额', '发票文件', '文件名', '匹配得分', '匹配依据'
+]
+
+def clean_filename_for_name(filename):
+    """从文件名提取商品名称（去掉数字和log字符）"""
+    # 移除扩展名
+    name = os.path.splitext(filename)[0]
+    # 移除数字
+    name = re.sub(r'\d+', '', name)
+    # 移除log字符（不区分大小写）
+    name = re.sub(r'log', '', name, flags=re.IGNORECASE)
+    # 移除特殊字符
+    name = re.sub(r'[^\w\s\u4e00-\u9fff]', '', name)
+    # 移除多余的空格
+    name = ' '.join(name.split())
+    return name.strip()
+
+def clean_filenames(filenames):
+    """clean_filename_for_name 的整列版本：对文件名列（pandas Series）一次完成所有替换"""
+    return (filenames
+            .str.replace(r'^(\.*[^.].*?)\.[^.]*$', r'\1', regex=True)  # 移除扩展名（与 os.path.splitext 相同）
+            .str.replace(r'\d+', '', regex=True)
+            .str.replace(r'(?i)log', '', regex=True)
+            .str.replace(r'[^\w\s\u4e00-\u9fff]', '', regex=True)
+            .str.split().str.join(' '))
+
+def _invoice_records(invoice_results, payment_df, matches):
+    """有发票的记录：发票与匹配到的支付记录按文件名连接"""
+    import pandas as pd
+    linked = pd.DataFrame(list(matches.values()), columns=Match._fields)
+    amounts = payment_df.drop_duplicates('filename').set_index('filename')['amount']
+    linked['amount'] = linked['payment'].map(amounts)
+    linked = invoice_results[['filename']].merge(linked, how='left', left_on='filename', right_on='invoice')
+    linked.index = invoice_results.index
+
+    # 优先使用清理后的文件名，为空时使用发票中的商品名称
+    names = clean_filenames(invoice_results['filename'])
+    return pd.DataFrame({
+        '名称': names.where(names != '', invoice_results['product_name']),
+        **FIXED_COLUMNS,
+        '供应商': invoice_results['supplier'],
+        '发票号码': invoice_results['invoice_number'],
+        '开票日期': invoice_results['invoice_date'],
+        '发票金额': invoice_results['price'],
+        '发票文件': invoice_results['filename'],
+        '实际支付金额': linked['amount'],
+        '文件名': linked['payment'],
+        # 差额：Decimal相减，没有金额时为空
+        '差额': subtract_amounts(linked['amount'], invoice_results['price']),
+        '匹配得分': linked['score'],
+        '匹配依据': linked['reason']
+    }, index=invoice_results.index)
+
+def _payment_records(payments, invoice_files):
+    """没有发票的支付记录"""
+    import pandas as pd
+    # 按文件名对应的发票没有提取结果时保留文件名，已有记录的发票不再重复列出
+    invoice_file = payments['invoice_file'].where(~payments['invoice_file'].isin(invoice_files), None)
+    return pd.DataFrame({
+        '名称': clean_filenames(payments['filename']),  # 使用清理后的文件名
+        **FIXED_COLUMNS,
+        '供应商': None,
+        '发票号码': None,
+        '开票日期': None,
+        '发票金额': None,
+        '发票文件': invoice_file,
+        '实际支付金额': payments['amount'],
+        '文件名': payments['filename'],
+        '差额': None,
+        '匹配得分': None,
+        '匹配依据': None
+    }, index=payments.index)
+
+def run_pipeline(pdf_analyzer, payment_tester, input_dir='.', output_dir='output', formats=('csv',)):
+    """完整处理：解析所有发票和支付截图，生成合并结果（各阶段之间直接传递记录，不读写中间文件）"""
+    # 处理PDF发票
+    logger.info("\n开始处理PDF发票...")
+    invoices = pdf_analyzer.process_pdfs(input_dir, output_dir, formats)
+    
+    # 处理支付截图
+    logger.info("\n开始处理支付截图...")
+    payments = payment_tester.process_payment_images(input_dir, output_dir)
+    
+    # 合并结果
+    logger.info("\n开始合并处理结果...")
+    combine_results(invoices, payments, output_dir, formats)
+
+def combine_results(invoices, payments, output_dir='output', formats=('csv',)):
+    """合并发票记录（InvoiceRecord）和支付记录（PaymentRecord），导出 combined_results.csv"""
+    import pandas as pd
+    invoice_results = records_frame(invoices or [], InvoiceRecord)
+    payment_df = records_frame(payments or [], PaymentRecord)
+    if not invoice_results.empty:
+        logger.info(f"读取到 {len(invoice_results)} 条发票记录")
+
+        # 显示前几条记录的内容
+        logger.info("\n发票数据示例:")
+        logger.info(invoice_results.head().to_string())
+
+    if not payment_df.empty:
+        logger.info(f"处理了 {len(payment_df)} 条支付记录")
+
+        # 显示前几条记录的内容
+        logger.info("\n支付数据示例:")
+        logger.info(payment_df.head().to_string())
+
+    else:
+        logger.warning("未找到支付记录")
+
+    # 按文件名和金额一对一匹配发票和支付截图
+    matches = {}
+    if not invoice_results.empty and not payment_df.empty:
+        matches = match_payments(zip(invoice_results['filename'], invoice_results['price']),
+                                 zip(payment_df['filename'], payment_df['amount']))
+
+    # 准备合并结果：有发票的记录和没有发票的支付记录，整列计算
+    parts = []
+    if not invoice_results.empty:
+        parts.append(_invoice_records(invoice_results, payment_df, matches))
+    if not payment_df.empty:
+        unmatched = payment_df[~payment_df['filename'].isin(list(matches))]
+        parts.append(_payment_records(unmatched, invoice_results['filename']))
+    combined_results = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+
+    # 保存合并结果
+    if not combined_results.empty:
+        # 按指定顺序排列列
+        df = combined_results[COMBINED_COLUMNS]
+
+        output_file = os.path.join(output_dir, 'combined_results.csv')
+        for exported in export_table(df, output_file, formats):
+            logger.info(f"\n合并结果已保存到: {exported}")
+        logger.info(f"总记录数: {len(df)}")
+
+        # 显示合并后的数据示例
+        logger.info("\n合并后的数据示例:")
+        logger.info(df.head().to_string())
+
+        # 显示统计信息
+        logger.info("\n处理结果统计:")
+        logger.info(f"发票记录数: {len(invoice_results) if not invoice_results.empty else 0}")
+        logger.info(f"支付记录数: {len(payment_df) if not payment_df.empty else 0}")
+        logger.info(f"成功匹配数: {df['实际支付金额'].notna().sum()}")
+
+        # 检查金额差异
+        if '发票金额' in df.columns and '实际支付金额' in df.columns:
+            error = (pd.to_numeric(df['差额'], errors='coerce') /
+                     pd.to_numeric(df['发票金额'], errors='coerce') * 100).abs()
+            mismatched = df['发票金额'].notna() & df['实际支付金额'].notna() & (error > AMOUNT_TOLERANCE * 100)
+            mismatches = df[mismatched].assign(误差百分比=error[mismatched])
+
+            if not mismatches.empty:
+                logger.warning(f"\n发现金额不匹配的记录（误差>{AMOUNT_TOLERANCE:.0%}）:")
+                for _, row in mismatches.iterrows():
+                    logger.warning(f"发票: {row['发票文件']}, "
+                                 f"发票金额: {row['发票金额']}, "
+                                 f"支付金额: {row['实际支付金额']}, "
+                                 f"差额: {row['差额']:.2f}, "
+                                 f"误差: {row['误差百分比']:.1f}%")
+    else:
+        logger.warning("没有找到任何处理结果")
@@ -0,0 +1,100 @@
+import os
+import logging
+from decimal import Decimal, InvalidOperation
+from operator import attrgetter
+
+logger = logging.getLogger(__name__)
+
+# 结果文件的导出格式：CSV 始终可用，Parquet 需要安装 pyarrow 或 fastparquet
+EXPORT_FORMATS = ('csv', 'parquet')
+
+_CENT = Decimal('0.01')
+
+
+def to_decimal(value):
+    """金额转换为两位小数的Decimal，没有金额（None、空字符串、NaN、无法解析）时返回None"""
+    if value is None or isinstance(value, Decimal):
+        amount = value
+    else:
+        try:
+            amount = Decimal(str(value).strip().replace(',', ''))
+        except (InvalidOperation, ValueError):
+            return None
+    if amount is None or not amount.is_finite():
+        return None
+    return amount.quantize(_CENT)
+
+
+def _text(value):
+    """文本字段：None 保持为None，其他值保存为字符串（发票号码不会被当作数字丢失前导零）"""
+    return None if value is None else str(value)
+
+
+class InvoiceRecord:
+    """一张发票的提取结果：文本字段为字符串，金额为Decimal"""
+
+    __slots__ = ('filename', 'invoice_number', 'invoice_date', 'supplier', 'price', 'product_name')
+
+    def __init__(self, filename, invoice_number=None, invoice_date=None, supplier=None, price=None,
+                 product_name=None):
+        self.filename = filename
+        self.invoice_number = _text(invoice_number)
+        self.invoice_date = _text(invoice_date)
+        self.supplier = _text(supplier)
+        self.price = to_decimal(price)
+        self.product_name = _text(product_name)
+
+    @classmethod
+    def from_info(cls, info):
+        """由 extract_pdf_info 返回的字典（或增量处理清单中保存的结果）生成"""
+        return cls(**{field: info.get(field) for field in cls.__slots__})
+
+    def __repr__(self):
+        return f"InvoiceRecord({self.filename!r}, price={self.price})"
+
+
+class PaymentRecord:
+    """一张支付截图的识别结果：支付金额为Decimal，invoice_file 为按文件名对应的发票"""
+
+    __slots__ = ('filename', 'amount', 'invoice_file', 'passes')
+
+    def __init__(self, filename, amount, invoice_file=None, passes=0):
+        self.filename = filename
+        self.amount = to_decimal(amount)
+        self.invoice_file = invoice_file
+        self.passes = passes
+
+    def __repr__(self):
+        return f"PaymentRecord({self.filename!r}, amount={self.amount})"
+
+
+def records_frame(records, record_type):
+    """记录列表转换为DataFrame：每个字段一列（object类型），不做类型推断"""
+    import pandas as pd
+    return pd.DataFrame({field: pd.Series(list(map(attrgetter(field), records)), dtype=object)
+                         for field in record_type.__slots__})
+
+
+def subtract_amounts(minuend, subtrahend):
+    """两列Decimal金额逐行相减，任一金额为空时结果为空"""
+    import pandas as pd
+    both = minuend.notna() & subtrahend.notna()
+    result = pd.Series(None, index=minuend.index, dtype=object)
+    result[both] = minuend[both] - subtrahend[both]
+    return result
+
+
+def export_table(df, output_file, formats=('csv',)):
+    """导出结果表：output_file 为CSV文件路径，Parquet文件与之同名（扩展名为 .parquet）；返回写出的文件列表"""
+    written = []
+    if 'csv' in formats:
+        df.to_csv(output_file, index=False, encoding='utf-8')
+        written.append(output_file)
+    if 'parquet' in formats:
+        parquet_file = os.path.splitext(output_file)[0] + '.parquet'
+        try:
+            df.to_parquet(parquet_file, index=False)
+            written.append(parquet_file)
+        except ImportError as e:
+            logger.warning(f"无法导出Parquet文件（需要安装 pyarrow 或 fastparquet）: {str(e)}")
+    return written
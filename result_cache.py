@@ -0,0 +1,128 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import logging
+
+
+def file_sha256(path):
+    """计算文件内容的SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def config_fingerprint(*parts):
+    """把处理配置（模式列表、版本号等）转换为稳定的哈希值"""
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+class ResultCache:
+    """基于SQLite的处理结果缓存
+
+    以 (namespace, key) 保存JSON结果，key 通常为文件内容哈希加处理配置指纹，
+    文件或配置变化后自然失效。按保存时间和总大小淘汰旧记录。
+    """
+
+    def __init__(self, db_path, namespace, max_age_days=90, max_bytes=256 * 1024 * 1024):
+        self.db_path = db_path
+        self.namespace = namespace
+        self.max_age_days = max_age_days
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+
+        # 多个处理任务可能同时使用同一个缓存文件：WAL模式下读取不等待写入，写入冲突时最多等待30秒
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS results (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            )
+        ''')
+        self._conn.commit()
+
+    def get(self, key):
+        """读取缓存结果，不存在时返回None"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT value FROM results WHERE namespace = ? AND key = ?',
+                (self.namespace, key)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute(
+                'UPDATE results SET last_used = ? WHERE namespace = ? AND key = ?',
+                (time.time(), self.namespace, key))
+            self._conn.commit()
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        """保存结果（需可JSON序列化）"""
+        data = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO results (namespace, key, value, size, created, last_used) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (self.namespace, key, data, len(data), now, now))
+            self._conn.commit()
+
+    def evict(self):
+        """淘汰过期记录，并在超出总大小限制时删除最久未使用的记录"""
+        with self._lock:
+            removed = 0
+            if self.max_age_days is not None:
+                cutoff = time.time() - self.max_age_days * 86400
+                removed += self._conn.execute(
+                    'DELETE FROM results WHERE created < ?', (cutoff,)).rowcount
+
+            if self.max_bytes is not None:
+                total = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+                if total > self.max_bytes:
+                    rows = self._conn.execute(
+                        'SELECT namespace, key, size FROM results ORDER BY last_used').fetchall()
+                    stale = []
+                    for namespace, key, size in rows:
+                        if total <= self.max_bytes:
+                            break
+                        stale.append((namespace, key))
+                        total -= size
+                    self._conn.executemany(
+                        'DELETE FROM results WHERE namespace = ? AND key = ?', stale)
+                    removed += len(stale)
+
+            self._conn.commit()
+        if removed:
+            self.logger.info(f"缓存淘汰记录数: {removed}")
+        return removed
+
+    def clear(self):
+        """清空当前命名空间的缓存"""
+        with self._lock:
+            self._conn.execute('DELETE FROM results WHERE namespace = ?', (self.namespace,))
+            self._conn.commit()
+
+    def close(self):
+        """淘汰旧记录并关闭数据库"""
+        self.evict()
+        with self._lock:
+            self._conn.close()
@@ -1,22 +1,105 @@
 import os
 import re
-import cv2
-import numpy as np
-import pandas as pd
-import pytesseract
-from pytesseract import Output
 import traceback
-from PIL import Image
 from datetime import datetime
 import logging
+from ocr_scheduler import OCRScheduler
+from result_cache import ResultCache, file_sha256, config_fingerprint
+from ocr_backend import get_backend, probe_tesseract
+from pdf_stream_writer import StreamingPDFWriter
+from matching import match_payments
+from records import PaymentRecord
+from amount_region import DETECTOR_VERSION
+from amount_grammar import GRAMMAR_VERSION, PAYMENT_GRAMMAR, find_payment_amounts
+from image_preprocess import (PREPROCESS_VERSION, DEFAULT_GLYPH_HEIGHT, VariantView, is_payment_image,
+                              shared_store)
+
+logger = logging.getLogger(__name__)
+
 
 class PaymentImageTester:
-    def __init__(self, min_font_height=20):
+    # 图像处理版本（完整识别时的顺序）
+    IMAGE_VERSIONS = ["原始灰度图", "CLAHE增强", "Otsu二值化", "自适应二值化"]
+    
+    # 图像处理版本对应的预处理结果（见 image_preprocess.VARIANTS）
+    VERSION_VARIANTS = {
+        "原始灰度图": 'gray',
+        "CLAHE增强": 'clahe',
+        "Otsu二值化": 'clahe_otsu',
+        "自适应二值化": 'clahe_adaptive'
+    }
+    
+    # 定义不同的PSM模式
+    PSM_MODES = [
+        3,   # 自动页面分割，但没有OSD（默认）
+        4,   # 假设有一列可变大小的文本
+        6,   # 假设为统一的文本块
+        7,   # 将图像视为单行文本
+        8,   # 将图像视为单词
+        11,  # 稀疏文本，需要尽可能多地找到文本
+        12,  # 稀疏文本和OSD
+        13   # 将图像视为单行文本，不进行任何预处理/OSD
+    ]
+    
+    # 金额区域识别使用的PSM模式（单行文本/单词/原始单行）
+    ROI_PSM_MODES = [7, 8, 13]
+    
+    # OCR识别语言
+    OCR_LANG = 'eng'
+    
+    # 级联模式的默认优先顺序（未列出的组合排在后面）
+    DEFAULT_CASCADE_ORDER = [
+        ("Otsu二值化", 6),
+        ("CLAHE增强", 6),
+        ("原始灰度图", 6),
+        ("Otsu二值化", 11),
+        ("CLAHE增强", 11),
+        ("原始灰度图", 11),
+        ("自适应二值化", 6),
+        ("Otsu二值化", 4),
+        ("CLAHE增强", 4)
+    ]
+    
+    def __init__(self, min_font_height=20, cascade=False, agreement_threshold=3, cascade_order=None, workers=1,
+                 use_cache=True, cache_path=None, ocr_backend=None, roi=True, roi_regions=3,
+                 target_glyph_height=DEFAULT_GLYPH_HEIGHT, image_store=None):
         self.min_font_height = min_font_height
+        
+        # 分辨率归一化：按正文字高缩放图片后再生成图像处理版本（0或None表示不缩放）
+        self.target_glyph_height = target_glyph_height
+        
+        # 图片只解码一次，各图像处理版本按需生成（默认与 DocumentAnalyzer 共用）
+        self.image_store = image_store or shared_store
         self.logger = logging.getLogger(__name__)
         
+        # 级联模式：按优先顺序识别，同一金额被 agreement_threshold 次独立识别确认后提前结束
+        self.cascade = cascade
+        self.agreement_threshold = agreement_threshold
+        self.cascade_order = list(cascade_order) if cascade_order else list(self.DEFAULT_CASCADE_ORDER)
+        self.last_pass_count = 0
+        
+        # 金额区域：先只识别字号最大的几行文字，找不到金额时再识别整张图片
+        self.roi = roi
+        self.roi_regions = roi_regions
+        
+        # 并行识别的线程数，大于1时由 OCRScheduler 统一调度所有图片的识别任务
+        self.workers = workers
+        
+        # 进度回调 progress(阶段, 已完成数, 总数)，每张图片识别完后调用（见 jobs.Job.update）
+        self.progress = None
+        
+        # OCR结果缓存：图片内容哈希 + 识别配置 -> 各次识别的候选金额和最终金额
+        self.use_cache = use_cache
+        self.cache_path = cache_path or os.path.join('output', 'ocr_cache.sqlite')
+        self._cache = None
+        self._cache_config = None
+        
+        # OCR后端：auto 优先使用进程内的 tesserocr，未安装时使用批量命令行模式
+        self.ocr_backend = get_backend(ocr_backend)
+        
         # 设置Tesseract路径
         if os.name == 'nt':  # Windows
+            import pytesseract
             tesseract_paths = [
                 r'C:\Program Files\Tesseract-OCR\tesseract.exe',
                 r'C:\Program Files (x86)\Tesseract-OCR\tesseract.exe',
@@ -34,35 +117,28 @@ class PaymentImageTester:
                     os.environ['TESSDATA_PREFIX'] = os.path.join(tesseract_dir, 'tessdata')
                     tesseract_found = True
                     self.logger.info(f"找到Tesseract: {path}")
-                    
-                    # 验证语言包
-                    tessdata_dir = os.path.join(tesseract_dir, 'tessdata')
-                    eng_traineddata = os.path.join(tessdata_dir, 'eng.traineddata')
-                    chi_sim_traineddata = os.path.join(tessdata_dir, 'chi_sim.traineddata')
-                    
-                    self.logger.info(f"检查语言包:")
-                    self.logger.info(f"tessdata目录: {tessdata_dir}")
-                    self.logger.info(f"英文语言包: {'存在' if os.path.exists(eng_traineddata) else '不存在'}")
-                    self.logger.info(f"中文语言包: {'存在' if os.path.exists(chi_sim_traineddata) else '不存在'}")
-                    
-                    if not os.path.exists(eng_traineddata):
-                        self.logger.error("未找到英文语言包!")
-                    if not os.path.exists(chi_sim_traineddata):
-                        self.logger.error("未找到中文语言包!")
-                    
                     break
             
             if not tesseract_found:
                 self.logger.error("未找到Tesseract安装，请确保已正确安装Tesseract")
                 raise FileNotFoundError("Tesseract未找到")
             
-            # 验证版本
+            # 验证版本和语言包（探测结果按Tesseract可执行文件缓存，未变化时不启动子进程）
             try:
-                version_output = os.popen(f'"{pytesseract.pytesseract.tesseract_cmd}" --version').read()
-                self.logger.info(f"Tesseract版本信息:\n{version_output}")
+                info = probe_tesseract(pytesseract.pytesseract.tesseract_cmd)
+                self.logger.info(f"Tesseract版本: {info.version}")
+                self.logger.info(f"检查语言包:")
+                self.logger.info(f"tessdata目录: {os.environ['TESSDATA_PREFIX']}")
+                self.logger.info(f"英文语言包: {'存在' if 'eng' in info.languages else '不存在'}")
+                self.logger.info(f"中文语言包: {'存在' if 'chi_sim' in info.languages else '不存在'}")
+                
+                if 'eng' not in info.languages:
+                    self.logger.error("未找到英文语言包!")
+                if 'chi_sim' not in info.languages:
+                    self.logger.error("未找到中文语言包!")
                 
-                # 从版本输出中提取版本号
-                version_match = re.search(r'tesseract\s+(\d+\.\d+)', version_output)
+                # 从版本号中提取主版本号
+                version_match = re.match(r'(\d+\.\d+)', info.version)
                 if version_match:
                     version = float(version_match.group(1))
                     if version < 4.0:
@@ -74,181 +150,337 @@ class PaymentImageTester:
     def extract_payment_from_image(self, image_path):
         """从图片中提取支付金额"""
         try:
-            # 读取图片
-            img = cv2.imread(image_path)
-            if img is None:
-                self.logger.error(f"无法读取图片: {image_path}")
-                return None
-            
-            # 转换为灰度图
-            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            
-            # 增加对比度
-            clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-            enhanced = clahe.apply(gray)
-            
-            # 创建不同的图像处理版本
-            images = []
-            
-            # 原始灰度图
-            images.append(("原始灰度图", gray))
-            
-            # CLAHE增强
-            images.append(("CLAHE增强", enhanced))
+            # 图片和识别配置都未变化时直接使用缓存结果
+            cache_key, cached = self._load_cached(image_path)
+            if cached is not None:
+                self.last_pass_count = 0
+                self.logger.info(f"使用缓存的支付金额: {cached['amount']} ({os.path.basename(image_path)})")
+                return cached['amount']
             
-            # Otsu二值化
-            _, binary_otsu = cv2.threshold(enhanced, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-            images.append(("Otsu二值化", binary_otsu))
-            
-            # 自适应二值化
-            binary_adaptive = cv2.adaptiveThreshold(enhanced, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)
-            images.append(("自适应二值化", binary_adaptive))
-            
-            # 定义不同的PSM模式
-            psm_modes = [
-                3,   # 自动页面分割，但没有OSD（默认）
-                4,   # 假设有一列可变大小的文本
-                6,   # 假设为统一的文本块
-                7,   # 将图像视为单行文本
-                8,   # 将图像视为单词
-                11,  # 稀疏文本，需要尽可能多地找到文本
-                12,  # 稀疏文本和OSD
-                13   # 将图像视为单行文本，不进行任何预处理/OSD
-            ]
+            # 读取图片并创建不同的图像处理版本
+            images = self._load_image_versions(image_path)
+            if images is None:
+                return None
             
             all_results = []
+            passes = 0
+            agreed_amount = None
             
-            # 对每个图像版本尝试不同的PSM模式
-            for img_name, img_version in images:
-                for psm in psm_modes:
-                    try:
-                        # 配置Tesseract
-                        config = f'--oem 3 --psm {psm}'
-                        
-                        # 进行OCR识别
-                        text = pytesseract.image_to_string(img_version, lang='eng', config=config)
-                        
-                        # 查找负数金额的不同模式
-                        amount_patterns = [
-                            r'-\d+\.\d{2}',           # 标准格式：-xx.xx
-                            r'[-—]\s*\d+\.\d{2}',     # 带空格：- xx.xx
-                            r'[-—]\d+\.\d{2}',        # 不同的负号：−xx.xx
-                            r'\(\d+\.\d{2}\)',        # 括号格式：(xx.xx)
-                            r'支付\s*[-—]?\s*\d+\.\d{2}',  # 带"支付"的格式
-                            r'¥\s*[-—]?\d+\.\d{2}',   # 带"¥"的格式
-                            r'实付\s*[-—]?\s*\d+\.\d{2}',  # 带"实付"的格式
-                            r'付款\s*[-—]?\s*\d+\.\d{2}',  # 带"付款"的格式
-                            r'总计\s*[-—]?\s*\d+\.\d{2}'   # 带"总计"的格式
-                        ]
-                        
-                        for pattern in amount_patterns:
-                            matches = re.findall(pattern, text)
-                            if matches:
-                                for match in matches:
-                                    try:
-                                        # 处理括号格式
-                                        if match.startswith('(') and match.endswith(')'):
-                                            amount = -float(match[1:-1])
-                                        else:
-                                            # 替换所有可能的负号为标准负号
-                                            cleaned_match = match.replace('—', '-').replace('−', '-').replace(' ', '')
-                                            # 提取数字部分
-                                            num_match = re.search(r'-?\d+\.\d{2}', cleaned_match)
-                                            if num_match:
-                                                amount = float(num_match.group())
-                                            else:
-                                                continue
-                                        
-                                        if amount < 0:  # 确保是负数
-                                            self.logger.info(f"找到支付金额: {amount} (图像处理: {img_name}, PSM: {psm})")
-                                            all_results.append((abs(amount), img_name, psm))
-                                    except ValueError:
-                                        continue
+            # 完整识别且后端支持批量时，每个PSM模式的所有图像版本一次提交
+            if self.ocr_backend.supports_batch and not self.cascade:
+                all_results, passes = self._run_batched_passes(images)
+            else:
+                # 按识别计划依次尝试图像版本和PSM模式
+                for completed, (img_name, psm) in enumerate(self._pass_plan(), 1):
+                    passes += self._count_passes(images, [(img_name, psm)])
+                    all_results.extend(self._run_pass(images, img_name, psm))
                     
-                    except Exception as e:
-                        self.logger.error(f"OCR处理失败 (图像处理: {img_name}, PSM: {psm}): {str(e)}")
-                        continue
-            
-            # 如果找到结果，返回最常见的金额
-            if all_results:
-                # 统计每个金额出现的次数
-                amount_counts = {}
-                for amount, img_name, psm in all_results:
-                    amount_str = f"{amount:.2f}"
-                    if amount_str not in amount_counts:
-                        amount_counts[amount_str] = 0
-                    amount_counts[amount_str] += 1
-                
-                # 找出出现次数最多的金额
-                most_common_amount = max(amount_counts.items(), key=lambda x: x[1])
-                amount = float(most_common_amount[0])
-                
-                self.logger.info(f"最终选择的支付金额: {amount:.2f} (出现次数: {most_common_amount[1]})")
-                return amount
+                    # 级联模式：达到一致次数后提前结束
+                    if self.cascade:
+                        agreed_amount = self._agreed_amount(all_results)
+                        if agreed_amount is not None:
+                            break
+                    
+                    # 金额区域中已找到金额时不再识别整张图片
+                    if self._roi_found(all_results, completed):
+                        break
             
-            self.logger.warning(f"未找到支付金额")
-            return None
+            self.last_pass_count = passes
+            amount = self._select_amount(all_results, passes, agreed_amount)
+            self._save_cached(cache_key, all_results, amount, passes)
+            return amount
                 
         except Exception as e:
             self.logger.error(f"处理图片时出错: {str(e)}")
             traceback.print_exc()
             return None
+
+    def _get_cache(self):
+        """打开OCR结果缓存，未启用或无法打开时返回None"""
+        if not self.use_cache:
+            return None
+        if self._cache is None:
+            try:
+                self._cache = ResultCache(self.cache_path, 'payment_ocr')
+            except Exception as e:
+                self.logger.warning(f"无法打开OCR缓存，本次不使用缓存: {str(e)}")
+                self.use_cache = False
+                return None
+        return self._cache
+
+    def config_fingerprint(self):
+        """识别配置指纹：图像处理版本、PSM模式、Tesseract版本、语言、金额模式、金额区域和级联设置"""
+        if self._cache_config is None:
+            try:
+                version = self.ocr_backend.version()
+            except Exception:
+                version = 'unknown'
+            self._cache_config = config_fingerprint(
+                self.IMAGE_VERSIONS, self.PSM_MODES, version, self.OCR_LANG,
+                (GRAMMAR_VERSION, PAYMENT_GRAMMAR.pattern),
+                self.cascade, self.agreement_threshold, self.cascade_order if self.cascade else None,
+                (DETECTOR_VERSION, self.min_font_height, self.roi_regions, self.ROI_PSM_MODES) if self.roi else None,
+                (PREPROCESS_VERSION, self.target_glyph_height))
+        return self._cache_config
+
+    def _cache_key(self, image_path):
+        """缓存键：图片内容哈希 + 识别配置指纹"""
+        return f"{file_sha256(image_path)}:{self.config_fingerprint()}"
+
+    def _load_cached(self, image_path):
+        """返回 (缓存键, 缓存结果)，未启用缓存时均为None"""
+        cache = self._get_cache()
+        if cache is None:
+            return None, None
+        try:
+            key = self._cache_key(image_path)
+        except OSError:
+            return None, None
+        return key, cache.get(key)
+
+    def _save_cached(self, cache_key, all_results, amount, passes):
+        """保存本次识别的候选金额和最终金额"""
+        if cache_key is None or self._cache is None:
+            return
+        self._cache.put(cache_key, {
+            'candidates': [list(result) for result in all_results],
+            'amount': amount,
+            'passes': passes
+        })
+
+    def _close_cache(self):
+        """报告缓存命中情况，淘汰旧记录并关闭缓存"""
+        if self._cache is None:
+            return
+        self.logger.info(f"OCR缓存: 命中{self._cache.hits}次, 未命中{self._cache.misses}次")
+        self._cache.close()
+        self._cache = None
+
+    def _load_image_versions(self, image_path):
+        """读取图片并返回 {图像版本名称: 图像}（图像在第一次使用时生成），读取失败返回None"""
+        # 读取灰度图并按正文字高缩放到统一尺度（超大图片缩小解码）
+        image = self.image_store.get(image_path, self.target_glyph_height)
+        if not image.load():
+            self.logger.error(f"无法读取图片: {image_path}")
+            return None
+        if image.scale != 1.0:
+            self.logger.info(f"分辨率归一化: 缩放{image.scale:.2f}倍, {image.gray.shape[1]}x{image.gray.shape[0]} "
+                             f"({os.path.basename(image_path)})")
+        names = {img_name: (variant, None) for img_name, variant in self.VERSION_VARIANTS.items()}
+        
+        # 字号最大的几行文字的图像处理版本
+        if self.roi:
+            regions = image.regions(self.min_font_height, self.roi_regions)
+            for index, (x, y, w, h, _) in enumerate(regions, 1):
+                for img_name, variant in self.VERSION_VARIANTS.items():
+                    names[self._roi_name(index, img_name)] = (variant, (x, y, w, h))
+            roi_pixels = sum(w * h for _, _, w, h, _ in regions)
+            self.logger.info(f"金额候选区域: {len(regions)}个, 占图片像素{roi_pixels / image.gray.size:.1%} "
+                             f"({os.path.basename(image_path)})")
+        return VariantView(image, names)
+
+    def _run_pass(self, images, img_name, psm):
+        """执行一次识别，返回 [(金额, 图像版本, PSM)]，识别失败返回空列表"""
+        if img_name not in images:  # 图片中没有检测到这么多金额候选区域
+            return []
+        try:
+            amounts = self._ocr_amounts(images[img_name], img_name, psm)
+        except Exception as e:
+            self.logger.error(f"OCR处理失败 (图像处理: {img_name}, PSM: {psm}): {str(e)}")
+            return []
+        return [(amount, img_name, psm) for amount in amounts]
+
+    def _run_batched_passes(self, images):
+        """批量识别，返回 (按识别计划顺序排列的 [(金额, 图像版本, PSM)], 识别次数)"""
+        roi_plan = self._roi_plan()
+        if roi_plan:
+            all_results = self._run_batched_stage(images, roi_plan)
+            if all_results:
+                return all_results, self._count_passes(images, roi_plan)
+        serial_plan = self._serial_plan()
+        return (self._run_batched_stage(images, serial_plan),
+                self._count_passes(images, roi_plan) + self._count_passes(images, serial_plan))
+
+    def _run_batched_stage(self, images, plan):
+        """同一PSM模式的所有图像一次提交给OCR后端，再按计划顺序提取金额"""
+        keys_by_psm = {}
+        for img_name, psm in plan:
+            if img_name in images:
+                keys_by_psm.setdefault(psm, []).append(img_name)
+        
+        texts = {}
+        for psm, img_names in keys_by_psm.items():
+            try:
+                batch = self.ocr_backend.image_to_string_batch(
+                    [images[img_name] for img_name in img_names],
+                    lang=self.OCR_LANG, config=f'--oem 3 --psm {psm}')
+            except Exception as e:
+                # 批量识别失败时逐个识别该PSM模式
+                self.logger.warning(f"批量OCR失败，改为逐个识别 (PSM: {psm}): {str(e)}")
+                continue
+            texts.update(((img_name, psm), text) for img_name, text in zip(img_names, batch))
+        
+        all_results = []
+        for img_name, psm in plan:
+            if (img_name, psm) not in texts:
+                all_results.extend(self._run_pass(images, img_name, psm))
+                continue
+            try:
+                amounts = self._parse_amounts(texts[(img_name, psm)], img_name, psm)
+            except Exception as e:
+                self.logger.error(f"OCR处理失败 (图像处理: {img_name}, PSM: {psm}): {str(e)}")
+                continue
+            all_results.extend((amount, img_name, psm) for amount in amounts)
+        return all_results
+
+    def _select_amount(self, all_results, passes, agreed_amount=None):
+        """根据所有识别结果选出最终的支付金额"""
+        if agreed_amount is not None:
+            self.logger.info(f"最终选择的支付金额: {agreed_amount:.2f} "
+                             f"(级联模式，{passes}次识别后达成一致)")
+            return agreed_amount
+        
+        # 未达成一致时按完整识别的顺序投票，保证结果与完整识别一致
+        if self.cascade:
+            serial_order = {key: index for index, key in enumerate(self._full_plan())}
+            all_results = sorted(all_results, key=lambda x: serial_order[(x[1], x[2])])
+        
+        # 如果找到结果，返回最常见的金额
+        if all_results:
+            # 统计每个金额出现的次数
+            amount_counts = {}
+            for amount, img_name, psm in all_results:
+                amount_str = f"{amount:.2f}"
+                if amount_str not in amount_counts:
+                    amount_counts[amount_str] = 0
+                amount_counts[amount_str] += 1
             
-    def process_payment_images(self, input_dir):
-        """处理目录下的所有支付截图，返回支付记录列表"""
+            # 找出出现次数最多的金额
+            most_common_amount = max(amount_counts.items(), key=lambda x: x[1])
+            amount = float(most_common_amount[0])
+            
+            self.logger.info(f"最终选择的支付金额: {amount:.2f} (出现次数: {most_common_amount[1]}, 识别次数: {passes})")
+            return amount
+        
+        self.logger.warning(f"未找到支付金额")
+        return None
+
+    def _serial_plan(self):
+        """完整识别的顺序：每个图像版本依次尝试所有PSM模式"""
+        return [(img_name, psm) for img_name in self.IMAGE_VERSIONS for psm in self.PSM_MODES]
+
+    def _roi_name(self, index, img_name):
+        return f"区域{index}-{img_name}"
+
+    def _roi_plan(self):
+        """金额区域的识别顺序：按字高从大到小的区域，每个图像版本尝试单行PSM模式"""
+        if not self.roi:
+            return []
+        return [(self._roi_name(index, img_name), psm)
+                for index in range(1, self.roi_regions + 1)
+                for img_name in self.IMAGE_VERSIONS for psm in self.ROI_PSM_MODES]
+
+    def _full_plan(self):
+        """完整识别的顺序：先识别金额区域，再识别整张图片"""
+        return self._roi_plan() + self._serial_plan()
+
+    def _pass_plan(self):
+        """返回本次识别要执行的 (图像版本, PSM) 顺序"""
+        serial = self._serial_plan()
+        if not self.cascade:
+            return self._roi_plan() + serial
+        
+        # 级联模式：先按优先顺序，再补齐剩余组合作为完整识别的后备
+        plan = [key for key in self.cascade_order if key in serial]
+        plan.extend(key for key in serial if key not in plan)
+        return self._roi_plan() + plan
+
+    def _roi_found(self, all_results, completed):
+        """金额区域全部识别完成（已完成识别计划的前 completed 项）且已找到金额"""
+        return self.roi and bool(all_results) and completed == len(self._roi_plan())
+
+    def _count_passes(self, images, plan):
+        """识别计划中实际执行OCR的次数，图片中没有检测到的金额候选区域不识别、不计数"""
+        return sum(1 for img_name, _ in plan if img_name in images)
+
+    def _ocr_amounts(self, img_version, img_name, psm):
+        """对单个图像版本执行一次OCR，返回找到的支付金额（绝对值）列表"""
+        # 配置Tesseract
+        config = f'--oem 3 --psm {psm}'
+        
+        # 进行OCR识别
+        text = self.ocr_backend.image_to_string(img_version, lang=self.OCR_LANG, config=config)
+        return self._parse_amounts(text, img_name, psm)
+
+    def _parse_amounts(self, text, img_name, psm):
+        """从OCR文本中找出支付金额（绝对值）列表"""
+        amounts = []
+        for amount in find_payment_amounts(text):
+            self.logger.info(f"找到支付金额: {-float(amount)} (图像处理: {img_name}, PSM: {psm})")
+            amounts.append(float(amount))
+        return amounts
+
+    def _agreed_amount(self, all_results):
+        """级联模式下，返回已被足够多次独立识别确认的金额，没有则返回None"""
+        passes_by_amount = {}
+        for amount, img_name, psm in all_results:
+            passes_by_amount.setdefault(f"{amount:.2f}", set()).add((img_name, psm))
+        
+        for amount_str, passes in passes_by_amount.items():
+            if len(passes) >= self.agreement_threshold:
+                return float(amount_str)
+        return None
+            
+    def process_payment_images(self, input_dir, output_dir='output'):
+        """处理目录下的所有支付截图，返回支付记录列表（PaymentRecord）；合并的截图PDF写入 output_dir"""
         try:
             results = []
             
             # 验证Tesseract版本
             try:
-                version = pytesseract.get_tesseract_version()
-                self.logger.info(f"\nTesseract版本: {version}")
+                version = self.ocr_backend.version()
+                self.logger.info(f"\nTesseract版本: {version} (OCR后端: {self.ocr_backend.name})")
             except Exception as e:
                 self.logger.warning(f"无法获取Tesseract版本: {str(e)}")
             
             # 创建输出目录
-            output_dir = 'output'
             if not os.path.exists(output_dir):
                 os.makedirs(output_dir)
             
-            # 处理所有图片
-            for filename in os.listdir(input_dir):
-                if 'log' in filename.lower() and filename.lower().endswith(('.jpg', '.jpeg', '.png')):
-                    image_path = os.path.join(input_dir, filename)
-                    self.logger.info(f"\n正在处理图片：{image_path}")
-                    amount = self.extract_payment_from_image(image_path)
-                    
-                    if amount is not None:
-                        # 尝试从文件名中找到对应的发票文件
-                        base_name = filename.lower().replace('_log', '').replace('.jpg', '').replace('.jpeg', '').replace('.png', '')
-                        invoice_file = None
-                        
-                        # 查找可能的发票文件
-                        for inv_file in os.listdir(input_dir):
-                            if inv_file.lower().endswith('.pdf'):
-                                inv_base = inv_file.lower().replace('.pdf', '')
-                                if base_name in inv_base or inv_base in base_name:
-                                    invoice_file = inv_file
-                                    break
-                        
-                        results.append({
-                            '文件名': filename,
-                            '实际支付金额': f"{amount:.2f}",
-                            '发票文件': invoice_file
-                        })
+            # 收集所有支付截图
+            image_files = [filename for filename in os.listdir(input_dir) if is_payment_image(filename)]
+            
+            # 识别所有图片
+            image_paths = [os.path.join(input_dir, filename) for filename in image_files]
+            extracted = self.extract_payments(image_paths)
+            
+            # 对应的发票文件
+            pdf_files = [f for f in os.listdir(input_dir) if f.lower().endswith('.pdf')]
+            
+            payments = []
+            for filename, image_path in zip(image_files, image_paths):
+                amount, passes = extracted[image_path]
+                if amount is not None:
+                    payments.append((filename, amount, passes))
+            results = self.payment_records(payments, pdf_files)
             
             # 显示处理结果统计
             if results:
                 self.logger.info("\n支付金额提取统计:")
                 self.logger.info(f"总计处理图片: {len(results)}张")
                 self.logger.info(f"成功提��金额: {len(results)}个")
+                total_passes = sum(result.passes for result in results)
+                self.logger.info(f"OCR识别次数: 共{total_passes}次, "
+                               f"平均每张{total_passes / len(results):.1f}次 "
+                               f"(完整识别每张{len(self._full_plan())}次)")
                 
                 # 显示提取的金额
                 self.logger.info("\n提取的支付金额:")
                 for result in results:
-                    self.logger.info(f"文件: {result['文件名']}, "
-                                   f"金额: {result['实际支付金额']}, "
-                                   f"对应发票: {result.get('发票文件', 'N/A')}")
+                    self.logger.info(f"文件: {result.filename}, "
+                                   f"金额: {result.amount}, "
+                                   f"对应发票: {result.invoice_file or 'N/A'}, "
+                                   f"识别次数: {result.passes}")
                 
                 # 合并所有支付截图为PDF
                 merged_log_pdf = os.path.join(output_dir, f'merged_{datetime.now().strftime("%Y%m%d")}_log.pdf')
@@ -262,37 +494,103 @@ class PaymentImageTester:
             self.logger.error(f"处理支付图片时出错: {str(e)}")
             traceback.print_exc()
             return []
+        finally:
+            self._close_cache()
+            
+    def extract_payments(self, image_paths):
+        """识别多张支付截图，返回 {图片路径: (支付金额, 识别次数)}"""
+        try:
+            total = len(image_paths)
+            self._report_progress(0, total)
+            if self.workers <= 1:
+                extracted = {}
+                for image_path in image_paths:
+                    self.logger.info(f"\n正在处理图片：{image_path}")
+                    amount = self.extract_payment_from_image(image_path)
+                    extracted[image_path] = (amount, self.last_pass_count)
+                    self._report_progress(len(extracted), total)
+                return extracted
+            
+            # 多线程模式：所有未缓存图片的识别任务统一调度
+            extracted = {}
+            cache_keys = {}
+            for image_path in image_paths:
+                cache_key, cached = self._load_cached(image_path)
+                if cached is not None:
+                    extracted[image_path] = (cached['amount'], 0)
+                else:
+                    cache_keys[image_path] = cache_key
             
+            self._report_progress(len(extracted), total)
+            cached = len(extracted)
+            progress = (lambda finished: self._report_progress(cached + finished, total)) if self.progress else None
+            ocr_results = OCRScheduler(self, self.workers).run(list(cache_keys), progress)
+            for image_path, (amount, passes, all_results) in ocr_results.items():
+                if all_results is not None:  # 图片读取失败时不缓存结果
+                    self._save_cached(cache_keys[image_path], all_results, amount, passes)
+                extracted[image_path] = (amount, passes)
+            
+            for image_path in image_paths:
+                amount, passes = extracted[image_path]
+                self.logger.info(f"图片 {os.path.basename(image_path)} 识别结果: {amount} (识别次数: {passes})")
+            return extracted
+        finally:
+            self.ocr_backend.report()
+            self._close_cache()
+
+    def _report_progress(self, done, total):
+        """报告识别进度；任务被取消时进度回调会抛出异常，在两张图片之间停止处理"""
+        if self.progress is not None:
+            self.progress('image', done, total)
+
+    def payment_records(self, payments, pdf_files):
+        """生成支付记录（PaymentRecord）：payments 为 [(文件名, 支付金额, 识别次数)]
+        
+        对应的发票文件按文件名一次匹配（见 matching.py）；发票金额在汇总结果时才参与匹配。
+        """
+        matches = match_payments([(pdf_file, None) for pdf_file in pdf_files],
+                                 [(filename, amount) for filename, amount, _ in payments])
+        return [PaymentRecord(filename, amount, matches[filename].invoice if filename in matches else None, passes)
+                for filename, amount, passes in payments]
+
     def merge_images_to_pdf(self, input_dir, output_pdf):
-        """将支付截图合并为一个PDF文件"""
+        """将支付截图合并为一个PDF文件（逐张写入，JPEG和PNG的数据直接嵌入，不解码也不重新压缩）"""
+        writer = None
         try:
-            images = []
             # 按文件名排序，确保合并顺序一致
-            filenames = sorted([f for f in os.listdir(input_dir) 
-                              if 'log' in f.lower() and f.lower().endswith(('.jpg', '.jpeg', '.png'))])
-            
-            for filename in filenames:
-                image_path = os.path.join(input_dir, filename)
-                img = Image.open(image_path)
-                if img.mode == 'RGBA':
-                    img = img.convert('RGB')
-                images.append(img)
+            filenames = sorted([f for f in os.listdir(input_dir) if is_payment_image(f)])
             
-            if images:
+            if filenames:
                 # 确保输出目录存在
                 output_dir = os.path.dirname(output_pdf)
-                if not os.path.exists(output_dir):
+                if output_dir and not os.path.exists(output_dir):
                     os.makedirs(output_dir)
                 
-                # 保存合并的PDF
-                images[0].save(output_pdf, save_all=True, append_images=images[1:])
+                # 每张截图读取后立即写入PDF，内存占用与截图数量无关
+                writer = StreamingPDFWriter(output_pdf)
+                for filename in filenames:
+                    self.append_to_merge(writer, os.path.join(input_dir, filename))
+                writer.close()
                 self.logger.info(f"支付截图已合并到: {output_pdf}")
-                self.logger.info(f"合并的图片数量: {len(images)}")
+                self.logger.info(f"合并的图片数量: {writer.page_count}")
             else:
                 self.logger.warning("没有找到支付截图可供合并")
         except Exception as e:
             self.logger.error(f"合并支付截图到PDF时出错: {str(e)}")
             traceback.print_exc()
+        finally:
+            # 出错或任务被取消（JobCancelled 不是 Exception）时放弃未完成的合并文件；已完成时不做任何处理
+            if writer is not None:
+                writer.abort()
+
+    def append_to_merge(self, writer, image_path):
+        """把一张支付截图追加到指定的合并写入器，返回是否成功（出错时只记录错误，继续合并其他截图）"""
+        try:
+            writer.add_image_page(image_path)
+            return True
+        except Exception as e:
+            self.logger.error(f"合并支付截图时出错 {os.path.basename(image_path)}: {str(e)}")
+            return False
 
 def main():
     # 设置日志级别
@@ -310,24 +608,24 @@ def main():
     
     # 显示处理结果统计
     if results:
-        self.logger.info("\n支付金额提取统计:")
-        self.logger.info(f"总计处理图片: {len(results)}张")
-        self.logger.info(f"成功提取金额: {len(results)}个")
+        logger.info("\n支付金额提取统计:")
+        logger.info(f"总计处理图片: {len(results)}张")
+        logger.info(f"成功提取金额: {len(results)}个")
         
         # 显示提取的金额
-        self.logger.info("\n提取的支付金额:")
+        logger.info("\n提取的支付金额:")
         for result in results:
-            self.logger.info(f"文件: {result['文件名']}, "
-                           f"金额: {result['实际支付金额']}, "
-                           f"对应发票: {result.get('发票文件', 'N/A')}")
+            logger.info(f"文件: {result.filename}, "
+                        f"金额: {result.amount}, "
+                        f"对应发票: {result.invoice_file or 'N/A'}")
         
         # 合并所有支付截图为PDF
         if not os.path.exists('output'):
             os.makedirs('output')
         merged_log_pdf = os.path.join('output', f'merged_{datetime.now().strftime("%Y%m%d")}_log.pdf')
-        self.merge_images_to_pdf(input_dir, merged_log_pdf)
+        tester.merge_images_to_pdf(input_dir, merged_log_pdf)
     else:
-        self.logger.warning("没有找到有效的支付记录")
+        logger.warning("没有找到有效的支付记录")
 
 if __name__ == '__main__':
     main() 
\ No newline at end of file
@@ -0,0 +1,325 @@
+# 原来的实现和合成数据：一致性测试的参照，benchmark.py 的耗时比较也使用这里的实现和数据
+import os
+import re
+
+
+# 原来逐个模式匹配的实现，作为金额语法一致性检查的参照
+LEGACY_AMOUNT_PATTERNS = [
+    r'-\d+\.\d{2}',
+    r'[-—]\s*\d+\.\d{2}',
+    r'[-—]\d+\.\d{2}',
+    r'\(\d+\.\d{2}\)',
+    r'支付\s*[-—]?\s*\d+\.\d{2}',
+    r'¥\s*[-—]?\d+\.\d{2}',
+    r'实付\s*[-—]?\s*\d+\.\d{2}',
+    r'付款\s*[-—]?\s*\d+\.\d{2}',
+    r'总计\s*[-—]?\s*\d+\.\d{2}'
+]
+
+
+def legacy_payment_amounts(text):
+    amounts = []
+    for pattern in LEGACY_AMOUNT_PATTERNS:
+        for match in re.findall(pattern, text):
+            if match.startswith('(') and match.endswith(')'):
+                amount = -float(match[1:-1])
+            else:
+                num_match = re.search(r'-?\d+\.\d{2}', match.replace('—', '-').replace('−', '-').replace(' ', ''))
+                if not num_match:
+                    continue
+                amount = float(num_match.group())
+            if amount < 0:
+                amounts.append(abs(amount))
+    return amounts
+
+
+def legacy_word_amounts(data):
+    from amount_grammar import WORD_PATTERNS
+    import pandas as pd
+
+    results = []
+    data = data[data.conf != -1]
+    for _, row in data.iterrows():
+        if pd.isna(row.text) or str(row.text).isspace():
+            continue
+        for pattern in WORD_PATTERNS:
+            for match in re.finditer(pattern, str(row.text)):
+                amount_float = -float(match.group(1).replace(',', ''))
+                if -1000000 <= amount_float <= -1:
+                    results.append((amount_float, row.height, pattern))
+    return results
+
+
+def grammar_word_amounts(data):
+    from amount_grammar import WORD_PATTERNS, extract_word_amounts
+
+    data = data[data.conf != -1]
+    words = data.text[data.text.notna()]
+    words = words[~words.astype(str).str.isspace()]
+    return [(-float(amount), data.height[index], WORD_PATTERNS[pattern])
+            for index, amount, pattern in extract_word_amounts(words)]
+
+
+# 生成测试语料用的片段：各种负号、空白、前缀、括号和容易误识别的字符
+GRAMMAR_PIECES = ['-', '—', '−', '–', ' ', '  ', '\n', '\t', '¥', '￥', '(', ')', '支付', '实付', '付款', '总计',
+                   '合计', '.', ',', '12', '3', '0.5', '45.60', '1,234.56', '٣٤.٥٦', 'O', 'l', '元', ':', '：']
+
+
+def random_amount(rng):
+    return f"{rng.randint(0, 99999)}.{rng.randint(0, 99):02d}"
+
+
+def grammar_corpus(rng, size):
+    """随机拼接的片段和模拟OCR文本，覆盖各种写法的组合"""
+    samples = []
+    templates = ['{p}{s}{a}', '{p} {s} {a}', '¥{s}{a}', '({a})', '{s}{g}{a}', '{p}\n{s}{a}', '{s}¥{g}{a}']
+    for index in range(size):
+        if index % 2:
+            text = ''.join(rng.choice(GRAMMAR_PIECES + [random_amount(rng)]) for _ in range(rng.randint(1, 12)))
+        else:
+            lines = []
+            for _ in range(rng.randint(1, 6)):
+                lines.append(rng.choice(templates).format(
+                    p=rng.choice(['', '支付', '实付', '付款', '总计', '合计']), s=rng.choice(['-', '—', '−', '']),
+                    g=rng.choice(['', ' ', '\t', ' \n']), a=random_amount(rng)))
+            text = '\n'.join(lines)
+        samples.append(text)
+    return samples
+
+
+def word_frames(rng, size):
+    """模拟 image_to_data 的单词表"""
+    import pandas as pd
+
+    frames = []
+    for _ in range(size):
+        count = rng.randint(20, 400)
+        words = []
+        for _ in range(count):
+            kind = rng.random()
+            if kind < 0.1:
+                words.append(float('nan'))
+            elif kind < 0.2:
+                words.append(' ')
+            elif kind < 0.6:
+                words.append(''.join(rng.choice(GRAMMAR_PIECES) for _ in range(rng.randint(1, 5))))
+            else:
+                words.append(rng.choice(['-', '−', '-¥', '− ¥ ', '']) + rng.choice(
+                    [random_amount(rng), str(rng.randint(0, 2000000)), '1,234.56', '12,30']))
+        frames.append(pd.DataFrame({
+            'conf': [rng.choice([-1, 50, 96]) for _ in range(count)],
+            'height': [rng.randint(8, 120) for _ in range(count)],
+            'text': pd.Series(words, dtype=object)
+        }))
+    return frames
+
+
+
+def legacy_invoice_fields(text):
+    """原来逐个模式列表在全文上匹配的实现，作为字段扫描器一致性检查的参照"""
+    from pdf_image_analyzer import DocumentAnalyzer as A
+
+    def first(patterns):
+        for pattern in patterns:
+            match = re.search(pattern, text)
+            if match:
+                return match
+        return None
+
+    match = first(A.INVOICE_PATTERNS)
+    invoice_number = match.group(1).strip() if match else None
+    match = first(A.DATE_PATTERNS)
+    invoice_date = match.group(1).replace('年', '-').replace('月', '-').replace('日', '').replace('/', '-') \
+        if match else None
+    match = first(A.SUPPLIER_PATTERNS)
+    supplier = re.sub(r'[^\w\s\u4e00-\u9fff]', '', match.group(1).strip()) if match else None
+    amount = None
+    for pattern in A.AMOUNT_PATTERNS:
+        for match in re.finditer(pattern, text):
+            try:
+                current_amount = float(match.group(1).replace(',', ''))
+            except ValueError:
+                continue
+            if amount is None or current_amount > amount:
+                amount = current_amount
+    match = first(A.PRODUCT_PATTERNS)
+    product_name = re.sub(r'[^\w\s\u4e00-\u9fff]', '', match.group(1).strip()) if match else None
+    return {
+        'invoice_number': invoice_number,
+        'invoice_date': invoice_date,
+        'supplier': supplier,
+        'price': f"{amount:.2f}" if amount is not None else None,
+        'product_name': product_name
+    }
+
+
+SUPPLIERS = ['北京某某科技有限公司', '上海实验器材(集团)有限公司', 'Shenzhen Nano Tech Co., Ltd.', '广州市天河区文具店']
+PRODUCTS = ['*实验器材*离心管', '*办公用品*打印纸', '*电子元件*传感器模块', '*信息技术服务*软件授权', 'Nanopore notebook']
+
+
+def invoice_text(rng):
+    """生成一张合成发票的文本层（部分发票带很长的明细附页，字段写法和顺序随机变化）"""
+    amount = rng.randint(100, 9999999) / 100
+    date = rng.choice(['{y}年{m:02d}月{d:02d}日', '{y}-{m}-{d}', '{y}/{m:02d}/{d:02d}']).format(
+        y=rng.randint(2019, 2025), m=rng.randint(1, 12), d=rng.randint(1, 28))
+    number = str(rng.randint(10 ** 7, 10 ** 20))
+    lines = [rng.choice(['电子发票（增值税专用发票）', '电子发票(普通发票)', 'Invoice'])]
+    header = [
+        rng.choice([f'发票号码：{number}', f'发票号码 {number}', f'No. {number}', f'NO：{number}', '']),
+        rng.choice([f'开票日期：{date}', f'开票日期 {date}', f'{date} 日期', f'日期: {date}', '']),
+        rng.choice([f'发票代码：{rng.randint(10 ** 9, 10 ** 11)}', ''])
+    ]
+    rng.shuffle(header)
+    lines += header
+    lines.append("购 买 方 名 称：某某大学")
+    lines.append(rng.choice([f'销售方名称：{rng.choice(SUPPLIERS)}', f'名称：{rng.choice(SUPPLIERS)}',
+                             f'销 售 方：{rng.choice(SUPPLIERS)}', f'供应商: {rng.choice(SUPPLIERS)}', '']))
+    lines.append(rng.choice(['货物或应税劳务、服务名称 规格型号 单位 数量 单价 金额', '项目名称 规格型号 单位 数量 单价 金额',
+                             '商品名称 数量 金额']))
+    # 明细行：多数发票只有几行，少数带几十到几百行的明细附页
+    item_count = rng.choice([1, 2, 3, 5, 8]) if rng.random() < 0.8 else rng.randint(50, 400)
+    for _ in range(item_count):
+        price = rng.randint(1, 99999) / 100
+        lines.append(f"{rng.choice(PRODUCTS)} 个 {rng.randint(1, 20)} {price:.2f} ¥{price:,.2f} 13% "
+                     f"{rng.choice(['', 'note', 'No', '合格', '名录'])}")
+    lines.append(rng.choice([f'合 计 ¥{amount / 1.13:.2f}', f'合计：¥{amount / 1.13:,.2f}', '']))
+    lines.append(rng.choice([f'价税合计（大写） 壹佰元整 （小写）¥{amount:.2f}', f'价税合计：¥{amount:.2f}',
+                             f'小写：￥{amount:,.2f}', f'人民币 {amount:.2f}', f'应付金额：{amount:.2f}',
+                             f'总额: {amount}']))
+    lines.append(rng.choice(['销售方：（章）', '开票人：张三', '']))
+    text = '\n'.join(lines)
+    # 多页发票的文本按页直接拼接（与 extract_pdf_info 相同）
+    if item_count > 40:
+        cut = text.index('\n', len(text) // 2)
+        text = text[:cut] + text[cut + 1:]
+    return text
+
+
+
+def legacy_find_invoice_file(filename, pdf_files):
+    """原来的对应方式：截图文件名去掉"_log"和扩展名后，与每个发票文件名比较包含关系，取第一个"""
+    base_name = filename.lower().replace('_log', '').replace('.jpg', '').replace('.jpeg', '').replace('.png', '')
+    for inv_file in pdf_files:
+        inv_base = inv_file.lower().replace('.pdf', '')
+        if base_name in inv_base or inv_base in base_name:
+            return inv_file
+    return None
+
+
+def matching_corpus(rng, size):
+    """合成的发票和支付截图：大部分截图与发票同名，部分改了写法、只有金额相同或没有对应的发票
+
+    返回 (发票 [(文件名, 金额)], 截图 [(文件名, 金额)], {截图文件名: 对应的发票文件名或None})。
+    """
+    products = ['离心管', '打印纸', '传感器模块', '软件授权', '移液枪头', 'notebook', 'reagent', 'cable']
+    invoices, payments, truth = [], [], {}
+    for index in range(size):
+        product = rng.choice(products)
+        amount = rng.randint(100, 999999) / 100
+        invoice = f"{product}_{index}.pdf"
+        invoices.append((invoice, amount))
+        kind = rng.choices(['same', 'variant', 'amount', 'fee', 'missing'], weights=[60, 15, 10, 10, 5])[0]
+        if kind == 'missing':
+            continue
+        if kind == 'variant':
+            payment = f"{product}{index}log.png"
+        elif kind == 'amount':
+            payment = f"IMG_{rng.randint(10 ** 8, 10 ** 9)}_log.jpg"
+        else:
+            payment = f"{product}_{index}_log.jpg"
+        # 部分支付金额含手续费或优惠，在10%以内
+        paid = round(amount * rng.uniform(0.95, 1.05), 2) if kind == 'fee' else amount
+        payments.append((payment, paid))
+        truth[payment] = invoice
+    # 没有对应发票的截图
+    for index in range(size // 20):
+        payment = f"{rng.choice(products)}_refund_{index}_log.jpg"
+        payments.append((payment, rng.randint(100, 999999) / 100))
+        truth[payment] = None
+    rng.shuffle(payments)
+    return invoices, payments, truth
+
+
+
+def legacy_combine_records(invoice_results, payment_df, matches):
+    """原来的合并方式：逐行遍历发票，每行单独转换金额和清理文件名"""
+    import pandas as pd
+    from pipeline import clean_filename_for_name
+
+    combined_results = []
+    payments_by_invoice = {match.invoice: match for match in matches.values()}
+    invoice_files = set(invoice_results['filename']) if not invoice_results.empty else set()
+    payment_amounts = dict(zip(payment_df['文件名'], payment_df['实际支付金额'])) if not payment_df.empty else {}
+    fixed = {'品牌': 'NA', '规格数量': 1, '规格单位': '套', '计量单位': '套', '数量': 1, '存放地点': '科技楼1907'}
+    if not invoice_results.empty:
+        for _, invoice in invoice_results.iterrows():
+            filename = invoice.get('filename', '')
+            product_name = clean_filename_for_name(filename)
+            record = {'名称': product_name or invoice.get('product_name', ''), **fixed,
+                      '供应商': invoice.get('supplier', ''), '发票号码': invoice.get('invoice_number', ''),
+                      '开票日期': invoice.get('invoice_date', ''), '发票金额': invoice.get('price', ''),
+                      '发票文件': invoice.get('filename', ''), '实际支付金额': None, '文件名': None, '差额': None,
+                      '匹配得分': None, '匹配依据': None}
+            match = payments_by_invoice.get(invoice['filename'])
+            if match:
+                record['实际支付金额'] = payment_amounts[match.payment]
+                record['文件名'] = match.payment
+                record['匹配得分'] = match.score
+                record['匹配依据'] = match.reason
+                try:
+                    record['差额'] = float(record['实际支付金额']) - float(record['发票金额'])
+                except (ValueError, TypeError):
+                    record['差额'] = None
+            combined_results.append(record)
+    if not payment_df.empty:
+        for _, payment in payment_df.iterrows():
+            if payment['文件名'] not in matches:
+                record = {'名称': clean_filename_for_name(payment.get('文件名', '')), **fixed,
+                          '供应商': '', '发票号码': '', '开票日期': '', '发票金额': '',
+                          '发票文件': payment['发票文件'] if payment['发票文件'] not in invoice_files else None,
+                          '实际支付金额': payment['实际支付金额'], '文件名': payment['文件名'], '差额': None,
+                          '匹配得分': None, '匹配依据': None}
+                combined_results.append(record)
+    return pd.DataFrame(combined_results)
+
+
+def combine_corpus(rng, rows):
+    """合并结果的合成记录，返回 (发票记录, 支付记录)
+
+    部分发票缺少金额、供应商或商品名称；发票号码有8位（可能以0开头）和20位两种；
+    另有文件名中只有数字和"log"的发票（名称取商品名称），部分支付记录对应的发票没有提取结果。
+    """
+    from records import InvoiceRecord, PaymentRecord
+
+    invoices, payments, truth = matching_corpus(rng, rows)
+    records = [InvoiceRecord(name, rng.choice([f"{rng.randint(0, 10 ** 8 - 1):08d}", f"24{rng.randint(0, 10 ** 18 - 1):018d}"]),
+                             '2024-01-01', rng.choice(SUPPLIERS) if rng.random() > 0.05 else None,
+                             amount if rng.random() > 0.02 else None,
+                             rng.choice(PRODUCTS) if rng.random() > 0.1 else None)
+               for name, amount in invoices]
+    records += [InvoiceRecord(f"{index}log.pdf", f"{index:08d}", None, None, 10.0, rng.choice(PRODUCTS))
+                for index in range(50)]
+    payment_records = [PaymentRecord(name, amount, truth.get(name) or (f"missing_{index}.pdf" if index % 7 == 0 else None), 1)
+                       for index, (name, amount) in enumerate(payments)]
+    return records, payment_records
+
+
+def legacy_combine_csv(records, payment_records, output_dir):
+    """原方式：发票结果写入 invoice_results.csv 再读回，支付记录为字典，逐行合并，返回 combined_legacy.csv 的路径"""
+    import pandas as pd
+    from matching import match_payments
+    from records import InvoiceRecord, records_frame
+    import pipeline
+
+    invoice_csv = os.path.join(output_dir, 'invoice_results.csv')
+    records_frame(records, InvoiceRecord).to_csv(invoice_csv, index=False, encoding='utf-8')
+    invoice_results = pd.read_csv(invoice_csv, encoding='utf-8')
+    payment_df = pd.DataFrame([{'文件名': payment.filename, '实际支付金额': f"{payment.amount:.2f}",
+                                '发票文件': payment.invoice_file, '识别次数': payment.passes}
+                               for payment in payment_records])
+    matches = match_payments(zip(invoice_results['filename'], invoice_results['price']),
+                             zip(payment_df['文件名'], payment_df['实际支付金额']))
+    legacy_file = os.path.join(output_dir, 'combined_legacy.csv')
+    legacy_combine_records(invoice_results, payment_df, matches)[pipeline.COMBINED_COLUMNS].to_csv(
+        legacy_file, index=False, encoding='utf-8')
+    return legacy_file
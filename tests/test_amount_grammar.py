@@ -0,0 +1,27 @@
+import random
+from decimal import Decimal
+
+from amount_grammar import find_payment_amounts
+from tests.reference import grammar_corpus, word_frames, legacy_payment_amounts, legacy_word_amounts, grammar_word_amounts
+
+
+def test_payment_amounts_match_legacy_patterns():
+    """金额语法的结果与原来逐个模式匹配完全一致（随机语料）"""
+    rng = random.Random(0)
+    for text in grammar_corpus(rng, 3000):
+        assert [float(amount) for amount in find_payment_amounts(text)] == legacy_payment_amounts(text), repr(text)
+
+
+def test_word_amounts_match_legacy_patterns():
+    """单词表（image_to_data 的结果）中的金额与原来逐行逐个模式匹配完全一致"""
+    rng = random.Random(1)
+    for frame in word_frames(rng, 40):
+        assert grammar_word_amounts(frame) == legacy_word_amounts(frame), repr(frame.text.tolist())
+
+
+def test_payment_amounts_examples():
+    """每个匹配的原模式各计一次（作为投票的次数），只保留负数金额"""
+    assert find_payment_amounts('支付 -12.30') == [Decimal('12.30')] * 4
+    assert find_payment_amounts('实付 - 99.90') == [Decimal('99.90')] * 2
+    assert find_payment_amounts('(45.60)') == [Decimal('45.60')]
+    assert find_payment_amounts('合计 45.60') == []
@@ -0,0 +1,148 @@
+import pytest
+
+from amount_region import find_text_lines
+from image_preprocess import ImageStore
+from ocr_backend import OCRBackend
+from test_image_payment import PaymentImageTester
+
+pytest.importorskip('cv2')
+
+# 合成截图中各行文字的 (字号, 文本)；实付金额是字号最大的一行，不在最上面
+SCREEN_LINES = [(24, '2024-03-01 12:30'), (28, 'Order 8812345'), (64, '-128.50'), (24, '1234 5678 9012'),
+                (20, 'Balance 5566.00')]
+
+
+def _screenshot(dark=False, lines=SCREEN_LINES):
+    """白底（深色模式为黑底）的支付截图，返回 (灰度图, 每行文字的 (top, bottom))"""
+    import numpy as np
+    from PIL import Image, ImageDraw, ImageFont
+
+    image = Image.new('L', (480, 800), 20 if dark else 255)
+    draw = ImageDraw.Draw(image)
+    rows, y = [], 40
+    for size, text in lines:
+        font = ImageFont.load_default(size)
+        draw.text((60, y), text, fill=235 if dark else 30, font=font)
+        left, top, right, bottom = draw.textbbox((60, y), text, font=font)
+        rows.append((top, bottom))
+        y += int(size * 2)
+    return np.array(image), rows
+
+
+def _row_of(region, rows):
+    """区域中心所在的文字行"""
+    x, y, w, h, _ = region
+    center = y + h / 2
+    return next(index for index, (top, bottom) in enumerate(rows) if top <= center <= bottom)
+
+
+@pytest.mark.parametrize('dark', [False, True])
+def test_largest_line_first(dark):
+    """字号最大的金额行排在第一位，区域向左扩展包含负号；深色模式截图的结果相同"""
+    gray, rows = _screenshot(dark)
+    regions = find_text_lines(gray, min_height=10, max_lines=3)
+    assert len(regions) == 3
+    assert [_row_of(region, rows) for region in regions[:2]] == [2, 1]
+    heights = [region[4] for region in regions]
+    assert heights == sorted(heights, reverse=True)
+
+    x, y, w, h, _ = regions[0]
+    top, bottom = rows[2]
+    assert x < 60 and y <= top and y + h >= bottom
+    assert 0 <= x and x + w <= gray.shape[1]
+
+
+def test_dark_mode_matches_light():
+    light = find_text_lines(_screenshot()[0], min_height=10, max_lines=3)
+    dark = find_text_lines(_screenshot(dark=True)[0], min_height=10, max_lines=3)
+    assert [region[4] for region in dark] == pytest.approx([region[4] for region in light], abs=2)
+    assert [region[1] for region in dark] == pytest.approx([region[1] for region in light], abs=3)
+
+
+def test_max_lines_and_min_height():
+    """max_lines 限制返回的行数，字高低于 min_height 的行不返回"""
+    gray, rows = _screenshot()
+    assert len(find_text_lines(gray, min_height=10, max_lines=1)) == 1
+    assert len(find_text_lines(gray, min_height=10, max_lines=10)) == len(SCREEN_LINES)
+
+    regions = find_text_lines(gray, min_height=30, max_lines=10)
+    assert [_row_of(region, rows) for region in regions] == [2]
+    assert find_text_lines(gray, min_height=200) == []
+
+
+def test_blank_image_has_no_lines():
+    import numpy as np
+    assert find_text_lines(np.full((800, 480), 255, np.uint8)) == []
+
+
+class ShapeBackend(OCRBackend):
+    """记录每次识别的图像尺寸；answer(是否为整张图片) 返回识别文本"""
+
+    name = 'shape'
+
+    def __init__(self, full_shape, answer, batch):
+        super().__init__()
+        self.full_shape = full_shape
+        self.answer = answer
+        self.supports_batch = batch
+        self.full_passes = 0
+        self.roi_passes = 0
+
+    def version(self):
+        return 'shape'
+
+    def _image_to_string_batch(self, images, lang, config):
+        texts = []
+        for image in images:
+            full = image.shape == self.full_shape
+            if full:
+                self.full_passes += 1
+            else:
+                self.roi_passes += 1
+            texts.append(self.answer(full))
+        return texts
+
+
+def _extract(tmp_path, gray, answer, batch):
+    from PIL import Image
+    path = str(tmp_path / 'pay_log.png')
+    Image.fromarray(gray).save(path)
+    store = ImageStore()
+    full_shape = store.get(path).gray.shape
+    backend = ShapeBackend(full_shape, answer, batch)
+    tester = PaymentImageTester(use_cache=False, ocr_backend=backend, roi=True, roi_regions=3, image_store=store)
+    return tester.extract_payment_from_image(path), tester, backend
+
+
+FULL_PASSES = len(PaymentImageTester.IMAGE_VERSIONS) * len(PaymentImageTester.PSM_MODES)
+ROI_PASSES = 3 * len(PaymentImageTester.IMAGE_VERSIONS) * len(PaymentImageTester.ROI_PSM_MODES)
+
+
+@pytest.mark.parametrize('batch', [False, True])
+def test_amount_found_in_regions_skips_full_image(tmp_path, batch):
+    """金额区域中找到金额时不再识别整张图片"""
+    amount, tester, backend = _extract(tmp_path, _screenshot()[0], lambda full: '-128.50\n\f', batch)
+    assert amount == 128.50
+    assert (backend.roi_passes, backend.full_passes) == (ROI_PASSES, 0)
+    assert tester.last_pass_count == ROI_PASSES
+
+
+@pytest.mark.parametrize('batch', [False, True])
+def test_falls_back_to_full_image(tmp_path, batch):
+    """金额区域中没有识别到金额时识别整张图片"""
+    answer = lambda full: '支付 -128.50\n\f' if full else '识别失败\n\f'
+    amount, tester, backend = _extract(tmp_path, _screenshot()[0], answer, batch)
+    assert amount == 128.50
+    assert (backend.roi_passes, backend.full_passes) == (ROI_PASSES, FULL_PASSES)
+    assert tester.last_pass_count == ROI_PASSES + FULL_PASSES
+
+
+@pytest.mark.parametrize('batch', [False, True])
+def test_no_regions_recognizes_full_image(tmp_path, batch):
+    """没有检测到文字行时直接识别整张图片"""
+    import numpy as np
+    answer = lambda full: '支付 -9.90\n\f'
+    amount, tester, backend = _extract(tmp_path, np.full((800, 480), 255, np.uint8), answer, batch)
+    assert amount == 9.90
+    assert (backend.roi_passes, backend.full_passes) == (0, FULL_PASSES)
+    assert tester.last_pass_count == FULL_PASSES
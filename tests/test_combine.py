@@ -0,0 +1,66 @@
+import os
+import random
+import logging
+from decimal import Decimal
+
+import pytest
+
+import pipeline
+from records import InvoiceRecord, PaymentRecord
+from tests.reference import combine_corpus, legacy_combine_csv
+
+
+def _read(path):
+    import pandas as pd
+    return pd.read_csv(path, dtype=str, keep_default_na=False, encoding='utf-8')
+
+
+def _cents(value):
+    return Decimal(value).quantize(Decimal('0.01')) if value else None
+
+
+@pytest.fixture
+def combined(tmp_path):
+    """同一批合成记录分别用原来的逐行合并和整列合并，返回 (发票记录, 原方式结果, 新结果)"""
+    records, payment_records = combine_corpus(random.Random(0), 2000)
+    logging.disable(logging.WARNING)
+    try:
+        legacy_file = legacy_combine_csv(records, payment_records, str(tmp_path))
+        pipeline.combine_results(records, payment_records, str(tmp_path))
+    finally:
+        logging.disable(logging.NOTSET)
+    return records, _read(legacy_file), _read(tmp_path / 'combined_results.csv')
+
+
+def test_same_rows_as_legacy(combined):
+    records, legacy, new = combined
+    assert len(new) == len(legacy) > len(records)
+    assert new['发票文件'].tolist()[:len(records)] == [record.filename for record in records]
+
+
+def test_amounts_match_legacy_to_the_cent(combined):
+    """金额按分比较（原方式的差额为浮点数相减）"""
+    _, legacy, new = combined
+    for column in ('发票金额', '实际支付金额', '差额'):
+        assert [_cents(value) for value in new[column]] == [_cents(value) for value in legacy[column]], column
+
+
+def test_other_columns_match_legacy(combined):
+    _, legacy, new = combined
+    for column in pipeline.COMBINED_COLUMNS:
+        if column in ('发票号码', '发票金额', '实际支付金额', '差额'):
+            continue
+        assert new[column].tolist() == legacy[column].tolist(), column
+
+
+def test_payment_without_invoice(tmp_path):
+    """没有对应发票的支付记录单独成行，发票金额和差额为空"""
+    invoices = [InvoiceRecord('离心管_1.pdf', '00012345', '2024-01-01', '某某公司', 12.5, '离心管')]
+    payments = [PaymentRecord('离心管_1_log.jpg', 12.5, '离心管_1.pdf', 1),
+                PaymentRecord('打印纸_log.jpg', 30.0, None, 3)]
+    pipeline.combine_results(invoices, payments, str(tmp_path))
+    result = _read(os.path.join(tmp_path, 'combined_results.csv'))
+    assert result['发票号码'].tolist() == ['00012345', '']
+    assert result['文件名'].tolist() == ['离心管_1_log.jpg', '打印纸_log.jpg']
+    assert [_cents(value) for value in result['差额']] == [Decimal('0.00'), None]
+    assert result['发票金额'].tolist()[1] == ''
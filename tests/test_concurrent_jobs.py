@@ -0,0 +1,136 @@
+import os
+import logging
+import threading
+
+import pytest
+
+from jobs import Job, JobManager
+from ocr_backend import OCRBackend
+from pdf_text import available_pdf_backends
+
+pytestmark = pytest.mark.skipif('pymupdf' not in available_pdf_backends(), reason='未安装 PyMuPDF')
+
+PREFIXES = ['batcha', 'batchb', 'batchc']
+
+
+class StubBackend(OCRBackend):
+    """每张图像都识别为同一个支付金额，不需要Tesseract"""
+
+    name = 'stub'
+
+    def version(self):
+        return 'stub'
+
+    def _image_to_string_batch(self, images, lang, config):
+        return ['支付 -12.30\n\f'] * len(images)
+
+
+def _write_folder(root, prefix):
+    """一个文件夹：两张发票PDF（文件名带前缀）和其中一张的支付截图"""
+    import pymupdf
+    from PIL import Image
+
+    folder = root / prefix
+    folder.mkdir()
+    for index in range(2):
+        document = pymupdf.open()
+        page = document.new_page()
+        for line_index, line in enumerate([f'发票号码：2411200000000000{index}{len(prefix)}01',
+                                           '开票日期：2024年03月01日', f'价税合计（大写）壹拾贰元叁角 （小写）¥12.30']):
+            page.insert_text((40, 60 + line_index * 16), line, fontname='china-s', fontsize=10)
+        document.save(str(folder / f'{prefix}_item{index}.pdf'))
+        document.close()
+    Image.new('RGB', (120, 200), 'white').save(str(folder / f'{prefix}_item0log.png'))
+    return str(folder)
+
+
+def test_concurrent_jobs_are_isolated(tmp_path, monkeypatch, caplog):
+    """同时运行的任务各自写入自己的输出目录和日志，不包含其他任务的文件和日志"""
+    import app
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(app, '_ocr_backend', StubBackend())
+    caplog.set_level(logging.INFO)
+    folders = [_write_folder(tmp_path, prefix) for prefix in PREFIXES]
+
+    # 所有任务都开始后才开始处理，确保它们同时运行
+    barrier = threading.Barrier(len(folders))
+
+    def runner(job):
+        barrier.wait(30)
+        app.run_job(job)
+
+    manager = JobManager(runner, max_workers=len(folders), jobs_dir=str(tmp_path / 'jobs'))
+    try:
+        submitted = [manager.submit(folder) for folder in folders]
+        for job in submitted:
+            assert job.wait(120), '任务没有结束'
+    finally:
+        manager.shutdown()
+
+    assert len({job.output_dir for job in submitted}) == len(submitted)
+    for prefix, job in zip(PREFIXES, submitted):
+        assert job.status == Job.DONE, job.error
+        others = [other for other in PREFIXES if other != prefix]
+
+        with open(os.path.join(job.output_dir, 'combined_results.csv'), encoding='utf-8') as f:
+            combined = f.read()
+        assert f'{prefix}_item0.pdf' in combined and f'{prefix}_item1.pdf' in combined
+        assert f'{prefix}_item0log.png' in combined
+        assert not any(other in combined for other in others)
+
+        with open(os.path.join(job.work_dir, 'job.log'), encoding='utf-8') as f:
+            log_file = f.read()
+        messages = '\n'.join(event.message for event in job.log.since(0)[0])
+        for log in (log_file, messages):
+            assert f'{prefix}_item0.pdf' in log
+            assert not any(other in log for other in others)
+
+
+def test_pruned_job_keeps_its_work_dir(tmp_path):
+    """超过保留数量的已结束任务只从内存中删除，任务目录中的输出文件和日志保留"""
+    manager = JobManager(lambda job: None, max_workers=1, max_finished=1, jobs_dir=str(tmp_path))
+    try:
+        first = manager.submit('first')
+        first.wait(10)
+        second = manager.submit('second')
+        second.wait(10)
+    finally:
+        manager.shutdown()
+    assert manager.get(first.id) is None and manager.get(second.id) is second
+    assert os.path.exists(os.path.join(first.work_dir, 'job.log'))
+
+
+def test_get_logs_without_job_id_reads_latest_job(monkeypatch):
+    """旧界面不带任务ID轮询时读取最近提交的任务，每条日志只返回一次"""
+    import app
+
+    release = threading.Event()
+
+    def runner(job):
+        logging.getLogger('app').warning('第一条')
+        release.wait(10)
+        logging.getLogger('app').warning('第二条')
+
+    manager = JobManager(runner, max_workers=1)
+    monkeypatch.setattr(app, 'jobs', manager)
+    client = app.app.test_client()
+
+    def poll(query=''):
+        """本测试记录的日志（忽略任务管理器自己的日志）"""
+        return [log.split(' - ')[-1] for log in client.get(f'/get-logs{query}').get_json()['logs'] if '第' in log]
+
+    try:
+        assert poll() == []
+        job = manager.submit('folder')
+        while not job.log.last_id:
+            job.log.wait(0, 1)
+        assert poll() == ['第一条']
+        release.set()
+        job.wait(10)
+        assert poll() == ['第二条']
+        assert poll() == []
+        assert poll(f'?job_id={job.id}') == ['第一条', '第二条']
+    finally:
+        release.set()
+        manager.shutdown()
@@ -0,0 +1,233 @@
+import os
+
+import pytest
+
+import image_preprocess
+from amount_region import estimate_glyph_height
+from image_preprocess import (DEFAULT_GLYPH_HEIGHT, MAX_SCALE, MIN_SCALE, SCALE_TOLERANCE, decode_factor, load_gray,
+                              normalize_resolution)
+from ocr_backend import OCRBackend
+
+pytest.importorskip('cv2')
+
+
+def _text_image(font_size, width=800, height=600):
+    """白底上若干行数字的灰度图，正文字高约为字号的0.7倍"""
+    import numpy as np
+    from PIL import Image, ImageDraw, ImageFont
+
+    image = Image.new('L', (width, height), 255)
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(font_size)
+    y = font_size
+    while y + 2 * font_size < height:
+        draw.text((font_size, y), '1234567890 8765.43', fill=0, font=font)
+        y += int(font_size * 1.8)
+    return np.array(image)
+
+
+def _save(tmp_path, gray, name='screen_log.png'):
+    from PIL import Image
+    path = str(tmp_path / name)
+    Image.fromarray(gray).save(path)
+    return path
+
+
+@pytest.fixture
+def decoded_factors(monkeypatch):
+    """记录每次读取图片时缩小解码的倍数"""
+    factors = []
+    read_gray = image_preprocess.read_gray
+
+    def recording(image_path, factor=1):
+        factors.append(factor)
+        return read_gray(image_path, factor)
+
+    monkeypatch.setattr(image_preprocess, 'read_gray', recording)
+    return factors
+
+
+@pytest.mark.parametrize('font_size, width, height', [(20, 800, 600), (60, 840, 600), (150, 2100, 1500)])
+def test_normalize_to_target_glyph_height(font_size, width, height):
+    """小字放大、大字缩小，缩放后的正文字高接近目标值"""
+    gray = _text_image(font_size, width, height)
+    normalized, scale = normalize_resolution(gray)
+    assert scale != 1.0
+    assert normalized.shape[1] == round(width * scale)
+    assert estimate_glyph_height(normalized) == pytest.approx(DEFAULT_GLYPH_HEIGHT, rel=SCALE_TOLERANCE)
+
+
+def test_scale_is_clamped():
+    """缩放比例限制在 [MIN_SCALE, MAX_SCALE] 范围内"""
+    gray = _text_image(10)
+    assert estimate_glyph_height(gray) * MAX_SCALE < DEFAULT_GLYPH_HEIGHT
+    normalized, scale = normalize_resolution(gray)
+    assert scale == MAX_SCALE and normalized.shape == (1200, 1600)
+
+    normalized, scale = normalize_resolution(gray, glyph_height=DEFAULT_GLYPH_HEIGHT / MIN_SCALE * 2)
+    assert scale == MIN_SCALE and normalized.shape == (150, 200)
+
+
+def test_within_tolerance_or_disabled_is_unchanged():
+    """字高与目标值相差不超过容差、没有文字或 target_glyph_height=0 时不缩放，返回原图"""
+    import numpy as np
+
+    gray = _text_image(45)
+    assert abs(DEFAULT_GLYPH_HEIGHT / estimate_glyph_height(gray) - 1) <= SCALE_TOLERANCE
+    assert normalize_resolution(gray)[0] is gray
+
+    blank = np.full((600, 800), 255, np.uint8)
+    assert normalize_resolution(blank) == (blank, 1.0)
+
+    small = _text_image(10)
+    assert normalize_resolution(small, target_glyph_height=0) == (small, 1.0)
+
+
+@pytest.mark.parametrize('long_side, factor', [(1000, 1), (3599, 1), (3600, 2), (7200, 4), (20000, 8)])
+def test_decode_factor(tmp_path, long_side, factor):
+    """缩小解码后长边不小于 MIN_DECODE_SIDE，最多缩小8倍"""
+    import numpy as np
+    path = _save(tmp_path, np.full((100, long_side), 255, np.uint8))
+    assert decode_factor(path) == factor
+    assert decode_factor(str(tmp_path / 'missing_log.png')) == 1
+
+
+def test_large_text_keeps_reduced_decode(tmp_path, decoded_factors):
+    """缩小解码后字高仍高于目标值时不重新解码"""
+    path = _save(tmp_path, _text_image(240, 4000, 1800))
+    gray, scale = load_gray(path)
+    assert decoded_factors == [2]
+    assert scale < 0.5 and gray.shape[1] == pytest.approx(4000 * scale, abs=1)
+    assert estimate_glyph_height(gray) == pytest.approx(DEFAULT_GLYPH_HEIGHT, rel=SCALE_TOLERANCE)
+
+
+@pytest.mark.parametrize('width, font_size, factors', [(4000, 56, [2, 1]), (7200, 90, [4, 2])])
+def test_small_text_redecodes_at_lower_factor(tmp_path, decoded_factors, width, font_size, factors):
+    """缩小解码后字高低于目标值时，按估计的原图字高改用较小的倍数重新解码，而不是先缩小再放大"""
+    path = _save(tmp_path, _text_image(font_size, width, 1200))
+    gray, scale = load_gray(path)
+    assert decoded_factors == factors
+    assert scale <= 1.0 / factors[-1]
+    assert estimate_glyph_height(gray) == pytest.approx(DEFAULT_GLYPH_HEIGHT, rel=SCALE_TOLERANCE)
+
+
+def test_load_without_normalization(tmp_path, decoded_factors):
+    """target_glyph_height=0 时按原尺寸读取，不缩小解码"""
+    path = _save(tmp_path, _text_image(56, 4000, 1200))
+    gray, scale = load_gray(path, target_glyph_height=0)
+    assert decoded_factors == [1]
+    assert (gray.shape, scale) == ((1200, 4000), 1.0)
+    assert load_gray(str(tmp_path / 'missing_log.png')) == (None, 1.0)
+
+
+@pytest.mark.parametrize('name, expected', [
+    ('pay_log.png', True), ('PAY_LOG.JPG', True), ('wechat-log-1.jpeg', True),
+    ('pay.png', False), ('pay_log.pdf', False), ('catalog.txt', False), ('log.gif', False),
+])
+def test_is_payment_image(name, expected):
+    assert image_preprocess.is_payment_image(name) == expected
+    assert image_preprocess.is_payment_image(f'/some/dir/{name}') == expected
+
+
+class DataBackend(OCRBackend):
+    """两个分析器都使用的OCR后端：识别文本和单词表都只包含一个负数金额"""
+
+    name = 'data'
+
+    def version(self):
+        return 'data'
+
+    def _image_to_string_batch(self, images, lang, config):
+        return ['支付 -12.30\n\f'] * len(images)
+
+    def _image_to_data_batch(self, images, lang, config):
+        import pandas as pd
+        return [pd.DataFrame({'conf': [90], 'text': ['-12.30'], 'height': [30]}) for _ in images]
+
+
+@pytest.fixture
+def built_variants(monkeypatch):
+    """记录每次生成的图像处理版本"""
+    built = []
+    for name, (source, build) in list(image_preprocess.VARIANTS.items()):
+        def recording(gray, name=name, build=build):
+            built.append(name)
+            return build(gray)
+        monkeypatch.setitem(image_preprocess.VARIANTS, name, (source, recording))
+    return built
+
+
+def test_store_decodes_once_for_both_analyzers(tmp_path, decoded_factors, built_variants):
+    """两个分析器共用 ImageStore：同一张截图只解码一次，各图像处理版本只生成一次"""
+    from collections import Counter
+    from image_preprocess import ImageStore
+    from pdf_image_analyzer import DocumentAnalyzer
+    from test_image_payment import PaymentImageTester
+
+    path = _save(tmp_path, _text_image(24))
+    store = ImageStore()
+    tester = PaymentImageTester(use_cache=False, ocr_backend=DataBackend(), image_store=store)
+    analyzer = DocumentAnalyzer(str(tmp_path), use_cache=False, ocr_backend=DataBackend(), image_store=store)
+
+    assert tester.extract_payment_from_image(path) == 12.30
+    assert analyzer.extract_payment_from_image(path) == 12.30
+    assert tester.extract_payment_from_image(path) == 12.30
+    assert len(decoded_factors) == 1
+    # 金额区域中已找到金额，整张图片只生成两个分析器共用的灰度图和 DocumentAnalyzer 的二值化版本；
+    # 每个金额区域的版本各生成一次，CLAHE增强被两种二值化共用
+    regions = len(store.get(path).regions(tester.min_font_height, tester.roi_regions))
+    assert regions > 0
+    assert Counter(built_variants) == {'clahe': regions, 'clahe_otsu': regions, 'clahe_adaptive': regions,
+                                       'otsu': 1, 'adaptive': 1}
+
+    # 文件内容变化后重新解码
+    image = store.get(path)
+    _save(tmp_path, _text_image(20))
+    os.utime(path, (1_700_000_000, 1_700_000_000))
+    assert store.get(path) is not image
+    assert analyzer.extract_payment_from_image(path) == 12.30
+    assert len(decoded_factors) == 2
+
+
+def test_analyzer_reads_only_payment_images(tmp_path, monkeypatch):
+    """DocumentAnalyzer 只识别文件名包含log的图片"""
+    from pdf_image_analyzer import DocumentAnalyzer
+
+    for name in ('pay_log.png', 'b_LOG.jpg', 'photo.png', 'log.txt', 'invoice.pdf.log'):
+        (tmp_path / name).write_bytes(b'')
+    recognized = []
+    monkeypatch.setattr(DocumentAnalyzer, 'extract_payment_from_image',
+                        lambda self, path: recognized.append(os.path.basename(path)))
+    analyzer = DocumentAnalyzer(str(tmp_path), use_cache=False, ocr_backend=DataBackend())
+    analyzer.analyze_documents()
+    assert sorted(recognized) == ['b_LOG.jpg', 'pay_log.png']
+
+
+def test_store_counts_variants_built_later(tmp_path):
+    """按需生成的图像处理版本计入 ImageStore 的内存，超过上限时立即淘汰最久未使用的图片"""
+    from image_preprocess import ImageStore
+
+    paths = [_save(tmp_path, _text_image(45), name) for name in ('a_log.png', 'b_log.png')]
+    first = ImageStore().get(paths[0])
+    first.load()
+    size = first.nbytes()
+    store = ImageStore(max_bytes=int(size * 2.5))
+
+    a = store.get(paths[0])
+    a.load()
+    a.variant('clahe')
+    assert store.nbytes() == a.nbytes() == 2 * size
+    a.variant('gray', (0, 0, 10, 10))  # 裁剪图与原图共用内存
+    assert store.nbytes() == 2 * size
+
+    b = store.get(paths[1])
+    assert store.nbytes() == 2 * size
+    b.load()
+    assert store.nbytes() == size  # a 被淘汰
+
+    # 已淘汰的图片继续生成图像处理版本时不计入
+    a.variant('otsu')
+    assert store.nbytes() == size
+    b.variant('otsu')
+    assert store.nbytes() == 2 * size
+    assert store.get(paths[1]) is b and store.get(paths[0]) is not a
@@ -0,0 +1,358 @@
+import os
+import threading
+from datetime import datetime
+
+import pytest
+
+from incremental import IncrementalRunner, RunManifest, watch_folder
+from records import PaymentRecord
+
+
+def _append_page(appended, writer, path):
+    """把文件内容（金额）画成一页：页面宽度为金额+1，内容为 bad 时模拟合并失败"""
+    from PIL import Image
+
+    with open(path, encoding='utf-8') as f:
+        content = f.read().strip()
+    if content == 'bad':
+        return False
+    image_path = f"{path}.page.png"
+    Image.new('L', (int(float(content)) + 1, 10), 255).save(image_path)
+    try:
+        writer.add_image_page(image_path)
+    finally:
+        os.remove(image_path)
+    appended.append(os.path.basename(path))
+    return True
+
+
+def _page_widths(path):
+    """合并PDF的各页宽度（即各页对应的金额+1）"""
+    import pymupdf
+
+    with pymupdf.open(path) as document:
+        assert not document.is_repaired
+        return [int(page.rect.width) for page in document]
+
+
+class FakeAnalyzer:
+    """发票"PDF"的内容就是价税合计，记录每次提取的文件"""
+
+    def __init__(self):
+        self.extracted = []
+        self.appended = []
+
+    def extractor_fingerprint(self):
+        return 'pdf-v1'
+
+    def extract_pdfs(self, pdf_files):
+        self.extracted.append(sorted(os.path.basename(path) for path in pdf_files))
+        infos = []
+        for path in pdf_files:
+            with open(path, encoding='utf-8') as f:
+                price = f.read().strip()
+            # 内容为 bad 的文件模拟提取失败
+            infos.append(None if price == 'bad' else
+                         {'filename': os.path.basename(path), 'invoice_number': '00000001', 'price': price})
+        return infos
+
+    def save_invoice_results(self, invoices, output_dir='output', formats=('csv',)):
+        self.invoices = invoices
+
+    def append_to_merge(self, writer, pdf_path):
+        return _append_page(self.appended, writer, pdf_path)
+
+
+class FakeTester:
+    """支付截图的内容就是支付金额"""
+
+    def __init__(self, fingerprint='image-v1'):
+        self.fingerprint = fingerprint
+        self.extracted = []
+        self.appended = []
+
+    def config_fingerprint(self):
+        return self.fingerprint
+
+    def extract_payments(self, image_paths):
+        self.extracted.append(sorted(os.path.basename(path) for path in image_paths))
+        results = {}
+        for path in image_paths:
+            with open(path, encoding='utf-8') as f:
+                amount = f.read().strip()
+            results[path] = (None, 0) if amount == 'bad' else (float(amount), 1)
+        return results
+
+    def payment_records(self, payments, pdf_files):
+        return [PaymentRecord(filename, amount, None, passes) for filename, amount, passes in payments]
+
+    def append_to_merge(self, writer, image_path):
+        return _append_page(self.appended, writer, image_path)
+
+
+def _write(path, content, mtime=None):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+def _combined(output_dir):
+    import pandas as pd
+    df = pd.read_csv(os.path.join(output_dir, 'combined_results.csv'), dtype=str, keep_default_na=False)
+    return {row['发票文件'] or row['文件名']: (row['发票金额'], row['实际支付金额']) for _, row in df.iterrows()}
+
+
+def _merged(output_dir, suffix=''):
+    return os.path.join(output_dir, f"merged_{datetime.now().strftime('%Y%m%d')}{suffix}.pdf")
+
+
+@pytest.fixture
+def folder(tmp_path):
+    input_dir, output_dir = tmp_path / 'input', tmp_path / 'output'
+    input_dir.mkdir()
+    output_dir.mkdir()
+    _write(input_dir / 'a.pdf', '12.50', mtime=1_700_000_000)
+    _write(input_dir / 'b.pdf', '30.00', mtime=1_700_000_000)
+    _write(input_dir / 'b_log.png', '30.00', mtime=1_700_000_000)
+    return str(input_dir), str(output_dir)
+
+
+def _runner(folder, analyzer, tester):
+    input_dir, output_dir = folder
+    return IncrementalRunner(analyzer, tester, input_dir, output_dir)
+
+
+def test_first_run_processes_everything(folder):
+    analyzer, tester = FakeAnalyzer(), FakeTester()
+    assert _runner(folder, analyzer, tester).run()
+    assert analyzer.extracted == [['a.pdf', 'b.pdf']]
+    assert tester.extracted == [['b_log.png']]
+    assert os.path.exists(os.path.join(folder[1], 'manifest.json'))
+    assert _combined(folder[1])['b.pdf'] == ('30.00', '30.00')
+
+
+def test_unchanged_files_are_skipped(folder):
+    analyzer, tester = FakeAnalyzer(), FakeTester()
+    _runner(folder, analyzer, tester).run()
+    assert not _runner(folder, analyzer, tester).run()
+    assert len(analyzer.extracted) == 1 and len(tester.extracted) == 1
+
+    # 只有修改时间变化、内容相同（例如重新复制）时不重新处理
+    os.utime(os.path.join(folder[0], 'b.pdf'), (1_700_000_500, 1_700_000_500))
+    assert not _runner(folder, analyzer, tester).run()
+    assert len(analyzer.extracted) == 1
+
+
+def test_added_and_modified_files(folder):
+    analyzer, tester = FakeAnalyzer(), FakeTester()
+    _runner(folder, analyzer, tester).run()
+
+    # 大小不变、内容和修改时间变化
+    _write(os.path.join(folder[0], 'a.pdf'), '99.90', mtime=1_700_000_900)
+    _write(os.path.join(folder[0], 'c_log.png'), '8.00')
+    assert _runner(folder, analyzer, tester).run()
+    assert analyzer.extracted[1:] == [['a.pdf']]
+    assert tester.extracted[1:] == [['c_log.png']]
+    combined = _combined(folder[1])
+    assert combined['a.pdf'][0] == '99.90'
+    assert combined['c_log.png'] == ('', '8.00')
+    assert combined['b.pdf'] == ('30.00', '30.00')
+
+
+def test_deleted_files(folder):
+    analyzer, tester = FakeAnalyzer(), FakeTester()
+    _runner(folder, analyzer, tester).run()
+    os.remove(os.path.join(folder[0], 'b_log.png'))
+    os.remove(os.path.join(folder[0], 'a.pdf'))
+
+    assert _runner(folder, analyzer, tester).run()
+    assert len(analyzer.extracted) == 1 and len(tester.extracted) == 1
+    assert tester.appended == ['b_log.png']
+    assert analyzer.appended == ['a.pdf', 'b.pdf']  # 发票有删除时只更新页面树，不重新追加
+    assert _page_widths(_merged(folder[1])) == [31]
+    assert _combined(folder[1]) == {'b.pdf': ('30.00', '')}
+    assert [record.filename for record in analyzer.invoices] == ['b.pdf']
+
+
+def test_only_payment_images_are_recognized(folder):
+    """文件名不包含log的图片和其他格式的文件不识别，也不记录在清单中；它们的变化不触发处理"""
+    for name in ('photo.png', 'c_log.gif', 'notes_log.txt'):
+        _write(os.path.join(folder[0], name), '5.00')
+    analyzer, tester = FakeAnalyzer(), FakeTester()
+    _runner(folder, analyzer, tester).run()
+    assert tester.extracted == [['b_log.png']]
+    assert tester.appended == ['b_log.png']
+
+    _write(os.path.join(folder[0], 'photo.png'), '6.00', mtime=1_700_000_900)
+    assert not _runner(folder, analyzer, tester).run()
+
+
+def test_config_change_reprocesses_everything(folder):
+    analyzer = FakeAnalyzer()
+    _runner(folder, analyzer, FakeTester()).run()
+    tester = FakeTester('image-v2')
+    assert _runner(folder, analyzer, tester).run()
+    assert analyzer.extracted == [['a.pdf', 'b.pdf'], ['a.pdf', 'b.pdf']]
+    assert tester.extracted == [['b_log.png']]
+
+
+def test_manifest_change_detection(tmp_path):
+    """新文件和修改过的文件需要处理，未变化（包括只有修改时间变化）的文件不需要，已删除的文件从清单中去掉"""
+    path = str(tmp_path / 'manifest.json')
+    unchanged, touched, resized, rewritten = (str(tmp_path / name) for name in ('u.pdf', 't.pdf', 'r.pdf', 'w.pdf'))
+    for name in (unchanged, touched, resized, rewritten):
+        _write(name, '10.00', mtime=1_700_000_000)
+
+    manifest = RunManifest(path, str(tmp_path), {'pdf': 'v1'})
+    assert not manifest.is_current('u.pdf', unchanged)
+    for name in (unchanged, touched, resized, rewritten):
+        manifest.update(os.path.basename(name), name, {'price': '10.00'})
+    manifest.update('gone.pdf', unchanged, {'price': '1.00'})
+    manifest.save()
+
+    _write(touched, '10.00', mtime=1_700_000_100)
+    _write(resized, '100.00', mtime=1_700_000_000)
+    _write(rewritten, '99.00', mtime=1_700_000_100)
+    manifest = RunManifest(path, str(tmp_path), {'pdf': 'v1'})
+    assert manifest.is_current('u.pdf', unchanged)
+    assert manifest.is_current('t.pdf', touched)
+    assert not manifest.is_current('r.pdf', resized)
+    assert not manifest.is_current('w.pdf', rewritten)
+    assert not manifest.is_current('new.pdf', unchanged)
+    assert manifest.prune({'u.pdf', 't.pdf', 'r.pdf', 'w.pdf'}) == ['gone.pdf']
+    assert manifest.result('gone.pdf') is None
+
+    # 处理配置变化时清单整体失效
+    assert RunManifest(path, str(tmp_path), {'pdf': 'v2'}).entries == {}
+
+
+def test_failed_files_are_retried(folder):
+    """提取失败的发票和没有识别出金额的截图不记录在清单中，下次运行时重新处理"""
+    analyzer, tester = FakeAnalyzer(), FakeTester()
+    _write(os.path.join(folder[0], 'c.pdf'), 'bad')
+    _write(os.path.join(folder[0], 'c_log.png'), 'bad')
+    assert _runner(folder, analyzer, tester).run()
+    assert 'c.pdf' not in _combined(folder[1])
+
+    assert _runner(folder, analyzer, tester).run()
+    assert analyzer.extracted[1:] == [['c.pdf']]
+    assert tester.extracted[1:] == [['c_log.png']]
+
+    _write(os.path.join(folder[0], 'c.pdf'), '7.00')
+    _write(os.path.join(folder[0], 'c_log.png'), '7.00')
+    assert _runner(folder, analyzer, tester).run()
+    assert _combined(folder[1])['c.pdf'] == ('7.00', '7.00')
+    assert not _runner(folder, analyzer, tester).run()
+
+
+class _StopWatching(BaseException):
+    pass
+
+
+def test_watch_continues_after_callback_error(tmp_path):
+    """处理出错时继续监视，下一次文件变化时重新处理"""
+    calls = []
+
+    def callback():
+        calls.append(len(calls))
+        if len(calls) == 1:
+            # 第一次处理出错后写入新文件，触发下一次处理
+            threading.Timer(0.3, _write, (str(tmp_path / 'new.pdf'), '1.00')).start()
+            raise RuntimeError('处理出错')
+        raise _StopWatching()
+
+    with pytest.raises(_StopWatching):
+        watch_folder(str(tmp_path), callback, debounce=0.1)
+    assert calls == [0, 1]
+
+
+def test_merged_pdf_appends_only_changed_files(folder):
+    """合并PDF只追加新增或修改的文件，删除的文件从页面中去掉，页面按文件名排序"""
+    analyzer, tester = FakeAnalyzer(), FakeTester()
+    _runner(folder, analyzer, tester).run()
+    assert analyzer.appended == ['a.pdf', 'b.pdf']
+    assert _page_widths(_merged(folder[1])) == [13, 31]
+    size = os.path.getsize(_merged(folder[1]))
+
+    _write(os.path.join(folder[0], 'a.pdf'), '40.00', mtime=1_700_000_900)
+    _write(os.path.join(folder[0], '0.pdf'), '5.00')
+    _write(os.path.join(folder[0], 'c.pdf'), '60.00')
+    assert _runner(folder, analyzer, tester).run()
+    assert analyzer.appended[2:] == ['0.pdf', 'a.pdf', 'c.pdf']
+    assert _page_widths(_merged(folder[1])) == [6, 41, 31, 61]
+    assert os.path.getsize(_merged(folder[1])) > size  # 追加写入，原来的内容保留
+
+    os.remove(os.path.join(folder[0], 'c.pdf'))
+    assert _runner(folder, analyzer, tester).run()
+    assert analyzer.appended[5:] == []
+    assert _page_widths(_merged(folder[1])) == [6, 41, 31]
+    # 截图没有变化，截图的合并文件不更新
+    assert tester.appended == ['b_log.png']
+
+
+def test_merged_pdf_rebuilt_when_modified(folder):
+    """合并文件被外部修改或删除时重新合并所有文件"""
+    analyzer, tester = FakeAnalyzer(), FakeTester()
+    _runner(folder, analyzer, tester).run()
+    with open(_merged(folder[1]), 'ab') as f:
+        f.write(b'% edited\n')
+
+    _write(os.path.join(folder[0], 'c.pdf'), '60.00')
+    _runner(folder, analyzer, tester).run()
+    assert analyzer.appended[2:] == ['a.pdf', 'b.pdf', 'c.pdf']
+    assert _page_widths(_merged(folder[1])) == [13, 31, 61]
+
+    os.remove(_merged(folder[1]))
+    _write(os.path.join(folder[0], 'c.pdf'), '70.00', mtime=1_700_000_900)
+    _runner(folder, analyzer, tester).run()
+    assert analyzer.appended[5:] == ['a.pdf', 'b.pdf', 'c.pdf']
+    assert _page_widths(_merged(folder[1])) == [13, 31, 71]
+
+
+def test_failed_merge_is_retried(folder):
+    """合并失败的文件下次更新合并文件时重新追加"""
+    analyzer, tester = FakeAnalyzer(), FakeTester()
+    _write(os.path.join(folder[0], 'c.pdf'), 'bad')
+    _runner(folder, analyzer, tester).run()
+    assert _page_widths(_merged(folder[1])) == [13, 31]
+
+    _write(os.path.join(folder[0], 'c.pdf'), '7.00')
+    _runner(folder, analyzer, tester).run()
+    assert analyzer.appended == ['a.pdf', 'b.pdf', 'c.pdf']
+    assert _page_widths(_merged(folder[1])) == [13, 31, 8]
+
+
+def test_failed_append_is_retried_without_changes(folder):
+    """提取成功但追加到合并PDF失败（或更新合并文件出错）的文件，下次运行时即使没有文件变化也重新追加"""
+    analyzer, tester = FakeAnalyzer(), FakeTester()
+    append = analyzer.append_to_merge
+    failures = {'c.pdf': False, 'd.pdf': RuntimeError('写入失败')}
+
+    def flaky(writer, path):
+        failure = failures.pop(os.path.basename(path), None)
+        if isinstance(failure, Exception):
+            raise failure
+        return append(writer, path) if failure is None else failure
+
+    analyzer.append_to_merge = flaky
+    _write(os.path.join(folder[0], 'c.pdf'), '60.00')
+    assert _runner(folder, analyzer, tester).run()
+    assert _page_widths(_merged(folder[1])) == [13, 31]
+
+    assert _runner(folder, analyzer, tester).run()
+    assert analyzer.extracted == [['a.pdf', 'b.pdf', 'c.pdf']]
+    assert analyzer.appended == ['a.pdf', 'b.pdf', 'c.pdf']
+    assert _page_widths(_merged(folder[1])) == [13, 31, 61]
+    assert not _runner(folder, analyzer, tester).run()
+
+    # 更新合并文件出错时合并文件保持原样，下次运行时追加
+    _write(os.path.join(folder[0], 'd.pdf'), '70.00')
+    assert _runner(folder, analyzer, tester).run()
+    assert _page_widths(_merged(folder[1])) == [13, 31, 61]
+    assert _runner(folder, analyzer, tester).run()
+    assert analyzer.extracted[1:] == [['d.pdf']]
+    assert analyzer.appended[3:] == ['d.pdf']
+    assert _page_widths(_merged(folder[1])) == [13, 31, 61, 71]
+    assert not _runner(folder, analyzer, tester).run()
+    assert tester.appended == ['b_log.png']
@@ -0,0 +1,32 @@
+import random
+
+import pytest
+
+from pdf_image_analyzer import DocumentAnalyzer
+from tests.reference import invoice_text, legacy_invoice_fields
+
+# 一致性检查另外加入随机拼接的关键字片段，覆盖模板之外的写法
+FUZZ_PIECES = ['发票号码', '发票代码', '开票', '日期', '名', '称', '销', '售', '方', '供应商', '公司名称', '金额', '合', '计',
+               '价税合计', '小写', '人民币', '总额', '应付', 'No', 'NO.', '¥', '￥', ':', '：', ' ', '\n', '2024年3月1日',
+               '2024-03-01', '2024/3/1', '12,345.60', '88.8', '7', 'ABC', '商品名称', '项目名称', '（', '）']
+
+
+@pytest.fixture(scope='module')
+def scanner():
+    return DocumentAnalyzer.field_scanner()
+
+
+def test_scan_matches_legacy_patterns(scanner):
+    """字段扫描器与原来逐个模式列表在全文上匹配的结果完全一致（合成发票文本）"""
+    rng = random.Random(0)
+    for _ in range(500):
+        text = invoice_text(rng)
+        assert scanner.scan(text) == legacy_invoice_fields(text)
+
+
+def test_scan_matches_legacy_patterns_on_fuzz(scanner):
+    """随机拼接的关键字片段"""
+    rng = random.Random(1)
+    for _ in range(2000):
+        text = ''.join(rng.choice(FUZZ_PIECES) for _ in range(rng.randint(1, 30)))
+        assert scanner.scan(text) == legacy_invoice_fields(text), repr(text)
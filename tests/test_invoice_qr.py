@@ -0,0 +1,108 @@
+from decimal import Decimal
+
+import pytest
+
+from invoice_fields import MAX_TAX_RATE, InvoiceFieldScanner
+from invoice_qr import decode_qr, parse_invoice_qr, read_invoice_qr
+from pdf_image_analyzer import DocumentAnalyzer
+from pdf_text import available_pdf_backends, get_pdf_backend
+
+VAT_PAYLOAD = '01,10,044031900111,12345678,100.00,20240101,12345678901234567890,ABCD,'
+DIGITAL_PAYLOAD = '01,32,,24442000000012345678,88.5,20240305,,A1B2'
+
+
+def test_parse_payloads():
+    assert parse_invoice_qr(VAT_PAYLOAD) == {
+        'invoice_type': '10', 'invoice_code': '044031900111', 'invoice_number': '12345678',
+        'invoice_date': '2024-01-01', 'amount': Decimal('100.00')}
+    # 全电发票没有发票代码，发票号码为20位；前后的空白忽略
+    qr = parse_invoice_qr(f'  {DIGITAL_PAYLOAD}\n')
+    assert qr['invoice_code'] is None
+    assert (qr['invoice_number'], qr['invoice_date'], qr['amount']) == ('24442000000012345678', '2024-03-05',
+                                                                       Decimal('88.5'))
+
+
+@pytest.mark.parametrize('payload', [
+    '',
+    'https://inv-veri.chinatax.gov.cn/',
+    '02,10,044031900111,12345678,100.00,20240101,',    # 版本不是01
+    '01,10,044031900111,1234567,100.00,20240101,',     # 发票号码不足8位
+    '01,10,044031900111,12345678,1百,20240101,',        # 金额不是数字
+    '01,10,044031900111,12345678,100.00,2024011,',     # 日期不是8位
+    '01,10,044031900111,12345678,100.00,202401011',    # 日期后还有数字
+])
+def test_parse_rejects_other_payloads(payload):
+    assert parse_invoice_qr(payload) is None
+
+
+def test_total_near_tax_window():
+    """价税合计取 [不含税金额, 不含税金额 × (1 + 最高税率)] 范围内最大的金额（允许半分的舍入误差）"""
+    total_near = InvoiceFieldScanner._total_near
+    high = round(100 * (1 + MAX_TAX_RATE), 2)
+    assert total_near([100.00, 106.00, 113.00, 1000.00], Decimal('100.00')) == 113.00
+    assert total_near([99.99, high + 0.01], Decimal('100.00')) == 100.00  # 范围外的金额不使用
+    assert total_near([high, high + 0.01], Decimal('100.00')) == high
+    assert total_near([99.996], Decimal('100.00')) == 99.996
+    assert total_near([], Decimal('88.50')) == 88.50
+
+
+def test_qr_fields_take_precedence_over_text():
+    """有二维码时发票号码和日期以二维码为准，金额为二维码金额对应的价税合计，而不是备注中更大的金额"""
+    scanner = DocumentAnalyzer.field_scanner()
+    text = '\n'.join(['发票号码：99999999', '开票日期：2020年01月01日', '销售方名称：北京某某科技有限公司',
+                      '合计 ¥100.00 ¥13.00', '价税合计（大写）壹佰壹拾叁元整 （小写）¥113.00',
+                      '备注：本年累计开票金额¥5000.00'])
+    without_qr = scanner.scan(text)
+    assert (without_qr['invoice_number'], without_qr['price']) == ('99999999', '5000.00')
+
+    fields = scanner.scan(text, parse_invoice_qr(VAT_PAYLOAD))
+    assert fields['invoice_number'] == '12345678'
+    assert fields['invoice_date'] == '2024-01-01'
+    assert fields['price'] == '113.00'
+    assert fields['supplier'] == without_qr['supplier']
+
+
+def _qr_modules(payload):
+    cv2 = pytest.importorskip('cv2')
+    return cv2.QRCodeEncoder.create().encode(payload)
+
+
+def test_decode_small_embedded_image():
+    """每个模块一个像素、没有空白区的二维码图像放大后解码"""
+    modules = _qr_modules(VAT_PAYLOAD)
+    assert max(modules.shape) < 150
+    assert decode_qr(modules) == VAT_PAYLOAD
+    assert decode_qr(modules[:0]) == ''
+    assert decode_qr(None) == ''
+
+
+@pytest.mark.skipif('pymupdf' not in available_pdf_backends(), reason='未安装 PyMuPDF')
+@pytest.mark.parametrize('style', ['image', 'vector'])
+def test_read_invoice_qr_from_pdf(tmp_path, style):
+    """从PDF第一页读取嵌入图像或矢量图形的二维码"""
+    import io
+    import numpy as np
+    import pymupdf
+    from PIL import Image
+
+    modules = _qr_modules(DIGITAL_PAYLOAD)
+    document = pymupdf.open()
+    page = document.new_page()
+    rect = pymupdf.Rect(40, 40, 110, 110)
+    if style == 'image':
+        stream = io.BytesIO()
+        Image.fromarray(modules).save(stream, format='PNG')
+        page.insert_image(rect, stream=stream.getvalue())
+    else:
+        cell = rect.width / modules.shape[0]
+        for row, col in zip(*np.nonzero(modules == 0)):
+            x, y = rect.x0 + col * cell, rect.y0 + row * cell
+            page.draw_rect(pymupdf.Rect(x, y, x + cell, y + cell), color=None, fill=(0, 0, 0), width=0)
+    page.insert_text((40, 200), '发票号码：24442000000012345678', fontname='china-s', fontsize=10)
+    path = str(tmp_path / f'{style}.pdf')
+    document.save(path)
+    document.close()
+
+    with get_pdf_backend('pymupdf').open(path) as pdf:
+        qr = read_invoice_qr(pdf)
+    assert qr is not None and qr['invoice_number'] == '24442000000012345678'
@@ -0,0 +1,130 @@
+import pytest
+
+from invoice_templates import TEMPLATES, first_item, match_template
+from pdf_image_analyzer import DocumentAnalyzer
+from pdf_text import available_pdf_backends
+
+# 数电发票的文字：(x, top, 文本)，坐标为相对页面宽高的比例；购买方名称在销售方名称之前
+DIGITAL_LINES = [
+    (0.36, 0.05, '电子发票（普通发票）'), (0.66, 0.06, '发票号码：24112000000012345678'),
+    (0.66, 0.11, '开票日期：2024年03月01日'),
+    (0.05, 0.21, '购买方信息'), (0.08, 0.25, '名称：某某大学'),
+    (0.52, 0.21, '销售方信息'), (0.55, 0.25, '名称：北京某某科技有限公司'),
+    (0.05, 0.37, '项目名称'), (0.05, 0.42, '*实验器材*离心管'), (0.05, 0.47, '*实验器材*移液枪'),
+    (0.05, 0.65, '合 计'), (0.7, 0.65, '¥100.00 ¥13.00'),
+]
+TOTAL_LINES = [(0.05, 0.74, '价税合计（大写）壹佰壹拾叁元整'), (0.66, 0.74, '（小写）¥113.00')]
+
+
+class FakeDocument:
+    """只有第一页大小和单词的文档；words 为None时读取单词会报错（用于检查没有解析页面内容）"""
+
+    def __init__(self, size, words):
+        self.page_count = 1
+        self.size = size
+        self.words = words
+
+    def page_size(self, index):
+        return self.size
+
+    def page_words(self, index):
+        assert self.words is not None, '宽高比不符合时不应解析页面'
+        return self.words
+
+
+def _words(lines, char_width=0.012, height=0.025):
+    """每行文字按空格拆成单词"""
+    words = []
+    for x, top, text in lines:
+        for part in text.split(' '):
+            words.append((x, top, x + len(part) * char_width, top + height, part))
+            x += (len(part) + 1) * char_width
+    return words
+
+
+@pytest.mark.parametrize('size, title, expected', [
+    ((595.3, 396.9), '电子发票（普通发票）', '数电发票'),
+    # 数电专票的标题包含"增值税专用发票"，按数电发票处理
+    ((595.3, 396.9), '电子发票（增值税专用发票）', '数电发票'),
+    # 标题被拆成几个单词
+    ((595.3, 396.9), '电子发票 （普通发票）', '数电发票'),
+    ((683.1, 396.9), '广东增值税电子普通发票', '增值税电子发票'),
+    # 两个模板的宽高比都符合时按标题区分
+    ((635.0, 396.9), '增值税电子专用发票', '增值税电子发票'),
+    ((683.1, 396.9), '电子发票（普通发票）', None),
+    ((595.3, 396.9), '销货清单', None),
+])
+def test_template_selection(size, title, expected):
+    template, words = match_template(FakeDocument(size, _words([(0.36, 0.05, title)])))
+    assert (template.name if template else None) == expected
+    assert (words is not None) == (expected is not None)
+
+
+def test_aspect_mismatch_skips_page_content():
+    """竖版A4页面不符合任何模板的宽高比，不读取页面中的单词"""
+    assert match_template(FakeDocument((595.3, 841.9), None)) == (None, None)
+
+
+def test_extract_reads_each_box():
+    """供应商只在销售方区域中查找（不会取到购买方名称），商品名称为项目名称列中表头之后的第一项"""
+    template = TEMPLATES[0]
+    fields, texts = template.extract(_words(DIGITAL_LINES + TOTAL_LINES), DocumentAnalyzer.field_scanner())
+    assert fields == {'invoice_number': '24112000000012345678', 'invoice_date': '2024-03-01',
+                      'supplier': '北京某某科技有限公司', 'price': '113.00', 'product_name': '实验器材离心管'}
+    assert '某某大学' not in texts['seller']
+
+    # 价税合计区域中没有金额时不提取金额（交给全文提取）
+    fields, _ = template.extract(_words(DIGITAL_LINES), DocumentAnalyzer.field_scanner())
+    assert fields['price'] is None
+
+
+def test_first_item_skips_header_and_total():
+    assert first_item('项目名称\n合 计\n*餐饮服务*餐费') == '餐饮服务餐费'
+    assert first_item('货物或应税劳务、服务名称\n') is None
+
+
+def _layout_pdf(path, lines, size=(595.3, 396.9)):
+    import pymupdf
+    document = pymupdf.open()
+    page = document.new_page(width=size[0], height=size[1])
+    for x, top, text in lines:
+        page.insert_text((x * size[0], top * size[1] + 6), text, fontname='china-s', fontsize=6)
+    document.save(str(path))
+    document.close()
+
+
+class TrackingAnalyzer(DocumentAnalyzer):
+    """记录是否解析了全文"""
+
+    def __init__(self, folder_path):
+        super().__init__(folder_path, use_cache=False, use_qr=False, pdf_ocr=False, pdf_backend='pymupdf')
+        self.full_text_pages = 0
+
+    def _page_texts(self, document):
+        for text in super()._page_texts(document):
+            self.full_text_pages += 1
+            yield text
+
+
+@pytest.mark.skipif('pymupdf' not in available_pdf_backends(), reason='未安装 PyMuPDF')
+def test_template_fields_skip_full_text(tmp_path):
+    """模板区域中找到所有所需字段时不解析全文"""
+    path = tmp_path / 'digital.pdf'
+    _layout_pdf(path, DIGITAL_LINES + TOTAL_LINES)
+    analyzer = TrackingAnalyzer(str(tmp_path))
+    fields = analyzer._extract_pdf_fields(str(path))
+    assert analyzer.full_text_pages == 0
+    assert (fields['invoice_number'], fields['supplier'], fields['price']) == ('24112000000012345678',
+                                                                              '北京某某科技有限公司', '113.00')
+
+
+@pytest.mark.skipif('pymupdf' not in available_pdf_backends(), reason='未安装 PyMuPDF')
+def test_incomplete_template_falls_back_to_full_text(tmp_path):
+    """价税合计不在模板区域中（版式有偏移）时改为解析全文，仍然得到所有字段"""
+    path = tmp_path / 'shifted.pdf'
+    _layout_pdf(path, DIGITAL_LINES + [(0.05, 0.9, '价税合计（大写）壹佰壹拾叁元整 （小写）¥113.00')])
+    analyzer = TrackingAnalyzer(str(tmp_path))
+    fields = analyzer._extract_pdf_fields(str(path))
+    assert analyzer.full_text_pages == 1
+    assert (fields['invoice_number'], fields['invoice_date'], fields['price']) == ('24112000000012345678',
+                                                                                  '2024-03-01', '113.00')
@@ -0,0 +1,139 @@
+import json
+import logging
+import functools
+
+import pytest
+
+import jobs
+from jobs import JobLog, JobManager
+
+
+def test_ring_buffer_reports_gap():
+    """环形缓冲区只保留最近的日志，读取位置之后被丢弃的条数作为 missed 返回"""
+    log = JobLog(size=5, rate=1000, burst=1000)
+    for index in range(1, 9):
+        log.append(logging.INFO, f'第{index}条')
+
+    events, missed, cursor = log.since(0)
+    assert [event.id for event in events] == [4, 5, 6, 7, 8]
+    assert (missed, cursor) == (3, 8)
+    assert log.since(2)[1] == 1
+    events, missed, _ = log.since(5)
+    assert [event.id for event in events] == [6, 7, 8] and missed == 0
+    assert log.since(8) == ([], 0, 8)
+
+    # 按级别过滤和分批读取
+    log.append(logging.WARNING, '警告')
+    events, _, cursor = log.since(0, logging.WARNING)
+    assert [event.message for event in events] == ['警告'] and cursor == 9
+    events, _, cursor = log.since(0, limit=2)
+    assert [event.id for event in events] == [5, 6] and cursor == 6
+
+    # 不属于本任务的事件ID（例如服务重启前）从头读取
+    assert [event.id for event in log.since(100)[0]] == [5, 6, 7, 8, 9]
+
+
+def test_token_bucket_limits_info_logs():
+    """INFO 日志超过令牌桶容量后只计数，以一条省略提示代替；WARNING 不限速"""
+    log = JobLog(size=100, rate=0.001, burst=5)
+    for index in range(20):
+        log.append(logging.INFO, f'信息{index}')
+    for index in range(3):
+        log.append(logging.WARNING, f'警告{index}')
+    log.append(logging.INFO, '被省略')
+    log.close()
+
+    messages = [event.message for event in log.since(0)[0]]
+    assert messages[:5] == [f'信息{index}' for index in range(5)]
+    assert messages[5].startswith('日志过多，已省略 15 条')
+    assert messages[6:9] == ['警告0', '警告1', '警告2']
+    # 任务结束时补上最后的省略条数
+    assert messages[9].startswith('日志过多，已省略 1 条') and len(messages) == 10
+    assert log.closed and not log.wait(log.last_id, 0)
+
+
+def _parse_sse(body):
+    """把事件流解析为 [(事件类型, ID, 数据)]"""
+    events = []
+    for block in body.split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.splitlines() if ': ' in line)
+        if 'event' in fields:
+            events.append((fields['event'], int(fields['id']) if 'id' in fields else None, json.loads(fields['data'])))
+    return events
+
+
+@pytest.fixture
+def run_logged_job(monkeypatch, caplog):
+    """提交一个记录 count 条 level 级别日志的任务，等待结束后返回任务和 Flask 测试客户端"""
+    import app
+
+    caplog.set_level(logging.INFO)
+    monkeypatch.setattr(app, 'SSE_FLUSH_INTERVAL', 0)
+    managers = []
+
+    def run(count, level=logging.WARNING, **log_options):
+        if log_options:
+            monkeypatch.setattr(jobs, 'JobLog', functools.partial(JobLog, **log_options))
+
+        def runner(job):
+            for index in range(count):
+                logging.getLogger('app').log(level, f'第{index}条')
+
+        manager = JobManager(runner, max_workers=1)
+        managers.append(manager)
+        monkeypatch.setattr(app, 'jobs', manager)
+        job = manager.submit('folder')
+        assert job.wait(10)
+        return job, app.app.test_client()
+
+    yield run
+    for manager in managers:
+        manager.shutdown()
+
+
+def _logs(events):
+    return [(event_id, data['message']) for event, event_id, data in events if event == 'log' and '第' in data['message']]
+
+
+def test_stream_resumes_after_last_event_id(run_logged_job):
+    """断线重连时从 Last-Event-ID（或 ?last_event_id=）之后继续推送，流以 status 和 end 事件结束"""
+    job, client = run_logged_job(5)
+    events = _parse_sse(client.get(f'/jobs/{job.id}/events').get_data(as_text=True))
+    logs = _logs(events)
+    assert [message.split(' - ')[-1] for _, message in logs] == [f'第{index}条' for index in range(5)]
+    assert [event for event, _, _ in events[-2:]] == ['status', 'end']
+    assert events[-1][2] == {'status': 'done'}
+
+    resume_id = logs[2][0]
+    resumed = _logs(_parse_sse(client.get(f'/jobs/{job.id}/events',
+                                          headers={'Last-Event-ID': str(resume_id)}).get_data(as_text=True)))
+    assert resumed == logs[3:]
+    by_query = _logs(_parse_sse(client.get(f'/jobs/{job.id}/events?last_event_id={resume_id}').get_data(as_text=True)))
+    assert by_query == logs[3:]
+
+    assert client.get(f'/jobs/{job.id}/events', headers={'Last-Event-ID': 'x'}).status_code == 400
+    assert client.get(f'/jobs/{job.id}/events?level=LOUD').status_code == 400
+    # 只推送 ERROR 及以上
+    assert _logs(_parse_sse(client.get(f'/jobs/{job.id}/events?level=error').get_data(as_text=True))) == []
+
+
+def test_stream_reports_overflow_gap(run_logged_job):
+    """重连时要继续的日志已被环形缓冲区丢弃：先推送 gap 事件报告丢失的条数，再推送剩余日志"""
+    job, client = run_logged_job(20, size=8)
+    events = _parse_sse(client.get(f'/jobs/{job.id}/events', headers={'Last-Event-ID': '1'}).get_data(as_text=True))
+    first_kept = job.log.since(0)[0][0].id
+    assert events[0] == ('gap', None, {'missed': first_kept - 2})
+    assert [event_id for event, event_id, _ in events if event == 'log'] == list(range(first_kept, job.log.last_id + 1))
+
+
+def test_stream_rate_limited_logs(run_logged_job):
+    """日志过多时推送的日志数受令牌桶限制，省略的条数以 WARNING 日志报告"""
+    job, client = run_logged_job(50, level=logging.INFO, rate=0.001, burst=10)
+    events = _parse_sse(client.get(f'/jobs/{job.id}/events').get_data(as_text=True))
+    logs = [data for event, _, data in events if event == 'log']
+    assert len(_logs(events)) == 10
+    omitted = [data for data in logs if data['message'].startswith('日志过多')]
+    assert len(omitted) == 1 and omitted[0]['level'] == 'WARNING'
+    # 任务结束时报告省略的条数（包括任务管理器自己的 INFO 日志）
+    assert int(omitted[0]['message'].split('已省略 ')[1].split(' 条')[0]) >= 40
+    assert len(logs) == 11
@@ -0,0 +1,131 @@
+import os
+import threading
+
+import pytest
+
+from jobs import Job, JobCancelled, JobManager
+from pdf_text import available_pdf_backends
+from tests.test_concurrent_jobs import StubBackend, _write_folder
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    """替换 app 的任务管理器：任务按 runners 中以文件夹名为键的函数执行"""
+    import app
+
+    runners = {}
+    manager = JobManager(lambda job: runners[os.path.basename(job.folder)](job), max_workers=2)
+    manager.runners = runners
+    monkeypatch.setattr(app, 'jobs', manager)
+    yield manager
+    manager.shutdown()
+
+
+@pytest.fixture
+def client():
+    import app
+    return app.app.test_client()
+
+
+def _wait_until_cancelled(job):
+    """模拟逐个处理文件：每隔一段时间报告进度，任务被取消时 job.update 抛出 JobCancelled"""
+    for done in range(1000):
+        job.update('pdf', done, 1000)
+        job.log.wait(job.log.last_id, 0.01)
+
+
+def test_submit_status_cancel(manager, client, tmp_path):
+    folder = tmp_path / 'folder'
+    folder.mkdir()
+    started = threading.Event()
+
+    def runner(job):
+        started.set()
+        _wait_until_cancelled(job)
+
+    manager.runners['folder'] = runner
+
+    response = client.post('/jobs', json={'folder_path': str(folder)})
+    assert response.status_code == 202
+    job_id = response.get_json()['job']['id']
+    assert response.headers['Location'] == f'/jobs/{job_id}'
+    assert started.wait(10)
+
+    status = client.get(f'/jobs/{job_id}').get_json()['job']
+    assert status['status'] == Job.RUNNING and status['stage'] == 'pdf'
+    assert [job['id'] for job in client.get('/jobs').get_json()['jobs']] == [job_id]
+
+    response = client.delete(f'/jobs/{job_id}')
+    assert response.status_code == 202 and response.get_json()['job']['cancel_requested']
+    assert manager.get(job_id).wait(10)
+    assert client.get(f'/jobs/{job_id}').get_json()['job']['status'] == Job.CANCELLED
+
+
+def test_invalid_requests(manager, client, tmp_path):
+    """没有文件夹或文件夹不存在时返回400，任务不存在时返回404"""
+    assert client.post('/jobs', json={}).status_code == 400
+    assert client.post('/jobs', data='not json').status_code == 400
+    assert client.post('/jobs', json={'folder_path': str(tmp_path / 'missing')}).status_code == 400
+    assert manager.list() == []
+
+    for response in (client.get('/jobs/unknown'), client.delete('/jobs/unknown'),
+                     client.get('/jobs/unknown/events'), client.get('/get-logs?job_id=unknown')):
+        assert response.status_code == 404
+        assert response.get_json()['status'] == 'error'
+
+
+def test_cancel_queued_job(manager, client, tmp_path):
+    """排队中的任务取消后不再执行"""
+    release = threading.Event()
+    ran = []
+    manager.runners['busy'] = lambda job: release.wait(10)
+    manager.runners['queued'] = ran.append
+    for name in ('busy', 'queued'):
+        (tmp_path / name).mkdir()
+
+    busy = [manager.submit(str(tmp_path / 'busy')) for _ in range(manager.max_workers)]
+    queued = manager.submit(str(tmp_path / 'queued'))
+    assert client.delete(f'/jobs/{queued.id}').status_code == 202
+    release.set()
+    assert queued.wait(10) and all(job.wait(10) for job in busy)
+    assert queued.status == Job.CANCELLED and ran == []
+
+
+class _Interrupted(BaseException):
+    pass
+
+
+@pytest.mark.parametrize('error, status', [(JobCancelled('job'), Job.CANCELLED), (RuntimeError('出错'), Job.FAILED),
+                                           (_Interrupted(), Job.FAILED)])
+def test_job_always_finishes(manager, error, status):
+    """任务无论以何种异常结束（包括不是 Exception 的 JobCancelled 和其他 BaseException）都不会停留在运行中"""
+    def runner(job):
+        raise error
+
+    manager.runners['folder'] = runner
+    job = manager.submit('folder')
+    assert job.wait(10)
+    assert job.status == status
+    assert job.log.closed
+
+
+@pytest.mark.skipif('pymupdf' not in available_pdf_backends(), reason='未安装 PyMuPDF')
+def test_cancel_during_processing(tmp_path, monkeypatch):
+    """处理过程中取消：在两个文件之间停止，任务状态为已取消，不留下未完成的合并文件"""
+    import app
+
+    monkeypatch.setattr(app, '_ocr_backend', StubBackend())
+    folder = _write_folder(tmp_path, 'batch')
+
+    def runner(job):
+        job.cancel()
+        app.run_job(job)
+
+    manager = JobManager(runner, max_workers=1, jobs_dir=str(tmp_path / 'jobs'))
+    try:
+        job = manager.submit(folder)
+        assert job.wait(60)
+    finally:
+        manager.shutdown()
+    assert job.status == Job.CANCELLED
+    assert os.listdir(job.output_dir) == []
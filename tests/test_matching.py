@@ -0,0 +1,66 @@
+import random
+
+from matching import match_payments, filename_tokens
+from tests.reference import matching_corpus, legacy_find_invoice_file
+
+
+def test_same_filename_and_amount():
+    matches = match_payments([('离心管_1.pdf', 12.5), ('打印纸_2.pdf', 30.0)],
+                             [('离心管_1_log.jpg', 12.5), ('打印纸_2_log.png', 30.0)])
+    assert matches['离心管_1_log.jpg'].invoice == '离心管_1.pdf'
+    assert matches['打印纸_2_log.png'].invoice == '打印纸_2.pdf'
+    assert matches['离心管_1_log.jpg'].score == 1.0
+
+
+def test_filename_tokens():
+    assert filename_tokens('Lab_Supplies-2024_log.JPG') == ['lab', 'supplies', '2024']
+    assert filename_tokens('实验器材.pdf') == ['实验', '验器', '器材']
+
+
+def test_unique_amount_without_common_words():
+    """文件名没有共同的词时，只有一张发票是这个金额才匹配"""
+    matches = match_payments([('离心管_1.pdf', 12.5), ('打印纸_2.pdf', 30.0)], [('IMG_0001_log.jpg', 12.5)])
+    assert matches['IMG_0001_log.jpg'].invoice == '离心管_1.pdf'
+    assert matches['IMG_0001_log.jpg'].reason == '文件名不同，金额相同'
+
+    matches = match_payments([('离心管_1.pdf', 12.5), ('打印纸_2.pdf', 12.5)], [('IMG_0001_log.jpg', 12.5)])
+    assert matches == {}
+
+
+def test_one_to_one():
+    """每张发票最多匹配一张截图，得分高的先匹配"""
+    matches = match_payments([('离心管_1.pdf', 12.5)], [('离心管_1_log.jpg', 99.0), ('离心管_1_log.png', 12.5)])
+    assert list(matches) == ['离心管_1_log.png']
+
+
+def test_missing_amounts():
+    matches = match_payments([('离心管_1.pdf', None)], [('离心管_1_log.jpg', float('nan'))])
+    assert matches['离心管_1_log.jpg'].invoice == '离心管_1.pdf'
+    assert '缺少金额' in matches['离心管_1_log.jpg'].reason
+
+
+def test_independent_of_input_order():
+    rng = random.Random(0)
+    invoices, payments, _ = matching_corpus(rng, 500)
+    expected = match_payments(invoices, payments)
+    rng.shuffle(invoices)
+    rng.shuffle(payments)
+    assert match_payments(invoices, payments) == expected
+
+
+def test_at_least_as_accurate_as_filename_containment():
+    """合成文件名和金额上的正确数不少于原来的文件名包含关系，错误匹配不多于原来（且不超过1%）"""
+    rng = random.Random(1)
+    invoices, payments, truth = matching_corpus(rng, 2000)
+    matches = match_payments(invoices, payments)
+    pdf_files = [name for name, _ in invoices]
+    results = {
+        'legacy': {payment: legacy_find_invoice_file(payment, pdf_files) for payment, _ in payments},
+        'index': {payment: matches[payment].invoice if payment in matches else None for payment, _ in payments}
+    }
+    correct, wrong = {}, {}
+    for name, found in results.items():
+        correct[name] = sum(found[payment] == truth[payment] for payment in truth)
+        wrong[name] = sum(found[payment] is not None and found[payment] != truth[payment] for payment in truth)
+    assert correct['index'] >= correct['legacy']
+    assert wrong['index'] <= min(wrong['legacy'], len(truth) // 100)
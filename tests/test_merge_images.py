@@ -0,0 +1,105 @@
+import os
+
+import pytest
+
+from pdf_text import available_pdf_backends, get_pdf_backend
+from pdf_stream_writer import StreamingPDFWriter
+from test_image_payment import PaymentImageTester
+
+pytestmark = pytest.mark.skipif('pymupdf' not in available_pdf_backends(), reason='未安装 PyMuPDF')
+
+
+@pytest.fixture
+def backend():
+    return get_pdf_backend('pymupdf')
+
+
+@pytest.fixture
+def image_files(tmp_path):
+    """随机像素的截图：JPEG、PNG、带透明通道的PNG和灰度PNG"""
+    import numpy as np
+    from PIL import Image
+
+    rng = np.random.default_rng(0)
+    paths = []
+    for name, mode in [('photo_log.jpg', 'RGB'), ('screen_log.png', 'RGB'), ('alpha_log.png', 'RGBA'),
+                       ('gray_log.png', 'L')]:
+        shape = (90, 60) if mode == 'L' else (90, 60, len(mode))
+        image = Image.fromarray(rng.integers(0, 255, shape, dtype=np.uint8), mode)
+        path = str(tmp_path / name)
+        if name.endswith('.jpg'):
+            image.save(path, quality=90)
+        else:
+            image.save(path)
+        paths.append(path)
+    return paths
+
+
+def _check_image_pages(backend, output, image_files):
+    """JPEG 数据原样嵌入，PNG（包括带透明通道和灰度图）解码后的像素与原图相同，页面大小与图像相同"""
+    import numpy as np
+    from PIL import Image
+
+    with backend.open(output) as merged:
+        document = merged._handle
+        assert document.page_count == len(image_files)
+        for path, page in zip(image_files, document):
+            xref = page.get_images()[0][0]
+            with Image.open(path) as image:
+                assert (page.rect.width, page.rect.height) == image.size
+                if path.endswith('.jpg'):
+                    with open(path, 'rb') as f:
+                        assert document.xref_stream_raw(xref) == f.read()
+                else:
+                    expected = np.array(image.convert('L' if image.mode == 'L' else 'RGB'))
+                    pixmap = backend._pymupdf.Pixmap(document, xref)
+                    actual = np.frombuffer(pixmap.samples, np.uint8).reshape(expected.shape)
+                    assert np.array_equal(actual, expected), os.path.basename(path)
+
+
+def test_image_pages(tmp_path, backend, image_files):
+    output = str(tmp_path / 'merged_log.pdf')
+    with StreamingPDFWriter(output) as writer:
+        for path in image_files:
+            writer.add_image_page(path)
+    _check_image_pages(backend, output, image_files)
+
+
+def test_merge_images_to_pdf(tmp_path, backend, image_files):
+    """按文件名顺序合并目录中的支付截图，其他文件不合并"""
+    (tmp_path / 'invoice.pdf').write_bytes(b'%PDF-1.4')
+    output = str(tmp_path / 'output' / 'merged_log.pdf')
+    PaymentImageTester(use_cache=False).merge_images_to_pdf(str(tmp_path), output)
+    _check_image_pages(backend, output, sorted(image_files))
+
+
+def test_cancel_leaves_no_output(tmp_path, image_files, monkeypatch):
+    """合并过程中任务被取消（JobCancelled 继承 BaseException）时删除临时文件"""
+    from jobs import JobCancelled
+
+    def cancelled(self, image_path):
+        raise JobCancelled('job')
+
+    monkeypatch.setattr(StreamingPDFWriter, 'add_image_page', cancelled)
+    output = str(tmp_path / 'merged_log.pdf')
+    with pytest.raises(JobCancelled):
+        PaymentImageTester(use_cache=False).merge_images_to_pdf(str(tmp_path), output)
+    assert not os.path.exists(output)
+    assert not os.path.exists(f"{output}.tmp")
+
+
+@pytest.mark.parametrize('cut', [b'', b'\x00\x00'], ids=['no-iend', 'partial-header'])
+def test_truncated_png_is_decoded(tmp_path, backend, image_files, cut):
+    """缺少 IEND 数据块或末尾的数据块头不完整的 PNG 改为解码后写入，而不是合并失败"""
+    path = image_files[1]
+    with open(path, 'rb') as f:
+        data = f.read()
+    assert data.endswith(b'IEND\xaeB`\x82')
+    truncated = str(tmp_path / 'truncated_log.png')
+    with open(truncated, 'wb') as f:
+        f.write(data[:-12] + cut)
+
+    output = str(tmp_path / 'merged_log.pdf')
+    with StreamingPDFWriter(output) as writer:
+        writer.add_image_page(truncated)
+    _check_image_pages(backend, output, [truncated])
@@ -0,0 +1,126 @@
+import os
+import sys
+
+import pytest
+
+import ocr_backend
+from ocr_backend import BatchCLIBackend, OCRBackend, PytesseractBackend, get_backend, probe_tesseract
+
+# 模拟的 tesseract 可执行文件：记录每次调用的参数；批量识别时每张图像输出一页（文件名），以 \f 分隔
+FAKE_TESSERACT = '''#!{python}
+import os, sys
+args = sys.argv[1:]
+with open({log!r}, 'a', encoding='utf-8') as f:
+    f.write(' '.join(args) + '\\n')
+if args[0] == '--version':
+    print('tesseract 5.3.0\\n leptonica-1.82.0')
+elif args[0] == '--list-langs':
+    print('List of available languages in "/usr/share/tessdata/" (2):\\nchi_sim\\neng')
+else:
+    with open(args[0], encoding='utf-8') as f:
+        paths = f.read().split()
+    sys.stdout.write(''.join('page %d %s\\n\\f' % (index, os.path.basename(path)) for index, path in enumerate(paths)))
+'''
+
+
+@pytest.fixture
+def tesseract(tmp_path, monkeypatch):
+    """把 pytesseract 使用的Tesseract替换为模拟的可执行文件，返回 (路径, 读取调用记录的函数)"""
+    pytesseract = pytest.importorskip('pytesseract')
+    path, log = tmp_path / 'tesseract', tmp_path / 'calls.log'
+    path.write_text(FAKE_TESSERACT.format(python=sys.executable, log=str(log)), encoding='utf-8')
+    path.chmod(0o755)
+    monkeypatch.setattr(pytesseract.pytesseract, 'tesseract_cmd', str(path))
+    monkeypatch.setattr(ocr_backend, '_probes', {})
+
+    def calls():
+        return log.read_text(encoding='utf-8').splitlines() if log.exists() else []
+    return str(path), calls
+
+
+def _images(count):
+    from PIL import Image
+    return [Image.new('L', (40 + index, 20), 255) for index in range(count)]
+
+
+def test_get_backend_selection(monkeypatch):
+    """按名称创建后端，已创建的后端直接返回；auto 在 tesserocr 不可用或无法初始化时使用批量命令行模式"""
+    backend = PytesseractBackend()
+    assert get_backend(backend) is backend
+    assert isinstance(get_backend('cli'), PytesseractBackend)
+    assert isinstance(get_backend('cli-batch'), BatchCLIBackend)
+    with pytest.raises(ValueError):
+        get_backend('unknown')
+
+    monkeypatch.setattr(ocr_backend, 'available_backends', lambda: ['cli', 'cli-batch'])
+    assert isinstance(get_backend(), BatchCLIBackend)
+
+    class BrokenTesserocr(OCRBackend):
+        name = 'tesserocr'
+
+        def check(self, lang='eng'):
+            return '找不到语言包'
+
+    monkeypatch.setattr(ocr_backend, 'available_backends', lambda: ['cli', 'cli-batch', 'tesserocr'])
+    monkeypatch.setattr(ocr_backend, 'TesserocrBackend', BrokenTesserocr)
+    assert isinstance(get_backend('auto'), BatchCLIBackend)
+
+    class WorkingTesserocr(BrokenTesserocr):
+        def check(self, lang='eng'):
+            return None
+
+    monkeypatch.setattr(ocr_backend, 'TesserocrBackend', WorkingTesserocr)
+    assert isinstance(get_backend('auto'), WorkingTesserocr)
+
+
+def test_batch_backend_splits_pages(tesseract):
+    """批量识别只启动一次Tesseract，按 \\f 拆分的结果与输入图像一一对应（保留页分隔符）"""
+    _, calls = tesseract
+    backend = BatchCLIBackend()
+    texts = backend.image_to_string_batch(_images(3), lang='eng', config='--oem 3 --psm 6')
+    assert texts == [f'page {index} {index:05d}.PNG\n\f' for index in range(3)]
+    assert len(calls()) == 1
+    assert calls()[0].split()[1:] == ['stdout', '-l', 'eng', '--oem', '3', '--psm', '6', 'txt']
+    assert (backend.calls, backend.images) == (1, 3)
+
+
+def test_batch_backend_rejects_page_mismatch(monkeypatch):
+    """结果页数与图像数不一致时抛出错误（调用方改为逐个识别），不会错位"""
+    backend = BatchCLIBackend()
+    monkeypatch.setattr(backend, '_run', lambda images, lang, config, extension: 'a\fb\f')
+    with pytest.raises(RuntimeError):
+        backend.image_to_string_batch(_images(3))
+    assert backend.image_to_string_batch(_images(2)) == ['a\f', 'b\f']
+
+
+def test_probe_cache(tesseract, tmp_path, monkeypatch):
+    """探测结果缓存在进程内和文件中；Tesseract可执行文件或 TESSDATA_PREFIX 变化时重新探测"""
+    path, calls = tesseract
+    cache_path = str(tmp_path / 'probe.json')
+    monkeypatch.delenv('TESSDATA_PREFIX', raising=False)
+
+    info = probe_tesseract(path, cache_path)
+    assert (info.version, info.languages) == ('5.3.0', ('chi_sim', 'eng'))
+    assert calls() == ['--version', '--list-langs']
+    assert probe_tesseract(path, cache_path) is info
+
+    # 新进程：从缓存文件读取，不启动子进程
+    monkeypatch.setattr(ocr_backend, '_probes', {})
+    assert probe_tesseract(path, cache_path) == info
+    assert len(calls()) == 2
+
+    # 重新安装（修改时间变化）
+    os.utime(path, ns=(os.stat(path).st_atime_ns, os.stat(path).st_mtime_ns + 1_000_000_000))
+    assert probe_tesseract(path, cache_path) == info
+    assert len(calls()) == 4
+
+    # 语言包目录变化
+    monkeypatch.setenv('TESSDATA_PREFIX', str(tmp_path))
+    probe_tesseract(path, cache_path)
+    assert len(calls()) == 6
+    monkeypatch.setattr(ocr_backend, '_probes', {})
+    probe_tesseract(path, cache_path)
+    assert len(calls()) == 6
+
+    with pytest.raises(FileNotFoundError):
+        probe_tesseract(str(tmp_path / 'missing'), cache_path)
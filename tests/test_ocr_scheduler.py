@@ -0,0 +1,93 @@
+import os
+import hashlib
+from collections import Counter
+
+import pytest
+
+from ocr_backend import OCRBackend
+from result_cache import ResultCache
+from image_preprocess import ImageStore
+from test_image_payment import PaymentImageTester
+
+# 模拟识别结果：由图像内容和PSM模式决定，同一金额经常被多次识别，也有识别不到金额的情况
+STUB_TEXTS = ['支付 -12.30', '(12.30)', '实付 -45.60', '¥-99.90', '识别失败']
+
+
+class StubBackend(OCRBackend):
+    """结果只取决于图像内容和识别配置的OCR后端，与调用顺序和线程无关"""
+
+    name = 'stub'
+
+    def version(self):
+        return 'stub'
+
+    def _image_to_string_batch(self, images, lang, config):
+        import numpy as np
+        texts = []
+        for image in images:
+            digest = hashlib.sha256(np.ascontiguousarray(image).tobytes() + config.encode()).digest()
+            texts.append(STUB_TEXTS[digest[0] % len(STUB_TEXTS)] + '\n\f')
+        return texts
+
+
+@pytest.fixture(scope='module')
+def image_paths(tmp_path_factory):
+    """合成截图：白底上字号不同的几行数字"""
+    import random
+    from PIL import Image, ImageDraw, ImageFont
+
+    folder = tmp_path_factory.mktemp('screens')
+    rng = random.Random(2)
+    paths = []
+    for index in range(5):
+        image = Image.new('L', (480, 800), 255)
+        draw = ImageDraw.Draw(image)
+        y = 30
+        for size in [56, 24, 24, 32, 24, 20]:
+            text = f"-{rng.randint(1, 9999)}.{rng.randint(0, 99):02d}  {rng.randint(100000, 999999)}"
+            draw.text((20, y), text, fill=rng.randint(0, 60), font=ImageFont.load_default(size))
+            y += int(size * 1.8)
+        path = str(folder / f'pay{index}_log.png')
+        image.save(path)
+        paths.append(path)
+    return paths
+
+
+def _extract(image_paths, cache_path, workers, cascade, roi):
+    """识别所有截图，返回 {文件名: (金额, 识别次数, 各金额的票数, 识别结果)}"""
+    tester = PaymentImageTester(cascade=cascade, roi=roi, workers=workers, cache_path=cache_path,
+                                ocr_backend=StubBackend(), image_store=ImageStore())
+    extracted = tester.extract_payments(image_paths)
+    cache = ResultCache(cache_path, 'payment_ocr')
+    try:
+        results = {}
+        for path in image_paths:
+            candidates = cache.get(tester._cache_key(path))['candidates']
+            amount, passes = extracted[path]
+            results[os.path.basename(path)] = (amount, passes,
+                                               Counter(f'{candidate[0]:.2f}' for candidate in candidates),
+                                               candidates)
+        return results
+    finally:
+        cache.close()
+
+
+@pytest.mark.parametrize('cascade', [False, True])
+@pytest.mark.parametrize('roi', [False, True])
+def test_parallel_matches_serial(image_paths, tmp_path, cascade, roi):
+    """多线程调度的金额、识别次数和投票结果与串行识别完全一致（级联和金额区域提前结束都开启或关闭）"""
+    serial = _extract(image_paths, str(tmp_path / 'serial.sqlite'), 1, cascade, roi)
+    parallel = _extract(image_paths, str(tmp_path / 'parallel.sqlite'), 4, cascade, roi)
+    assert parallel == serial
+    assert any(amount is not None for amount, _, _, _ in serial.values())
+    if cascade or roi:
+        # 提前结束确实发生过
+        full = len(PaymentImageTester(roi=roi, ocr_backend=StubBackend())._full_plan())
+        assert any(passes < full for _, passes, _, _ in serial.values())
+
+
+def test_scheduler_limits_openmp_threads(image_paths, tmp_path, monkeypatch):
+    """创建识别线程池时限制Tesseract自身的线程数，不依赖入口程序的设置"""
+    monkeypatch.delenv('OMP_THREAD_LIMIT', raising=False)
+    _extract(image_paths[:1], str(tmp_path / 'cache.sqlite'), 2, False, False)
+    assert os.environ['OMP_THREAD_LIMIT'] == '1'
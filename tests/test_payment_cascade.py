@@ -0,0 +1,116 @@
+import pytest
+
+from ocr_backend import OCRBackend
+from test_image_payment import PaymentImageTester
+
+
+class ScriptedBackend(OCRBackend):
+    """按 (图像版本, PSM) 返回预设文本的OCR后端，记录每次识别的组合"""
+
+    name = 'scripted'
+
+    def __init__(self, answer):
+        super().__init__()
+        self.answer = answer
+        self.passes = []
+
+    def version(self):
+        return 'scripted'
+
+    def _image_to_string_batch(self, images, lang, config):
+        psm = int(config.split('--psm ')[1])
+        texts = []
+        for img_name in images:
+            self.passes.append((img_name, psm))
+            texts.append(self.answer(img_name, psm))
+        return texts
+
+
+def _tester(answer, cascade, **kwargs):
+    """不读取图片：各图像版本就是它的名称，由 ScriptedBackend 按名称返回识别结果"""
+    tester = PaymentImageTester(cascade=cascade, roi=False, use_cache=False, ocr_backend=ScriptedBackend(answer),
+                                **kwargs)
+    tester._load_image_versions = lambda image_path: {name: name for name in tester.IMAGE_VERSIONS}
+    return tester
+
+
+def _amount_text(amount):
+    return f'支付 -{amount:.2f}\n\f' if amount is not None else '识别失败\n\f'
+
+
+FULL_PASSES = len(PaymentImageTester.IMAGE_VERSIONS) * len(PaymentImageTester.PSM_MODES)
+
+
+def test_pass_plan_puts_cascade_order_first():
+    """级联模式的识别计划以优先顺序开始，其余组合补齐为完整识别的32次，不重复也不遗漏"""
+    tester = _tester(lambda img_name, psm: '', cascade=True)
+    plan = tester._pass_plan()
+    assert len(plan) == FULL_PASSES == 32
+    assert plan[:len(tester.DEFAULT_CASCADE_ORDER)] == tester.DEFAULT_CASCADE_ORDER
+    assert sorted(plan) == sorted(tester._serial_plan())
+
+    # 金额区域的识别排在最前面
+    roi_tester = PaymentImageTester(cascade=True, roi=True, ocr_backend=ScriptedBackend(None))
+    roi_plan = roi_tester._pass_plan()
+    assert roi_plan[:len(roi_tester._roi_plan())] == roi_tester._roi_plan()
+    assert roi_plan[len(roi_tester._roi_plan()):] == plan
+
+
+def test_early_exit_after_agreement(tmp_path):
+    """同一金额被 agreement_threshold 次独立识别确认后提前结束，只执行优先顺序中的前几次识别"""
+    tester = _tester(lambda img_name, psm: _amount_text(12.30), cascade=True)
+    assert tester.extract_payment_from_image(str(tmp_path / 'pay.png')) == 12.30
+    assert tester.last_pass_count == 3
+    assert tester.ocr_backend.passes == tester.DEFAULT_CASCADE_ORDER[:3]
+
+
+def test_agreement_counts_distinct_passes(tmp_path):
+    """同一次识别中多次出现的金额只算一次确认，在第三个不同的识别组合确认后结束"""
+    def answer(img_name, psm):
+        if psm == 11:
+            return '支付 -7.77 实付 -7.77\n\f'
+        return _amount_text(None)
+
+    tester = _tester(answer, cascade=True)
+    assert tester._agreed_amount([(7.77, 'Otsu二值化', 11)] * 3) is None
+    assert tester.extract_payment_from_image(str(tmp_path / 'pay.png')) == 7.77
+    # 优先顺序中前三次（PSM 6）没有找到金额，接下来三次（PSM 11）达成一致
+    assert tester.last_pass_count == 6
+    assert tester.ocr_backend.passes == tester.DEFAULT_CASCADE_ORDER[:6]
+
+
+def test_disagreement_falls_back_to_full_sweep(tmp_path):
+    """始终达不成一致时执行完整的32次识别，结果和识别次数与不使用级联模式时相同"""
+    def answer(img_name, psm):
+        # 每个金额最多被两次识别找到，达不到一致次数
+        index = PaymentImageTester.IMAGE_VERSIONS.index(img_name) * 100 + psm
+        return _amount_text(index // 2 + 0.5)
+
+    cascade = _tester(answer, cascade=True)
+    full = _tester(answer, cascade=False)
+    amount = cascade.extract_payment_from_image(str(tmp_path / 'pay.png'))
+    assert amount == full.extract_payment_from_image(str(tmp_path / 'pay.png'))
+    assert cascade.last_pass_count == full.last_pass_count == FULL_PASSES
+    assert sorted(cascade.ocr_backend.passes) == sorted(full.ocr_backend.passes)
+    assert len(set(cascade.ocr_backend.passes)) == FULL_PASSES
+
+
+def test_select_amount_votes_in_full_plan_order():
+    """没有达成一致时按完整识别的顺序投票：票数相同时选择完整识别中先出现的金额，与识别顺序无关"""
+    tester = _tester(lambda img_name, psm: '', cascade=True)
+    # 按级联顺序 5.00 先出现，按完整识别顺序（原始灰度图在前）8.00 先出现
+    results = [(5.00, 'Otsu二值化', 6), (5.00, 'CLAHE增强', 6), (8.00, '原始灰度图', 6), (8.00, '原始灰度图', 11)]
+    assert tester._select_amount(results, 4) == 8.00
+    assert tester._select_amount(results, 4, agreed_amount=5.00) == 5.00
+    assert tester._select_amount([], FULL_PASSES) is None
+
+
+@pytest.mark.parametrize('threshold, passes', [(1, 1), (2, 2), (4, 7)])
+def test_agreement_threshold(tmp_path, threshold, passes):
+    """识别次数随一致次数变化：除优先顺序中第4到6次识别失败外每次都找到同一金额，恰好在第 threshold 次确认时结束"""
+    def answer(img_name, psm):
+        return _amount_text(None if (img_name, psm) in PaymentImageTester.DEFAULT_CASCADE_ORDER[3:6] else 3.00)
+
+    tester = _tester(answer, cascade=True, agreement_threshold=threshold)
+    assert tester.extract_payment_from_image(str(tmp_path / 'pay.png')) == 3.00
+    assert tester.last_pass_count == passes
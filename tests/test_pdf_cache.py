@@ -0,0 +1,80 @@
+import pytest
+
+from pdf_image_analyzer import DocumentAnalyzer
+from pdf_text import available_pdf_backends
+
+pytestmark = pytest.mark.skipif('pymupdf' not in available_pdf_backends(), reason='未安装 PyMuPDF')
+
+
+def _invoice_pdf(path, invoice_number, price):
+    import pymupdf
+    document = pymupdf.open()
+    page = document.new_page()
+    for index, line in enumerate([f'发票号码：{invoice_number}', '开票日期：2024年03月01日',
+                                  '销售方名称：北京某某科技有限公司', f'价税合计（大写）壹佰元整 （小写）¥{price}']):
+        page.insert_text((40, 60 + index * 16), line, fontname='china-s', fontsize=10)
+    document.save(str(path))
+    document.close()
+
+
+class CountingAnalyzer(DocumentAnalyzer):
+    """记录实际解析PDF的次数（未命中缓存）"""
+
+    def __init__(self, folder_path, **kwargs):
+        kwargs.setdefault('use_qr', False)
+        kwargs.setdefault('use_templates', False)
+        kwargs.setdefault('pdf_ocr', False)
+        super().__init__(folder_path, pdf_backend='pymupdf', **kwargs)
+        self.parsed = 0
+
+    def _extract_pdf_fields(self, pdf_path):
+        self.parsed += 1
+        return super()._extract_pdf_fields(pdf_path)
+
+
+def _extract(tmp_path, pdf_path, **kwargs):
+    """用新的分析器提取一次（与再次运行程序相同），返回 (发票信息, 解析次数)"""
+    analyzer = CountingAnalyzer(str(tmp_path), cache_path=str(tmp_path / 'pdf_cache.sqlite'), **kwargs)
+    info = analyzer.extract_pdfs([str(pdf_path)])[0]
+    return info, analyzer.parsed
+
+
+def test_unchanged_pdf_uses_cache(tmp_path):
+    pdf_path = tmp_path / 'invoice.pdf'
+    _invoice_pdf(pdf_path, '24112000000012345678', '100.00')
+    info, parsed = _extract(tmp_path, pdf_path)
+    assert parsed == 1 and info['invoice_number'] == '24112000000012345678'
+    cached, parsed = _extract(tmp_path, pdf_path)
+    assert parsed == 0 and cached == info
+
+
+def test_changed_pdf_invalidates_cache(tmp_path):
+    """同名PDF内容变化时重新解析，得到新的字段"""
+    pdf_path = tmp_path / 'invoice.pdf'
+    _invoice_pdf(pdf_path, '24112000000012345678', '100.00')
+    _extract(tmp_path, pdf_path)
+
+    _invoice_pdf(pdf_path, '24112000000087654321', '200.00')
+    info, parsed = _extract(tmp_path, pdf_path)
+    assert parsed == 1
+    assert (info['invoice_number'], info['price']) == ('24112000000087654321', '200.00')
+    assert _extract(tmp_path, pdf_path)[1] == 0
+
+
+def test_extractor_version_invalidates_cache(tmp_path, monkeypatch):
+    """提取器版本或提取设置变化时缓存失效"""
+    pdf_path = tmp_path / 'invoice.pdf'
+    _invoice_pdf(pdf_path, '24112000000012345678', '100.00')
+    fingerprint = CountingAnalyzer(str(tmp_path)).extractor_fingerprint()
+    _extract(tmp_path, pdf_path)
+
+    monkeypatch.setattr(DocumentAnalyzer, 'EXTRACTOR_VERSION', DocumentAnalyzer.EXTRACTOR_VERSION + 1)
+    assert CountingAnalyzer(str(tmp_path)).extractor_fingerprint() != fingerprint
+    assert _extract(tmp_path, pdf_path)[1] == 1
+    assert _extract(tmp_path, pdf_path)[1] == 0
+
+    # 提取设置变化
+    assert _extract(tmp_path, pdf_path, stop_early=False)[1] == 1
+    assert _extract(tmp_path, pdf_path, use_templates=True)[1] == 1
+    assert (CountingAnalyzer(str(tmp_path), use_qr=True).extractor_fingerprint()
+            != CountingAnalyzer(str(tmp_path)).extractor_fingerprint())
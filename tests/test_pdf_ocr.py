@@ -0,0 +1,128 @@
+import os
+import time
+
+import numpy as np
+import pytest
+
+from pdf_ocr import MAX_RENDER_PIXELS, PageImageCache, ScannedPageReader, bounded_dpi, normalize_ocr_text
+
+
+@pytest.mark.parametrize('width, height', [(595.3, 841.9), (2384, 3370), (14400, 14400)])
+def test_bounded_dpi_caps_pixels(width, height):
+    """A4页面按原分辨率渲染；大幅面页面降低分辨率，渲染的像素数不超过上限"""
+    dpi = bounded_dpi(width, height, 300)
+    pixels = (width * dpi / 72) * (height * dpi / 72)
+    assert pixels <= MAX_RENDER_PIXELS
+    if (width * 300 / 72) * (height * 300 / 72) <= MAX_RENDER_PIXELS:
+        assert dpi == 300
+    else:
+        assert 1 <= dpi < 300
+        # 不会降得过低：再高1 DPI 就会超过上限
+        assert (width * (dpi + 1) / 72) * (height * (dpi + 1) / 72) > MAX_RENDER_PIXELS * 0.99
+
+
+def test_bounded_dpi_without_limit():
+    assert bounded_dpi(14400, 14400, 300, max_pixels=None) == 300
+    assert bounded_dpi(10 ** 6, 10 ** 6, 300, max_pixels=1) == 1
+
+
+@pytest.mark.parametrize('text, expected', [
+    # 冒号与数字之间的空格保留（字段模式允许空白）
+    ('发 票 号 码 ： 24112000000012345678\n', '发票号码： 24112000000012345678'),
+    ('开\t票 日 期：2024 年 03 月 01 日', '开票日期：2024 年 03 月 01 日'),
+    ('价 税 合 计 （ 小 写 ） ¥113.00\f', '价税合计（小写） ¥113.00'),
+    # 英文和数字之间的空格保留
+    ('Invoice No 1234 5678\n\n', 'Invoice No 1234 5678'),
+    ('\n销 售 方\n名 称：某 某 公 司\n', '销售方\n名称：某某公司'),
+])
+def test_normalize_ocr_text(text, expected):
+    assert normalize_ocr_text(text) == expected
+
+
+def _touch(path, size, mtime, atime=None):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+    os.utime(path, (atime or mtime, mtime))
+
+
+def test_cache_round_trip(tmp_path):
+    pytest.importorskip('cv2')
+    cache = PageImageCache(str(tmp_path))
+    image = np.random.default_rng(0).integers(0, 256, (40, 30), dtype=np.uint8)
+    assert cache.get('ab' * 32, 0, 300) is None
+    cache.put('ab' * 32, 0, 300, image)
+    assert np.array_equal(cache.get('ab' * 32, 0, 300), image)
+    assert cache.get('ab' * 32, 0, 200) is None and cache.get('ab' * 32, 1, 300) is None
+    assert not [name for _, _, names in os.walk(tmp_path) for name in names if name.endswith('.tmp.png')]
+
+
+def test_evict_by_age_and_stale_tmp(tmp_path):
+    """过期的图像和一小时前的临时文件被删除；正在写入（最近的）临时文件保留"""
+    now = time.time()
+    cache = PageImageCache(str(tmp_path), max_age_days=90)
+    old = str(tmp_path / 'ab' / 'old_0_300.png')
+    recent = str(tmp_path / 'ab' / 'recent_0_300.png')
+    stale_tmp = str(tmp_path / 'ab' / 'recent_0_300.png.1.2.tmp.png')
+    writing_tmp = str(tmp_path / 'cd' / 'new_0_300.png.3.4.tmp.png')
+    _touch(old, 10, now - 91 * 86400)
+    _touch(recent, 10, now - 89 * 86400)
+    _touch(stale_tmp, 10, now - 2 * 3600)
+    _touch(writing_tmp, 10, now - 60)
+
+    assert cache.evict() == 2
+    assert not os.path.exists(old) and not os.path.exists(stale_tmp)
+    assert os.path.exists(recent) and os.path.exists(writing_tmp)
+
+
+def test_evict_by_size_least_recently_used(tmp_path):
+    """超出总大小时按访问时间删除最久未使用的图像（临时文件不计入）"""
+    now = time.time()
+    cache = PageImageCache(str(tmp_path), max_bytes=250)
+    paths = {name: str(tmp_path / 'ab' / f'{name}_0_300.png') for name in ('a', 'b', 'c')}
+    _touch(paths['a'], 100, now - 30, atime=now - 1)      # 最近使用过
+    _touch(paths['b'], 100, now - 20, atime=now - 20)
+    _touch(paths['c'], 100, now - 10, atime=now - 10)
+    _touch(str(tmp_path / 'ab' / 'd_0_300.png.1.2.tmp.png'), 500, now)
+
+    assert cache.evict() == 1
+    assert not os.path.exists(paths['b'])
+    assert os.path.exists(paths['a']) and os.path.exists(paths['c'])
+    assert cache.evict() == 0
+
+
+class FakeDocument:
+    """渲染时返回按分辨率生成的图像，记录渲染次数"""
+
+    def __init__(self, pdf_path, size):
+        self.pdf_path = pdf_path
+        self.size = size
+        self.rendered = []
+
+    def page_size(self, index):
+        return self.size
+
+    def render(self, index, region=(0, 0, 1, 1), dpi=200):
+        self.rendered.append(dpi)
+        width, height = self.size
+        return np.full((int(height * dpi / 72), int(width * dpi / 72)), 255, np.uint8)
+
+
+def test_reader_renders_with_bounded_dpi_and_cache(tmp_path):
+    """大幅面页面按降低后的分辨率渲染，再次读取同一PDF时使用缓存的页面图像"""
+    pytest.importorskip('cv2')
+    pdf_path = tmp_path / 'scan.pdf'
+    pdf_path.write_bytes(b'%PDF-1.7 scanned')
+    reader = ScannedPageReader(None, dpi=300, max_pixels=100_000, cache_dir=str(tmp_path / 'cache'))
+    document = FakeDocument(str(pdf_path), (595.3, 841.9))
+
+    image, cached = reader.render(document, 0)
+    assert not cached and image.size <= 100_000
+    assert document.rendered == [bounded_dpi(595.3, 841.9, 300, 100_000)]
+    image, cached = reader.render(document, 0)
+    assert cached and document.rendered == [bounded_dpi(595.3, 841.9, 300, 100_000)]
+
+    # PDF内容变化时重新渲染
+    pdf_path.write_bytes(b'%PDF-1.7 another scan')
+    _, cached = reader.render(document, 0)
+    assert not cached and len(document.rendered) == 2
@@ -0,0 +1,60 @@
+import os
+import threading
+
+import pytest
+
+import pdf_image_analyzer
+from pdf_image_analyzer import DocumentAnalyzer
+
+INVOICE_NUMBERS = ['24112000000000000001', '24112000000000000002', '24112000000000000003']
+
+
+@pytest.fixture
+def pdf_files(tmp_path):
+    pymupdf = pytest.importorskip('pymupdf')
+    paths = []
+    for index, number in enumerate(INVOICE_NUMBERS):
+        document = pymupdf.open()
+        page = document.new_page()
+        for line_index, line in enumerate([f'发票号码：{number}', '开票日期：2024年03月01日', '销售方名称：某某公司',
+                                           f'价税合计（大写）壹佰元整 （小写）¥{100 + index}.00']):
+            page.insert_text((40, 60 + line_index * 16), line, fontname='china-s', fontsize=10)
+        path = str(tmp_path / f'invoice_{index}.pdf')
+        document.save(path)
+        document.close()
+        paths.append(path)
+    return paths
+
+
+def _analyzer(folder, workers):
+    return DocumentAnalyzer(folder, workers=workers, use_cache=False, use_qr=False, use_templates=False, pdf_ocr=False)
+
+
+def _extract_with_timeout(analyzer, pdf_files, timeout=120):
+    """在线程中提取，超时视为卡死"""
+    results = []
+    thread = threading.Thread(target=lambda: results.append(analyzer.extract_pdfs(pdf_files)), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), '提取没有结束'
+    return results[0]
+
+
+def test_parallel_matches_serial(pdf_files):
+    folder = os.path.dirname(pdf_files[0])
+    serial = _analyzer(folder, 1).extract_pdfs(pdf_files)
+    parallel = _extract_with_timeout(_analyzer(folder, 2), pdf_files)
+    assert parallel == serial
+    assert [info['invoice_number'] for info in parallel] == INVOICE_NUMBERS
+
+
+def _broken_initializer(log_queue):
+    raise RuntimeError('子进程初始化失败')
+
+
+def test_pool_that_cannot_start_falls_back_to_serial(pdf_files, monkeypatch):
+    """子进程初始化失败时每个任务都得到 BrokenProcessPool 且没有任务开始，不能无限重试"""
+    monkeypatch.setattr(pdf_image_analyzer, '_init_pdf_worker', _broken_initializer)
+    folder = os.path.dirname(pdf_files[0])
+    results = _extract_with_timeout(_analyzer(folder, 2), pdf_files)
+    assert [info['invoice_number'] for info in results] == INVOICE_NUMBERS
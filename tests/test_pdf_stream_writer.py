@@ -0,0 +1,158 @@
+import os
+import random
+
+import pytest
+
+from pdf_text import available_pdf_backends, get_pdf_backend
+from pdf_stream_writer import Name, StreamingPDFWriter, parse_object
+
+pytestmark = pytest.mark.skipif('pymupdf' not in available_pdf_backends(), reason='未安装 PyMuPDF')
+
+
+@pytest.fixture
+def backend():
+    return get_pdf_backend('pymupdf')
+
+
+def _seal(size=64):
+    """同一销售方的印章图像（各发票中内容相同，合并时只写入一次）"""
+    from PIL import Image, ImageDraw
+    image = Image.new('RGB', (size, size), 'white')
+    ImageDraw.Draw(image).ellipse((4, 4, size - 4, size - 4), outline='red', width=4)
+    return image
+
+
+def _invoice_pdf(backend, path, rng, pages):
+    import io
+    document = backend._pymupdf.open()
+    seal = io.BytesIO()
+    _seal().save(seal, format='PNG')
+    for page_index in range(pages):
+        page = document.new_page()
+        page.insert_text((40, 60), f"Invoice {os.path.basename(path)} page {page_index + 1}")
+        for line in range(rng.randint(1, 20)):
+            page.insert_text((40, 90 + line * 14), f"item {line} {rng.randint(1, 99999) / 100:.2f}")
+        if page_index == 0:
+            page.insert_image(backend._pymupdf.Rect(400, 700, 520, 820), stream=seal.getvalue())
+    document.save(path)
+    document.close()
+
+
+def test_merged_pdf_opens_with_same_pages(tmp_path, backend):
+    """合并后的文件可以用 PyMuPDF 打开，页数和每页的文本与原文件相同，相同的印章图像只写入一次"""
+    rng = random.Random(0)
+    pdf_files = []
+    for index in range(6):
+        path = str(tmp_path / f"invoice_{index}.pdf")
+        _invoice_pdf(backend, path, rng, rng.randint(1, 3))
+        pdf_files.append(path)
+
+    output = str(tmp_path / 'merged.pdf')
+    with StreamingPDFWriter(output) as writer:
+        for path in pdf_files:
+            with backend.open(path) as document:
+                writer.append(document.merge_source())
+    assert writer.objects_deduplicated > 0
+    assert not os.path.exists(f"{output}.tmp")
+
+    expected = []
+    for path in pdf_files:
+        with backend.open(path) as document:
+            expected.extend(document.pages())
+    with backend.open(output) as merged:
+        assert merged.page_count == writer.page_count == len(expected)
+        assert list(merged.pages()) == expected
+        images = {xref for index in range(merged.page_count) for xref, *_ in merged._handle.get_page_images(index)}
+        assert len(images) == 1
+
+
+def test_error_leaves_no_output(tmp_path, backend):
+    """合并过程中出错时删除临时文件，不留下不完整的输出"""
+    path = str(tmp_path / 'invoice.pdf')
+    _invoice_pdf(backend, path, random.Random(1), 1)
+    output = str(tmp_path / 'merged.pdf')
+    with pytest.raises(RuntimeError):
+        with StreamingPDFWriter(output) as writer:
+            with backend.open(path) as document:
+                writer.append(document.merge_source())
+            raise RuntimeError('中断')
+    assert not os.path.exists(output)
+    assert not os.path.exists(f"{output}.tmp")
+
+
+def test_resume_appends_incremental_update(tmp_path, backend):
+    """继续写入时原来的内容不变，新页面和页面树追加在末尾；出错时截断回原来的长度"""
+    rng = random.Random(2)
+    paths = []
+    for index in range(3):
+        paths.append(str(tmp_path / f"invoice_{index}.pdf"))
+        _invoice_pdf(backend, paths[-1], rng, 1)
+
+    output = str(tmp_path / 'merged.pdf')
+    with StreamingPDFWriter(output) as writer:
+        for path in paths[:2]:
+            with backend.open(path) as document:
+                writer.append(document.merge_source())
+    with open(output, 'rb') as f:
+        original = f.read()
+
+    with pytest.raises(RuntimeError):
+        with StreamingPDFWriter(output, resume=writer.state) as failed:
+            with backend.open(paths[2]) as document:
+                failed.append(document.merge_source())
+            raise RuntimeError('中断')
+    with open(output, 'rb') as f:
+        assert f.read() == original
+
+    # 去掉第一个文件的页面，追加第三个文件的页面放在最前面
+    with StreamingPDFWriter(output, resume=writer.state) as resumed:
+        first, second = resumed.pages
+        with backend.open(paths[2]) as document:
+            resumed.append(document.merge_source())
+        resumed.set_pages([resumed.pages[-1], second])
+    with open(output, 'rb') as f:
+        assert f.read().startswith(original)
+
+    expected = []
+    for path in (paths[2], paths[1]):
+        with backend.open(path) as document:
+            expected.extend(document.pages())
+    with backend.open(output) as merged:
+        assert not merged._handle.is_repaired
+        assert list(merged.pages()) == expected
+
+    # 文件被修改过时不能继续写入
+    with open(output, 'ab') as f:
+        f.write(b'\n')
+    with pytest.raises(ValueError):
+        StreamingPDFWriter(output, resume=resumed.state)
+
+
+def test_parse_object_keeps_non_latin1_bytes():
+    """PyMuPDF 按 raw-unicode-escape 解码的对象文本还原为原来的字节，不替换为"?"；无法还原时报错"""
+    source = b'<</N/x\\u4e2d/S(caf\xe9)/T<E4B8AD>>>'
+    text = source.decode('raw_unicode_escape')
+    assert '中' in text
+    assert parse_object(text) == parse_object(source) == {
+        'N': Name('x\\u4e2d'), 'S': b'caf\xe9', 'T': '中'.encode('utf-8')}
+    with pytest.raises(ValueError):
+        parse_object('<</N/x\ufffd>>')
+
+
+def test_non_ascii_objects_copied_unchanged(tmp_path, backend):
+    """合并后页面中的中文名称和字符串与原文件相同"""
+    path = str(tmp_path / 'invoice.pdf')
+    document = backend._pymupdf.open()
+    page = document.new_page()
+    document.xref_set_key(page.xref, 'PieceInfo', '<</Résumé<</LastModified(D:2024\\344)/Note(发票)>>>>')
+    document.save(path)
+    document.close()
+
+    output = str(tmp_path / 'merged.pdf')
+    with StreamingPDFWriter(output) as writer:
+        with backend.open(path) as source:
+            writer.append(source.merge_source())
+    with backend.open(path) as source, backend.open(output) as merged:
+        expected = source._handle.xref_get_key(source._handle[0].xref, 'PieceInfo')
+        assert merged._handle.xref_get_key(merged._handle[0].xref, 'PieceInfo') == expected
+        assert '/R#C3#A9sum#C3#A9' in expected[1] and '<E58F91E7A5A8>' in expected[1]
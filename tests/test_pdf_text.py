@@ -0,0 +1,87 @@
+import random
+
+import pytest
+
+from pdf_image_analyzer import DocumentAnalyzer
+from pdf_text import available_pdf_backends, get_pdf_backend
+from tests.reference import invoice_text
+
+INVOICE_LINES = ['发票号码：24112000000012345678', '开票日期：2024年03月01日', '销售方名称：北京某某科技有限公司',
+                 '项目名称 规格型号 单位 数量 单价 金额', '*实验器材*离心管 个 2 50.00 100.00',
+                 '价税合计（大写）壹佰壹拾叁元整 （小写）¥113.00']
+
+
+@pytest.fixture(scope='module')
+def scanner():
+    return DocumentAnalyzer.field_scanner()
+
+
+@pytest.fixture
+def invoice_pdf(tmp_path):
+    """第一页为发票，后面三页是明细附页（用 PyMuPDF 生成）"""
+    pymupdf = pytest.importorskip('pymupdf')
+    document = pymupdf.open()
+    for page_index in range(4):
+        page = document.new_page()
+        lines = INVOICE_LINES if not page_index else [f"销货清单 第{page_index + 1}页"] + \
+            [f"*实验器材*离心管 个 1 {index}.00" for index in range(40)]
+        for line_index, line in enumerate(lines):
+            page.insert_text((40, 60 + line_index * 16), line, fontname='china-s', fontsize=10)
+    path = str(tmp_path / 'invoice.pdf')
+    document.save(path)
+    document.close()
+    return path
+
+
+def _analyzer(tmp_path, backend):
+    return DocumentAnalyzer(str(tmp_path), use_cache=False, use_qr=False, use_templates=False, pdf_ocr=False,
+                            pdf_backend=backend)
+
+
+def test_backends_extract_same_fields(tmp_path, invoice_pdf):
+    results = {name: _analyzer(tmp_path, name)._extract_pdf_fields(invoice_pdf) for name in available_pdf_backends()}
+    fields = results['pymupdf']
+    assert fields['invoice_number'] == '24112000000012345678'
+    assert fields['invoice_date'] == '2024-03-01'
+    assert fields['price'] == '113.00'
+    for name, other in results.items():
+        assert other == fields, name
+
+
+@pytest.mark.parametrize('backend', available_pdf_backends())
+def test_stop_early_parses_only_needed_pages(invoice_pdf, scanner, backend):
+    """所需字段都在第一页时只解析一页；关闭提前停止时解析所有页，字段相同"""
+    backend = get_pdf_backend(backend)
+    with backend.open(invoice_pdf) as document:
+        early, _ = scanner.scan_pages(document.pages())
+        assert document.pages_parsed == 1
+    with backend.open(invoice_pdf) as document:
+        full, _ = scanner.scan_pages(document.pages(), stop_early=False)
+        assert document.pages_parsed == document.page_count == 4
+    assert early['invoice_number'] == full['invoice_number'] == '24112000000012345678'
+    assert early['price'] == full['price'] == '113.00'
+
+
+def _scan_each_prefix(scanner, pages):
+    """原来的逐页提取：每页都在累积的全文上重新扫描，字段完整后停止"""
+    text = ''
+    for page_text in pages:
+        text += page_text
+        fields = scanner.scan(text)
+        if scanner.is_complete(fields, text):
+            return fields, text
+    return scanner.scan(text), text
+
+
+def test_scan_pages_matches_full_rescan(scanner):
+    """按页提取（只在新页中查找缺少的字段）与每页重新扫描全文的结果一致，包括字段跨页的情况"""
+    rng = random.Random(2)
+    for _ in range(1000):
+        text = invoice_text(rng)
+        if rng.random() < 0.3:
+            text = text.replace('价税合计', '合计').replace('小写', '')
+        filler = ''.join(rng.choice('明细 行\n1234产品') for _ in range(rng.randint(0, 400)))
+        text = filler + text + filler
+        cuts = sorted(rng.sample(range(1, len(text)), min(rng.randint(1, 8), len(text) - 1)))
+        pages = [text[start:end] for start, end in zip([0] + cuts, cuts + [len(text)])]
+        assert scanner.scan_pages(iter(pages)) == _scan_each_prefix(scanner, pages)
@@ -0,0 +1,97 @@
+import random
+import logging
+from decimal import Decimal
+
+import pytest
+
+import pipeline
+from records import InvoiceRecord, PaymentRecord, to_decimal, records_frame, export_table
+from tests.reference import combine_corpus, legacy_combine_csv
+
+
+def _read(path):
+    import pandas as pd
+    return pd.read_csv(path, dtype=str, keep_default_na=False, encoding='utf-8')
+
+
+def test_to_decimal():
+    assert to_decimal('1,234.5') == Decimal('1234.50')
+    assert to_decimal(12.345) == Decimal('12.34')
+    assert to_decimal(Decimal('7')) == Decimal('7.00')
+    for value in (None, '', 'abc', float('nan'), float('inf')):
+        assert to_decimal(value) is None
+
+
+def test_records_keep_text_fields():
+    """发票号码保存为字符串，不会被当作数字丢失前导零"""
+    record = InvoiceRecord.from_info({'filename': 'a.pdf', 'invoice_number': '00012345', 'price': '113.00',
+                                      'supplier': None})
+    assert record.invoice_number == '00012345'
+    assert record.price == Decimal('113.00')
+    assert record.supplier is None
+
+    df = records_frame([record, InvoiceRecord('b.pdf')], InvoiceRecord)
+    assert list(df.columns) == list(InvoiceRecord.__slots__)
+    assert (df.dtypes == object).all()
+    assert df['invoice_number'].tolist() == ['00012345', None]
+
+
+def test_combined_invoice_numbers_match_extraction(tmp_path):
+    """合并结果中的发票号码与提取结果完全相同；原来经过CSV读写时以0开头的号码丢失前导零"""
+    records, payment_records = combine_corpus(random.Random(0), 2000)
+    logging.disable(logging.WARNING)
+    try:
+        legacy = _read(legacy_combine_csv(records, payment_records, str(tmp_path)))
+        pipeline.combine_results(records, payment_records, str(tmp_path))
+    finally:
+        logging.disable(logging.NOTSET)
+    new = _read(tmp_path / 'combined_results.csv')
+
+    expected = [record.invoice_number for record in records]
+    expected += [''] * (len(new) - len(expected))
+    assert new['发票号码'].tolist() == expected
+    assert legacy['发票号码'].tolist() != expected
+
+
+def test_export_parquet(tmp_path):
+    pytest.importorskip('pyarrow')
+    import pandas as pd
+
+    df = records_frame([PaymentRecord('a_log.jpg', '12.30', 'a.pdf', 3)], PaymentRecord).astype(str)
+    written = export_table(df, str(tmp_path / 'payments.csv'), formats=('csv', 'parquet'))
+    assert written == [str(tmp_path / 'payments.csv'), str(tmp_path / 'payments.parquet')]
+    assert pd.read_parquet(written[1])['filename'].tolist() == ['a_log.jpg']
+
+
+def test_export_without_parquet_engine(tmp_path, monkeypatch):
+    """没有安装 Parquet 引擎时只导出CSV"""
+    import pandas as pd
+
+    def missing_engine(self, *args, **kwargs):
+        raise ImportError('pyarrow')
+
+    monkeypatch.setattr(pd.DataFrame, 'to_parquet', missing_engine)
+    df = records_frame([PaymentRecord('a_log.jpg', '12.30', 'a.pdf', 3)], PaymentRecord)
+    written = export_table(df, str(tmp_path / 'payments.csv'), formats=('csv', 'parquet'))
+    assert written == [str(tmp_path / 'payments.csv')]
+
+
+def test_payment_script_main(tmp_path, monkeypatch, caplog):
+    """单独运行支付截图识别脚本时输出识别的支付记录，并合并截图"""
+    import test_image_payment
+    from test_image_payment import PaymentImageTester
+
+    merged = []
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(PaymentImageTester, 'process_payment_images',
+                        lambda self, input_dir: [PaymentRecord('a_log.jpg', '12.30', 'a.pdf')])
+    monkeypatch.setattr(PaymentImageTester, 'merge_images_to_pdf',
+                        lambda self, input_dir, output_file: merged.append(output_file))
+    caplog.set_level(logging.INFO, logger='test_image_payment')
+    test_image_payment.main()
+    assert '文件: a_log.jpg, 金额: 12.30, 对应发票: a.pdf' in caplog.text
+    assert len(merged) == 1 and merged[0].startswith('output')
+
+    monkeypatch.setattr(PaymentImageTester, 'process_payment_images', lambda self, input_dir: [])
+    test_image_payment.main()
+    assert '没有找到有效的支付记录' in caplog.text
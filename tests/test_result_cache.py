@@ -0,0 +1,126 @@
+import time
+
+import pytest
+
+from ocr_backend import OCRBackend
+from result_cache import ResultCache, config_fingerprint
+from test_image_payment import PaymentImageTester
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache.sqlite'), 'test')
+    yield cache
+    cache.close()
+
+
+def test_hits_and_misses(tmp_path, cache):
+    """保存后读取命中，不存在的键和其他命名空间未命中；重新打开后仍然可以读取"""
+    assert cache.get('a') is None
+    cache.put('a', {'amount': 12.3, 'candidates': [[12.3, 'CLAHE增强', 6]]})
+    assert cache.get('a') == {'amount': 12.3, 'candidates': [[12.3, 'CLAHE增强', 6]]}
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    other = ResultCache(cache.db_path, 'other')
+    reopened = ResultCache(cache.db_path, 'test')
+    try:
+        assert other.get('a') is None
+        assert reopened.get('a')['amount'] == 12.3
+    finally:
+        other.close()
+        reopened.close()
+
+
+def test_config_fingerprint():
+    """配置指纹稳定（字典顺序无关），任一部分变化时不同"""
+    base = config_fingerprint(['原始灰度图'], [3, 6], '5.3.0', {'a': 1, 'b': 2})
+    assert base == config_fingerprint(['原始灰度图'], [3, 6], '5.3.0', {'b': 2, 'a': 1})
+    assert base != config_fingerprint(['原始灰度图'], [3, 6], '5.4.0', {'a': 1, 'b': 2})
+    assert base != config_fingerprint(['原始灰度图'], [3, 6, 11], '5.3.0', {'a': 1, 'b': 2})
+
+
+def test_evict_by_age(cache, monkeypatch):
+    """超过保存期限的记录被淘汰（按保存时间，读取不会延长期限）"""
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now - 91 * 86400)
+    cache.put('old', 1)
+    monkeypatch.setattr(time, 'time', lambda: now - 89 * 86400)
+    cache.put('recent', 2)
+    monkeypatch.setattr(time, 'time', lambda: now)
+    assert cache.get('old') == 1
+
+    assert cache.evict() == 1
+    assert cache.get('old') is None
+    assert cache.get('recent') == 2
+
+
+def test_evict_by_size(tmp_path, monkeypatch):
+    """超出总大小时删除最久未使用的记录，直到不超过限制"""
+    cache = ResultCache(str(tmp_path / 'cache.sqlite'), 'test', max_bytes=250)
+    clock = iter(range(1_700_000_000, 1_700_001_000))
+    monkeypatch.setattr(time, 'time', lambda: next(clock))
+    try:
+        for key in ('a', 'b'):
+            cache.put(key, 'x' * 98)  # JSON编码后100字节
+        assert cache.evict() == 0
+        cache.put('c', 'x' * 98)
+        assert cache.get('a') is not None  # a 最近使用过，最久未使用的是 b
+
+        assert cache.evict() == 1
+        assert cache.get('b') is None
+        assert cache.get('a') is not None and cache.get('c') is not None
+    finally:
+        cache.close()
+
+
+class VersionedBackend(OCRBackend):
+    """每次识别都找到同一金额，Tesseract版本可以修改"""
+
+    name = 'versioned'
+
+    def __init__(self, version='5.3.0'):
+        super().__init__()
+        self._version = version
+
+    def version(self):
+        return self._version
+
+    def _image_to_string_batch(self, images, lang, config):
+        return ['支付 -12.30\n\f'] * len(images)
+
+
+def _extract(image_path, cache_path, backend, **kwargs):
+    """识别一张截图，返回 (金额, 实际识别次数)"""
+    tester = PaymentImageTester(roi=False, cache_path=cache_path, ocr_backend=backend, **kwargs)
+    tester._load_image_versions = lambda path: {name: name for name in tester.IMAGE_VERSIONS}
+    calls = backend.calls
+    try:
+        return tester.extract_payment_from_image(image_path), backend.calls - calls
+    finally:
+        tester._close_cache()
+
+
+def test_payment_cache_invalidation(tmp_path):
+    """同一截图和配置第二次识别时命中缓存；截图内容、识别配置或Tesseract版本变化时重新识别"""
+    image_path = tmp_path / 'pay_log.png'
+    image_path.write_bytes(b'screenshot-1')
+    cache_path = str(tmp_path / 'ocr_cache.sqlite')
+    backend = VersionedBackend()
+
+    assert _extract(str(image_path), cache_path, backend) == (12.30, 32)
+    assert _extract(str(image_path), cache_path, backend) == (12.30, 0)
+
+    # 识别配置变化（级联模式）
+    assert _extract(str(image_path), cache_path, backend, cascade=True) == (12.30, 3)
+    assert _extract(str(image_path), cache_path, backend, cascade=True) == (12.30, 0)
+
+    # Tesseract版本变化
+    assert _extract(str(image_path), cache_path, VersionedBackend('5.4.0'))[1] == 32
+
+    # 截图内容变化（文件名相同）
+    image_path.write_bytes(b'screenshot-2')
+    assert _extract(str(image_path), cache_path, backend)[1] == 32
+    assert _extract(str(image_path), cache_path, backend)[1] == 0
+
+    # 不使用缓存
+    assert _extract(str(image_path), cache_path, backend, use_cache=False)[1] == 32